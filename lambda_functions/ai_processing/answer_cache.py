@@ -0,0 +1,212 @@
+"""
+施設問い合わせの回答キャッシュ
+
+初回ターン（previous_response_id なし）の質問は「チェックアウトは何時」「キーボックスの場所」など
+同じ内容の繰り返しが多いため、file_search 付きの応答生成結果をウォームなコンテナ内に保持する。
+
+キー: (正規化した質問文, 言語, ゲスト状態クラス, ベクターストアID, コンテンツバージョン, ルート, 検索設定)
+- ゲスト状態クラスは get_guest_state が返す値（滞在中の承認済みゲスト / それ以外）で、
+  システムインストラクションの分岐と一致させる。
+- ルート（model_routing で選んだルート名）と検索設定（モデル・推論量・file_search の設定）が変わると
+  別のキーになる（SLO 超過で軽いルートに下げた回答・設定を変える前の回答を取り違えない）。
+- ベクターストアの内容を更新したら ANSWER_CACHE_CONTENT_VERSION を変えるか invalidate() を呼ぶ。
+
+ゲスト固有の値（ゲスト名・部屋番号・キーボックスの暗証番号）を含む回答は保存しない。
+番号は数字のほか、英語・かなの数詞や漢数字（「two six seven one」「にろくななイチ」「二千六百七十一」）で
+書かれていても数字に直して照合する。
+キャッシュヒット時は回答を生成したレスポンスのIDも返し、次のターンはその続きとして答える
+（インストラクションは previous_response_id で引き継がれないため、ほかのゲストの情報は入らない）。
+"""
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+from utils.calculate_key_code import calculate_key_code
+from voice_logger import get_logger
+from event_capture import event_capture
+
+ANSWER_CACHE_ENABLED = os.environ.get('ANSWER_CACHE_ENABLED', 'false').lower() == 'true'
+DEFAULT_TTL_SECONDS = int(os.environ.get('ANSWER_CACHE_TTL_SECONDS', '3600'))
+DEFAULT_MAX_ENTRIES = int(os.environ.get('ANSWER_CACHE_MAX_ENTRIES', '512'))
+# ベクターストアのファイルが入れ替わるたびにデプロイ時に更新する（ファイル一覧のハッシュ）
+CONTENT_VERSION = os.environ.get('ANSWER_CACHE_CONTENT_VERSION', '')
+
+# キャッシュする回答のフィールド
+CACHED_FIELDS = ('assistant_response_text', 'needs_operator', 'end_conversation', 'response_id')
+
+# 数字に直して照合する数詞（normalize_query 後の文字列に対して使うので小文字・空白なし）
+_UNIT_WORDS = {
+    'zero': 0, 'oh': 0, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6, 'seven': 7,
+    'eight': 8, 'nine': 9,
+    'ぜろ': 0, 'れい': 0, 'まる': 0, 'いち': 1, 'に': 2, 'さん': 3, 'よん': 4, 'し': 4, 'ご': 5, 'ろく': 6,
+    'なな': 7, 'しち': 7, 'はち': 8, 'きゅう': 9, 'く': 9,
+}
+_TEEN_WORDS = {
+    'ten': 10, 'eleven': 11, 'twelve': 12, 'thirteen': 13, 'fourteen': 14, 'fifteen': 15, 'sixteen': 16,
+    'seventeen': 17, 'eighteen': 18, 'nineteen': 19,
+}
+_TENS_WORDS = {
+    'twenty': 2, 'thirty': 3, 'forty': 4, 'fifty': 5, 'sixty': 6, 'seventy': 7, 'eighty': 8, 'ninety': 9,
+}
+_KANJI_DIGITS = {'〇': 0, '零': 0, '一': 1, '二': 2, '三': 3, '四': 4, '五': 5, '六': 6, '七': 7, '八': 8, '九': 9}
+_KANJI_UNITS = {'十': 10, '百': 100, '千': 1000}
+
+
+def _alternation(words) -> str:
+    return '|'.join(sorted(words, key=len, reverse=True))
+
+
+_NUMBER_WORD_PATTERN = re.compile(
+    f"({_alternation(_TENS_WORDS)})({_alternation(w for w in _UNIT_WORDS if w.isascii())})?"
+    f"|{_alternation(_TEEN_WORDS)}|{_alternation(_UNIT_WORDS)}"
+)
+_KANJI_NUMBER_PATTERN = re.compile(f"[{''.join(_KANJI_DIGITS)}{''.join(_KANJI_UNITS)}]+")
+
+logger = get_logger('answer_cache')
+
+CacheKey = Tuple[str, str, str, str, str, str, str]
+
+
+def normalize_query(text: str) -> str:
+    """全角半角・大文字小文字・空白・句読点の違いを吸収"""
+    normalized = unicodedata.normalize('NFKC', text or '').casefold()
+    return ''.join(
+        ch for ch in normalized
+        if not unicodedata.category(ch).startswith(('P', 'Z', 'C'))
+    )
+
+
+def _kanji_number(run: str) -> str:
+    """漢数字の並びを数字に（十・百・千を含めば位取り、含まなければ1文字ずつ）"""
+    if not any(ch in _KANJI_UNITS for ch in run):
+        return ''.join(str(_KANJI_DIGITS[ch]) for ch in run)
+    total, current = 0, 0
+    for ch in run:
+        if ch in _KANJI_UNITS:
+            total += (current or 1) * _KANJI_UNITS[ch]
+            current = 0
+        else:
+            current = current * 10 + _KANJI_DIGITS[ch]
+    return str(total + current)
+
+
+def _number_word(match: re.Match) -> str:
+    word = match.group(0)
+    if match.group(1):
+        return f"{_TENS_WORDS[match.group(1)]}{_UNIT_WORDS[match.group(2)] if match.group(2) else 0}"
+    return str(_TEEN_WORDS.get(word, _UNIT_WORDS.get(word)))
+
+
+def spelled_digits(normalized: str) -> str:
+    """normalize_query 済みの文字列の数詞・漢数字を数字に直す（カタカナはひらがなにしてから照合）"""
+    text = ''.join(chr(ord(ch) - 0x60) if 'ァ' <= ch <= 'ヶ' else ch for ch in normalized)
+    text = _KANJI_NUMBER_PATTERN.sub(lambda m: _kanji_number(m.group(0)), text)
+    return _NUMBER_WORD_PATTERN.sub(_number_word, text)
+
+
+def guest_specific_values(guest_info: Optional[Dict]) -> Iterable[str]:
+    """回答に含まれていたらキャッシュしてはいけないゲスト固有の値"""
+    if not guest_info:
+        return []
+    values = []
+    guest_name = guest_info.get('guestName') or ''
+    values.append(guest_name)
+    values.extend(guest_name.split())  # 姓・名だけで呼びかけるケース
+    room_number = guest_info.get('roomNumber')
+    if room_number:
+        values.append(room_number)
+        values.append(calculate_key_code(room_number))
+    return [normalize_query(value) for value in values if value and len(value) >= 2]
+
+
+class AnswerCache:
+    """TTLとLRU上限付きの回答キャッシュ"""
+
+    def __init__(self, ttl_seconds: int = DEFAULT_TTL_SECONDS, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 content_version: str = CONTENT_VERSION, clock=time.time):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.content_version = content_version
+        self._clock = clock
+        self._entries: "OrderedDict[CacheKey, Tuple[float, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejected = 0
+
+    def make_key(self, query_text: str, language: str, guest_state: str, vector_store_id: str,
+                 route: str = '', search_settings: Optional[Dict] = None) -> Optional[CacheKey]:
+        normalized = normalize_query(query_text)
+        if not normalized:
+            return None
+        settings = json.dumps(search_settings or {}, sort_keys=True, separators=(',', ':'), default=str)
+        return (normalized, language, guest_state, vector_store_id or '', self.content_version, route or '', settings)
+
+    def get(self, key: Optional[CacheKey]) -> Optional[Dict]:
+        """キャッシュ済みの回答を返す"""
+        if key is None:
+            return None
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(entry[1])
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Optional[CacheKey], answer: Dict, guest_info: Optional[Dict]) -> bool:
+        """
+        回答を登録
+
+        Returns:
+            登録した場合True（ゲスト固有の値を含むなどで登録しなかった場合False）
+        """
+        if key is None:
+            return False
+        text = normalize_query(answer.get('assistant_response_text'))
+        digits = spelled_digits(text)
+        if any(value in text or value in digits for value in guest_specific_values(guest_info)):
+            with self._lock:
+                self.rejected += 1
+            logger.info("Answer contains guest-specific values; not cached")
+            return False
+
+        value = {field: answer.get(field) for field in CACHED_FIELDS}
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return True
+
+    def invalidate(self, content_version: Optional[str] = None) -> None:
+        """全エントリを破棄（ベクターストア更新時）。新しいコンテンツバージョンも指定できる"""
+        with self._lock:
+            self._entries.clear()
+            if content_version is not None:
+                self.content_version = content_version
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'rejected': self.rejected,
+                'size': len(self._entries)
+            }
+
+
+# 記録・再生ハーネス用にヒット結果を記録する（再生時はキャッシュの中身を記録から再現する）
+answer_cache = event_capture.wrap('answer_cache', AnswerCache(), ('get',))
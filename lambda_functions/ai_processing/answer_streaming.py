@@ -0,0 +1,216 @@
+"""
+回答の文単位ストリーミング
+
+構造化出力（JSON）の生成完了を待つと、発信者は最後のトークンまで何も聞けない。
+ストリーミングモードでは Responses API のストリームを読みながら
+部分的なJSONから assistant_response_text を取り出し、最初の1文がそろった時点で
+その文だけを先に通話へ送る。needs_operator / end_conversation は生成完了後の
+最終TwiMLで従来どおり判定し、最終TwiMLでは送信済みの文の続きだけを読み上げる。
+
+calls.update は再生中のTwiMLを打ち切るため、最初の1文を送った後は、文字数から見積もった
+再生時間が経過するまで最終TwiMLの送信を待つ（検索中アナウンスは最初の1文で打ち切ってよい）。
+
+ANSWER_STREAMING_ENABLED=true で有効化（ポーリングモードでは使わない）。
+"""
+import asyncio
+import os
+import re
+import time
+from typing import Awaitable, Callable, Optional, Union
+
+from voice_logger import get_logger
+
+ANSWER_STREAMING_ENABLED = os.environ.get('ANSWER_STREAMING_ENABLED', 'false').lower() == 'true'
+
+# 先行して送る最初の文の最小文字数（「はい。」だけを送っても待ち時間は埋まらない）
+MIN_FIRST_SENTENCE_CHARS = 8
+
+# 読み上げ速度の目安（文字/秒、prosody rate=80% 適用後）
+SPEECH_CHARS_PER_SECOND = {'ja-JP': 5.5, 'en-US': 11.0}
+DEFAULT_SPEECH_CHARS_PER_SECOND = 11.0
+
+ANSWER_FIELD = 'assistant_response_text'
+
+logger = get_logger('answer_streaming')
+
+_FIELD_START = re.compile(r'"' + ANSWER_FIELD + r'"\s*:\s*"')
+_SENTENCE_END = frozenset('。！？!?\n')
+# 直後に空白があっても文末とみなさない英語の略語
+_ABBREVIATIONS = frozenset({'mr', 'mrs', 'ms', 'dr', 'st', 'no', 'approx', 'a.m', 'p.m', 'e.g', 'i.e'})
+_SIMPLE_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+class PartialAnswerExtractor:
+    """ストリーミング中の不完全なJSONから assistant_response_text の確定済み部分を取り出す"""
+
+    def __init__(self):
+        self._raw = ''
+        self._pos: Optional[int] = None  # 値の中で次に読む位置
+        self._chars = []
+        self.complete = False
+
+    def feed(self, delta: str) -> str:
+        """JSONの差分を追加し、現時点でデコードできた回答テキストを返す"""
+        self._raw += delta
+        if self._pos is None:
+            match = _FIELD_START.search(self._raw)
+            if not match:
+                return ''
+            self._pos = match.end()
+        if not self.complete:
+            self._decode()
+        return ''.join(self._chars)
+
+    def _decode(self) -> None:
+        raw, pos, end = self._raw, self._pos, len(self._raw)
+        while pos < end:
+            ch = raw[pos]
+            if ch == '"':
+                self.complete = True
+                pos += 1
+                break
+            if ch != '\\':
+                self._chars.append(ch)
+                pos += 1
+                continue
+            # エスケープシーケンスが途中で切れている場合は次の差分を待つ
+            if pos + 1 >= end:
+                break
+            kind = raw[pos + 1]
+            if kind != 'u':
+                self._chars.append(_SIMPLE_ESCAPES.get(kind, kind))
+                pos += 2
+                continue
+            if pos + 6 > end:
+                break
+            code = int(raw[pos + 2:pos + 6], 16)
+            if 0xD800 <= code <= 0xDBFF:
+                # サロゲートペアは後半の \uXXXX まで揃ってからデコード
+                if pos + 12 > end:
+                    break
+                low = int(raw[pos + 8:pos + 12], 16)
+                code = 0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)
+                pos += 6
+            self._chars.append(chr(code))
+            pos += 6
+        self._pos = pos
+
+
+def _is_abbreviation(text: str, dot_index: int) -> bool:
+    words = text[:dot_index].split()
+    word = words[-1].lower() if words else ''
+    return word in _ABBREVIATIONS or len(word) == 1
+
+
+def first_sentence(text: str, min_chars: int = MIN_FIRST_SENTENCE_CHARS) -> Optional[str]:
+    """
+    確定した最初の文（min_chars に満たなければ次の文末まで）を返す
+
+    英語のピリオドは直後に空白が来た時点で文末とみなす（"3.5" や末尾の "." は続きを待つ）。
+    """
+    for index, ch in enumerate(text):
+        if ch == '.':
+            if index + 1 >= len(text) or not text[index + 1].isspace() or _is_abbreviation(text, index):
+                continue
+        elif ch not in _SENTENCE_END:
+            continue
+        sentence = text[:index + 1].strip()
+        if len(sentence) >= min_chars:
+            return sentence
+    return None
+
+
+def estimate_speech_seconds(text: str, language: str) -> float:
+    """読み上げにかかる時間の見積もり"""
+    return len(text) / SPEECH_CHARS_PER_SECOND.get(language, DEFAULT_SPEECH_CHARS_PER_SECOND)
+
+
+class FirstSentencePlayback:
+    """
+    最初の文の先行再生と、次のTwiMLを送ってよい時刻の管理
+
+    vector_search には on_first_sentence を渡し、通話への送信は start() で開始する
+    （投機的検索では分類が general に確定するまで送信しない）。
+    """
+
+    def __init__(self, language: str, clock=time.monotonic):
+        self.language = language
+        self._clock = clock
+        self._sentence: Optional[asyncio.Future] = None
+        self._task: Optional[asyncio.Task] = None
+        self._delivering = False
+        self._speech_ends_at = 0.0
+        self.pushed_text = ''
+        self.first_audio_at: Optional[float] = None
+
+    def _sentence_future(self) -> asyncio.Future:
+        if self._sentence is None:
+            self._sentence = asyncio.get_running_loop().create_future()
+        return self._sentence
+
+    async def on_first_sentence(self, sentence: str) -> None:
+        """vector_search から最初の文を受け取る"""
+        future = self._sentence_future()
+        if not future.done():
+            future.set_result(sentence)
+
+    def speech_started(self, text: str) -> None:
+        """音声を含むTwiMLを送った直後に呼ぶ（次のTwiMLで打ち切らないよう再生終了時刻を見積もる）"""
+        self._speech_ends_at = self._clock() + estimate_speech_seconds(text, self.language)
+
+    async def _wait_speech_end(self) -> None:
+        remaining = self._speech_ends_at - self._clock()
+        if remaining > 0:
+            await asyncio.sleep(remaining)
+
+    def start(self, push: Callable[[str], Awaitable[None]],
+              after: Union[Awaitable, Callable[[], Awaitable], None] = None) -> None:
+        """
+        最初の文が届いたら、再生中の音声の終了を待って push(sentence) で通話へ送る
+
+        after には先に送るTwiML（検索中アナウンス）の送信タスク、または最初の文が届いた時点で呼ぶ
+        コルーチン関数を渡す（送信順の逆転を防ぐ）。
+        """
+        self._task = asyncio.ensure_future(self._run(push, after))
+
+    async def _run(self, push: Callable[[str], Awaitable[None]],
+                   after: Union[Awaitable, Callable[[], Awaitable], None]) -> None:
+        sentence = await self._sentence_future()
+        if after is not None:
+            await (after() if callable(after) else after)
+        await self._wait_speech_end()
+        self._delivering = True
+        await push(sentence)
+        self.pushed_text = sentence
+        self.first_audio_at = self._clock()
+        self.speech_started(sentence)
+
+    async def finish(self) -> str:
+        """
+        生成完了時に呼ぶ。未送信の文は送らずに取りやめ、送信中なら完了を待ち、
+        送信済みの文の再生が終わるまで待機する
+
+        Returns:
+            送信済みの文（送っていなければ空文字）
+        """
+        if self._task is None:
+            return ''
+        if not self._delivering:
+            self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error("Failed to push first sentence", error=e)
+        if self.pushed_text:
+            await self._wait_speech_end()
+        return self.pushed_text
+
+
+def remaining_text(full_text: str, pushed_text: str) -> str:
+    """最終TwiMLで読み上げる残りのテキスト（送信済みの文が先頭と一致しなければ全文）"""
+    stripped = full_text.lstrip()
+    if pushed_text and stripped.startswith(pushed_text):
+        return stripped[len(pushed_text):].strip()
+    return full_text
@@ -0,0 +1,253 @@
+"""
+Call Analytics - ターンごとの結果の記録（保留時間・オペレーター転送までの時間・コストの分析用）
+
+責務: AI Processing Lambda の呼び出し（発信者の1ターン）ごとに、言語・_dispatch_by_urgency で選んだ経路・
+回答のフラグ（end_conversation / needs_operator / degraded）・ステージごとの所要時間・トークン数・再試行数と、
+発話の受信からの時間を1レコードにまとめ、1行のJSONとして標準出力（CloudWatch Logs）に書き出す。
+tools/report_call_latency.py がログから SQLite に取り込み、無音時間・オペレーター転送までの時間・
+通話あたりのコストを集計する。
+
+時間はすべて ImmediateResponse Lambda が発話を受信した時刻（received_at）から:
+- first_audio_ms: AI Processing Lambda が最初に音声のある TwiML を届けるまで
+  （検索中アナウンス・先行再生の1文・回答・転送案内のどれか。受信直後の「解析します」の案内を含む）
+- answer_ms: このターンの最後の TwiML（回答・転送・エラー案内）を届けるまで
+- operator_ms: 緊急・オペレーター希望の経路で転送（Dial）の TwiML を届けるまで
+ポーリングモードでは結果ストアへの保存時刻で、発信者に届くのは次のポーリング（最大 POLL_INTERVAL_SECONDS 後）。
+
+- 無効時（既定）は turn が何もせず、meter_openai はクライアントをそのまま返す
+- 個人情報（部屋番号・ゲスト名・発話）は記録しない
+- ステージの所要時間は call_tracing のスパン（CALL_TRACING_ENABLED が無効でも計測だけ行う）
+- トークン数は OpenAI クライアントのラッパーでレスポンスの usage から集計する（ストリーミングは完了イベント）
+"""
+import contextvars
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from call_tracing import tracer
+from voice_logger import get_logger
+
+CALL_ANALYTICS_ENABLED = os.environ.get('CALL_ANALYTICS_ENABLED', 'false').lower() == 'true'
+
+ANALYTICS_MARKER = 'voice_turn'
+FORMAT_VERSION = 1
+# 経路（_dispatch_by_urgency の分岐）のうちオペレーターに転送するもの
+OPERATOR_PATHS = frozenset({'urgent', 'operator_request'})
+
+_current: contextvars.ContextVar = contextvars.ContextVar('call_analytics_turn', default=None)
+
+logger = get_logger('call_analytics')
+
+
+class TurnOutcome:
+    """1ターンの結果（呼び出しの間に集め、終了時に書き出す）"""
+
+    def __init__(self, event: Dict):
+        self.started_at = time.time()
+        self._started = time.monotonic()
+        received_at = event.get('received_at')
+        # ImmediateResponse Lambda が受信時刻を渡していなければ呼び出し開始を基準にする
+        self.received_at = received_at if isinstance(received_at, (int, float)) else self.started_at
+        self.fields: Dict[str, Any] = {
+            'call_sid': event.get('call_sid'),
+            # トレースと同じターンの識別子（ポーリングのターンID、なければ受信時刻のエポック秒）
+            'turn': event.get('turn_id') or str(int(self.received_at)),
+            'language': event.get('language', 'en-US'),
+            'continuing': bool(event.get('previous_openai_response_id')),
+            'path': None,
+            'action': None,
+            'status': None,
+            'end_conversation': False,
+            'needs_operator': False,
+            'degraded': False,
+        }
+        self.counts: Dict[str, int] = {}
+        self.usage: List[Dict[str, Any]] = []
+        self.first_audio_ms: Optional[float] = None
+        self.answer_ms: Optional[float] = None
+        self.operator_ms: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def since_received_ms(self) -> float:
+        # 受信時刻は別の Lambda の時計なので、経過はこの呼び出しの単調時計で測って足す
+        return (self.started_at - self.received_at) * 1000 + (time.monotonic() - self._started) * 1000
+
+    def record(self, stages: Dict[str, float]) -> Dict[str, Any]:
+        tokens = {key: sum(entry.get(key) or 0 for entry in self.usage)
+                  for key in ('input_tokens', 'cached_tokens', 'output_tokens')}
+        return {
+            'analytics': ANALYTICS_MARKER,
+            'v': FORMAT_VERSION,
+            **self.fields,
+            'received_at': round(self.received_at, 3),
+            'started_at': round(self.started_at, 3),
+            'queue_ms': round(max(self.started_at - self.received_at, 0.0) * 1000, 1),
+            'first_audio_ms': _round(self.first_audio_ms),
+            'answer_ms': _round(self.answer_ms),
+            'operator_ms': _round(self.operator_ms),
+            'duration_ms': round((time.monotonic() - self._started) * 1000, 1),
+            'stages': stages,
+            **tokens,
+            'usage': self.usage,
+            'counts': self.counts,
+            'error': self.error,
+        }
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 1) if value is not None else None
+
+
+class _MeteredResponses:
+    """responses.create のトークン数を集計するプロキシ（その他の属性はそのまま委譲）"""
+
+    def __init__(self, responses, analytics: 'CallAnalytics'):
+        self._responses = responses
+        self._analytics = analytics
+
+    def __getattr__(self, name: str):
+        return getattr(self._responses, name)
+
+    async def create(self, *args, **kwargs):
+        result = await self._responses.create(*args, **kwargs)
+        if kwargs.get('stream'):
+            return self._metered_stream(kwargs.get('model'), result)
+        self._analytics.add_usage(kwargs.get('model') or getattr(result, 'model', None), getattr(result, 'usage', None))
+        return result
+
+    async def _metered_stream(self, model: Optional[str], stream):
+        async for event in stream:
+            if getattr(event, 'type', None) in ('response.completed', 'response.failed', 'response.incomplete'):
+                response = getattr(event, 'response', None)
+                self._analytics.add_usage(model or getattr(response, 'model', None), getattr(response, 'usage', None))
+            yield event
+
+
+class _MeteredEmbeddings:
+    """embeddings.create のトークン数を集計するプロキシ"""
+
+    def __init__(self, embeddings, analytics: 'CallAnalytics'):
+        self._embeddings = embeddings
+        self._analytics = analytics
+
+    def __getattr__(self, name: str):
+        return getattr(self._embeddings, name)
+
+    async def create(self, *args, **kwargs):
+        result = await self._embeddings.create(*args, **kwargs)
+        usage = getattr(result, 'usage', None)
+        self._analytics.add_tokens(kwargs.get('model'), input_tokens=getattr(usage, 'prompt_tokens', None))
+        return result
+
+
+class _MeteredOpenAI:
+    """AsyncOpenAI の responses / embeddings のトークン数を集計するプロキシ"""
+
+    def __init__(self, client, analytics: 'CallAnalytics'):
+        self._wrapped = client  # _client は AsyncOpenAI の httpx クライアント名なので使わない
+        self.responses = _MeteredResponses(client.responses, analytics)
+        self.embeddings = _MeteredEmbeddings(client.embeddings, analytics)
+
+    def __getattr__(self, name: str):
+        return getattr(self._wrapped, name)
+
+
+class CallAnalytics:
+    """ターンの結果の収集と書き出し"""
+
+    def __init__(self, enabled: bool = CALL_ANALYTICS_ENABLED, stream=None):
+        self.enabled = enabled
+        self._stream = stream
+        self.emitted = 0
+
+    def meter_openai(self, client):
+        """トークン数を集計する OpenAI クライアント（無効ならそのまま返す）"""
+        if not self.enabled:
+            return client
+        return _MeteredOpenAI(client, self)
+
+    @contextmanager
+    def turn(self, event: Dict):
+        """AI Processing Lambda の呼び出しを1ターンとして記録する"""
+        if not self.enabled:
+            yield
+            return
+        outcome = TurnOutcome(event)
+        token = _current.set(outcome)
+        try:
+            yield
+        except Exception as e:
+            outcome.error = type(e).__name__
+            raise
+        finally:
+            stages = tracer.stage_durations()
+            _current.reset(token)
+            self._emit(outcome, stages)
+
+    def result(self, value):
+        """ハンドラの戻り値（status / action）を記録して返す"""
+        outcome = _current.get()
+        if outcome is not None and isinstance(value, dict):
+            outcome.fields['status'] = value.get('status')
+            outcome.fields['action'] = value.get('action')
+        return value
+
+    def set(self, **fields) -> None:
+        """経路・フラグなどを記録"""
+        outcome = _current.get()
+        if outcome is not None:
+            outcome.fields.update(fields)
+
+    def count(self, name: str, amount: int = 1) -> None:
+        """再試行などの回数を記録"""
+        outcome = _current.get()
+        if outcome is not None:
+            outcome.counts[name] = outcome.counts.get(name, 0) + amount
+
+    def add_usage(self, model: Optional[str], usage) -> None:
+        """Responses API の usage を記録"""
+        if usage is None:
+            return
+        details = getattr(usage, 'input_tokens_details', None)
+        self.add_tokens(model, input_tokens=getattr(usage, 'input_tokens', None),
+                        cached_tokens=getattr(details, 'cached_tokens', None),
+                        output_tokens=getattr(usage, 'output_tokens', None))
+
+    def add_tokens(self, model: Optional[str], input_tokens: int = None, cached_tokens: int = None,
+                   output_tokens: int = None) -> None:
+        outcome = _current.get()
+        if outcome is None:
+            return
+        outcome.usage.append({'model': model, 'input_tokens': input_tokens or 0, 'cached_tokens': cached_tokens or 0,
+                              'output_tokens': output_tokens or 0})
+
+    def audio_delivered(self) -> None:
+        """音声のある TwiML を発信者に届けた（最初の1回が first_audio_ms）"""
+        outcome = _current.get()
+        if outcome is not None and outcome.first_audio_ms is None:
+            outcome.first_audio_ms = outcome.since_received_ms()
+
+    def answer_delivered(self) -> None:
+        """このターンの最後の TwiML を届けた（転送の経路なら operator_ms も記録）"""
+        outcome = _current.get()
+        if outcome is None:
+            return
+        self.audio_delivered()
+        outcome.answer_ms = outcome.since_received_ms()
+        if outcome.fields.get('path') in OPERATOR_PATHS and outcome.operator_ms is None:
+            outcome.operator_ms = outcome.answer_ms
+
+    def _emit(self, outcome: TurnOutcome, stages: Dict[str, float]) -> None:
+        try:
+            line = json.dumps(outcome.record(stages), ensure_ascii=False, separators=(',', ':'), default=str)
+        except Exception as e:
+            logger.warning("Failed to build call analytics record", error=e)
+            return
+        (self._stream or sys.stdout).write(line + '\n')
+        self.emitted += 1
+
+
+call_analytics = CallAnalytics()
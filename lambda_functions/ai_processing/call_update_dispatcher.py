@@ -0,0 +1,270 @@
+"""
+Twilio 通話更新（calls.update）の非同期ディスパッチャ
+
+twilio ライブラリの同期クライアントをスレッドプールで呼ぶ代わりに、Calls リソースの REST API
+（POST /2010-04-01/Accounts/{AccountSid}/Calls/{CallSid}.json）を aiohttp で直接呼び出す。
+aiohttp は twilio ライブラリの依存として Layer に含まれている。
+
+- キープアライブ接続プール: ClientSession を呼び出し間で共有する
+- 同時実行数の上限と、トークンバケットによる秒間リクエスト数の上限（アカウントの REST 制限対策）
+- 429 / 5xx / 接続エラーは指数バックオフ（429 は Retry-After を優先）で再試行
+- 同じ CallSid の未送信の更新は最新のものだけを送る（置き換えられた呼び出しは SUPERSEDED を返す）
+
+ClientSession はイベントループに紐づくため、呼び出しごとに asyncio.run する場合は
+呼び出しの最後に aclose() する（常駐ループ event_loop_runtime で動かす場合は閉じずに再利用する）。
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+import aiohttp
+
+from call_analytics import call_analytics
+from voice_logger import get_logger
+
+CALL_DISPATCHER_ENABLED = os.environ.get('TWILIO_CALL_DISPATCHER_ENABLED', 'true').lower() == 'true'
+TWILIO_API_BASE_URL = os.environ.get('TWILIO_API_BASE_URL', 'https://api.twilio.com')
+MAX_CONCURRENCY = int(os.environ.get('TWILIO_UPDATE_MAX_CONCURRENCY', '10'))
+RATE_PER_SECOND = float(os.environ.get('TWILIO_UPDATE_RATE_PER_SECOND', '20'))
+MAX_ATTEMPTS = int(os.environ.get('TWILIO_UPDATE_MAX_ATTEMPTS', '4'))
+REQUEST_TIMEOUT_SECONDS = float(os.environ.get('TWILIO_UPDATE_TIMEOUT_SECONDS', '5'))
+
+# バックオフ（秒）: BACKOFF_BASE * 2^(試行回数-1) を上限 BACKOFF_MAX で切り、フルジッター
+BACKOFF_BASE = 0.2
+BACKOFF_MAX = 2.0
+
+SENT = 'sent'
+SUPERSEDED = 'superseded'
+
+logger = get_logger('call_update_dispatcher')
+
+
+class TwilioCallUpdateError(Exception):
+    """再試行しても成功しなかった、または再試行対象外のエラー応答"""
+
+    def __init__(self, status: int, body: str):
+        super().__init__(f"Twilio call update failed with HTTP {status}: {body[:200]}")
+        self.status = status
+        self.body = body
+
+
+def _is_retryable(status: int) -> bool:
+    return status == 429 or status >= 500
+
+
+def _retry_after_seconds(headers) -> Optional[float]:
+    value = headers.get('Retry-After')
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+def backoff_seconds(attempt: int, rng=random.random) -> float:
+    """attempt 回目の失敗後の待ち時間（フルジッター）"""
+    return rng() * min(BACKOFF_MAX, BACKOFF_BASE * (2 ** (attempt - 1)))
+
+
+class TokenBucket:
+    """秒間 rate 件・最大 burst 件のトークンバケット"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.burst
+        self._clock = clock
+        self._updated_at = clock()
+
+    async def acquire(self) -> None:
+        while True:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class _PendingUpdate:
+    __slots__ = ('twiml', 'future')
+
+    def __init__(self, twiml: str, future: asyncio.Future):
+        self.twiml = twiml
+        self.future = future
+
+
+class _CallSlot:
+    """CallSid ごとの送信待ちの更新（常に最新の1件だけ）と送信タスク"""
+    __slots__ = ('pending', 'worker')
+
+    def __init__(self):
+        self.pending: Optional[_PendingUpdate] = None
+        self.worker: Optional[asyncio.Task] = None
+
+
+class CallUpdateDispatcher:
+    """calls.update の非同期送信"""
+
+    def __init__(self, account_sid: str, auth_token: str, base_url: str = TWILIO_API_BASE_URL,
+                 max_concurrency: int = MAX_CONCURRENCY, rate_per_second: float = RATE_PER_SECOND,
+                 max_attempts: int = MAX_ATTEMPTS, timeout_seconds: float = REQUEST_TIMEOUT_SECONDS):
+        self.account_sid = account_sid
+        self._auth = aiohttp.BasicAuth(account_sid or '', auth_token or '')
+        self.base_url = base_url.rstrip('/')
+        self.max_concurrency = max_concurrency
+        self.rate_per_second = rate_per_second
+        self.max_attempts = max_attempts
+        self.timeout_seconds = timeout_seconds
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._bucket: Optional[TokenBucket] = None
+        self._slots: Dict[str, _CallSlot] = {}
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.retried = 0
+        self.rate_limited = 0
+        self.superseded = 0
+        self.failed = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+
+    def _call_url(self, call_sid: str) -> str:
+        return f"{self.base_url}/2010-04-01/Accounts/{self.account_sid}/Calls/{call_sid}.json"
+
+    def _bind_loop(self) -> None:
+        """実行中のイベントループ用のセッション・セマフォ・バケットを用意"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._session is not None and not self._session.closed:
+            return
+        if self._session is not None and not self._session.closed:
+            logger.warning("Dropping call update session bound to another event loop")
+        self._loop = loop
+        self._session = aiohttp.ClientSession(
+            auth=self._auth,
+            connector=aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=60),
+            timeout=aiohttp.ClientTimeout(total=self.timeout_seconds),
+            trace_configs=[self._connection_trace()]
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._bucket = TokenBucket(self.rate_per_second)
+        self._slots = {}
+
+    def _connection_trace(self) -> aiohttp.TraceConfig:
+        """新規接続とキープアライブ接続の再利用を数える"""
+        async def on_create(_session, _context, _params):
+            self._count('connections_created')
+
+        async def on_reuse(_session, _context, _params):
+            self._count('connections_reused')
+
+        trace = aiohttp.TraceConfig()
+        trace.on_connection_create_end.append(on_create)
+        trace.on_connection_reuseconn.append(on_reuse)
+        return trace
+
+    async def update(self, call_sid: str, twiml: str) -> str:
+        """
+        通話のTwiMLを差し替える
+
+        Returns:
+            SENT、または送信前に同じ CallSid の新しい更新に置き換えられた場合は SUPERSEDED
+        Raises:
+            TwilioCallUpdateError: 再試行対象外のエラー応答、または再試行の上限に達した場合
+            ConnectionError: 接続エラー・タイムアウトが再試行の上限まで続いた場合
+        """
+        self._bind_loop()
+        slot = self._slots.get(call_sid)
+        if slot is None:
+            slot = self._slots[call_sid] = _CallSlot()
+        if slot.pending is not None:
+            if not slot.pending.future.done():
+                slot.pending.future.set_result(SUPERSEDED)
+            self._count('superseded')
+            logger.info("Superseded pending call update")
+        future = self._loop.create_future()
+        slot.pending = _PendingUpdate(twiml, future)
+        if slot.worker is None or slot.worker.done():
+            slot.worker = asyncio.ensure_future(self._drain(call_sid, slot))
+        return await future
+
+    async def _drain(self, call_sid: str, slot: _CallSlot) -> None:
+        """送信待ちがなくなるまで最新の更新を1件ずつ送る（同じ通話への更新は直列）"""
+        try:
+            while slot.pending is not None:
+                update, slot.pending = slot.pending, None
+                try:
+                    await self._send(call_sid, update.twiml)
+                except Exception as e:
+                    if not update.future.done():
+                        update.future.set_exception(e)
+                else:
+                    if not update.future.done():
+                        update.future.set_result(SENT)
+        finally:
+            if self._slots.get(call_sid) is slot and slot.pending is None:
+                del self._slots[call_sid]
+
+    async def _send(self, call_sid: str, twiml: str) -> None:
+        url = self._call_url(call_sid)
+        for attempt in range(1, self.max_attempts + 1):
+            retry_after = None
+            async with self._semaphore:
+                await self._bucket.acquire()
+                try:
+                    async with self._session.post(url, data={'Twiml': twiml}) as response:
+                        if response.status < 400:
+                            await response.read()
+                            self._count('sent')
+                            logger.info("Twilio call update completed", attempt=attempt)
+                            return
+                        body = await response.text()
+                        if response.status == 429:
+                            self._count('rate_limited')
+                            retry_after = _retry_after_seconds(response.headers)
+                        if not _is_retryable(response.status) or attempt == self.max_attempts:
+                            self._count('failed')
+                            raise TwilioCallUpdateError(response.status, body)
+                        logger.warning("Retrying Twilio call update", status=response.status, attempt=attempt)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    if attempt == self.max_attempts:
+                        self._count('failed')
+                        raise ConnectionError(f"Twilio call update failed: {e!r}") from e
+                    logger.warning("Retrying Twilio call update after connection error", error=e, attempt=attempt)
+            self._count('retried')
+            call_analytics.count('twilio_update_retries')
+            await asyncio.sleep(retry_after if retry_after is not None else backoff_seconds(attempt))
+
+    def _count(self, field: str) -> None:
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    async def aclose(self) -> None:
+        """接続プールを閉じる（イベントループを閉じる前に呼ぶ）"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._loop = None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'sent': self.sent,
+                'retried': self.retried,
+                'rate_limited': self.rate_limited,
+                'superseded': self.superseded,
+                'failed': self.failed,
+                'connections_created': self.connections_created,
+                'connections_reused': self.connections_reused
+            }
+
+
+def create_call_dispatcher() -> Optional[CallUpdateDispatcher]:
+    """環境変数からディスパッチャを生成（無効化されていればNone、twilio_client の executor 経由で送る）"""
+    if not CALL_DISPATCHER_ENABLED:
+        return None
+    return CallUpdateDispatcher(os.environ.get('TWILIO_ACCOUNT_SID'), os.environ.get('TWILIO_AUTH_TOKEN'))
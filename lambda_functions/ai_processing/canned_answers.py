@@ -0,0 +1,104 @@
+"""
+縮退モード用の定型回答（よくある質問）
+
+回答生成のサーキットブレーカーが開いている間、OpenAI を呼ばずに返せる回答。
+CANNED_ANSWERS_PATH の JSON を初回だけ読み込む（ファイルが無ければ定型回答なしでオペレーター案内になる）。
+
+    {
+      "ja-JP": [
+        {"questions": ["チェックアウトは何時ですか"], "keywords": ["チェックアウト"], "answer": "..."}
+      ],
+      "en-US": [...]
+    }
+
+- questions のどれかとの類似度（answer_cache.normalize_query で正規化した文字列の difflib 比）が
+  MATCH_THRESHOLD 以上、または keywords がすべて質問に含まれていれば一致とする
+- 回答はすべてのゲストに同じ内容を返すため、ゲスト固有の値（部屋番号・暗証番号など）を含めない
+"""
+import difflib
+import json
+import os
+import threading
+from typing import Dict, List, Optional
+
+from answer_cache import normalize_query
+from voice_logger import get_logger
+
+CANNED_ANSWERS_PATH = os.environ.get(
+    'CANNED_ANSWERS_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'canned_answers.json')
+)
+MATCH_THRESHOLD = float(os.environ.get('CANNED_ANSWER_MATCH_THRESHOLD', '0.75'))
+
+logger = get_logger('canned_answers')
+
+
+class CannedAnswers:
+    """言語ごとの定型回答と質問の照合"""
+
+    def __init__(self, entries_by_language: Dict[str, List[Dict]], threshold: float = MATCH_THRESHOLD):
+        self.threshold = threshold
+        self._entries = {
+            language: [
+                {
+                    'questions': [normalize_query(question) for question in entry.get('questions', [])],
+                    'keywords': [normalize_query(keyword) for keyword in entry.get('keywords', [])],
+                    'answer': entry['answer'],
+                }
+                for entry in entries
+            ]
+            for language, entries in entries_by_language.items()
+        }
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._entries.values())
+
+    def _score(self, query: str, entry: Dict) -> float:
+        if entry['keywords'] and all(keyword in query for keyword in entry['keywords']):
+            return 1.0
+        return max((difflib.SequenceMatcher(None, query, question).ratio() for question in entry['questions']),
+                   default=0.0)
+
+    def match(self, query_text: str, language: str) -> Optional[str]:
+        """質問に一致する定型回答（なければNone）"""
+        query = normalize_query(query_text)
+        best_score, best_answer = 0.0, None
+        for entry in self._entries.get(language, []) if query else []:
+            score = self._score(query, entry)
+            if score > best_score:
+                best_score, best_answer = score, entry['answer']
+        answer = best_answer if best_score >= self.threshold else None
+        with self._lock:
+            if answer:
+                self.hits += 1
+            else:
+                self.misses += 1
+        logger.info("Canned answer lookup", matched=answer is not None, score=round(best_score, 3))
+        return answer
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'entries': len(self), 'hits': self.hits, 'misses': self.misses}
+
+
+_canned: Optional[CannedAnswers] = None
+_canned_lock = threading.Lock()
+
+
+def get_canned_answers(path: str = None) -> CannedAnswers:
+    """コンテナ内で共有する定型回答を返す（初回だけ読み込み、読めなければ空）"""
+    global _canned
+    if _canned is not None:
+        return _canned
+    with _canned_lock:
+        if _canned is None:
+            try:
+                with open(path or CANNED_ANSWERS_PATH, encoding='utf-8') as f:
+                    _canned = CannedAnswers(json.load(f))
+                logger.info("Canned answers loaded", path=path or CANNED_ANSWERS_PATH, entries=len(_canned))
+            except (OSError, ValueError, KeyError, AttributeError) as e:
+                _canned = CannedAnswers({})
+                logger.warning("Canned answers unavailable", path=path or CANNED_ANSWERS_PATH, error=e)
+    return _canned
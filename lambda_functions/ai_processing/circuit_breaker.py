@@ -0,0 +1,237 @@
+"""
+OpenAI 呼び出しのサーキットブレーカー（コンテナ単位）
+
+OpenAI が障害・高遅延の間も、各通話は分類・回答生成のリクエストを最後まで待ってからエラーで切断していた。
+呼び出し箇所（'classify' / 'answer'）ごとに直近 WINDOW_SECONDS の結果を数え、
+
+- closed: 通常どおり呼び出す。呼び出しが MIN_CALLS 件以上あり、失敗率が FAILURE_RATE_THRESHOLD 以上
+  または遅延（slow_call_ms 以上）率が SLOW_RATE_THRESHOLD 以上になったら open にする。
+  障害の直前に成功が続いていても早く開くよう、失敗・遅延が CONSECUTIVE_FAILURES 回続いた場合も open にする
+- open: 呼び出さずに CircuitOpenError を送出する（呼び出し側が縮退応答を返す）。OPEN_SECONDS 後に half_open にする
+- half_open: HALF_OPEN_PROBES 本まで試験的に呼び出し、CLOSE_AFTER_SUCCESSES 回続けて成功したら closed に戻す。
+  失敗・遅延なら再び open にする
+
+失敗として数えるのは接続エラー・タイムアウト・レート制限・5xx のみ（リクエストの誤りによる 4xx は数えない）。
+応答期限やヘッジでキャンセルされた呼び出しは、slow_call_ms を超えていれば遅延として数える。
+状態の遷移はログに出し、遷移回数と拒否数を stats() で集計する。
+
+CIRCUIT_BREAKER_ENABLED=true で有効になる。効果は tools/simulate_circuit_breaker.py で確認できる。
+"""
+import os
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict
+
+import openai
+
+from voice_logger import get_logger
+
+CIRCUIT_BREAKER_ENABLED = os.environ.get('CIRCUIT_BREAKER_ENABLED', 'false').lower() == 'true'
+FAILURE_RATE_THRESHOLD = float(os.environ.get('CIRCUIT_FAILURE_RATE', '0.5'))
+SLOW_RATE_THRESHOLD = float(os.environ.get('CIRCUIT_SLOW_RATE', '0.5'))
+MIN_CALLS = int(os.environ.get('CIRCUIT_MIN_CALLS', '4'))
+# Lambda のコンテナは1度に1通話しか処理しないため、障害中（1通話10秒以上）でも MIN_CALLS に届く長さにする
+WINDOW_SECONDS = float(os.environ.get('CIRCUIT_WINDOW_SECONDS', '180'))
+OPEN_SECONDS = float(os.environ.get('CIRCUIT_OPEN_SECONDS', '30'))
+CONSECUTIVE_FAILURES = int(os.environ.get('CIRCUIT_CONSECUTIVE_FAILURES', '3'))
+HALF_OPEN_PROBES = 1
+CLOSE_AFTER_SUCCESSES = 2
+# 呼び出し箇所ごとの「遅い」とみなすレイテンシ
+SLOW_CALL_MS = {
+    'classify': float(os.environ.get('CIRCUIT_SLOW_CLASSIFY_MS', '4000')),
+    'answer': float(os.environ.get('CIRCUIT_SLOW_ANSWER_MS', '15000')),
+}
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+logger = get_logger('circuit_breaker')
+
+
+class CircuitOpenError(Exception):
+    """ブレーカーが開いているため呼び出さなかった"""
+
+    def __init__(self, name: str):
+        super().__init__(f"circuit '{name}' is open")
+        self.name = name
+
+
+SERVICE_FAILURES = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+
+def is_service_failure(error: Exception) -> bool:
+    """OpenAI 側の障害とみなす例外か"""
+    return isinstance(error, SERVICE_FAILURES)
+
+
+def degradable_errors() -> tuple:
+    """
+    縮退応答に切り替える例外（except 節で使う）
+
+    ブレーカーが有効なら、開いている場合に加えて OpenAI 側の障害で失敗した呼び出しも縮退応答にする
+    （half_open の試験呼び出しや開く直前の呼び出しで発信者を切断しない）。
+    """
+    return (CircuitOpenError, *SERVICE_FAILURES) if CIRCUIT_BREAKER_ENABLED else (CircuitOpenError,)
+
+
+class CircuitBreaker:
+    """1つの呼び出し箇所のブレーカー"""
+
+    def __init__(self, name: str, slow_call_ms: float, failure_rate: float = FAILURE_RATE_THRESHOLD,
+                 slow_rate: float = SLOW_RATE_THRESHOLD, min_calls: int = MIN_CALLS,
+                 consecutive_failures: int = CONSECUTIVE_FAILURES,
+                 window_seconds: float = WINDOW_SECONDS, open_seconds: float = OPEN_SECONDS,
+                 half_open_probes: int = HALF_OPEN_PROBES, close_after_successes: int = CLOSE_AFTER_SUCCESSES,
+                 is_failure: Callable[[Exception], bool] = is_service_failure, clock=time.monotonic):
+        self.name = name
+        self.slow_call_ms = slow_call_ms
+        self.failure_rate = failure_rate
+        self.slow_rate = slow_rate
+        self.min_calls = min_calls
+        self.consecutive_failures = consecutive_failures
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.close_after_successes = close_after_successes
+        self._is_failure = is_failure
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._outcomes = deque()    # (時刻, 失敗か, 遅延か)
+        self._failure_streak = 0
+        self.state = CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self.rejected = 0
+        self.transitions: Dict[str, int] = {}
+
+    def _transition(self, state: str, now: float, **details) -> None:
+        """ロック内で呼ぶ"""
+        key = f"{self.state}->{state}"
+        self.transitions[key] = self.transitions.get(key, 0) + 1
+        logger.info("Circuit breaker state change", breaker=self.name, from_state=self.state, to_state=state,
+                    **details)
+        self.state = state
+        if state == OPEN:
+            self._opened_at = now
+        elif state == HALF_OPEN:
+            self._probes_in_flight = 0
+            self._probe_successes = 0
+        else:
+            self._outcomes.clear()
+        self._failure_streak = 0
+
+    def _acquire(self) -> bool:
+        """呼び出してよければ True（half_open の試験呼び出しなら probe として数える）"""
+        with self._lock:
+            now = self._clock()
+            if self.state == OPEN and now - self._opened_at >= self.open_seconds:
+                self._transition(HALF_OPEN, now)
+            if self.state == CLOSED:
+                return False
+            if self.state == HALF_OPEN and self._probes_in_flight < self.half_open_probes:
+                self._probes_in_flight += 1
+                return True
+            self.rejected += 1
+            raise CircuitOpenError(self.name)
+
+    def reject_if_open(self) -> None:
+        """
+        開いていれば CircuitOpenError を送出する（前処理の OpenAI 呼び出しも省くために先に確認する）
+
+        OPEN_SECONDS を過ぎていれば送出せず、続く call() を half_open の試験呼び出しにする。
+        """
+        with self._lock:
+            if self.state == OPEN and self._clock() - self._opened_at < self.open_seconds:
+                self.rejected += 1
+                raise CircuitOpenError(self.name)
+
+    def _rates(self, now: float) -> tuple:
+        while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+            self._outcomes.popleft()
+        calls = len(self._outcomes)
+        if not calls:
+            return 0, 0.0, 0.0
+        return (calls, sum(failed for _, failed, _ in self._outcomes) / calls,
+                sum(slow for _, _, slow in self._outcomes) / calls)
+
+    def _record(self, probe: bool, failed: bool, slow: bool, completed: bool) -> None:
+        with self._lock:
+            now = self._clock()
+            if probe:
+                self._probes_in_flight -= 1
+                if self.state != HALF_OPEN:
+                    return
+                if failed or slow:
+                    self._transition(OPEN, now, probe_failed=failed, probe_slow=slow)
+                elif completed:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.close_after_successes:
+                        self._transition(CLOSED, now)
+                return
+            if self.state != CLOSED or not (completed or slow):
+                return
+            self._outcomes.append((now, failed, slow))
+            self._failure_streak = self._failure_streak + 1 if failed or slow else 0
+            calls, failure_rate, slow_rate = self._rates(now)
+            if (self._failure_streak >= self.consecutive_failures or
+                    calls >= self.min_calls and (failure_rate >= self.failure_rate or slow_rate >= self.slow_rate)):
+                self._transition(OPEN, now, calls=calls, failure_rate=round(failure_rate, 3),
+                                 slow_rate=round(slow_rate, 3), failure_streak=self._failure_streak)
+
+    async def call(self, make_request: Callable[[], Awaitable]):
+        """
+        make_request() の結果を返す
+
+        Raises:
+            CircuitOpenError: ブレーカーが開いている（make_request は呼ばない）
+        """
+        probe = self._acquire()
+        started = self._clock()
+        failed = completed = False
+        try:
+            result = await make_request()
+            completed = True
+            return result
+        except Exception as e:
+            failed = self._is_failure(e)
+            completed = True
+            raise
+        finally:
+            # キャンセル（completed=False）は遅延していた場合だけ数える
+            slow = (self._clock() - started) * 1000 >= self.slow_call_ms
+            self._record(probe, failed, slow and not failed, completed)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            calls, failure_rate, slow_rate = self._rates(self._clock())
+            return {
+                'state': self.state,
+                'calls_in_window': calls,
+                'failure_rate': round(failure_rate, 3),
+                'slow_rate': round(slow_rate, 3),
+                'rejected': self.rejected,
+                'transitions': dict(self.transitions),
+            }
+
+
+circuit_breakers = {name: CircuitBreaker(name, slow_call_ms) for name, slow_call_ms in SLOW_CALL_MS.items()}
+
+
+async def guarded_request(name: str, make_request: Callable[[], Awaitable]):
+    """CIRCUIT_BREAKER_ENABLED なら name のブレーカー経由、無効ならそのまま make_request() を待つ"""
+    if not CIRCUIT_BREAKER_ENABLED:
+        return await make_request()
+    return await circuit_breakers[name].call(make_request)
+
+
+def check_circuit(name: str) -> None:
+    """CIRCUIT_BREAKER_ENABLED で name のブレーカーが開いていれば CircuitOpenError を送出する"""
+    if CIRCUIT_BREAKER_ENABLED:
+        circuit_breakers[name].reject_if_open()
+
+
+def circuit_stats() -> Dict:
+    return {name: breaker.stats() for name, breaker in circuit_breakers.items()}
@@ -1,10 +1,21 @@
 import openai
 import json
+import time
 from typing import Optional
+from voice_logger import get_logger
+from urgency_rules import URGENCY_PRERULES_ENABLED, pre_classify
+from model_routing import MODEL_ROUTING_ENABLED, model_router
+from request_hedging import hedged_request
+from circuit_breaker import CircuitOpenError, degradable_errors, guarded_request
+
+logger = get_logger('classification_service')
 
 # 有効な緊急度の値
 VALID_URGENCY_VALUES = frozenset(["urgent", "general", "operator_request", "unknown"])
 
+# ルーティング無効時の分類の設定
+DEFAULT_CLASSIFICATION_SETTINGS = {'model': 'gpt-5.4-mini', 'reasoning_effort': 'minimal', 'verbosity': 'low'}
+
 # JSON Schema for Structured Outputs
 urgency_classification_schema = {
     "type": "object",
@@ -63,12 +74,12 @@ def _parse_urgency_result(text: str) -> dict:
     urgency = result.get("urgency")
     reasoning = result.get("reasoning", "N/A")
     
-    print(f"分類結果: urgency='{urgency}', reasoning='{reasoning}'")
+    logger.info("分類結果", urgency=urgency, reasoning=reasoning)
     
     if urgency in VALID_URGENCY_VALUES:
         return {"urgency": urgency}
     
-    print(f"予期しない緊急度の値: {urgency}")
+    logger.warning("予期しない緊急度の値", urgency=urgency)
     return {"urgency": "unknown"}
 
 
@@ -83,32 +94,44 @@ def _handle_api_status_error(e: openai.APIStatusError) -> dict:
     except Exception as ex_detail:
         error_details = f"エラー詳細の取得中に別のエラーが発生: {ex_detail}"
         
-    print(f"OpenAI APIがエラーを返しました (ステータスコード: {e.status_code}): {e.response}")
-    print(f"エラー詳細:\n{error_details}")
+    logger.error("OpenAI APIがエラーを返しました", status_code=e.status_code, details=error_details)
     return {"urgency": "error"}
 
 
 async def classify_message_urgency(
     openai_async_client: openai.AsyncOpenAI,
-    user_message: str
+    user_message: str,
+    language: str = 'en-US'
 ) -> dict:
     """
     OpenAIを使用してユーザーのメッセージの緊急度を分類（初回ターンのみ実行）
+    明白な urgent / operator_request はルールベースのプレ分類で即座に返す
+    MODEL_ROUTING_ENABLED=true なら発話の長さで分類に使うモデルを選ぶ（model_routing）
+    サーキットブレーカーが開いている間は OpenAI を呼ばずに general（degraded=True）を返す
+    （ブレーカーが有効なら OpenAI 側の障害で失敗した場合も同じ）
     
     Args:
         openai_async_client: OpenAI非同期クライアント
         user_message: 分類するメッセージ
+        language: 通話の言語コード（ルーティングの手がかり）
     
     Returns:
         {
             'urgency': str ("urgent", "general", "operator_request", "unknown", "error")
         }
     """
+    # 明白な緊急・オペレーター希望はLLMを待たずに即判定
+    if URGENCY_PRERULES_ENABLED:
+        rule_result = pre_classify(user_message)
+        if rule_result:
+            logger.info("ルールで分類", urgency=rule_result['urgency'], matched=rule_result['matched'])
+            return {"urgency": rule_result['urgency']}
+
     if not openai_async_client:
-        print("Error: classify_message_urgency - OpenAI async client not provided.")
+        logger.error("classify_message_urgency - OpenAI async client not provided.")
         return {"urgency": "error", "response_id": None}
 
-    print(f"メッセージの緊急度を分類中: '{user_message}'")
+    logger.debug("メッセージの緊急度を分類中", user_message=user_message)
 
     system_instructions = """あなたはOsaka Bay Wheelというホテルのユーザーからの問い合わせを分類するアシスタントです。
 ユーザーの最初のメッセージを以下の4つのカテゴリに分類してください。
@@ -143,15 +166,18 @@ async def classify_message_urgency(
   "reasoning": "判断理由を簡潔に（日本語）"
 }
 """
-    try:
-        response = await openai_async_client.responses.create(
-            model="gpt-5.4-mini",
+    route = model_router.route_classification(user_message, language) if MODEL_ROUTING_ENABLED else None
+    settings = route.settings if route else DEFAULT_CLASSIFICATION_SETTINGS
+
+    def create_response():
+        return openai_async_client.responses.create(
+            model=settings['model'],
             instructions=system_instructions,
             input=[
                 {"role": "user", "content": user_message}
             ],
             reasoning={
-                "effort": "minimal"
+                "effort": settings['reasoning_effort']
             },
             text={
                 "format": {
@@ -160,26 +186,43 @@ async def classify_message_urgency(
                     "schema": urgency_classification_schema,
                     "strict": True
                 },
-                "verbosity": "low"
+                "verbosity": settings['verbosity']
             }
         )
 
+    started_at = time.monotonic()
+    try:
+        try:
+            response = await guarded_request('classify', lambda: hedged_request('classify', create_response))
+        except CircuitOpenError:
+            raise
+        except Exception:
+            if route:
+                model_router.record(route, (time.monotonic() - started_at) * 1000, error=True)
+            raise
+        if route:
+            model_router.record(route, (time.monotonic() - started_at) * 1000, response)
+
         # レスポンスからテキストを抽出
         text = _extract_text_from_response(response)
         if text:
             return _parse_urgency_result(text)
         
-        print("テキスト出力が見つかりませんでした")
+        logger.warning("テキスト出力が見つかりませんでした")
         return {"urgency": "unknown"}
 
+    except degradable_errors() as e:
+        # 回答生成側で定型回答またはオペレーター案内になる（明白な緊急はプレ分類ルールで判定済み）
+        logger.warning("OpenAI を利用できないため一般の問い合わせとして扱います", error=e)
+        return {"urgency": "general", "degraded": True}
     except openai.APIConnectionError as e:
-        print(f"OpenAI APIへの接続に失敗しました: {e}")
+        logger.error("OpenAI APIへの接続に失敗しました", error=e)
         return {"urgency": "error"}
     except openai.RateLimitError as e:
-        print(f"OpenAI APIのレート制限に達しました: {e}")
+        logger.error("OpenAI APIのレート制限に達しました", error=e)
         return {"urgency": "error"}
     except openai.APIStatusError as e:
         return _handle_api_status_error(e)
     except Exception as e:
-        print(f"OpenAI分類中に予期せぬエラーが発生しました: {e}")
+        logger.error("OpenAI分類中に予期せぬエラーが発生しました", error=e)
         return {"urgency": "error"}
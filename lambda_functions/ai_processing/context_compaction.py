@@ -0,0 +1,313 @@
+"""
+長い通話の会話コンテキストの圧縮
+
+継続ターンは previous_response_id で会話をつなぎ続けるため、過去の質問・回答・file_search の
+検索結果がすべて毎ターンの入力として再処理・再課金され、質問を重ねるほど応答が遅くなる。
+チェーンのターン数か直前ターンの入力トークン数が上限に達したら、
+「これまでの会話の要約 + 直前のやり取り + 今回の質問」を入力として新しいチェーンを始める。
+
+- 新しいチェーンのレスポンスIDは通常のターンと同じように返すため、Gather のアクションURL
+  （セッショントークン）が運ぶ通話状態の形は変わらない
+- 要約は応答の経路に入れない。上限に達したターンの回答を記録した時点で要約の生成をバックグラウンドで始め、
+  回答を届けた後に drain() で完了を待つ（Lambda の凍結前）。次のターンは用意済みの要約で新しいチェーンを始める
+- チェーンの状態（ターン数・入力トークン数・直前のやり取り・要約）はコンテナ内に保持し、
+  別のコンテナに来た場合は responses.retrieve とリクエストの metadata から復元する
+  （要約はコンテナ内にしかないため、そのターンはチェーンを続け、その回答の記録後に要約を作る）
+- 要約の生成や状態の取得に失敗した場合は圧縮せずに従来どおりチェーンを続ける
+- ターンごとの入力トークン数とレイテンシをログに出し、圧縮前（一度も圧縮していないチェーン）と
+  圧縮後のターンに分けて stats() で集計する
+
+CONTEXT_COMPACTION_ENABLED=true で有効になる。
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import openai
+from voice_logger import get_logger
+
+CONTEXT_COMPACTION_ENABLED = os.environ.get('CONTEXT_COMPACTION_ENABLED', 'false').lower() == 'true'
+MAX_TURNS = int(os.environ.get('CONTEXT_COMPACTION_MAX_TURNS', '6'))
+MAX_INPUT_TOKENS = int(os.environ.get('CONTEXT_COMPACTION_MAX_INPUT_TOKENS', '8000'))
+CHAIN_CACHE_SIZE = 512
+SUMMARY_MODEL = "gpt-5-mini"
+SUMMARY_MAX_OUTPUT_TOKENS = 600
+SUMMARY_TIMEOUT_SECONDS = 10.0
+# Lambda のタイムアウトまでに残す時間（drain が呼び出しのタイムアウト→非同期呼び出しの再試行を起こさないように）
+DRAIN_SAFETY_MARGIN_MS = 3000
+
+SUMMARY_INSTRUCTIONS = """
+あなたは民泊の電話応答の会話記録を引き継ぎ用に要約する担当です。
+次の回答に必要な情報だけを、箇条書きで最大8行にまとめてください：
+- ゲストがこれまでに尋ねたことと、案内した回答の要点（時刻・場所・手順などの事実）
+- 未解決の事項、ゲストの状況や希望
+検索結果の原文や挨拶は含めないでください。JSONではなく平文で書いてください。
+"""
+SUMMARY_REQUEST = "ここまでの会話を要約してください。"
+SUMMARY_HEADER = "これまでの通話の要約（このあとに直前のやり取りが続きます）:\n"
+
+logger = get_logger('context_compaction')
+
+
+class ChainPlan:
+    """今回のターンの送り方（チェーンを続けるか、圧縮した文脈で新しいチェーンを始めるか）"""
+
+    def __init__(self, turn: int, compactions: int, previous_response_id: Optional[str],
+                 context_items: Optional[List[Dict]] = None, compaction_ms: float = 0.0):
+        self.turn = turn
+        self.compactions = compactions
+        self.previous_response_id = previous_response_id
+        self.context_items = context_items or []
+        self.compaction_ms = compaction_ms
+
+    @property
+    def compacted(self) -> bool:
+        return bool(self.context_items)
+
+    def metadata(self) -> Dict[str, str]:
+        """レスポンスに付けて保存するチェーン情報（別コンテナでの復元用）"""
+        return {'chain_turn': str(self.turn), 'compactions': str(self.compactions)}
+
+
+def _usage_tokens(response) -> tuple[Optional[int], Optional[int]]:
+    """レスポンスの入力トークン数とそのうちキャッシュされたトークン数"""
+    usage = getattr(response, 'usage', None)
+    input_tokens = getattr(usage, 'input_tokens', None)
+    details = getattr(usage, 'input_tokens_details', None)
+    return input_tokens, getattr(details, 'cached_tokens', None)
+
+
+def _answer_text(response) -> str:
+    """保存済みレスポンスの出力JSONから回答テキストを取り出す（取れなければ出力テキストそのもの）"""
+    text = getattr(response, 'output_text', '') or ''
+    try:
+        return json.loads(text).get('assistant_response_text', text)
+    except (json.JSONDecodeError, AttributeError):
+        return text
+
+
+def _input_text(item) -> str:
+    content = getattr(item, 'content', None)
+    if isinstance(content, str):
+        return content
+    return ''.join(getattr(part, 'text', '') or '' for part in content or [])
+
+
+class ConversationCompactor:
+    """チェーンの状態を追跡し、上限に達したチェーンを要約に置き換える"""
+
+    def __init__(self, max_turns: int = MAX_TURNS, max_input_tokens: int = MAX_INPUT_TOKENS,
+                 max_chains: int = CHAIN_CACHE_SIZE, clock=time.monotonic):
+        self.max_turns = max_turns
+        self.max_input_tokens = max_input_tokens
+        self.max_chains = max_chains
+        self._clock = clock
+        self._chains: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pending = set()
+        self.compactions = 0
+        self.compactions_deferred = 0
+        self.compaction_failures = 0
+        self.compaction_ms = 0.0
+        self.summary_ms = 0.0
+        self.chain_lookups = 0
+        self.chain_restores = 0
+        self._phases = {phase: {'turns': 0, 'input_tokens': 0, 'latency_ms': 0.0} for phase in ('before', 'after')}
+
+    def _remember(self, response_id: str, state: Dict) -> None:
+        with self._lock:
+            self._chains[response_id] = state
+            self._chains.move_to_end(response_id)
+            while len(self._chains) > self.max_chains:
+                self._chains.popitem(last=False)
+
+    async def _restore(self, client: openai.AsyncOpenAI, response_id: str) -> Optional[Dict]:
+        """別のコンテナで作られたチェーンの状態を保存済みレスポンスから復元"""
+        try:
+            response = await client.responses.retrieve(response_id)
+        except openai.APIError as e:
+            logger.warning("Could not retrieve previous response for compaction", error=e)
+            return None
+        metadata = getattr(response, 'metadata', None) or {}
+        input_tokens, _ = _usage_tokens(response)
+        with self._lock:
+            self.chain_restores += 1
+        return {
+            'turn': int(metadata.get('chain_turn', '1')),
+            'compactions': int(metadata.get('compactions', '0')),
+            'input_tokens': input_tokens or 0,
+            'question': None,
+            'answer': _answer_text(response)
+        }
+
+    async def _last_question(self, client: openai.AsyncOpenAI, response_id: str) -> Optional[str]:
+        """チェーンの最後のユーザー発話（コンテナ内に無いときだけ取得する）"""
+        try:
+            items = await client.responses.input_items.list(response_id, order='desc', limit=1)
+        except openai.APIError as e:
+            logger.warning("Could not list input items for compaction", error=e)
+            return None
+        for item in getattr(items, 'data', None) or []:
+            if getattr(item, 'role', None) == 'user':
+                return _input_text(item)
+        return None
+
+    def _needs_compaction(self, state: Dict) -> bool:
+        return state['turn'] >= self.max_turns or state['input_tokens'] >= self.max_input_tokens
+
+    async def plan(self, client: openai.AsyncOpenAI, previous_response_id: Optional[str]) -> ChainPlan:
+        """今回のターンをどう送るかを決める（要約が用意済みなら新しいチェーンの文脈を作る）"""
+        if not previous_response_id:
+            return ChainPlan(1, 0, None)
+
+        with self._lock:
+            self.chain_lookups += 1
+            state = self._chains.get(previous_response_id)
+        if state is None:
+            state = await self._restore(client, previous_response_id)
+        if state is None:
+            return ChainPlan(1, 0, previous_response_id)
+        if not self._needs_compaction(state):
+            return ChainPlan(state['turn'] + 1, state['compactions'], previous_response_id)
+        if not state.get('summary'):
+            # 要約の生成を待って無音を伸ばすより、今回はチェーンを続ける（記録時に要約を作る）
+            with self._lock:
+                self.compactions_deferred += 1
+            logger.info("Conversation summary not ready; continuing the chain", previous_turns=state['turn'])
+            return ChainPlan(state['turn'] + 1, state['compactions'], previous_response_id)
+
+        started = self._clock()
+        context_items = await self._context_items(client, previous_response_id, state)
+        elapsed_ms = (self._clock() - started) * 1000
+        with self._lock:
+            self.compactions += 1
+            self.compaction_ms += elapsed_ms
+        logger.info("Compacted conversation", previous_turns=state['turn'],
+                    previous_input_tokens=state['input_tokens'], compaction_ms=round(elapsed_ms, 1))
+        return ChainPlan(1, state['compactions'] + 1, None, context_items, elapsed_ms)
+
+    async def _summarize(self, client: openai.AsyncOpenAI, response_id: str, state: Dict) -> None:
+        """チェーンの要約を生成して状態に保存する（回答の経路の外で実行する）"""
+        started = self._clock()
+        try:
+            summary_response = await client.responses.create(
+                model=SUMMARY_MODEL,
+                previous_response_id=response_id,
+                instructions=SUMMARY_INSTRUCTIONS,
+                input=[{"role": "user", "content": SUMMARY_REQUEST}],
+                reasoning={"effort": "minimal"},
+                text={"verbosity": "low"},
+                max_output_tokens=SUMMARY_MAX_OUTPUT_TOKENS,
+                store=False
+            )
+        except openai.APIError as e:
+            logger.warning("Conversation summary failed; continuing the chain", error=e)
+            with self._lock:
+                self.compaction_failures += 1
+            return
+        summary = (getattr(summary_response, 'output_text', '') or '').strip()
+        if not summary:
+            logger.warning("Conversation summary was empty; continuing the chain")
+            with self._lock:
+                self.compaction_failures += 1
+            return
+        elapsed_ms = (self._clock() - started) * 1000
+        state['summary'] = summary
+        with self._lock:
+            self.summary_ms += elapsed_ms
+        logger.info("Prepared conversation summary", response_id=response_id, summary_ms=round(elapsed_ms, 1))
+
+    async def drain(self, context=None, timeout: float = SUMMARY_TIMEOUT_SECONDS) -> None:
+        """
+        バックグラウンドの要約の完了を待つ（回答を届けた後、呼び出しの終了前に呼ぶ）
+
+        Lambda の context があれば、待つ時間を残り時間から DRAIN_SAFETY_MARGIN_MS を引いた分までに抑える。
+        間に合わない要約はキャンセルし、次のターンはチェーンをそのまま続ける。
+        """
+        pending = list(self._pending)
+        if not pending:
+            return
+        if context is not None:
+            remaining_ms = context.get_remaining_time_in_millis() - DRAIN_SAFETY_MARGIN_MS
+            timeout = max(0.0, min(timeout, remaining_ms / 1000))
+        _, not_done = await asyncio.wait(pending, timeout=timeout)
+        for task in not_done:
+            task.cancel()
+        if not_done:
+            await asyncio.gather(*not_done, return_exceptions=True)
+            with self._lock:
+                self.compaction_failures += len(not_done)
+            logger.warning("Conversation summary timed out; continuing the chain", count=len(not_done))
+
+    async def _context_items(self, client: openai.AsyncOpenAI, previous_response_id: str,
+                             state: Dict) -> List[Dict]:
+        """要約 + 直前のやり取りの入力アイテム"""
+        question = state.get('question') or await self._last_question(client, previous_response_id)
+        items = [{"role": "developer", "content": SUMMARY_HEADER + state['summary']}]
+        if question:
+            items.append({"role": "user", "content": question})
+        if state.get('answer'):
+            items.append({"role": "assistant", "content": state['answer']})
+        return items
+
+    def record(self, plan: ChainPlan, response, question: str, answer: str, latency_ms: float,
+               client: Optional[openai.AsyncOpenAI] = None) -> None:
+        """ターンの結果を記録し、入力トークン数とレイテンシをログに出す
+
+        次のターンで圧縮が必要になるチェーンで client があれば、要約の生成をバックグラウンドで始める。
+        """
+        response_id = getattr(response, 'id', None)
+        input_tokens, cached_tokens = _usage_tokens(response)
+        phase = 'after' if plan.compactions else 'before'
+        with self._lock:
+            totals = self._phases[phase]
+            totals['turns'] += 1
+            totals['input_tokens'] += input_tokens or 0
+            totals['latency_ms'] += latency_ms
+        logger.info("Conversation turn", chain_turn=plan.turn, compactions=plan.compactions,
+                    compacted=plan.compacted, input_tokens=input_tokens, cached_tokens=cached_tokens,
+                    latency_ms=round(latency_ms, 1), compaction_ms=round(plan.compaction_ms, 1), totals=self.stats)
+        if not response_id:
+            return
+        state = {
+            'turn': plan.turn,
+            'compactions': plan.compactions,
+            'input_tokens': input_tokens or 0,
+            'question': question,
+            'answer': answer
+        }
+        self._remember(response_id, state)
+        if client is not None and self._needs_compaction(state):
+            task = asyncio.ensure_future(self._summarize(client, response_id, state))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            phases = {}
+            for phase, totals in self._phases.items():
+                turns = totals['turns']
+                phases[phase] = {
+                    'turns': turns,
+                    'avg_input_tokens': round(totals['input_tokens'] / turns) if turns else None,
+                    'avg_latency_ms': round(totals['latency_ms'] / turns, 1) if turns else None
+                }
+            return {
+                'compactions': self.compactions,
+                'compactions_deferred': self.compactions_deferred,
+                'compaction_failures': self.compaction_failures,
+                'compaction_ms': round(self.compaction_ms, 1),
+                'summary_ms': round(self.summary_ms, 1),
+                'summaries_pending': len(self._pending),
+                'chain_lookups': self.chain_lookups,
+                'chain_restores': self.chain_restores,
+                'chains': len(self._chains),
+                **phases
+            }
+
+
+conversation_compactor = ConversationCompactor()
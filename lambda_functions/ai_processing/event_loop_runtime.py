@@ -0,0 +1,108 @@
+"""
+ai_processing Lambda 用の常駐イベントループ
+
+asyncio.run は呼び出しごとにイベントループを作って閉じるため、モジュールレベルの
+openai.AsyncOpenAI（httpx）や CallUpdateDispatcher（aiohttp）の接続プールがループと一緒に使えなくなり、
+ウォームコンテナでも毎ターン TCP + TLS ハンドシェイクからやり直していた。
+コンテナごとに1つのループを持ち続け、呼び出し間で非同期クライアントとその接続プールを再利用する。
+
+- 呼び出しの終了時に、その呼び出しで残ったタスク（破棄した投機的検索など）はキャンセルする
+  （Lambda の凍結中にタスクを残さない）
+- ループが閉じられていた・実行中だった場合は作り直す
+- ループの再利用回数・作り直し回数・残タスク数と、接続プールの状態を stats() で返す
+
+PERSISTENT_EVENT_LOOP_ENABLED=false で呼び出しごとの asyncio.run に戻せる。
+"""
+import asyncio
+import os
+import threading
+import time
+from typing import Callable, Coroutine, Dict, Optional
+
+from voice_logger import get_logger
+
+PERSISTENT_EVENT_LOOP_ENABLED = os.environ.get('PERSISTENT_EVENT_LOOP_ENABLED', 'true').lower() == 'true'
+
+logger = get_logger('event_loop_runtime')
+
+
+def httpx_pool_connections(async_client) -> Optional[int]:
+    """openai.AsyncOpenAI の httpx 接続プールに保持している接続数（取得できなければNone）"""
+    pool = getattr(getattr(getattr(async_client, '_client', None), '_transport', None), '_pool', None)
+    try:
+        return len(pool.connections)
+    except (AttributeError, TypeError):
+        return None
+
+
+class PersistentLoopRunner:
+    """コンテナ内で1つのイベントループを使い回してコルーチンを実行する"""
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_created_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._probes: Dict[str, Callable[[], object]] = {}
+        self.invocations = 0
+        self.loops_created = 0
+        self.loop_reuses = 0
+        self.leftover_tasks_cancelled = 0
+
+    def register_probe(self, name: str, probe: Callable[[], object]) -> None:
+        """stats() に含める接続プールなどの状態取得関数を登録"""
+        self._probes[name] = probe
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        loop = self._loop
+        if loop is not None and not loop.is_closed() and not loop.is_running():
+            self.loop_reuses += 1
+            return loop
+        if loop is not None:
+            logger.warning("Recreating event loop", closed=loop.is_closed(), running=loop.is_running())
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        self._loop_created_at = self._clock()
+        self.loops_created += 1
+        return loop
+
+    def run(self, coro: Coroutine):
+        """コルーチンを常駐ループで完了まで実行し、呼び出し中に生まれた残タスクを片付ける"""
+        with self._lock:
+            self.invocations += 1
+            loop = self._get_loop()
+        try:
+            return loop.run_until_complete(coro)
+        finally:
+            self._cancel_leftover_tasks(loop)
+
+    def _cancel_leftover_tasks(self, loop: asyncio.AbstractEventLoop) -> None:
+        pending = [task for task in asyncio.all_tasks(loop) if not task.done()]
+        if not pending:
+            return
+        for task in pending:
+            task.cancel()
+        loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        self.leftover_tasks_cancelled += len(pending)
+        logger.info("Cancelled leftover tasks", count=len(pending))
+
+    def stats(self) -> Dict:
+        loop_age = self._clock() - self._loop_created_at if self._loop_created_at is not None else None
+        stats = {
+            'invocations': self.invocations,
+            'loops_created': self.loops_created,
+            'loop_reuses': self.loop_reuses,
+            'leftover_tasks_cancelled': self.leftover_tasks_cancelled,
+            'loop_age_seconds': round(loop_age, 1) if loop_age is not None else None,
+            'loop_closed': self._loop.is_closed() if self._loop is not None else None
+        }
+        for name, probe in self._probes.items():
+            try:
+                stats[name] = probe()
+            except Exception as e:
+                stats[name] = f"error: {e}"
+        return stats
+
+
+loop_runner = PersistentLoopRunner()
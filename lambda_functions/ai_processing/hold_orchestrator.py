@@ -0,0 +1,150 @@
+"""
+応答期限つきの保留の制御
+
+一般問い合わせでは「回答を生成します。少々お待ちください。」のアナウンスを毎回 calls.update で送っていたため、
+2秒で回答ができる質問でも Twilio API の呼び出しが1回増え、アナウンスの再生が回答の前に挟まっていた。
+Webhook の受信時刻（ImmediateResponse Lambda が渡す received_at）からの経過時間を基準に、
+
+- KEEPALIVE_AFTER_MS までに回答ができればアナウンスを送らずにそのまま回答を届ける
+- できていなければアナウンス（キープアライブ）を送り、その後ろに短い保留（call_hold.hold_tail）を付ける
+- ANSWER_DEADLINE_MS（発信者の保留の上限 HOLD_MAX_SECONDS より前）までに回答ができなければ
+  生成を打ち切り、呼び出し側が代わりの案内を送る（HoldDeadlineExceeded）
+
+回答の最初の1文を先行再生する場合（answer_streaming）は、その再生がキープアライブの代わりになるため、
+先行再生が始まった後はアナウンスを送らない（settle_keepalive を先行再生の after に渡す）。
+
+HOLD_ORCHESTRATION_ENABLED=false で従来どおり毎回アナウンスを送る。
+"""
+import asyncio
+import os
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from call_hold import HOLD_MAX_SECONDS
+from voice_logger import get_logger
+
+HOLD_ORCHESTRATION_ENABLED = os.environ.get('HOLD_ORCHESTRATION_ENABLED', 'true').lower() == 'true'
+KEEPALIVE_AFTER_MS = float(os.environ.get('HOLD_KEEPALIVE_AFTER_MS', '4000'))
+ANSWER_DEADLINE_MS = float(os.environ.get('HOLD_ANSWER_DEADLINE_MS', str((HOLD_MAX_SECONDS - 4) * 1000)))
+
+logger = get_logger('hold_orchestrator')
+
+
+class HoldDeadlineExceeded(Exception):
+    """回答が応答期限までにできなかった"""
+
+
+class HoldStats:
+    """キープアライブの要否と期限切れのカウンタ"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.answered_before_keepalive = 0
+        self.keepalives = 0
+        self.keepalives_skipped = 0     # 先行再生が始まっていたため送らなかった
+        self.keepalive_failures = 0
+        self.deadline_fallbacks = 0
+
+    def record(self, field: str) -> None:
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                'answered_before_keepalive': self.answered_before_keepalive,
+                'keepalives': self.keepalives,
+                'keepalives_skipped': self.keepalives_skipped,
+                'keepalive_failures': self.keepalive_failures,
+                'deadline_fallbacks': self.deadline_fallbacks
+            }
+
+
+hold_stats = HoldStats()
+
+
+class HoldOrchestrator:
+    """1ターン分の回答待ち（キープアライブの送信判断と応答期限）"""
+
+    def __init__(self, received_at: Optional[float] = None, keepalive_after_ms: float = KEEPALIVE_AFTER_MS,
+                 deadline_ms: float = ANSWER_DEADLINE_MS, stats: HoldStats = hold_stats, clock=time.time):
+        self._clock = clock
+        self.received_at = received_at if received_at is not None else clock()
+        self.keepalive_after_ms = keepalive_after_ms
+        self.deadline_ms = deadline_ms
+        self._stats = stats
+        self._audio_claimed = False
+        self._keepalive_task: Optional[asyncio.Task] = None
+        self.keepalive_sent_at_ms: Optional[float] = None
+
+    @property
+    def held_since(self) -> int:
+        """保留の基準時刻（ImmediateResponse Lambda の保留エンドポイントと同じ値）"""
+        return int(self.received_at)
+
+    def elapsed_ms(self) -> float:
+        return (self._clock() - self.received_at) * 1000
+
+    async def settle_keepalive(self) -> None:
+        """
+        先行再生の前に呼ぶ: 送信中のキープアライブを待ち、以後のキープアライブは送らない
+
+        FirstSentencePlayback.start の after に渡す。
+        """
+        self._audio_claimed = True
+        if self._keepalive_task is not None:
+            await self._keepalive_task
+
+    async def _send_keepalive(self, send: Callable[[], Awaitable[None]]) -> None:
+        try:
+            await send()
+            self.keepalive_sent_at_ms = self.elapsed_ms()
+            self._stats.record('keepalives')
+        except Exception as e:
+            # 保留は ImmediateResponse Lambda の TwiML で続いているため、回答の待機は続ける
+            self._stats.record('keepalive_failures')
+            logger.error("Failed to send hold keepalive", error=e)
+
+    async def wait(self, answer: Awaitable, send_keepalive: Optional[Callable[[], Awaitable[None]]] = None):
+        """
+        回答を待ち、必要ならキープアライブを送る
+
+        Args:
+            answer: 回答を生成するコルーチン（またはタスク）
+            send_keepalive: キープアライブを通話に送る関数（Noneなら送らない。ポーリングモード用）
+
+        Returns:
+            answer の結果
+
+        Raises:
+            HoldDeadlineExceeded: 応答期限までに回答ができなかった（answer はキャンセル済み）
+        """
+        task = asyncio.ensure_future(answer)
+        try:
+            keepalive_in_ms = self.keepalive_after_ms - self.elapsed_ms()
+            if keepalive_in_ms > 0:
+                await asyncio.wait({task}, timeout=keepalive_in_ms / 1000)
+            if task.done():
+                self._stats.record('answered_before_keepalive')
+            elif send_keepalive is not None and self._audio_claimed:
+                self._stats.record('keepalives_skipped')
+            elif send_keepalive is not None:
+                self._keepalive_task = asyncio.ensure_future(self._send_keepalive(send_keepalive))
+
+            remaining_ms = self.deadline_ms - self.elapsed_ms()
+            try:
+                return await asyncio.wait_for(task, timeout=max(remaining_ms, 0) / 1000)
+            except asyncio.TimeoutError:
+                self._stats.record('deadline_fallbacks')
+                logger.warning("Answer missed the hold deadline", elapsed_ms=round(self.elapsed_ms(), 1),
+                               deadline_ms=self.deadline_ms)
+                raise HoldDeadlineExceeded() from None
+        finally:
+            if not task.done():
+                task.cancel()
+            if self._keepalive_task is not None:
+                await self._keepalive_task
+            logger.info("Hold orchestration", elapsed_ms=round(self.elapsed_ms(), 1),
+                        keepalive_sent_at_ms=self.keepalive_sent_at_ms and round(self.keepalive_sent_at_ms, 1),
+                        stats=self._stats.snapshot)
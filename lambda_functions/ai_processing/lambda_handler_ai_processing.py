@@ -1,8 +1,9 @@
 import asyncio
+import contextvars
 import json
 import os
+import time
 from twilio.rest import Client
-from twilio.twiml.voice_response import VoiceResponse, Gather as TwilioGather
 import openai
 import classification_service
 # 内部モジュールのインポート
@@ -11,7 +12,23 @@ from utils.validation import validate_essential_env_vars, validate_handler_resou
 from utils.twilio_utils import update_twilio_call_async
 # layerのインポート
 from lingual_manager import LingualManager
-from ssml_helper import wrap_with_prosody
+from twiml_renderer import TwimlRenderer, HANGUP_TAIL, dial, document, pause
+from session_token import session_codec
+from call_result_store import create_result_store
+from call_update_dispatcher import create_call_dispatcher
+from event_loop_runtime import PERSISTENT_EVENT_LOOP_ENABLED, httpx_pool_connections, loop_runner
+from speculative_search import SPECULATIVE_SEARCH_ENABLED, SpeculativeSearch
+from answer_streaming import ANSWER_STREAMING_ENABLED, FirstSentencePlayback, remaining_text
+from model_routing import MODEL_ROUTING_ENABLED, model_router
+from request_hedging import OPENAI_HEDGING_ENABLED, request_hedger
+from circuit_breaker import CIRCUIT_BREAKER_ENABLED, circuit_stats
+from hold_orchestrator import HOLD_ORCHESTRATION_ENABLED, HoldDeadlineExceeded, HoldOrchestrator
+from call_hold import hold_tail
+from voice_logger import get_logger, set_context
+from event_capture import event_capture
+from call_tracing import tracer
+from call_analytics import CALL_ANALYTICS_ENABLED, call_analytics
+from context_compaction import CONTEXT_COMPACTION_ENABLED, conversation_compactor
 
 ACCOUNT_SID = os.environ.get('TWILIO_ACCOUNT_SID')
 AUTH_TOKEN = os.environ.get('TWILIO_AUTH_TOKEN')
@@ -24,15 +41,44 @@ validate_essential_env_vars()
 
 # インスタンスの作成
 twilio_client = Client(ACCOUNT_SID, AUTH_TOKEN)
+call_dispatcher = create_call_dispatcher()  # calls.update の非同期送信（無効ならNoneでtwilio_clientを使う）
 lingual_mgr = LingualManager()
-openai_async_client = openai.AsyncOpenAI(api_key=OPENAI_API_KEY)
+twiml_renderer = TwimlRenderer(lingual_mgr)
+result_store = create_result_store()  # ポーリングモード用（テーブル未設定ならNone）
+logger = get_logger('ai_processing')
 
+# ポーリングモードのターンID（ImmediateResponse Lambdaが発行、Noneならcalls.updateで通知）
+_poll_turn_id = contextvars.ContextVar('poll_turn_id', default=None)
+# 呼び出し開始時刻（最初の回答音声までの時間の計測用）
+_invocation_started_at = contextvars.ContextVar('invocation_started_at', default=None)
+# ImmediateResponse Lambda が発話を受信した時刻（エポック秒、保留の期限の基準）
+_received_at = contextvars.ContextVar('received_at', default=None)
 
-def _build_action_url(language: str, room_number: str = None, phone_last4: str = None, response_id: str = None, source: str = None) -> str:
+
+def instrument_openai(client):
+    """本番と同じく OpenAI クライアントにトークン集計と記録・再生のラップを掛ける"""
+    return event_capture.wrap_openai(call_analytics.meter_openai(client))
+
+
+openai_async_client = instrument_openai(openai.AsyncOpenAI(api_key=OPENAI_API_KEY))
+loop_runner.register_probe('openai_pool_connections', lambda: httpx_pool_connections(openai_async_client))
+loop_runner.register_probe('call_dispatcher', lambda: call_dispatcher.stats() if call_dispatcher else None)
+loop_runner.register_probe('model_routes', lambda: model_router.stats() if MODEL_ROUTING_ENABLED else None)
+loop_runner.register_probe('request_hedging', lambda: request_hedger.stats() if OPENAI_HEDGING_ENABLED else None)
+loop_runner.register_probe('circuit_breakers', lambda: circuit_stats() if CIRCUIT_BREAKER_ENABLED else None)
+
+
+def _build_action_url(language: str, call_state: dict, response_id: str = None, source: str = None) -> str:
     """GatherのアクションURLを構築"""
     url = f"{LAMBDA1_FUNCTION_URL}?language={language}"
     if source:
         url += f"&source={source}"
+    if call_state.get('session') and session_codec.enabled:
+        # 会話ポインタを更新したセッショントークンを再発行
+        session = session_codec.encode(language, call_state.get('room_number'), call_state.get('guest_info'), response_id)
+        return f"{url}&session={session}"
+    room_number = call_state.get('room_number')
+    phone_last4 = call_state.get('phone_last4')
     if response_id:
         url += f"&previous_openai_response_id={response_id}"
     if room_number:
@@ -42,39 +88,58 @@ def _build_action_url(language: str, room_number: str = None, phone_last4: str =
     return url
 
 
-def _create_timeout_hangup_twiml(response: VoiceResponse, language: str, voice: str) -> None:
-    """タイムアウトメッセージと切断を追加"""
-    timeout_msg = lingual_mgr.get_message(language, "timeout_message")
-    response.say(wrap_with_prosody(timeout_msg), language=language, voice=voice)
-    response.pause(length=3)
-    response.hangup()
+async def _update_call(call_sid: str, twiml: str) -> None:
+    """calls.update で通話の TwiML を差し替える（記録・再生の出力として記録する）"""
+    with event_capture.io('twilio', 'update', twiml=twiml):
+        await update_twilio_call_async(twilio_client, call_sid, twiml, call_dispatcher)
+
+
+async def _deliver_twiml(call_sid: str, twiml: str) -> None:
+    """TwiMLを通話に届ける（ポーリングモードは結果ストアへ保存、通常はcalls.updateで差し替え）"""
+    turn_id = _poll_turn_id.get()
+    if turn_id and result_store:
+        with event_capture.io('result_store', 'put', turn_id=turn_id, twiml=twiml), tracer.span('result_store_put'):
+            await asyncio.to_thread(result_store.put, call_sid, turn_id, twiml)
+        logger.info("Stored TwiML result", turn_id=turn_id)
+        call_analytics.answer_delivered()
+        return
+    await _update_call(call_sid, twiml)
+    call_analytics.answer_delivered()
 
 
-def _create_error_hangup_twiml(language: str, voice: str, message_key: str = "processing_error") -> VoiceResponse:
+def _create_error_hangup_twiml(language: str, message_key: str = "processing_error") -> str:
     """エラーメッセージと切断のTwiMLを生成"""
-    response = VoiceResponse()
-    response.say(wrap_with_prosody(lingual_mgr.get_message(language, message_key)), language=language, voice=voice)
-    response.pause(length=3)
-    response.hangup()
-    return response
+    return twiml_renderer.error_hangup(language, message_key)
 
 
-async def _send_error_and_hangup(call_sid: str, language: str, voice: str, message_key: str = "processing_error") -> dict:
+async def _send_error_and_hangup(call_sid: str, language: str, message_key: str = "processing_error") -> dict:
     """エラーメッセージを送信して切断"""
-    error_twiml = _create_error_hangup_twiml(language, voice, message_key)
+    error_twiml = _create_error_hangup_twiml(language, message_key)
     try:
-        await update_twilio_call_async(twilio_client, call_sid, str(error_twiml))
+        await _deliver_twiml(call_sid, error_twiml)
     except Exception as e:
-        print(f"Failed to send error message: {e}")
+        logger.error("Failed to send error message", error=e)
     return {'status': 'error', 'message': message_key}
 
 
+def _answer_fragments(language: str, assistant_text: str) -> list:
+    """アシスタントの応答テキストのSay要素（ストリーミングで全文送信済みなら空）"""
+    return [twiml_renderer.say_text(language, assistant_text)] if assistant_text else []
+
+
+def _log_time_to_first_audio(streamed: bool) -> None:
+    started_at = _invocation_started_at.get()
+    if started_at is not None:
+        logger.info("Time to first answer audio", streamed=streamed,
+                    time_to_first_audio_ms=round((time.monotonic() - started_at) * 1000, 1))
+
+
 def _parse_search_results(search_results_json: str, language: str) -> dict:
     """検索結果JSONをパース"""
     try:
         return json.loads(search_results_json)
     except json.JSONDecodeError:
-        print(f"Error: Failed to parse JSON from vector search: {search_results_json}")
+        logger.error("Failed to parse JSON from vector search", search_results=search_results_json)
         return {
             "assistant_response_text": lingual_mgr.get_message(language, "system_error"),
             "needs_operator": False,
@@ -82,96 +147,181 @@ def _parse_search_results(search_results_json: str, language: str) -> dict:
         }
 
 
-async def _handle_end_conversation(call_sid: str, language: str, voice: str, assistant_text: str) -> dict:
+async def _handle_end_conversation(call_sid: str, language: str, assistant_text: str) -> dict:
     """会話終了処理"""
-    ending_twiml = VoiceResponse()
-    ending_twiml.say(wrap_with_prosody(assistant_text), language=language, voice=voice)
-    ending_msg = lingual_mgr.get_message(language, "ending_message")
-    ending_twiml.say(wrap_with_prosody(ending_msg), language=language, voice=voice)
-    ending_twiml.pause(length=3)
-    ending_twiml.hangup()
+    ending_twiml = document([
+        *_answer_fragments(language, assistant_text),
+        twiml_renderer.say_message(language, "ending_message"),
+        HANGUP_TAIL
+    ])
     
     try:
-        await update_twilio_call_async(twilio_client, call_sid, str(ending_twiml))
-        print("Conversation ended by user request.")
+        await _deliver_twiml(call_sid, ending_twiml)
+        logger.info("Conversation ended by user request.")
         return {'status': 'completed', 'action': 'conversation_ended'}
     except Exception as e:
-        print(f"Error ending conversation: {e}")
+        logger.error("Error ending conversation", error=e)
         return {'status': 'error', 'message': f"Failed to end conversation: {str(e)}"}
 
 
-async def _handle_operator_choice(call_sid: str, language: str, voice: str, assistant_text: str, 
-                                   response_id: str, room_number: str, phone_last4: str) -> dict:
+async def _handle_operator_choice(call_sid: str, language: str, assistant_text: str,
+                                   response_id: str, call_state: dict) -> dict:
     """オペレーター転送の選択肢を提示"""
-    twiml = VoiceResponse()
-    twiml.say(wrap_with_prosody(assistant_text), language=language, voice=voice)
-    
-    prompt_text = lingual_mgr.get_message(language, "prompt_for_operator_dtmf")
-    action_url = _build_action_url(language, room_number, phone_last4, response_id, "operator_choice_dtmf")
-    
-    gather = TwilioGather(
-        input='dtmf',
-        num_digits=1,
-        method='POST',
-        timeout=7,
-        action=action_url
-    )
-    gather.say(wrap_with_prosody(prompt_text), language=language, voice=voice)
-    twiml.append(gather)
-    _create_timeout_hangup_twiml(twiml, language, voice)
+    action_url = _build_action_url(language, call_state, response_id, "operator_choice_dtmf")
+    twiml = document([
+        *_answer_fragments(language, assistant_text),
+        twiml_renderer.operator_choice_gather(language, action_url),
+        twiml_renderer.timeout_tail(language)
+    ])
     
-    await update_twilio_call_async(twilio_client, call_sid, str(twiml))
-    print("Prompted user for operator transfer choice (DTMF).")
+    await _deliver_twiml(call_sid, twiml)
+    logger.info("Prompted user for operator transfer choice (DTMF).")
     return {'status': 'completed', 'action': 'prompted_for_operator_choice_dtmf'}
 
 
-async def _handle_search_results_response(call_sid: str, language: str, voice: str, assistant_text: str,
-                                           response_id: str, room_number: str, phone_last4: str) -> dict:
+async def _handle_search_results_response(call_sid: str, language: str, assistant_text: str,
+                                           response_id: str, call_state: dict) -> dict:
     """検索結果を返して次の質問を促す"""
-    twiml = VoiceResponse()
-    twiml.say(wrap_with_prosody(assistant_text), language=language, voice=voice)
-    
-    action_url = _build_action_url(language, room_number, phone_last4, response_id)
-    gather = TwilioGather(
-        input='speech', language=language, method='POST',
-        action=action_url, timeout=7, speechTimeout='auto', speechModel='deepgram-nova-3'
-    )
-    follow_up_msg = lingual_mgr.get_message(language, "follow_up_question")
-    gather.say(wrap_with_prosody(follow_up_msg), language=language, voice=voice)
-    twiml.append(gather)
-    _create_timeout_hangup_twiml(twiml, language, voice)
+    action_url = _build_action_url(language, call_state, response_id)
+    twiml = document([
+        *_answer_fragments(language, assistant_text),
+        twiml_renderer.speech_gather(language, action_url, "follow_up_question"),
+        twiml_renderer.timeout_tail(language)
+    ])
     
     try:
-        await update_twilio_call_async(twilio_client, call_sid, str(twiml))
-        print("Search results and follow-up prompt sent to user.")
+        await _deliver_twiml(call_sid, twiml)
+        logger.info("Search results and follow-up prompt sent to user.")
         return {
             'status': 'completed',
             'action': 'provided_search_results_and_gathered',
             'openai_response_id': response_id
         }
     except Exception as e:
-        print(f"Error sending search results to user: {e}")
+        logger.error("Error sending search results to user", error=e)
         return {'status': 'error', 'message': f"Failed to send search results: {str(e)}"}
 
 
-async def _handle_general_inquiry(call_sid: str, language: str, voice: str, speech_result: str,
-                                   previous_response_id: str, guest_info: dict, room_number: str, phone_last4: str) -> dict:
+def _search_facility(speech_result: str, language: str, previous_response_id: str, guest_info: dict,
+                     playback: FirstSentencePlayback = None):
+    """施設情報のベクトル検索コルーチンを生成（playback があればストリーミングで生成）"""
+    return tracer.trace_coroutine('vector_search', openai_vector_search_with_file_search_tool(
+        openai_async_client, speech_result, language, OPENAI_VECTOR_STORE_ID_FACILITY, previous_response_id, guest_info,
+        on_first_sentence=playback.on_first_sentence if playback else None
+    ))
+
+
+def _create_playback(language: str) -> FirstSentencePlayback:
+    """ストリーミングモードの先行再生（ポーリングモードは1ターン1TwiMLのため使わない）"""
+    if not ANSWER_STREAMING_ENABLED or _poll_turn_id.get():
+        return None
+    return FirstSentencePlayback(language)
+
+
+def _start_speculative_search(speech_result: str, language: str, previous_response_id: str,
+                              guest_info: dict, playback: FirstSentencePlayback = None) -> SpeculativeSearch:
+    """初回ターンは分類と並行して検索を開始（継続ターンは分類しないため不要）"""
+    if not SPECULATIVE_SEARCH_ENABLED or previous_response_id:
+        return None
+    return SpeculativeSearch(_search_facility(speech_result, language, None, guest_info, playback))
+
+
+def _hold_fragment(language: str, hold: HoldOrchestrator) -> str:
+    """続きのTwiMLが届くまでの短い保留（保留の上限に達していればなし）"""
+    return hold_tail(language, hold.held_since, LAMBDA1_FUNCTION_URL) or ''
+
+
+async def _push_first_sentence(call_sid: str, language: str, sentence: str, hold: HoldOrchestrator = None) -> None:
+    """生成途中の回答の最初の1文を先に読み上げる（続きは最終TwiMLで送る）"""
+    tail = _hold_fragment(language, hold) if hold else pause(25)
+    twiml = document([twiml_renderer.say_text(language, sentence), tail])
+    await _update_call(call_sid, twiml)
+    _log_time_to_first_audio(streamed=True)
+
+
+async def _wait_with_hold(call_sid: str, language: str, search_task, hold: HoldOrchestrator,
+                          playback: FirstSentencePlayback = None) -> tuple[str, str]:
+    """
+    回答を待ち、間に合わないときだけ検索中アナウンス（キープアライブ）を送る
+
+    Returns:
+        (検索結果JSON, 先行再生した文)
+
+    Raises:
+        HoldDeadlineExceeded: 応答期限までに回答ができなかった
+    """
+    async def send_keepalive():
+        twiml = document([twiml_renderer.say_message(language, "general_inquiry"), _hold_fragment(language, hold)])
+        await _update_call(call_sid, twiml)
+
+    if playback:
+        # 先行再生が始まればそれがキープアライブの代わりになる（送信中のアナウンスがあれば送信後に差し替える）
+        playback.start(lambda sentence: _push_first_sentence(call_sid, language, sentence, hold),
+                       after=hold.settle_keepalive)
+    try:
+        search_results_json = await hold.wait(search_task, send_keepalive)
+    except HoldDeadlineExceeded:
+        if playback:
+            await playback.finish()
+        raise
+    logger.info("Vector search completed.", keepalive_sent=hold.keepalive_sent_at_ms is not None)
+    pushed_text = await playback.finish() if playback else ''
+    return search_results_json, pushed_text
+
+
+async def _handle_answer_deadline(call_sid: str, language: str, previous_response_id: str, call_state: dict) -> dict:
+    """応答期限切れ: 保留が切れる前にお詫びとオペレーター転送の選択肢を送る（2なら前のターンから質問し直せる）"""
+    action_url = _build_action_url(language, call_state, previous_response_id, "operator_choice_dtmf")
+    twiml = document([
+        twiml_renderer.say_message(language, "answer_delayed"),
+        twiml_renderer.operator_choice_gather(language, action_url),
+        twiml_renderer.timeout_tail(language)
+    ])
+    try:
+        await _deliver_twiml(call_sid, twiml)
+        return {'status': 'completed', 'action': 'answer_deadline_fallback'}
+    except Exception as e:
+        logger.error("Error sending answer deadline fallback", error=e)
+        return {'status': 'error', 'message': f"Failed to send deadline fallback: {str(e)}"}
+
+
+async def _handle_general_inquiry(call_sid: str, language: str, speech_result: str,
+                                   previous_response_id: str, guest_info: dict, call_state: dict,
+                                   speculative: SpeculativeSearch = None,
+                                   playback: FirstSentencePlayback = None) -> dict:
     """一般的な問い合わせの処理"""
-    # 検索中アナウンス
-    announce_msg = lingual_mgr.get_message(language, "general_inquiry")
-    announce_twiml = VoiceResponse()
-    announce_twiml.say(wrap_with_prosody(announce_msg), language=language, voice=voice)
-    announce_twiml.pause(length=25)
-    
-    # 並行処理
-    announce_task = update_twilio_call_async(twilio_client, call_sid, str(announce_twiml))
-    search_task = openai_vector_search_with_file_search_tool(
-        openai_async_client, speech_result, language, OPENAI_VECTOR_STORE_ID_FACILITY, previous_response_id, guest_info
-    )
+    if speculative:
+        search_task = speculative.result()
+    else:
+        search_task = _search_facility(speech_result, language, previous_response_id, guest_info, playback)
     
-    print("Announcement and vector search tasks created, starting them in parallel...")
-    _, search_results_json = await asyncio.gather(announce_task, search_task)
-    print("Search announcement sent and vector search completed.")
+    pushed_text = ''
+    hold = HoldOrchestrator(_received_at.get()) if HOLD_ORCHESTRATION_ENABLED else None
+    if _poll_turn_id.get():
+        # ポーリングモードでは発信者はRedirectループで待機中のため、アナウンスで割り込まない
+        try:
+            search_results_json = await (hold.wait(search_task) if hold else search_task)
+        except HoldDeadlineExceeded:
+            return await _handle_answer_deadline(call_sid, language, previous_response_id, call_state)
+        logger.info("Vector search completed (poll mode).")
+    elif hold:
+        try:
+            search_results_json, pushed_text = await _wait_with_hold(call_sid, language, search_task, hold, playback)
+        except HoldDeadlineExceeded:
+            return await _handle_answer_deadline(call_sid, language, previous_response_id, call_state)
+    else:
+        # 検索中アナウンス
+        announce_twiml = document([twiml_renderer.say_message(language, "general_inquiry"), pause(25)])
+        announce_task = asyncio.ensure_future(_update_call(call_sid, announce_twiml))
+        if playback:
+            # 最初の1文はアナウンスの送信後に送る（アナウンスの再生途中でも差し替える）
+            playback.start(lambda sentence: _push_first_sentence(call_sid, language, sentence), after=announce_task)
+        
+        # 並行処理
+        _, search_results_json = await asyncio.gather(announce_task, search_task)
+        logger.info("Search announcement sent and vector search completed.")
+        if playback:
+            pushed_text = await playback.finish()
     
     # 結果をパース
     parsed = _parse_search_results(search_results_json, language)
@@ -180,187 +330,228 @@ async def _handle_general_inquiry(call_sid: str, language: str, voice: str, spee
     end_conversation = parsed.get("end_conversation", False)
     response_id = parsed.get("response_id")
     
-    print(f"  Assistant text: {assistant_text}")
-    print(f"  Needs operator: {needs_operator}, End conversation: {end_conversation}")
-    print(f"  OpenAI Response ID: {response_id}")
-    
-    if end_conversation:
-        return await _handle_end_conversation(call_sid, language, voice, assistant_text)
+    if parsed.get("degraded") and not assistant_text:
+        # 回答生成のサーキットブレーカーが開いていて定型回答もない: お詫びとオペレーター転送の選択肢
+        assistant_text = lingual_mgr.get_message(language, "ai_unavailable")
     
-    if needs_operator:
-        return await _handle_operator_choice(call_sid, language, voice, assistant_text, response_id, room_number, phone_last4)
+    call_analytics.set(end_conversation=end_conversation, needs_operator=needs_operator,
+                       degraded=bool(parsed.get("degraded")))
+    logger.info("Vector search result", needs_operator=needs_operator, end_conversation=end_conversation,
+                response_id=response_id, streamed_prefix_chars=len(pushed_text), degraded=parsed.get("degraded", False))
+    logger.debug("Assistant text", assistant_text=assistant_text)
+    # 先に読み上げた文の続きだけを最終TwiMLで送る
+    assistant_text = remaining_text(assistant_text, pushed_text)
     
-    return await _handle_search_results_response(call_sid, language, voice, assistant_text, response_id, room_number, phone_last4)
+    if end_conversation:
+        result = await _handle_end_conversation(call_sid, language, assistant_text)
+    elif needs_operator:
+        result = await _handle_operator_choice(call_sid, language, assistant_text, response_id, call_state)
+    else:
+        result = await _handle_search_results_response(call_sid, language, assistant_text, response_id, call_state)
+    if not pushed_text:
+        _log_time_to_first_audio(streamed=False)
+    return result
 
 
-async def _handle_urgent_or_operator(call_sid: str, language: str, voice: str, urgency: str) -> dict:
+async def _handle_urgent_or_operator(call_sid: str, language: str, urgency: str) -> dict:
     """緊急またはオペレーター希望の処理"""
     message_key = "urgent_inquiry" if urgency == "urgent" else "transferring_to_operator"
-    ai_response = lingual_mgr.get_message(language, message_key)
-    
-    twiml = VoiceResponse()
-    twiml.say(wrap_with_prosody(ai_response), language=language, voice=voice)
-    twiml.dial(OPERATOR_PHONE_NUMBER)
+    twiml = document([twiml_renderer.say_message(language, message_key), dial(OPERATOR_PHONE_NUMBER)])
     
     try:
-        await update_twilio_call_async(twilio_client, call_sid, str(twiml))
-        print(f"Transferred to operator due to: {urgency}")
+        await _deliver_twiml(call_sid, twiml)
+        logger.info("Transferred to operator", urgency=urgency)
         return {'status': 'completed', 'action': f'transferred_to_operator_{urgency}'}
     except Exception as e:
-        print(f"Error in {urgency} case: {e}")
+        logger.error("Error transferring to operator", urgency=urgency, error=e)
         return {'status': 'error', 'message': f"Twilio API error in {urgency} case: {str(e)}"}
 
 
-async def _handle_unknown_inquiry(call_sid: str, language: str, voice: str, room_number: str, phone_last4: str) -> dict:
+async def _handle_unknown_inquiry(call_sid: str, language: str, call_state: dict) -> dict:
     """不明な問い合わせの処理"""
-    ai_response = lingual_mgr.get_message(language, "inquiry_not_understood")
-    twiml = VoiceResponse()
-    twiml.say(wrap_with_prosody(ai_response), language=language, voice=voice)
-    
-    action_url = _build_action_url(language, room_number, phone_last4)
-    gather = TwilioGather(
-        input='speech', language=language, method='POST',
-        action=action_url, timeout=7, speechTimeout='auto', speechModel='deepgram-nova-3'
-    )
-    re_prompt_msg = lingual_mgr.get_message(language, "re_prompt_inquiry")
-    gather.say(wrap_with_prosody(re_prompt_msg), language=language, voice=voice)
-    twiml.append(gather)
-    _create_timeout_hangup_twiml(twiml, language, voice)
+    action_url = _build_action_url(language, call_state)
+    twiml = document([
+        twiml_renderer.say_message(language, "inquiry_not_understood"),
+        twiml_renderer.speech_gather(language, action_url, "re_prompt_inquiry"),
+        twiml_renderer.timeout_tail(language)
+    ])
     
     try:
-        await update_twilio_call_async(twilio_client, call_sid, str(twiml))
+        await _deliver_twiml(call_sid, twiml)
         return {'status': 'completed', 'action': 'prompted_again_unknown'}
     except Exception as e:
-        print(f"Error in unknown case: {e}")
+        logger.error("Error in unknown case", error=e)
         return {'status': 'error', 'message': f"Twilio API error in unknown case: {str(e)}"}
 
 
-async def _handle_classification_error(call_sid: str, language: str, voice: str) -> dict:
+async def _handle_classification_error(call_sid: str, language: str) -> dict:
     """分類エラーの処理"""
-    print("Classification service error or unexpected result. Hanging up.")
-    ai_response = lingual_mgr.get_message(language, "system_error")
-    twiml = VoiceResponse()
-    twiml.say(wrap_with_prosody(ai_response), language=language, voice=voice)
-    twiml.pause(length=3)
-    twiml.hangup()
+    logger.warning("Classification service error or unexpected result. Hanging up.")
+    twiml = twiml_renderer.error_hangup(language, "system_error")
     
     try:
-        await update_twilio_call_async(twilio_client, call_sid, str(twiml))
-        print(f"Successfully updated call {call_sid} to hang up due to classification error.")
+        await _deliver_twiml(call_sid, twiml)
+        logger.info("Updated call to hang up due to classification error.")
         return {'status': 'completed', 'action': 'hangup_due_to_classification_error'}
     except Exception as e:
-        print(f"Error updating call to hang up after classification error: {e}")
+        logger.error("Error updating call to hang up after classification error", error=e)
         return {'status': 'error', 'message': f"Twilio API error during error hangup: {str(e)}"}
 
 
-async def _classify_user_message(speech_result: str, previous_response_id: str) -> tuple[str, bool]:
+async def _classify_user_message(speech_result: str, previous_response_id: str, language: str) -> tuple[str, bool]:
     """ユーザーメッセージを分類"""
     if previous_response_id:
-        print(f"Continuing conversation with previous_response_id: {previous_response_id}")
-        print("Skipping classification - treating as 'general' inquiry")
+        logger.info("Continuing conversation - skipping classification", previous_response_id=previous_response_id)
         return "general", False
     
-    print(f"First turn - Classifying user message: '{speech_result}'")
-    classification_result = await classification_service.classify_message_urgency(
-        openai_async_client, speech_result
-    )
-    print(f"Classification result: {classification_result}")
+    with tracer.span('classification') as span:
+        classification_result = await classification_service.classify_message_urgency(
+            openai_async_client, speech_result, language
+        )
+        span.set(urgency=classification_result.get('urgency'))
+    logger.info("Classification result", urgency=classification_result.get('urgency'))
     urgency = classification_result.get('urgency')
     should_hangup = urgency == "error"
     
     if should_hangup:
-        print("Classification service returned an error. Will proceed to hangup.")
+        logger.warning("Classification service returned an error. Will proceed to hangup.")
     
     return urgency, should_hangup
 
 
-async def _handle_missing_speech_result(call_sid: str, language: str, voice: str) -> dict:
+async def _handle_missing_speech_result(call_sid: str, language: str) -> dict:
     """speech_resultがない場合の処理"""
-    print("警告: speech_resultがAIProcessing Lambdaに渡されませんでした。")
-    error_msg = lingual_mgr.get_message(language, "could_not_understand")
-    hangup_msg = lingual_mgr.get_message(language, "hangup")
-    
-    twiml = VoiceResponse()
-    twiml.say(wrap_with_prosody(error_msg), language=language, voice=voice)
-    twiml.say(wrap_with_prosody(hangup_msg), language=language, voice=voice)
-    twiml.pause(length=3)
-    twiml.hangup()
+    logger.warning("speech_resultがAIProcessing Lambdaに渡されませんでした。")
+    twiml = document([
+        twiml_renderer.say_message(language, "could_not_understand"),
+        twiml_renderer.say_message(language, "hangup"),
+        HANGUP_TAIL
+    ])
     
     try:
-        await update_twilio_call_async(twilio_client, call_sid, str(twiml))
+        await _deliver_twiml(call_sid, twiml)
     except Exception as e:
-        print(f"Error updating call with speech_result error: {e}")
+        logger.error("Error updating call with speech_result error", error=e)
     return {'status': 'error', 'message': 'Missing speech_result for processing'}
 
 
-async def _dispatch_by_urgency(urgency: str, should_hangup: bool, call_sid: str, language: str, voice: str,
+async def _dispatch_by_urgency(urgency: str, should_hangup: bool, call_sid: str, language: str,
                                 speech_result: str, previous_response_id: str, guest_info: dict,
-                                room_number: str, phone_last4: str) -> dict:
+                                call_state: dict, speculative: SpeculativeSearch = None,
+                                playback: FirstSentencePlayback = None) -> dict:
     """緊急度に応じて適切なハンドラにディスパッチ"""
+    call_analytics.set(path=urgency)
     if urgency == "general":
         return await _handle_general_inquiry(
-            call_sid, language, voice, speech_result, previous_response_id, guest_info, room_number, phone_last4
+            call_sid, language, speech_result, previous_response_id, guest_info, call_state, speculative, playback
         )
     
     if urgency in ["urgent", "operator_request"]:
-        return await _handle_urgent_or_operator(call_sid, language, voice, urgency)
+        return await _handle_urgent_or_operator(call_sid, language, urgency)
     
     if urgency == "unknown":
-        return await _handle_unknown_inquiry(call_sid, language, voice, room_number, phone_last4)
+        return await _handle_unknown_inquiry(call_sid, language, call_state)
     
     if urgency == "error" or should_hangup:
-        return await _handle_classification_error(call_sid, language, voice)
+        return await _handle_classification_error(call_sid, language)
     
     # 予期しないurgency値
-    print(f"Unexpected urgency value: {urgency}")
-    return await _handle_classification_error(call_sid, language, voice)
+    logger.warning("Unexpected urgency value", urgency=urgency)
+    return await _handle_classification_error(call_sid, language)
 
 
 async def lambda_handler_async(event, context):
-    print(f"AIProcessing Lambda Event: {json.dumps(event)}")
+    # EVENT_CAPTURE_ENABLED=true ならイベント・I/O・calls.update を記録（記録・再生ハーネス用）
+    # CALL_TRACING_ENABLED=true なら ImmediateResponse Lambda のトレースの続きとしてステージの所要時間を出力
+    # CALL_ANALYTICS_ENABLED=true ならターンの結果（経路・保留時間・トークン数）を出力（ステージの計測は tracer を使う）
+    call_sid = event.get('call_sid')
+    with event_capture.invocation('ai_processing', event, call_sid), \
+            tracer.invocation('ai_processing', call_sid, event.get('trace'), collect=CALL_ANALYTICS_ENABLED), \
+            call_analytics.turn(event):
+        result = await _process_event(event, context)
+        if CONTEXT_COMPACTION_ENABLED:
+            # 回答を届けた後に、次のターン用の会話の要約の生成を待つ（残タスクとしてキャンセルされないように）
+            # 待つのは Lambda の残り時間の範囲内まで（タイムアウトすると非同期呼び出しの再試行でターン全体が再実行される）
+            await conversation_compactor.drain(context)
+        return event_capture.result(call_analytics.result(result))
+
+
+async def _process_event(event, context):
     speech_result = event.get('speech_result')
     call_sid = event.get('call_sid')
+    _invocation_started_at.set(time.monotonic())
+    _received_at.set(event.get('received_at'))
+    set_context(call_sid=call_sid, aws_request_id=getattr(context, 'aws_request_id', None))
+    logger.debug("AIProcessing Lambda Event", event=lambda: event)
     language = event.get('language', 'en-US')
-    room_number = event.get('room_number')
-    phone_last4 = event.get('phone_last4')
     guest_info = event.get('guest_info')
+    # Gatherのアクションに引き継ぐ通話状態
+    call_state = {
+        'room_number': event.get('room_number'),
+        'phone_last4': event.get('phone_last4'),
+        'guest_info': guest_info,
+        'session': event.get('session')
+    }
     previous_response_id = event.get('previous_openai_response_id')
-
-    voice = lingual_mgr.get_voice(language)
+    _poll_turn_id.set(event.get('turn_id'))
     
-    # ゲスト情報をログ出力（デバッグ用）
-    if guest_info:
-        print(f"Guest info received: {guest_info.get('guestName')} in room {guest_info.get('roomNumber')}")
-    else:
-        print("Warning: No guest info provided in event")
+    if not guest_info:
+        logger.warning("No guest info provided in event")
 
     resource_validation_error = validate_handler_resources(twilio_client, openai_async_client, call_sid)
     if resource_validation_error:
         return resource_validation_error
 
     if not speech_result:
-        return await _handle_missing_speech_result(call_sid, language, voice)
+        return await _handle_missing_speech_result(call_sid, language)
 
+    playback = _create_playback(language)
+    # 初回ターンは分類の完了を待たずに検索を開始しておく
+    speculative = _start_speculative_search(speech_result, language, previous_response_id, guest_info, playback)
     try:
         # メッセージ分類
-        urgency, should_hangup = await _classify_user_message(speech_result, previous_response_id)
+        urgency, should_hangup = await _classify_user_message(speech_result, previous_response_id, language)
+        if speculative and urgency == "general":
+            speculative.mark_classified()
+        elif speculative:
+            await speculative.discard(urgency)
+            speculative = None
         
         # 緊急度に応じた処理にディスパッチ
         return await _dispatch_by_urgency(
-            urgency, should_hangup, call_sid, language, voice,
-            speech_result, previous_response_id, guest_info, room_number, phone_last4
+            urgency, should_hangup, call_sid, language,
+            speech_result, previous_response_id, guest_info, call_state, speculative, playback
         )
 
     except openai.APIError as e:
-        print(f"OpenAI APIエラーが発生しました: {e}")
-        return await _send_error_and_hangup(call_sid, language, voice, "processing_error")
+        logger.error("OpenAI APIエラーが発生しました", error=e)
+        return await _send_error_and_hangup(call_sid, language, "processing_error")
     except ConnectionError as e:
-        print(f"Twilio接続エラー: {e}")
+        logger.error("Twilio接続エラー", error=e)
         return {'status': 'error', 'message': f"Twilio Connection Error: {str(e)}"}
     except Exception as e:
-        print(f"AI処理中に予期せぬエラーが発生しました: {e}")
-        return await _send_error_and_hangup(call_sid, language, voice, "processing_error")
+        logger.error("AI処理中に予期せぬエラーが発生しました", error=e)
+        return await _send_error_and_hangup(call_sid, language, "processing_error")
+    finally:
+        if speculative:
+            await speculative.discard("aborted")  # 分類中の例外などで使われなかった検索を止める
+
+async def _run_invocation(event, context):
+    try:
+        return await lambda_handler_async(event, context)
+    finally:
+        if call_dispatcher:
+            # 接続プールはこの呼び出しのイベントループに紐づくため閉じる
+            await call_dispatcher.aclose()
+            logger.info("Call update dispatcher stats", stats=call_dispatcher.stats)
+
 
 def lambda_handler(event, context):
+    if PERSISTENT_EVENT_LOOP_ENABLED:
+        # 常駐ループで実行し、OpenAI・Twilio の接続プールを次の呼び出しでも使う
+        try:
+            return loop_runner.run(lambda_handler_async(event, context))
+        finally:
+            logger.info("Event loop runtime stats", stats=loop_runner.stats)
     # asyncio.run() を使って非同期関数を呼び出す
-    return asyncio.run(lambda_handler_async(event, context))
+    return asyncio.run(_run_invocation(event, context))
@@ -0,0 +1,267 @@
+"""
+質問ごとのモデル・推論量・冗長度の選択（ルーティング）
+
+回答生成（vector_search）と緊急度分類（classification_service）は、質問の内容に関係なく
+同じモデル・同じ reasoning effort で呼んでいたため、「チェックアウトは何時？」のような短い事実の質問も
+複数の用件を含む苦情と同じだけ待たされていた。
+呼び出しごとに安価な手がかりからルート（モデル・effort・verbosity の組）を選ぶ。
+
+手がかり:
+- 質問の長さ（日本語は正規化後の文字数、それ以外は単語数）と言語
+- 通話内のターン番号（コンテキスト圧縮が有効ならチェーン内のターン、無効なら初回か継続かだけ）
+- ローカルの意図推定: 時刻・場所・パスワードなどを尋ねる質問（lookup）か、
+  複数の質問・故障・苦情・予約変更を含む質問（complex）か
+- レイテンシの SLO: コンテナ内で直近 LATENCY_WINDOW_SECONDS に選んだルートの p95 が SLO を超えていたら
+  1段軽いルートに下げる。下げている間も PROBE_RATE の割合のリクエストは元のルートに送り（probe）、
+  古いサンプルは時間で捨てるため、元のルートの遅延が戻れば p95 が SLO を下回って格下げが解ける
+
+回答のルート:
+- fast: 短い lookup の質問（長いチェーンの後半は除く）
+- deep: complex の質問、または長い質問（SLO 超過時も fast には下げない）
+- standard: それ以外（従来の設定）
+
+選んだルートと理由・レイテンシ・トークン数は "Model route" としてログに出し、stats() でルートごとに集計する。
+ルートの内容は MODEL_ROUTES に JSON で上書きできる（例: {"answer_fast":{"model":"gpt-5-nano"}}）。
+品質とレイテンシの比較は tools/evaluate_model_routing.py で行う。
+
+MODEL_ROUTING_ENABLED=true で有効になる（無効なら従来どおり固定の設定）。
+"""
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from urgency_rules import english_words, normalize_transcript
+from voice_logger import get_logger
+
+MODEL_ROUTING_ENABLED = os.environ.get('MODEL_ROUTING_ENABLED', 'false').lower() == 'true'
+ANSWER_SLO_MS = float(os.environ.get('MODEL_ROUTING_ANSWER_SLO_MS', '4000'))
+CLASSIFY_SLO_MS = float(os.environ.get('MODEL_ROUTING_CLASSIFY_SLO_MS', '1500'))
+# fast ルートを使うターンの上限（チェーンの後半は前の回答を踏まえた質問が多いため）
+FAST_MAX_TURN = int(os.environ.get('MODEL_ROUTING_FAST_MAX_TURN', '3'))
+LATENCY_WINDOW = 200
+LATENCY_WINDOW_SECONDS = float(os.environ.get('MODEL_ROUTING_WINDOW_SECONDS', '300'))
+# SLO 超過で格下げしている間に元のルートへ送る割合（元のルートのレイテンシを更新し続けるため）
+PROBE_RATE = float(os.environ.get('MODEL_ROUTING_PROBE_RATE', '0.05'))
+SLO_MIN_SAMPLES = 20
+
+DEFAULT_ROUTES = {
+    'answer_fast': {'model': 'gpt-5-mini', 'reasoning_effort': 'minimal', 'verbosity': 'low'},
+    'answer_standard': {'model': 'gpt-5-mini', 'reasoning_effort': 'low', 'verbosity': 'low'},
+    # 既定は standard と同じ（p95 を上げないため。重くする場合は MODEL_ROUTES で指定して評価する）
+    'answer_deep': {'model': 'gpt-5-mini', 'reasoning_effort': 'low', 'verbosity': 'low'},
+    'classify_fast': {'model': 'gpt-5-nano', 'reasoning_effort': 'minimal', 'verbosity': 'low'},
+    'classify_standard': {'model': 'gpt-5.4-mini', 'reasoning_effort': 'minimal', 'verbosity': 'low'},
+}
+ROUTE_OVERRIDES = json.loads(os.environ.get('MODEL_ROUTES') or '{}')
+
+# 短い質問とみなす長さ（日本語は文字数、英語は単語数）と、長い質問とみなす長さ
+SHORT_QUERY = {'ja': 30, 'en': 12}
+LONG_QUERY = {'ja': 80, 'en': 35}
+# 分類を軽いモデルに任せる長さ
+CLASSIFY_SHORT_QUERY = {'ja': 20, 'en': 8}
+
+# 正規化後のテキストに部分一致（表記は正規化前のままでよい）
+JA_LOOKUP_TERMS = (
+    "何時", "なんじ", "時間", "じかん", "どこ", "場所", "ありますか", "パスワード", "暗証番号",
+    "wifi", "いくら", "料金", "何階", "なんかい", "使えますか", "できますか", "教えて",
+)
+JA_COMPLEX_TERMS = (
+    "それと", "それから", "あとそれから", "あともう一つ", "ついでに", "困って", "こまって", "壊れ", "こわれ", "動かない",
+    "うごかない", "使えない", "つかえない", "つかない", "出ない", "うるさい", "汚い", "きたない", "苦情",
+    "クレーム", "返金", "変更", "へんこう", "キャンセル", "延長", "なぜ", "どうして",
+)
+EN_LOOKUP_PHRASES = (
+    "what time", "when", "where", "password", "wifi", "wi fi", "is there", "are there", "how much",
+    "which floor", "can i use", "do you have", "code",
+)
+EN_COMPLEX_PHRASES = (
+    "and also", "also", "another question", "broken", "not working", "doesnt work", "does not work",
+    "wont", "complain", "complaint", "refund", "change", "reschedule", "cancel", "extend", "noisy", "dirty", "why",
+)
+
+_QUESTION_MARK = re.compile(r'[?？]')
+
+logger = get_logger('model_routing')
+
+_JA_LOOKUP = tuple(normalize_transcript(term) for term in JA_LOOKUP_TERMS)
+_JA_COMPLEX = tuple(normalize_transcript(term) for term in JA_COMPLEX_TERMS)
+_EN_LOOKUP = tuple(f" {phrase} " for phrase in EN_LOOKUP_PHRASES)
+_EN_COMPLEX = tuple(f" {phrase} " for phrase in EN_COMPLEX_PHRASES)
+
+
+def _route_settings(name: str) -> Dict:
+    return {**DEFAULT_ROUTES[name], **ROUTE_OVERRIDES.get(name, {})}
+
+
+def guess_intent(text: str, language: str) -> str:
+    """'lookup'（短い事実の質問）/ 'complex'（複数の用件・故障・苦情など）/ 'general'"""
+    if len(_QUESTION_MARK.findall(text or '')) >= 2:
+        return 'complex'  # 1回の発話に複数の質問
+    if language.startswith('ja'):
+        normalized = normalize_transcript(text)
+        complex_hit = any(term in normalized for term in _JA_COMPLEX)
+        lookup_hit = any(term in normalized for term in _JA_LOOKUP)
+    else:
+        words = english_words(text)
+        complex_hit = any(phrase in words for phrase in _EN_COMPLEX)
+        lookup_hit = any(phrase in words for phrase in _EN_LOOKUP)
+    if complex_hit:
+        return 'complex'
+    return 'lookup' if lookup_hit else 'general'
+
+
+def query_length(text: str, language: str) -> int:
+    """日本語は正規化後の文字数、それ以外は単語数"""
+    if language.startswith('ja'):
+        return len(normalize_transcript(text))
+    return len(english_words(text).split())
+
+
+def _script(language: str) -> str:
+    return 'ja' if language.startswith('ja') else 'en'
+
+
+class RouteDecision:
+    """選んだルートと、その理由になった手がかり"""
+
+    def __init__(self, task: str, route: str, settings: Dict, signals: Dict, reasons: List[str]):
+        self.task = task
+        self.route = route
+        self.settings = settings
+        self.signals = signals
+        self.reasons = reasons
+
+    @property
+    def name(self) -> str:
+        return f"{self.task}_{self.route}"
+
+
+class ModelRouter:
+    """手がかりからルートを選び、ルートごとのレイテンシを記録する"""
+
+    def __init__(self, answer_slo_ms: float = ANSWER_SLO_MS, classify_slo_ms: float = CLASSIFY_SLO_MS,
+                 fast_max_turn: int = FAST_MAX_TURN, window: int = LATENCY_WINDOW,
+                 window_seconds: float = LATENCY_WINDOW_SECONDS, probe_rate: float = PROBE_RATE,
+                 clock=time.monotonic):
+        self.slo_ms = {'answer': answer_slo_ms, 'classify': classify_slo_ms}
+        self.fast_max_turn = fast_max_turn
+        self._window = window
+        self._window_seconds = window_seconds
+        self._probe_every = round(1 / probe_rate) if probe_rate > 0 else 0
+        self._clock = clock
+        self._latencies: Dict[str, deque] = {}
+        self._downgrades: Dict[str, int] = {}
+        self._counts: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def _recent(self, name: str) -> List[float]:
+        """直近 window_seconds のレイテンシ（古いサンプルは捨てる。ロックを取って呼ぶ）"""
+        samples = self._latencies.get(name)
+        if not samples:
+            return []
+        cutoff = self._clock() - self._window_seconds
+        while samples and samples[0][0] < cutoff:
+            samples.popleft()
+        return [latency for _, latency in samples]
+
+    def _p95(self, name: str) -> Optional[float]:
+        with self._lock:
+            values = sorted(self._recent(name))
+        if len(values) < SLO_MIN_SAMPLES:
+            return None
+        return values[min(len(values) - 1, int(len(values) * 0.95))]
+
+    def _over_slo(self, task: str, route: str) -> bool:
+        p95 = self._p95(f"{task}_{route}")
+        return p95 is not None and p95 > self.slo_ms[task]
+
+    def _probe(self, name: str) -> bool:
+        """格下げするリクエストのうち、元のルートに送るものか（probe_rate ごとに1件）"""
+        with self._lock:
+            self._downgrades[name] = self._downgrades.get(name, 0) + 1
+            return bool(self._probe_every) and self._downgrades[name] % self._probe_every == 0
+
+    def _decide(self, task: str, route: str, signals: Dict, reasons: List[str], lighter: Dict) -> RouteDecision:
+        # SLO を超えているルートは1段軽いルートに下げる（一部は元のルートのレイテンシの確認に残す）
+        probe = False
+        if route in lighter and self._over_slo(task, route):
+            probe = self._probe(f"{task}_{route}")
+            if probe:
+                reasons.append(f"{route}_slo_probe")
+            else:
+                reasons.append(f"{route}_p95_over_slo")
+                route = lighter[route]
+        decision = RouteDecision(task, route, _route_settings(f"{task}_{route}"), signals, reasons)
+        with self._lock:
+            counts = self._counts.setdefault(decision.name, {'routed': 0, 'recorded': 0, 'errors': 0, 'probes': 0})
+            counts['routed'] += 1
+            counts['probes'] += probe
+        return decision
+
+    def route_answer(self, query_text: str, language: str, turn: int = 1) -> RouteDecision:
+        """
+        回答生成のルートを選ぶ
+
+        Args:
+            query_text: 質問文
+            language: 言語コード
+            turn: 通話内（チェーン内）のターン番号（初回は1）
+        """
+        script = _script(language)
+        length = query_length(query_text, language)
+        intent = guess_intent(query_text, language)
+        signals = {'length': length, 'language': language, 'turn': turn, 'intent': intent}
+        if intent == 'complex' or length > LONG_QUERY[script]:
+            route, reasons = 'deep', ['complex' if intent == 'complex' else 'long_query']
+        elif intent == 'lookup' and length <= SHORT_QUERY[script] and turn <= self.fast_max_turn:
+            route, reasons = 'fast', ['short_lookup']
+        else:
+            route, reasons = 'standard', ['default']
+        return self._decide('answer', route, signals, reasons, {'deep': 'standard', 'standard': 'fast'})
+
+    def route_classification(self, user_message: str, language: str) -> RouteDecision:
+        """緊急度分類のルートを選ぶ（短い発話は軽いモデル）"""
+        length = query_length(user_message, language)
+        signals = {'length': length, 'language': language}
+        if length <= CLASSIFY_SHORT_QUERY[_script(language)]:
+            route, reasons = 'fast', ['short_message']
+        else:
+            route, reasons = 'standard', ['default']
+        return self._decide('classify', route, signals, reasons, {'standard': 'fast'})
+
+    def record(self, decision: RouteDecision, latency_ms: float, response=None, error: bool = False) -> None:
+        """ルートのレイテンシとトークン数を記録してログに出す"""
+        usage = getattr(response, 'usage', None)
+        with self._lock:
+            counts = self._counts.setdefault(decision.name, {'routed': 0, 'recorded': 0, 'errors': 0, 'probes': 0})
+            counts['recorded'] += 1
+            counts['errors'] += error
+            if not error:
+                samples = self._latencies.setdefault(decision.name, deque(maxlen=self._window))
+                samples.append((self._clock(), latency_ms))
+        logger.info("Model route", task=decision.task, route=decision.route, model=decision.settings['model'],
+                    reasoning_effort=decision.settings['reasoning_effort'], verbosity=decision.settings['verbosity'],
+                    reasons=decision.reasons, signals=decision.signals, latency_ms=round(latency_ms, 1), error=error,
+                    input_tokens=getattr(usage, 'input_tokens', None),
+                    output_tokens=getattr(usage, 'output_tokens', None))
+
+    def stats(self) -> Dict:
+        """ルートごとの件数と直近のレイテンシ（p50 / p95）"""
+        with self._lock:
+            snapshot = {name: (dict(counts), sorted(self._recent(name)))
+                        for name, counts in self._counts.items()}
+        result = {}
+        for name, (counts, values) in sorted(snapshot.items()):
+            result[name] = {
+                **counts,
+                'p50_ms': round(values[len(values) // 2], 1) if values else None,
+                'p95_ms': round(values[min(len(values) - 1, int(len(values) * 0.95))], 1) if values else None,
+            }
+        return result
+
+
+model_router = ModelRouter()
@@ -0,0 +1,183 @@
+"""
+OpenAI リクエストのヘッジ（テールレイテンシ対策）
+
+responses.create のまれな遅延（数秒〜十数秒）が、発信者の無音や保留切れの原因になる。
+一次リクエストが適応的な遅延（直近のレイテンシの p90）を過ぎても完了しなければ同じリクエストをもう1本送り、
+先に成功した方を使ってもう一方はキャンセルする。
+
+- 遅延は呼び出しの種類（'classify' / 'answer'）ごとに直近 LATENCY_WINDOW 件の完了時間から計算する
+  （サンプルが HEDGE_MIN_SAMPLES 件に満たない間は HEDGE_INITIAL_DELAY_MS）
+- 直近 LATENCY_WINDOW 件のうちヘッジした割合が HEDGE_MAX_RATE 以上ならヘッジしない（コストの上限）
+- 一次リクエストが遅延より前に失敗した場合はヘッジせずにそのまま例外を返す。
+  ヘッジ後に片方が失敗した場合はもう一方を待ち、両方失敗したら一次リクエストの例外を返す
+- ヘッジ率・ヘッジ側の勝ち数・短縮できた時間（推定）を stats() で集計する。
+  短縮時間は、ヘッジが勝った時点より遅く完了した直近のサンプルの中央値から、勝った時点を引いた値で推定する
+
+ストリーミングでの回答生成はヘッジしない（最初の1文の先行再生が2本のストリームから届くため）。
+OPENAI_HEDGING_ENABLED=true で有効になる。効果は tools/simulate_request_hedging.py で確認できる。
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional
+
+from call_analytics import call_analytics
+from voice_logger import get_logger
+
+OPENAI_HEDGING_ENABLED = os.environ.get('OPENAI_HEDGING_ENABLED', 'false').lower() == 'true'
+HEDGE_QUANTILE = float(os.environ.get('OPENAI_HEDGE_QUANTILE', '0.9'))
+HEDGE_MAX_RATE = float(os.environ.get('OPENAI_HEDGE_MAX_RATE', '0.1'))
+HEDGE_INITIAL_DELAY_MS = float(os.environ.get('OPENAI_HEDGE_INITIAL_DELAY_MS', '3000'))
+HEDGE_MIN_DELAY_MS = float(os.environ.get('OPENAI_HEDGE_MIN_DELAY_MS', '300'))
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+
+logger = get_logger('request_hedging')
+
+
+class _Operation:
+    """呼び出しの種類ごとのレイテンシとヘッジの記録"""
+
+    def __init__(self, window: int):
+        self.latencies = deque(maxlen=window)
+        self.hedge_flags = deque(maxlen=window)
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.suppressed = 0     # ヘッジ率の上限で送らなかった
+        self.saved_ms = 0.0
+
+
+class RequestHedger:
+    """一次リクエストが遅いときだけ複製リクエストを送る"""
+
+    def __init__(self, quantile: float = HEDGE_QUANTILE, max_rate: float = HEDGE_MAX_RATE,
+                 initial_delay_ms: float = HEDGE_INITIAL_DELAY_MS, min_delay_ms: float = HEDGE_MIN_DELAY_MS,
+                 min_samples: int = HEDGE_MIN_SAMPLES, window: int = LATENCY_WINDOW, clock=time.monotonic):
+        self.quantile = quantile
+        self.max_rate = max_rate
+        self.initial_delay_ms = initial_delay_ms
+        self.min_delay_ms = min_delay_ms
+        self.min_samples = min_samples
+        self._window = window
+        self._clock = clock
+        self._operations: Dict[str, _Operation] = {}
+        self._lock = threading.Lock()
+
+    def _operation(self, name: str) -> _Operation:
+        operation = self._operations.get(name)
+        if operation is None:
+            operation = self._operations.setdefault(name, _Operation(self._window))
+        return operation
+
+    def delay_ms(self, name: str) -> float:
+        """ヘッジを送るまでの待ち時間（直近のレイテンシの quantile 点）"""
+        with self._lock:
+            values = sorted(self._operation(name).latencies)
+        if len(values) < self.min_samples:
+            return self.initial_delay_ms
+        return max(self.min_delay_ms, values[min(len(values) - 1, int(len(values) * self.quantile))])
+
+    def _allow_hedge(self, operation: _Operation) -> bool:
+        with self._lock:
+            flags = operation.hedge_flags
+            if flags and sum(flags) / len(flags) >= self.max_rate:
+                operation.suppressed += 1
+                return False
+            return True
+
+    def _estimate_saved_ms(self, operation: _Operation, won_at_ms: float) -> float:
+        """一次リクエストがあとどれだけかかったかの推定（won_at_ms より遅かったサンプルの中央値 - won_at_ms）"""
+        with self._lock:
+            slower = sorted(value for value in operation.latencies if value > won_at_ms)
+        return slower[len(slower) // 2] - won_at_ms if slower else 0.0
+
+    def _finish(self, operation: _Operation, latency_ms: float, hedged: bool, hedge_won: bool = False,
+                saved_ms: float = 0.0) -> None:
+        with self._lock:
+            operation.requests += 1
+            operation.latencies.append(latency_ms)
+            operation.hedge_flags.append(hedged)
+            operation.hedged += hedged
+            operation.hedge_wins += hedge_won
+            operation.saved_ms += saved_ms
+
+    async def call(self, name: str, make_request: Callable[[], Awaitable]):
+        """
+        make_request() の結果を返す（遅ければ make_request() をもう1回呼んで先に成功した方を返す）
+
+        Args:
+            name: 呼び出しの種類（遅延とヘッジ率はこの単位で管理する）
+            make_request: リクエストのコルーチンを作る関数（ヘッジ時に2回呼ぶ）
+        """
+        operation = self._operation(name)
+        delay_ms = self.delay_ms(name)
+        started = self._clock()
+        primary = asyncio.ensure_future(make_request())
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay_ms / 1000)
+            if done or not self._allow_hedge(operation):
+                result = await primary
+                self._finish(operation, (self._clock() - started) * 1000, hedged=False)
+                return result
+
+            hedge_started = self._clock()
+            hedge = asyncio.ensure_future(make_request())
+            call_analytics.count('openai_hedges')
+            winner = await self._first_success(primary, hedge)
+            won_at_ms = (self._clock() - started) * 1000
+            hedge_won = winner is hedge
+            saved_ms = self._estimate_saved_ms(operation, won_at_ms) if hedge_won else 0.0
+            latency_ms = (self._clock() - hedge_started) * 1000 if hedge_won else won_at_ms
+            self._finish(operation, latency_ms, hedged=True, hedge_won=hedge_won, saved_ms=saved_ms)
+            logger.info("Hedged request", operation=name, delay_ms=round(delay_ms, 1),
+                        winner='hedge' if hedge_won else 'primary', latency_ms=round(won_at_ms, 1),
+                        estimated_saved_ms=round(saved_ms, 1))
+            return winner.result()
+        finally:
+            if not primary.done():
+                primary.cancel()
+
+    @staticmethod
+    async def _first_success(primary: asyncio.Future, hedge: asyncio.Future) -> asyncio.Future:
+        """先に成功した方を返し、もう一方はキャンセルする（両方失敗なら一次リクエストの例外）"""
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in (primary, hedge):
+                    if future in done and not future.cancelled() and future.exception() is None:
+                        return future
+            primary.result()  # 両方失敗: 一次リクエストの例外を送出
+            return hedge
+        finally:
+            for future in pending:
+                future.cancel()
+            if pending:
+                await asyncio.wait(pending)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                name: {
+                    'requests': operation.requests,
+                    'hedged': operation.hedged,
+                    'hedge_rate': round(operation.hedged / operation.requests, 3) if operation.requests else 0.0,
+                    'hedge_wins': operation.hedge_wins,
+                    'suppressed': operation.suppressed,
+                    'estimated_saved_ms': round(operation.saved_ms, 1),
+                }
+                for name, operation in self._operations.items()
+            }
+
+
+request_hedger = RequestHedger()
+
+
+async def hedged_request(name: str, make_request: Callable[[], Awaitable], hedger: Optional[RequestHedger] = None):
+    """OPENAI_HEDGING_ENABLED なら request_hedger 経由、無効ならそのまま make_request() を待つ"""
+    if not OPENAI_HEDGING_ENABLED:
+        return await make_request()
+    return await (hedger or request_hedger).call(name, make_request)
@@ -0,0 +1,121 @@
+"""
+初回ターンの投機的ベクトル検索
+
+初回ターンは「分類 → 一般問い合わせなら検索」と LLM を2回直列に待っていたため、
+分類と同時に検索を開始しておき、分類結果が general ならその検索結果をそのまま使う。
+urgent / operator_request / unknown / error の場合は検索タスクをキャンセルする。
+
+ルールベースのプレ分類で即判定できた場合は、検索タスクがイベントループで一度も
+実行されないうちにキャンセルされるため、OpenAI へのリクエストは発生しない。
+
+SPECULATIVE_SEARCH_ENABLED=false で無効化できる。
+"""
+import asyncio
+import os
+import threading
+import time
+from typing import Coroutine, Dict, Optional
+
+from voice_logger import get_logger
+
+SPECULATIVE_SEARCH_ENABLED = os.environ.get('SPECULATIVE_SEARCH_ENABLED', 'true').lower() == 'true'
+
+logger = get_logger('speculative_search')
+
+
+class SpeculationStats:
+    """投機的検索の効果（無駄になった呼び出しと短縮できた時間）のカウンタ"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.launched = 0
+        self.used = 0
+        self.cancelled_unsent = 0   # 実行前にキャンセル（リクエストなし）
+        self.wasted = 0             # 実行中・完了後に破棄（リクエストが無駄になった）
+        self.saved_ms = 0.0         # 分類と並行して進んだ検索時間の合計
+        self.wasted_ms = 0.0        # 破棄した検索が走っていた時間の合計
+
+    def record(self, field: str, elapsed_ms: float = 0.0) -> None:
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+            if field == 'used':
+                self.saved_ms += elapsed_ms
+            elif field == 'wasted':
+                self.wasted_ms += elapsed_ms
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                'launched': self.launched,
+                'used': self.used,
+                'cancelled_unsent': self.cancelled_unsent,
+                'wasted': self.wasted,
+                'saved_ms': round(self.saved_ms, 1),
+                'wasted_ms': round(self.wasted_ms, 1)
+            }
+
+
+speculation_stats = SpeculationStats()
+
+
+class SpeculativeSearch:
+    """分類と並行して走らせる検索タスク"""
+
+    def __init__(self, search: Coroutine, stats: SpeculationStats = speculation_stats, clock=time.monotonic):
+        self._clock = clock
+        self._stats = stats
+        self._search = search
+        self._sent = False
+        self._settled = False
+        self._started_at = clock()
+        self._search_finished_at: Optional[float] = None
+        self._classified_at: Optional[float] = None
+        self._task = asyncio.ensure_future(self._run())
+        stats.record('launched')
+
+    async def _run(self) -> str:
+        # ここに到達した時点で検索コルーチンが動き出す（＝リクエストが送られる）
+        self._sent = True
+        try:
+            return await self._search
+        finally:
+            self._search_finished_at = self._clock()
+
+    def _elapsed_ms(self, until: float) -> float:
+        return (until - self._started_at) * 1000
+
+    def mark_classified(self) -> None:
+        """分類が完了した時刻を記録（短縮時間の計算に使う）"""
+        self._classified_at = self._clock()
+
+    async def result(self) -> str:
+        """分類が general だった場合に検索結果を受け取る"""
+        if self._classified_at is None:
+            self.mark_classified()
+        self._settled = True
+        try:
+            return await self._task
+        finally:
+            # 分類の待ち時間のうち検索が並行して進んでいた分が短縮時間
+            search_end = self._search_finished_at or self._clock()
+            saved_ms = self._elapsed_ms(min(self._classified_at, search_end))
+            self._stats.record('used', saved_ms)
+            logger.info("Speculative search used", saved_ms=round(saved_ms, 1), stats=self._stats.snapshot)
+
+    async def discard(self, urgency: Optional[str]) -> None:
+        """分類が general 以外だった場合に検索をキャンセル（result() / discard() 済みなら何もしない）"""
+        if self._settled:
+            return
+        self._settled = True
+        if not self._sent:
+            self._task.cancel()
+            self._search.close()  # 一度も実行されていないコルーチンを閉じる
+            self._stats.record('cancelled_unsent')
+        else:
+            self._task.cancel()
+            self._stats.record('wasted', self._elapsed_ms(self._search_finished_at or self._clock()))
+        try:
+            await self._task
+        except (asyncio.CancelledError, Exception):
+            pass  # 破棄する検索のエラーは無視
+        logger.info("Speculative search discarded", urgency=urgency, stats=self._stats.snapshot)
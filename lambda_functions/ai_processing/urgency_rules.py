@@ -0,0 +1,223 @@
+"""
+ルールベースの緊急度プレ分類
+
+「火事です」「人と話したい」「operator please」のように、分類プロンプト自体に例として
+挙がっている明白なケースをLLMに問い合わせる前にローカルで判定する。
+確信度が高い場合だけ urgent / operator_request を返し、それ以外はNoneを返してLLMに任せる。
+
+- 語彙は単語ではなく意図を含むフレーズ（「火事です」「人が倒れ」「there is a fire」「talk to a human」）にする。
+  "fire" "human" 「倒れ」「担当者」のような単語だけでは「fire show」「倒れたゴミ箱」「担当者の名前」にも一致するため。
+- 日本語: NFKC・カタカナ→ひらがな・長音記号/空白/句読点の除去をしてから部分一致で照合し、
+  音声認識の表記ゆれ（「オペレータ」「おぺれーたー」など）を吸収する。
+- 英語: 単語列（小文字・アポストロフィ除去）に対してフレーズ単位で照合し、
+  "fireworks" や "smoking area" のような語の一部への誤一致を避ける。
+- 否定・仮定の表現（「火事ではない」「火事の場合は」「not a fire」「in case of」）、
+  設備の場所・使い方の質問（「消火器はどこ」「where is the fire alarm」）、
+  既知の紛らわしい用法（「fire pit」「robbed of sleep」「ゴミ箱が倒れ」「担当者の名前」）はブロックしてLLMに回す。
+- operator_request は発話が取り次ぎの依頼だけのとき（英語は残りの語が「I want to」「please」などの
+  言い回しだけ、日本語は一致した語以外が短いとき）に限る。「speak to a person about late checkout」のように
+  別の用件を含む発話はLLMに回す。
+- urgent と operator_request の両方に一致した場合は urgent を優先する。
+
+語彙の調整後は tools/evaluate_urgency_rules.py でラベル付きフィクスチャ（紛らわしい一般の質問を含む）の
+適合率・再現率を確認する。
+"""
+import os
+import re
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+URGENCY_PRERULES_ENABLED = os.environ.get('URGENCY_PRERULES_ENABLED', 'true').lower() == 'true'
+
+# 日本語（正規化後のテキストに部分一致。表記は正規化前のままでよい）
+JA_URGENT_TERMS: Tuple[str, ...] = (
+    # 火災・煙・ガス
+    "火事です", "火事だ", "火事が起き", "火事になっ", "火事が発生", "かじです", "かじだ", "火災が発生",
+    "火が出て", "燃えて", "もえて", "煙が出", "煙が充満", "けむりが", "焦げ臭い", "焦げくさい", "こげくさい",
+    "ガス漏れ", "ガスもれ", "ガスの臭い", "ガスのにおい", "ガス臭い", "ガスくさい",
+    # 水漏れ
+    "水漏れ", "みずもれ", "水もれ", "漏水", "水があふれ", "水が溢れ",
+    # 急病・怪我（「倒れ」は人が倒れた場合だけ）
+    "救急車を", "きゅうきゅうしゃを", "怪我をして", "怪我をしました", "怪我して", "怪我しました",
+    "けがをして", "けがをしました", "けがして", "けがしました", "血が出", "血が止まら", "出血",
+    "人が倒れ", "ひとがたおれ", "友達が倒れ", "友人が倒れ", "家族が倒れ", "子供が倒れ", "子どもが倒れ",
+    "夫が倒れ", "妻が倒れ", "父が倒れ", "母が倒れ", "連れが倒れ", "急に倒れ", "きゅうにたおれ",
+    "倒れて意識", "倒れて動か", "倒れて起き", "意識がない", "いしきがない",
+    "息ができない", "いきができない", "息が苦しい",
+    # 防犯
+    "泥棒が入", "泥棒に入", "泥棒です", "どろぼうがはい", "どろぼうです", "盗まれ", "ぬすまれ",
+    "不審者", "ふしんしゃ", "侵入され", "侵入して", "侵入者", "閉じ込め", "とじこめ",
+    # 災害
+    "地震です", "地震が起き", "地震が来", "じしんです", "津波警報", "津波が来",
+)
+
+JA_OPERATOR_TERMS: Tuple[str, ...] = (
+    "オペレーターと話", "オペレーターにつな", "オペレーターに繋", "オペレーターお願い", "オペレーターをお願い",
+    "オペレーターに代わ", "オペレーターにかわ",
+    "人と話", "ひとと話", "ひととはな", "人間と話", "にんげんと話", "にんげんとはな", "人間の方と",
+    "スタッフに繋", "スタッフにつな", "スタッフと話", "スタッフに代わ",
+    "担当者と話", "担当者に繋", "担当者につな", "担当者に代わ", "担当者はいますか", "担当者いますか",
+    "たんとうしゃとはな", "係の人と", "係の人に", "かかりのひと", "人に繋", "人につな", "誰かと話", "だれかと話",
+    "だれかとはな",
+)
+# 発話全体がこれだけなら operator_request
+JA_OPERATOR_UTTERANCES: Tuple[str, ...] = ("オペレーター", "オペレーターさん", "オペレーターです")
+# operator_request とみなす発話の、一致した語以外の長さ（正規化後の文字数）の上限
+JA_OPERATOR_MAX_EXTRA_CHARS = 12
+
+# 英語（単語列に対してフレーズ一致）
+EN_URGENT_PHRASES: Tuple[str, ...] = (
+    "there is a fire", "theres a fire", "there was a fire", "a fire in", "on fire", "caught fire",
+    "catching fire", "started a fire", "fire broke out", "call the fire department",
+    "smell smoke", "there is smoke", "theres smoke", "full of smoke", "smoke coming",
+    "burning smell", "smells like burning", "gas leak", "smell gas", "smells like gas", "water leak",
+    "leaking water", "is flooding", "is flooded", "call an ambulance", "need an ambulance", "send an ambulance",
+    "get an ambulance", "someone collapsed", "has collapsed", "just collapsed", "is injured", "im injured", "got injured", "been injured", "bleeding", "unconscious",
+    "cant breathe", "cannot breathe", "intruder", "broke in", "broken into", "tried to break in",
+    "breaking in", "was stolen", "were stolen", "been stolen", "got stolen", "someone stole", "stole my",
+    "i was robbed", "we were robbed", "been robbed", "got robbed",
+    "there was an earthquake", "there is an earthquake", "theres an earthquake", "earthquake just",
+    "tsunami warning", "tsunami alert", "tsunami is coming",
+    "its an emergency", "this is an emergency", "emergency please", "im trapped", "were trapped",
+    "trapped in", "stuck in the elevator",
+)
+
+EN_OPERATOR_PHRASES: Tuple[str, ...] = (
+    "talk to an operator", "speak to an operator", "speak with an operator", "talk to the operator",
+    "speak to the operator", "connect me to an operator", "connect me to the operator", "operator please",
+    "talk to a human", "speak to a human", "speak with a human", "talk with a human",
+    "talk to a real person", "speak to a real person", "speak with a real person",
+    "talk to a person", "speak to a person", "speak with a person",
+    "speak to someone", "talk to someone", "speak with someone", "talk with someone",
+    "speak to staff", "talk to staff", "speak to a staff", "talk to a staff",
+    "speak to a representative", "talk to a representative",
+)
+# 発話全体がこれだけなら operator_request
+EN_OPERATOR_UTTERANCES = frozenset({
+    "operator", "operater", "opera tor", "representative", "representative please", "human please",
+    "a human please", "real person please",
+})
+# operator_request のフレーズ以外に含まれていてよい語（取り次ぎの依頼の言い回し）
+EN_REQUEST_WORDS = frozenset({
+    "i", "id", "im", "we", "want", "wanna", "would", "like", "to", "can", "could", "may", "let", "me", "us",
+    "please", "just", "need", "do", "you", "is", "it", "there", "possible", "a", "an", "the", "now", "right",
+    "ok", "okay", "yes", "yeah", "hi", "hello", "hey", "um", "uh", "so", "actually", "sorry", "excuse",
+    "connect", "transfer", "put", "through", "get", "thanks", "thank",
+})
+
+# 一致してもLLMに回す表現
+JA_BLOCKING_TERMS: Tuple[str, ...] = (
+    "ではない", "じゃない", "ではありません", "じゃありません", "大丈夫", "だいじょうぶ",
+    "場合", "ばあい", "時は", "ときは", "どこ", "ありますか", "使い方", "つかいかた",
+    "消火器", "しょうかき", "火災報知", "報知器", "非常口", "避難経路", "花火",
+    # 既知の紛らわしい用法
+    "ゴミ箱", "ごみばこ", "名前", "なまえ", "苦手", "にがて", "多いですか", "おおいですか",
+    "営業時間", "対応時間", "受付時間",
+)
+EN_BLOCKING_WORDS = frozenset({
+    "no", "not", "dont", "isnt", "wasnt", "arent", "never", "where", "extinguisher", "alarm",
+    "exit", "fireworks", "firework", "smoking", "if",
+})
+EN_BLOCKING_PHRASES: Tuple[str, ...] = (
+    "in case of", "how do i", "how to", "what should i do if",
+    # 既知の紛らわしい用法
+    "fire pit", "fire show", "fire drill", "fire escape", "fire door", "fire station", "fire place",
+    "fire dance", "fire works", "fire safety", "robbed of", "per person", "tour operator", "operator of",
+)
+
+_LONG_VOWEL_MARKS = str.maketrans('', '', 'ー－―‐')
+_ENGLISH_WORD = re.compile(r"[a-z0-9]+")
+
+
+def _katakana_to_hiragana(text: str) -> str:
+    return ''.join(chr(ord(ch) - 0x60) if 'ァ' <= ch <= 'ヶ' else ch for ch in text)
+
+
+def normalize_transcript(text: str) -> str:
+    """日本語照合用: 表記ゆれを吸収し、空白・句読点・記号を除いたテキスト"""
+    normalized = unicodedata.normalize('NFKC', text or '').casefold()
+    normalized = _katakana_to_hiragana(normalized).translate(_LONG_VOWEL_MARKS)
+    return ''.join(
+        ch for ch in normalized
+        if not unicodedata.category(ch).startswith(('P', 'Z', 'C', 'S'))
+    )
+
+
+def english_words(text: str) -> str:
+    """英語照合用: 前後を空白で囲んだ小文字の単語列（"can't" → "cant"）"""
+    normalized = unicodedata.normalize('NFKC', text or '').casefold().replace("'", '').replace('’', '')
+    return f" {' '.join(_ENGLISH_WORD.findall(normalized))} "
+
+
+def _phrase(phrase: str) -> str:
+    return f" {phrase} "
+
+
+_JA_URGENT = tuple(normalize_transcript(term) for term in JA_URGENT_TERMS)
+_JA_OPERATOR = tuple(normalize_transcript(term) for term in JA_OPERATOR_TERMS)
+_JA_OPERATOR_UTTERANCES = frozenset(normalize_transcript(term) for term in JA_OPERATOR_UTTERANCES)
+_JA_BLOCKING = tuple(normalize_transcript(term) for term in JA_BLOCKING_TERMS)
+_EN_URGENT = tuple(_phrase(phrase) for phrase in EN_URGENT_PHRASES)
+_EN_OPERATOR = tuple(_phrase(phrase) for phrase in EN_OPERATOR_PHRASES)
+_EN_BLOCKING = tuple(_phrase(phrase) for phrase in EN_BLOCKING_PHRASES)
+
+
+def _matches(text: str, terms: Tuple[str, ...]) -> List[str]:
+    return [term.strip() for term in terms if term in text]
+
+
+def _is_blocked(japanese: str, english: str) -> bool:
+    if any(term in japanese for term in _JA_BLOCKING):
+        return True
+    if EN_BLOCKING_WORDS.intersection(english.split()):
+        return True
+    return any(phrase in english for phrase in _EN_BLOCKING)
+
+
+def _operator_hits(japanese: str, english: str) -> List[str]:
+    """
+    取り次ぎの依頼だけの発話なら一致した語を返す（別の用件を含む発話は空リスト）
+    """
+    if japanese in _JA_OPERATOR_UTTERANCES:
+        return [japanese]
+    if english.strip() in EN_OPERATOR_UTTERANCES:
+        return [english.strip()]
+
+    hits = []
+    ja_hits = _matches(japanese, _JA_OPERATOR)
+    if ja_hits and len(japanese) - max(len(term) for term in ja_hits) <= JA_OPERATOR_MAX_EXTRA_CHARS:
+        hits += ja_hits
+    en_hits = _matches(english, _EN_OPERATOR)
+    if en_hits:
+        rest = english
+        for phrase in en_hits:
+            rest = rest.replace(_phrase(phrase), ' ')
+        if set(rest.split()) <= EN_REQUEST_WORDS:
+            hits += en_hits
+    return hits
+
+
+def pre_classify(user_message: str) -> Optional[Dict]:
+    """
+    明白な urgent / operator_request をローカルで判定
+
+    Args:
+        user_message: 音声認識結果のテキスト
+
+    Returns:
+        {'urgency': 'urgent' | 'operator_request', 'matched': [一致した語]}
+        確信度が低い場合はNone（LLMで分類する）
+    """
+    japanese = normalize_transcript(user_message)
+    english = english_words(user_message)
+    if not japanese or _is_blocked(japanese, english):
+        return None
+
+    urgent_hits = _matches(japanese, _JA_URGENT) + _matches(english, _EN_URGENT)
+    if urgent_hits:
+        return {'urgency': 'urgent', 'matched': urgent_hits}
+
+    operator_hits = _operator_hits(japanese, english)
+    if operator_hits:
+        return {'urgency': 'operator_request', 'matched': operator_hits}
+    return None
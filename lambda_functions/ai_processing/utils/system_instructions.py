@@ -1,5 +1,9 @@
 from .calculate_key_code import calculate_key_code
 from datetime import datetime
+from functools import lru_cache
+from voice_logger import get_logger
+
+logger = get_logger('system_instructions')
 
 
 # 共通の応答生成ガイドライン
@@ -31,7 +35,8 @@ COMMON_SYSTEM_CAPABILITIES = """
 """
 
 
-# 共通のneeds_operator判定ルールとend_conversation判定ルール、JSON形式の説明
+# 共通のneeds_operator判定ルールとend_conversation判定ルール
+# （JSONの形式は vector_search の strict な json_schema で強制されるため、ここでは説明しない）
 COMMON_NEEDS_OPERATOR_INSTRUCTIONS = """
 以下の場合は 'needs_operator' フラグをTrueにしてください：
 1. 検索結果が見つからない場合や、情報が不十分な場合
@@ -47,75 +52,93 @@ COMMON_NEEDS_OPERATOR_INSTRUCTIONS = """
 
 'end_conversation' フラグがTrueの場合は、assistant_response_textで「承知いたしました」などの締めの挨拶を含めてください。
 それ以外の場合は 'end_conversation' をFalseにしてください。
-
-回答は以下のJSON形式で返してください：
-{{
-  "assistant_response_text": "ユーザーへの応答テキスト（{language}）",
-  "needs_operator": true または false,
-  "end_conversation": true または false
-}}
 """
 
 
-def get_vector_search_instructions(guest_info: dict, language: str) -> str:
+# 施設とアシスタントの役割（全ゲスト共通）
+ASSISTANT_IDENTITY = "あなたは、〒552-0021 大阪府大阪市港区築港4-2-24にある、Osaka Bay Wheel民泊の親切な電話応答アシスタントです。"
+
+
+# ゲスト状態クラス（インストラクションの分岐・回答キャッシュのキーに使う）
+GUEST_STATE_IN_STAY = "in_stay"    # 承認済みかつ滞在期間内（キーボックスの暗証番号を案内できる）
+GUEST_STATE_DEFAULT = "default"    # 未承認、または滞在期間外
+
+
+def get_guest_state(guest_info: dict, now: datetime = None) -> str:
     """
-    ベクトル検索用の基本システムインストラクション
+    ゲスト情報から状態クラスを判定
     
     Args:
         guest_info: ゲスト情報辞書
-        language: 応答言語（例: "ja-JP", "en-US"）
+        now: 判定時刻（省略時は現在時刻）
     
     Returns:
-        システムインストラクション文字列
+        GUEST_STATE_IN_STAY または GUEST_STATE_DEFAULT
     """
-    # ゲスト情報から各変数を取得
-    guest_name = guest_info.get('guestName') if guest_info else None
-    room_number = guest_info.get('roomNumber') if guest_info else None
-    # phone = guest_info.get('phone') if guest_info else None
     check_in_date = guest_info.get('checkInDate') if guest_info else None
     check_out_date = guest_info.get('checkOutDate') if guest_info else None
     approval_status = guest_info.get('approvalStatus') if guest_info else None
-    key_code = calculate_key_code(room_number) if room_number else None
-    
-    # 現在時刻
-    now = datetime.now()
     
-    # デフォルト条件：approval_status が approved 以外、または滞在期間外
-    use_default_instructions = True
+    if approval_status != 'approved' or not check_in_date or not check_out_date:
+        return GUEST_STATE_DEFAULT
     
-    if approval_status == 'approved' and check_in_date and check_out_date:
-        try:
-            # check_in_date の深夜0時
-            check_in_datetime = datetime.fromisoformat(check_in_date.replace('Z', '+00:00'))
-            check_in_start = check_in_datetime.replace(hour=0, minute=0, second=0, microsecond=0)
-            
-            # check_out_date の昼12時
-            check_out_datetime = datetime.fromisoformat(check_out_date.replace('Z', '+00:00'))
-            check_out_end = check_out_datetime.replace(hour=12, minute=0, second=0, microsecond=0)
-            
-            # 滞在期間内かチェック
-            if check_in_start <= now <= check_out_end:
-                use_default_instructions = False
-        except (ValueError, AttributeError) as e:
-            print(f"Warning: Failed to parse dates: {e}")
-            use_default_instructions = True
-    
-    # デフォルトパターン（承認されていないか、滞在期間外）
-    if use_default_instructions:
-        system_instructions = f"""あなたは、〒552-0021 大阪府大阪市港区築港4-2-24にある、Osaka Bay Wheel民泊の親切な電話応答アシスタントです。
-あなたの担当は、{room_number}号室の{guest_name}様です。
+    now = now or datetime.now()
+    try:
+        # check_in_date の深夜0時
+        check_in_datetime = datetime.fromisoformat(check_in_date.replace('Z', '+00:00'))
+        check_in_start = check_in_datetime.replace(hour=0, minute=0, second=0, microsecond=0)
+        
+        # check_out_date の昼12時
+        check_out_datetime = datetime.fromisoformat(check_out_date.replace('Z', '+00:00'))
+        check_out_end = check_out_datetime.replace(hour=12, minute=0, second=0, microsecond=0)
+        
+        # 滞在期間内かチェック
+        if check_in_start <= now <= check_out_end:
+            return GUEST_STATE_IN_STAY
+    except (ValueError, AttributeError) as e:
+        logger.warning("Failed to parse dates", error=e)
+    return GUEST_STATE_DEFAULT
+
+
+@lru_cache(maxsize=None)
+def get_instruction_prefix(language: str) -> str:
+    """
+    全ゲスト共通のインストラクション（言語ごとにプロセス内で一度だけ組み立てる）
 
-{COMMON_RESPONSE_GUIDELINES.format(language=language)}
-{COMMON_SYSTEM_CAPABILITIES}
-{COMMON_NEEDS_OPERATOR_INSTRUCTIONS.format(language=language)}"""
-    else:
-        # 承認済みかつ滞在期間内のパターン
-        system_instructions = f"""あなたは、〒552-0021 大阪府大阪市港区築港4-2-24にある、Osaka Bay Wheel民泊の親切な電話応答アシスタントです。
-あなたの担当は、{room_number}号室の{guest_name}様です。
-{room_number}号室のキーボックスの暗証番号のダイヤル4桁（**Key Box Code**）の番号は : {key_code}
+    OpenAIのプロンプトキャッシュは先頭一致で効くため、ゲストごとに変わる内容は含めず、
+    同じ言語なら常にバイト単位で同一の文字列を返す。
+    """
+    return f"""{ASSISTANT_IDENTITY}
 
 {COMMON_RESPONSE_GUIDELINES.format(language=language)}
 {COMMON_SYSTEM_CAPABILITIES}
-{COMMON_NEEDS_OPERATOR_INSTRUCTIONS.format(language=language)}"""
+{COMMON_NEEDS_OPERATOR_INSTRUCTIONS}"""
+
+
+def get_guest_instruction_suffix(guest_info: dict) -> str:
+    """
+    ゲストごとのインストラクション（共通部分の後ろに付ける）
+
+    キーボックスの暗証番号は承認済みかつ滞在期間内のゲストにのみ含める。
+    """
+    guest_name = guest_info.get('guestName') if guest_info else None
+    room_number = guest_info.get('roomNumber') if guest_info else None
+    suffix = f"\nあなたの担当は、{room_number}号室の{guest_name}様です。\n"
+    if get_guest_state(guest_info) == GUEST_STATE_IN_STAY:
+        key_code = calculate_key_code(room_number) if room_number else None
+        suffix += f"{room_number}号室のキーボックスの暗証番号のダイヤル4桁（**Key Box Code**）の番号は : {key_code}\n"
+    return suffix
+
+
+def get_vector_search_instructions(guest_info: dict, language: str) -> str:
+    """
+    ベクトル検索用の基本システムインストラクション
+    
+    Args:
+        guest_info: ゲスト情報辞書
+        language: 応答言語（例: "ja-JP", "en-US"）
     
-    return system_instructions
+    Returns:
+        システムインストラクション文字列（共通部分 + ゲストごとの部分）
+    """
+    return get_instruction_prefix(language) + get_guest_instruction_suffix(guest_info)
@@ -1,17 +1,40 @@
 import asyncio
+from call_analytics import call_analytics
+from call_tracing import tracer
+from voice_logger import get_logger
 
-async def update_twilio_call_async(twilio_client, call_sid: str, twiml_string: str):
-    """Twilioの通話を非同期で更新する (実際にはrun_in_executorで同期呼び出しをラップ)"""
+logger = get_logger('twilio_utils')
+
+
+async def update_twilio_call_async(twilio_client, call_sid: str, twiml_string: str, dispatcher=None):
+    """
+    Twilioの通話を非同期で更新する
+
+    dispatcher（CallUpdateDispatcher）があればaiohttpの接続プール経由で送信し、
+    なければ同期クライアントの calls(call_sid).update をスレッドで実行する。
+    """
+    with tracer.span('twilio_update'):
+        result = await _update_twilio_call(twilio_client, call_sid, twiml_string, dispatcher)
+    call_analytics.audio_delivered()  # 送る TwiML はどれも音声（アナウンス・回答・案内）で始まる
+    return result
+
+
+async def _update_twilio_call(twilio_client, call_sid: str, twiml_string: str, dispatcher=None):
+    if dispatcher:
+        try:
+            return await dispatcher.update(call_sid, twiml_string)
+        except Exception as e:
+            logger.error("Error in update_twilio_call_async", error=e)
+            raise
     if not twilio_client:
-        print("Error: update_twilio_call_async - Twilio client not initialized.")
+        logger.error("update_twilio_call_async - Twilio client not initialized.")
         # エラーを呼び出し元に伝えるか、ここで例外を発生させる
         raise ConnectionError("Twilio client not initialized for async update.")
     try:
-        loop = asyncio.get_event_loop()
         # twilio_client.calls(call_sid).update はブロッキングIOなので別スレッドで実行
-        await loop.run_in_executor(None, lambda: twilio_client.calls(call_sid).update(twiml=twiml_string))
-        print(f"Async Twilio call update for {call_sid} completed via executor.")
+        await asyncio.to_thread(lambda: twilio_client.calls(call_sid).update(twiml=twiml_string))
+        logger.info("Async Twilio call update completed via executor.")
     except Exception as e:
-        print(f"Error in update_twilio_call_async for call {call_sid}: {e}")
+        logger.error("Error in update_twilio_call_async", error=e)
         # エラーを呼び出し元に伝えるか、ここで例外を発生させる
-        raise
\ No newline at end of file
+        raise
@@ -1,4 +1,8 @@
 import os
+from voice_logger import get_logger
+
+logger = get_logger('validation')
+
 
 def validate_essential_env_vars():
     """
@@ -41,15 +45,15 @@ def validate_handler_resources(twilio_client, openai_async_client, call_sid):
     全て正常なら None を返します。
     """
     if not twilio_client:
-        print("エラー: Twilio clientが初期化されていません。")
+        logger.error("Twilio clientが初期化されていません。")
         return {'status': 'error', 'message': 'Twilio client not initialized at handler start'}
 
     if not openai_async_client:
-        print("エラー: OpenAI async clientが初期化されていません。")
+        logger.error("OpenAI async clientが初期化されていません。")
         return {'status': 'error', 'message': 'OpenAI async client not initialized at handler start'}
 
     if not call_sid:
-        print("エラー: call_sid がイベントに含まれていません。")
+        logger.error("call_sid がイベントに含まれていません。")
         return {'status': 'error', 'message': 'Missing call_sid'}
 
     # 全て正常なら None を返す
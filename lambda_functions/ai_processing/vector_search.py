@@ -1,7 +1,42 @@
+import asyncio
 import openai
 import json
-from typing import Optional
-from utils.system_instructions import get_vector_search_instructions
+import os
+import time
+from typing import Awaitable, Callable, Optional
+from utils.system_instructions import get_vector_search_instructions, get_guest_state
+from answer_cache import ANSWER_CACHE_ENABLED, answer_cache
+from answer_streaming import PartialAnswerExtractor, first_sentence
+from context_compaction import CONTEXT_COMPACTION_ENABLED, ChainPlan, conversation_compactor
+from facility_retrieval import FacilityIndex, format_context, get_facility_index
+from model_routing import MODEL_ROUTING_ENABLED, model_router
+from request_hedging import hedged_request
+from circuit_breaker import CircuitOpenError, check_circuit, degradable_errors, guarded_request
+from canned_answers import get_canned_answers
+from voice_logger import get_logger
+
+# 施設資料の検索方法: file_search（OpenAI のベクターストア）/ local（レイヤーの索引をプロセス内で検索）
+FACILITY_RETRIEVAL_MODE = os.environ.get('FACILITY_RETRIEVAL_MODE', 'file_search')
+FACILITY_RETRIEVAL_TOP_K = int(os.environ.get('FACILITY_RETRIEVAL_TOP_K', '4'))
+FACILITY_RETRIEVAL_MIN_SCORE = float(os.environ.get('FACILITY_RETRIEVAL_MIN_SCORE', '2.0'))
+FACILITY_RETRIEVAL_USE_VECTORS = os.environ.get('FACILITY_RETRIEVAL_USE_VECTORS', 'false').lower() == 'true'
+FACILITY_RETRIEVAL_MIN_SIMILARITY = float(os.environ.get('FACILITY_RETRIEVAL_MIN_SIMILARITY', '0.3'))
+
+# file_search の検索設定と応答生成の設定（言語ごとの上書きは FILE_SEARCH_SETTINGS_BY_LANGUAGE に JSON で指定。
+# 値は tools/benchmark_retrieval_settings.py のレポートから選ぶ）
+DEFAULT_SEARCH_SETTINGS = {
+    'max_num_results': int(os.environ.get('FILE_SEARCH_MAX_NUM_RESULTS', '10')),
+    'score_threshold': float(os.environ.get('FILE_SEARCH_SCORE_THRESHOLD', '0.2')),
+    'model': os.environ.get('VECTOR_SEARCH_MODEL', 'gpt-5-mini'),
+    'reasoning_effort': os.environ.get('VECTOR_SEARCH_REASONING_EFFORT', 'low'),
+    'verbosity': os.environ.get('VECTOR_SEARCH_VERBOSITY', 'low')
+}
+SEARCH_SETTINGS_BY_LANGUAGE = json.loads(os.environ.get('FILE_SEARCH_SETTINGS_BY_LANGUAGE') or '{}')
+
+logger = get_logger('vector_search')
+
+EXTRACTION_FAILED_TEXT = "検索結果に基づく応答の抽出に失敗しました。"
+LOCAL_CONTEXT_HEADER = "データベースの検索結果（この内容に基づいて回答してください）:\n"
 
 
 def _create_error_response(message: str, response_id: str = None) -> str:
@@ -14,6 +49,24 @@ def _create_error_response(message: str, response_id: str = None) -> str:
     }, ensure_ascii=False)
 
 
+def _create_degraded_response(query_text: str, language: str, previous_response_id: str = None) -> str:
+    """
+    OpenAI を利用できないとき（ブレーカーが開いている・障害で失敗した）の縮退応答のJSON文字列
+
+    定型回答があればそれを返し、なければ回答テキストを空にして needs_operator=True にする
+    （呼び出し側が案内メッセージとオペレーター転送の選択肢を送る）。
+    会話を引き継げるよう、前のターンのレスポンスIDをそのまま返す。
+    """
+    canned = get_canned_answers().match(query_text, language)
+    return json.dumps({
+        "assistant_response_text": canned or "",
+        "needs_operator": canned is None,
+        "end_conversation": False,
+        "response_id": previous_response_id,
+        "degraded": True
+    }, ensure_ascii=False)
+
+
 def _get_response_format_schema() -> dict:
     """レスポンスフォーマットのスキーマを取得"""
     return {
@@ -37,26 +90,44 @@ def _get_response_format_schema() -> dict:
     }
 
 
-def _build_request_payload(system_instructions: str, query_text: str, vector_store_id: str, previous_response_id: str = None) -> dict:
-    """APIリクエストペイロードを構築"""
+def search_settings_for(language: str, overrides: dict = None, route_settings: dict = None) -> dict:
+    """言語の検索設定（既定値 < 言語ごとの設定 < ルーティングで選んだ設定 < 呼び出し側の上書き）"""
+    return {**DEFAULT_SEARCH_SETTINGS, **SEARCH_SETTINGS_BY_LANGUAGE.get(language, {}), **(route_settings or {}),
+            **(overrides or {})}
+
+
+def _build_request_payload(system_instructions: str, query_text: str, vector_store_id: str, previous_response_id: str = None,
+                           chain_plan: ChainPlan = None, retrieved_context: str = None,
+                           search_settings: dict = None) -> dict:
+    """
+    APIリクエストペイロードを構築
+
+    search_settings（search_settings_for の戻り値）を省略すると既定の検索設定を使う。
+    chain_plan があれば圧縮した文脈とチェーン情報を付ける。
+    retrieved_context（プロセス内検索の結果）があれば file_search ツールを使わずに入力へ入れる。
+    """
+    settings = search_settings or DEFAULT_SEARCH_SETTINGS
+    context_items = list(chain_plan.context_items) if chain_plan else []
+    if retrieved_context is not None:
+        context_items.append({"role": "developer", "content": LOCAL_CONTEXT_HEADER + retrieved_context})
     payload = {
-        "model": "gpt-5-mini",
+        "model": settings['model'],
         "instructions": system_instructions,
-        "input": [{"role": "user", "content": query_text}],
+        "input": [*context_items, {"role": "user", "content": query_text}],
         "tools": [
             {
                 "type": "file_search",
                 "vector_store_ids": [vector_store_id],
-                "max_num_results": 10,
-                "ranking_options": {"score_threshold": 0.2}
+                "max_num_results": settings['max_num_results'],
+                "ranking_options": {"score_threshold": settings['score_threshold']}
             }
         ],
         "reasoning": {
-            "effort": "low"
+            "effort": settings['reasoning_effort']
         },
         "tool_choice": "auto",
         "text": {
-            "verbosity": "low",
+            "verbosity": settings['verbosity'],
             "format": {
                 "type": "json_schema",
                 "name": "AssistantResponseWithOperatorFlag",
@@ -65,6 +136,11 @@ def _build_request_payload(system_instructions: str, query_text: str, vector_sto
             }
         }
     }
+    if retrieved_context is not None:
+        del payload["tools"], payload["tool_choice"]
+    if chain_plan:
+        previous_response_id = chain_plan.previous_response_id
+        payload["metadata"] = chain_plan.metadata()
     if previous_response_id:
         payload["previous_response_id"] = previous_response_id
     return payload
@@ -73,20 +149,19 @@ def _build_request_payload(system_instructions: str, query_text: str, vector_sto
 def _extract_response_id(response) -> Optional[str]:
     """レスポンスからIDを抽出"""
     if response and hasattr(response, 'id'):
-        print(f"Response ID: {response.id}")
         return response.id
-    print("Warning: Could not retrieve response ID from API response.")
+    logger.warning("Could not retrieve response ID from API response.")
     return None
 
 
 def _find_output_message(response) -> Optional[object]:
     """レスポンスからoutput messageを探す"""
     if not response or not hasattr(response, 'output'):
-        print("Error: Response object or response.output is missing.")
+        logger.error("Response object or response.output is missing.")
         return None
     
     if not isinstance(response.output, list) or len(response.output) == 0:
-        print(f"Error: response.output is not a list or is empty: {response.output}")
+        logger.error("response.output is not a list or is empty", output=lambda: response.output)
         return None
     
     return next(
@@ -101,12 +176,12 @@ def _extract_output_text(output_message) -> Optional[str]:
         return None
     
     if not hasattr(output_message, 'content') or not isinstance(output_message.content, list) or len(output_message.content) == 0:
-        print("Error: Could not find valid ResponseOutputMessage content.")
+        logger.error("Could not find valid ResponseOutputMessage content.")
         return None
     
     output_text_obj = output_message.content[0]
     if not hasattr(output_text_obj, 'type') or output_text_obj.type != 'output_text':
-        print(f"Error: Expected ResponseOutputText, but got: {output_text_obj}")
+        logger.error("Expected ResponseOutputText", got=lambda: output_text_obj)
         return None
     
     if hasattr(output_text_obj, 'text') and isinstance(output_text_obj.text, str):
@@ -125,9 +200,9 @@ def _parse_model_output(text: str) -> dict:
             "end_conversation": data.get("end_conversation", False)
         }
     except json.JSONDecodeError:
-        print(f"Error: Failed to parse JSON from model output: {text}")
+        logger.error("Failed to parse JSON from model output", text=text)
         return {
-            "assistant_response_text": "検索結果に基づく応答の抽出に失敗しました。",
+            "assistant_response_text": EXTRACTION_FAILED_TEXT,
             "needs_operator": False,
             "end_conversation": False
         }
@@ -136,7 +211,7 @@ def _parse_model_output(text: str) -> dict:
 def _extract_final_output(response, response_id: str) -> dict:
     """レスポンスから最終出力を抽出"""
     default_output = {
-        "assistant_response_text": "検索結果に基づく応答の抽出に失敗しました。",
+        "assistant_response_text": EXTRACTION_FAILED_TEXT,
         "needs_operator": False,
         "end_conversation": False,
         "response_id": response_id
@@ -155,6 +230,46 @@ def _extract_final_output(response, response_id: str) -> dict:
     return parsed
 
 
+async def _create_streamed_response(openai_async_client: openai.AsyncOpenAI, request_payload: dict,
+                                    on_first_sentence: Callable[[str], Awaitable[None]]):
+    """ストリーミングで応答を生成し、最初の1文がそろった時点で on_first_sentence を呼ぶ"""
+    extractor = PartialAnswerExtractor()
+    sentence_task = None
+    final_response = None
+    stream = await openai_async_client.responses.create(**request_payload, stream=True)
+    async for event in stream:
+        event_type = getattr(event, 'type', None)
+        if event_type == 'response.output_text.delta' and sentence_task is None:
+            sentence = first_sentence(extractor.feed(event.delta))
+            if sentence:
+                # ストリームの読み取りを止めないよう別タスクで通知
+                sentence_task = asyncio.ensure_future(on_first_sentence(sentence))
+        elif event_type == 'response.completed':
+            final_response = event.response
+        elif event_type in ('response.failed', 'response.incomplete', 'error'):
+            logger.error("Streaming response did not complete", event_type=event_type)
+            final_response = getattr(event, 'response', None)
+    if sentence_task is not None:
+        await sentence_task
+    return final_response
+
+
+async def _retrieve_local_context(openai_async_client: openai.AsyncOpenAI, facility_index: FacilityIndex,
+                                  query_text: str) -> Optional[str]:
+    """プロセス内の索引で施設資料を検索（該当なしならNoneを返し、呼び出し側は file_search を使う）"""
+    query_vector = None
+    if FACILITY_RETRIEVAL_USE_VECTORS and facility_index.has_vectors:
+        embedding = await openai_async_client.embeddings.create(model=facility_index.embedding_model, input=query_text)
+        query_vector = embedding.data[0].embedding
+    chunks = facility_index.search(query_text, FACILITY_RETRIEVAL_TOP_K, FACILITY_RETRIEVAL_MIN_SCORE,
+                                   query_vector, FACILITY_RETRIEVAL_MIN_SIMILARITY)
+    if not chunks:
+        logger.info("No local facility chunks matched; falling back to file_search")
+        return None
+    logger.info("Local facility retrieval", chunks=lambda: [(chunk.source, round(chunk.score, 3)) for chunk in chunks])
+    return format_context(chunks)
+
+
 def _handle_api_status_error(e: openai.APIStatusError) -> str:
     """APIStatusErrorの詳細をログ出力してエラーレスポンスを返す"""
     error_details_str = "N/A"
@@ -166,8 +281,7 @@ def _handle_api_status_error(e: openai.APIStatusError) -> str:
     except Exception as ex_detail:
         error_details_str = f"エラー詳細の取得中に別のエラーが発生: {ex_detail}"
     
-    print(f"OpenAI APIステータスエラー (HTTP {e.status_code}): {e.response}")
-    print(f"エラー詳細:\n{error_details_str}")
+    logger.error("OpenAI APIステータスエラー", status_code=e.status_code, details=error_details_str)
     return _create_error_response("データベース検索中に予期せぬエラーが発生しました。管理者にご連絡ください。")
 
 
@@ -177,51 +291,117 @@ async def openai_vector_search_with_file_search_tool(
     language: str,
     vector_store_id: str = None,
     previous_response_id: str = None,
-    guest_info: dict = None
+    guest_info: dict = None,
+    on_first_sentence: Callable[[str], Awaitable[None]] = None,
+    search_settings: dict = None
 ) -> str:
-    
-    print(f"Previous Response ID: {previous_response_id}")
-    
-    # ゲスト情報をログ出力
-    if guest_info:
-        print(f"Guest info in vector_search: {json.dumps(guest_info, ensure_ascii=False)}")
-    else:
-        print("No guest info provided to vector_search")
+    """
+    file_search 付きで回答を生成し、JSON文字列で返す
+
+    on_first_sentence を渡すとストリーミングで生成し、回答の最初の1文がそろった時点で呼び出す
+    （回答キャッシュにヒットした場合は呼ばれない）。
+    コンテキスト圧縮が有効なら、長くなったチェーンは要約から始まる新しいチェーンに切り替え、
+    新しいチェーンのレスポンスIDを返す。
+    FACILITY_RETRIEVAL_MODE=local なら施設資料をプロセス内の索引で検索してプロンプトに入れ、
+    索引が無い・該当チャンクが無い場合は file_search ツールで回答する。
+    MODEL_ROUTING_ENABLED=true なら質問の長さ・意図・ターン番号からモデルと推論量を選ぶ（model_routing）。
+    search_settings で file_search の検索設定・推論量をこの呼び出しだけ上書きできる（ベンチマーク用）。
+    CIRCUIT_BREAKER_ENABLED=true でブレーカーが開いている間は OpenAI を呼ばずに縮退応答（degraded=True）を返す
+    （OpenAI 側の障害で失敗した場合も同じ）。
+    """
+
+    logger.debug("Guest info in vector_search", guest_info=guest_info)
 
     # バリデーション
     if not openai_async_client:
-        print("Error: OpenAI async client not provided.")
+        logger.error("OpenAI async client not provided.")
         return _create_error_response("エラー: OpenAIクライアントが利用できません。")
     
     if not vector_store_id:
-        print("Error: Vector Store ID not provided or configured.")
+        logger.error("Vector Store ID not provided or configured.")
         return _create_error_response("エラー: 検索対象のデータベースが設定されていません。")
 
-    print(f"File Search Tool を使用して検索開始: '{query_text}' (Vector Store: {vector_store_id})")
+    facility_index = get_facility_index() if FACILITY_RETRIEVAL_MODE == 'local' else None
+    knowledge_key = f"local:{facility_index.content_version}" if facility_index else vector_store_id
+
+    # 回答キャッシュは文脈を持たない初回ターンの質問のみ対象（ルートと検索設定もキーに入れるため、ここでルートを選ぶ）
+    cache_key = None
+    route = None
+    if ANSWER_CACHE_ENABLED and not previous_response_id:
+        if MODEL_ROUTING_ENABLED:
+            route = model_router.route_answer(query_text, language, 1)
+        cache_key = answer_cache.make_key(query_text, language, get_guest_state(guest_info), knowledge_key,
+                                          route.name if route else '',
+                                          search_settings_for(language, search_settings, route.settings if route else None))
+        cached = answer_cache.get(cache_key)
+        if cached is not None:
+            # response_id は回答を生成したレスポンスのID。インストラクションは引き継がれないので、
+            # 次のターンはこのゲストのインストラクションでキャッシュした質問と回答の続きとして答える
+            logger.info("Answer cache hit", stats=answer_cache.stats(), response_id=cached.get("response_id"))
+            return json.dumps(cached, ensure_ascii=False)
+
+    logger.info("File Search Tool を使用して検索開始", vector_store_id=vector_store_id,
+                previous_response_id=previous_response_id)
 
     system_instructions = get_vector_search_instructions(guest_info, language)
     
     try:
-        request_payload = _build_request_payload(system_instructions, query_text, vector_store_id, previous_response_id)
-        response = await openai_async_client.responses.create(**request_payload)
+        # ブレーカーが開いていれば圧縮・埋め込みの呼び出しも行わずに縮退応答を返す
+        check_circuit('answer')
+        chain_plan = None
+        if CONTEXT_COMPACTION_ENABLED:
+            chain_plan = await conversation_compactor.plan(openai_async_client, previous_response_id)
+        retrieved_context = None
+        if facility_index:
+            retrieved_context = await _retrieve_local_context(openai_async_client, facility_index, query_text)
+        if MODEL_ROUTING_ENABLED and route is None:
+            turn = chain_plan.turn if chain_plan else (2 if previous_response_id else 1)
+            route = model_router.route_answer(query_text, language, turn)
+        request_payload = _build_request_payload(system_instructions, query_text, vector_store_id, previous_response_id,
+                                                 chain_plan, retrieved_context,
+                                                 search_settings_for(language, search_settings,
+                                                                     route.settings if route else None))
+        started_at = time.monotonic()
+        try:
+            if on_first_sentence:
+                response = await guarded_request('answer', lambda: _create_streamed_response(
+                    openai_async_client, request_payload, on_first_sentence))
+            else:
+                response = await guarded_request('answer', lambda: hedged_request(
+                    'answer', lambda: openai_async_client.responses.create(**request_payload)))
+        except CircuitOpenError:
+            raise
+        except Exception:
+            if route:
+                model_router.record(route, (time.monotonic() - started_at) * 1000, error=True)
+            raise
+        if route:
+            model_router.record(route, (time.monotonic() - started_at) * 1000, response)
 
-        print("--- OpenAI API Response (Success with JSON Schema) ---")
         response_id = _extract_response_id(response)
-        print("--- End of OpenAI API Response ---")
 
         final_output = _extract_final_output(response, response_id)
+        if chain_plan:
+            conversation_compactor.record(chain_plan, response, query_text, final_output["assistant_response_text"],
+                                          (time.monotonic() - started_at) * 1000, openai_async_client)
+        if cache_key and response_id and final_output["assistant_response_text"] != EXTRACTION_FAILED_TEXT:
+            answer_cache.put(cache_key, final_output, guest_info)
         generated_json_string = json.dumps(final_output, ensure_ascii=False)
-        print(f"File Search Tool による応答生成完了。最終JSON文字列: {generated_json_string}")
+        logger.info("File Search Tool による応答生成完了", response_id=response_id)
+        logger.debug("最終JSON文字列", output=generated_json_string)
         return generated_json_string
 
+    except degradable_errors() as e:
+        logger.warning("OpenAI を利用できないため縮退応答を返します", error=e)
+        return _create_degraded_response(query_text, language, previous_response_id)
     except openai.APIConnectionError as e:
-        print(f"OpenAI APIへの接続エラー: {e}")
+        logger.error("OpenAI APIへの接続エラー", error=e)
         return _create_error_response("申し訳ありません、現在データベースへの接続に問題が発生しています。")
     except openai.RateLimitError as e:
-        print(f"OpenAI APIレート制限エラー: {e}")
+        logger.error("OpenAI APIレート制限エラー", error=e)
         return _create_error_response("現在、多くのお問い合わせを処理中です。恐れ入りますが、少し時間をおいて再度お試しください。")
     except openai.APIStatusError as e:
         return _handle_api_status_error(e)
     except Exception as e:
-        print(f"File Search Tool 処理中に予期せぬエラーが発生しました: {e}")
+        logger.error("File Search Tool 処理中に予期せぬエラーが発生しました", error=e)
         return _create_error_response(f"「{query_text}」の検索中にエラーが発生しました。")
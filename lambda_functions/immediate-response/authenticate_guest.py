@@ -3,28 +3,139 @@ Twilio電話認証用のゲスト認証モジュール
 
 部屋番号（roomNumber）と電話番号下4桁（phoneLast4）を使って
 DynamoDBからゲスト情報を取得し、認証を行う。
+
+通常は roomPhoneLast4 属性（"<部屋番号>#<電話番号下4桁>"）の GSI を1回引くだけで認証する。
+既存レコードのバックフィルが完了するまでは、GSIで見つからない場合に
+部屋単位のクエリ＋電話番号フィルタ（従来方式）へフォールバックする。
 """
 import boto3
 import os
+from datetime import datetime, timedelta, timezone
 from typing import Dict, Optional, List
 from boto3.dynamodb.conditions import Key
+from voice_logger import get_logger
+from event_capture import event_capture
 
 # 環境変数からテーブル名を取得
 GUEST_TABLE_NAME = os.environ.get('GUEST_TABLE_NAME', 'obw-guest')
+ROOM_PHONE_INDEX_NAME = os.environ.get('ROOM_PHONE_INDEX_NAME', 'RoomPhoneLast4Index')
+# バックフィル完了後は "false" にしてフォールバックを無効化する
+ROOM_PHONE_INDEX_FALLBACK = os.environ.get('ROOM_PHONE_INDEX_FALLBACK', 'true').lower() == 'true'
+
+ROOM_PHONE_ATTRIBUTE = 'roomPhoneLast4'
+# 滞在中かどうかの判定に使う施設の日付（チェックイン・アウト日は JST の YYYY-MM-DD）
+FACILITY_TIMEZONE = timezone(timedelta(hours=9))
+
+
+def capture_table(target):
+    """ゲストテーブルの query を記録・再生の対象にする（EVENT_CAPTURE_ENABLED でなければそのまま返す）"""
+    return event_capture.wrap(
+        'dynamodb', target, ('query',),
+        serialize=lambda op, response: {'Items': response.get('Items', []),
+                                        'LastEvaluatedKey': response.get('LastEvaluatedKey')}
+    )
+
 
 # DynamoDBクライアント
 dynamodb = boto3.resource('dynamodb')
-table = dynamodb.Table(GUEST_TABLE_NAME)
+table = capture_table(dynamodb.Table(GUEST_TABLE_NAME))
+logger = get_logger('authenticate_guest')
+
+
+def phone_digits(phone: str) -> str:
+    """電話番号から数字のみを抽出"""
+    return ''.join(c for c in (phone or '') if c.isdigit())
+
+
+def build_room_phone_key(room_number: str, phone: str) -> Optional[str]:
+    """
+    GSI用のルックアップキーを生成
+
+    Args:
+        room_number: 部屋番号
+        phone: 電話番号（表記ゆれ可）または下4桁
+
+    Returns:
+        "<部屋番号>#<電話番号下4桁>"（数字が4桁未満の場合はNone）
+    """
+    digits = phone_digits(phone)
+    if not room_number or len(digits) < 4:
+        return None
+    return f"{room_number}#{digits[-4:]}"
+
+
+def _query_all(**kwargs) -> List[Dict]:
+    """ページネーションを辿って全件取得"""
+    items: List[Dict] = []
+    while True:
+        response = table.query(**kwargs)
+        items.extend(response.get('Items', []))
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            return items
+        kwargs['ExclusiveStartKey'] = last_key
+
+
+def _find_by_lookup_index(room_number: str, phone_last4: str) -> List[Dict]:
+    """roomPhoneLast4 GSIでゲストを取得（1回のキー検索）"""
+    lookup_key = build_room_phone_key(room_number, phone_last4)
+    if not lookup_key:
+        return []
+    try:
+        return _query_all(
+            IndexName=ROOM_PHONE_INDEX_NAME,
+            KeyConditionExpression=Key(ROOM_PHONE_ATTRIBUTE).eq(lookup_key)
+        )
+    except Exception as e:
+        # GSI未作成・作成中などはフォールバックに任せる
+        logger.warning("Lookup index query failed, falling back to room query", error=e)
+        return []
+
+
+def _find_by_room_query(room_number: str, phone_last4: str) -> Optional[List[Dict]]:
+    """
+    部屋の全ゲストを取得し電話番号下4桁でフィルタ（従来方式）
+
+    Returns:
+        マッチしたゲストのリスト（部屋にゲストがいない場合はNone）
+    """
+    guests = _query_all(KeyConditionExpression=Key('roomNumber').eq(room_number))
+    if not guests:
+        return None
+
+    logger.debug("Guests found in room", room_number=room_number, count=len(guests))
+    return [
+        guest for guest in guests
+        if guest.get('phone') and phone_digits(guest['phone']).endswith(phone_last4)
+    ]
+
+
+def _pick_guest(guests: List[Dict], today: Optional[str] = None) -> Dict:
+    """
+    同じ部屋・電話番号下4桁のゲストが複数いる場合に認証するゲストを選ぶ
+
+    GSI・部屋単位クエリの返す順序に頼らず、今日が滞在期間に入っているゲストを優先し、
+    その中でチェックイン日が最も新しいゲスト（同じなら guestId の大きいほう）を選ぶ。
+    """
+    today = today or datetime.now(FACILITY_TIMEZONE).date().isoformat()
+
+    def sort_key(guest: Dict):
+        check_in = guest.get('checkInDate') or ''
+        check_out = guest.get('checkOutDate') or ''
+        staying = bool(check_in) and check_in <= today and (not check_out or today <= check_out)
+        return staying, check_in, guest.get('guestId') or ''
+
+    return max(guests, key=sort_key)
 
 
 def authenticate_guest(room_number: str, phone_last4: str) -> Dict:
     """
     部屋番号と電話番号下4桁でゲストを認証
-    
+
     Args:
         room_number: 部屋番号（例: "201", "802"）
         phone_last4: 電話番号の下4桁（例: "1234"）
-    
+
     Returns:
         {
             'success': bool,
@@ -33,44 +144,34 @@ def authenticate_guest(room_number: str, phone_last4: str) -> Dict:
         }
     """
     try:
-        # 1. roomNumberで全ゲストを取得
-        response = table.query(
-            KeyConditionExpression=Key('roomNumber').eq(room_number)
-        )
-        
-        guests: List[Dict] = response.get('Items', [])
-        
-        if not guests:
-            print(f"No guests found for room: {room_number}")
-            return {
-                'success': False,
-                'error': 'NO_GUESTS_IN_ROOM'
-            }
-        
-        print(f"Found {len(guests)} guest(s) in room {room_number}")
-        
-        # 2. 電話番号下4桁でフィルタ（数字のみを抽出して比較）
-        matching_guests = []
-        for guest in guests:
-            phone = guest.get('phone', '')
-            if phone:
-                # 電話番号から数字のみを抽出
-                phone_digits_only = ''.join(c for c in phone if c.isdigit())
-                # 数字のみの電話番号の末尾4桁と比較
-                if phone_digits_only.endswith(phone_last4):
-                    matching_guests.append(guest)
-                    print(f"Match found: guestId={guest.get('guestId')}, phone {phone} (digits: {phone_digits_only}) ends with {phone_last4}")
-        
+        # 1. roomPhoneLast4 GSIで直接検索
+        matching_guests = _find_by_lookup_index(room_number, phone_last4)
+
+        # 2. 見つからなければ従来方式（部屋単位のクエリ + フィルタ）
+        if not matching_guests and ROOM_PHONE_INDEX_FALLBACK:
+            matching_guests = _find_by_room_query(room_number, phone_last4)
+            if matching_guests is None:
+                logger.info("No guests found for room", room_number=room_number)
+                return {
+                    'success': False,
+                    'error': 'NO_GUESTS_IN_ROOM'
+                }
+            if matching_guests:
+                logger.info("Match found via room query fallback (lookup attribute not yet backfilled)",
+                            room_number=room_number)
+
         if not matching_guests:
-            print(f"No guest with phone ending in {phone_last4} found in room {room_number}")
+            logger.info("No guest with matching phone found in room", room_number=room_number)
             return {
                 'success': False,
                 'error': 'PHONE_NOT_MATCH'
             }
-        
-        # 3. マッチしたゲストを返す（複数いる場合は最初の1件）
-        guest_info = matching_guests[0]
-        
+
+        # 3. マッチしたゲストを返す（複数いる場合は滞在中・チェックイン日の新しいゲスト）
+        guest_info = _pick_guest(matching_guests)
+        logger.info("Match found", guest_id=guest_info.get('guestId'), room_number=room_number,
+                    candidates=len(matching_guests))
+
         # 認証成功時に返す情報を選別（必要最小限のみ）
         return {
             'success': True,
@@ -83,9 +184,9 @@ def authenticate_guest(room_number: str, phone_last4: str) -> Dict:
                 'approvalStatus': guest_info.get('approvalStatus')
             }
         }
-        
+
     except Exception as e:
-        print(f"Error authenticating guest: {str(e)}")
+        logger.error("Error authenticating guest", error=e)
         return {
             'success': False,
             'error': 'DATABASE_ERROR',
@@ -0,0 +1,181 @@
+"""
+認証済みゲスト情報のTTLキャッシュ
+
+phone_last4_input で認証したゲスト情報を (roomNumber, phoneLast4) をキーに保持し、
+同じ通話の発話ターンごとに発生していたDynamoDBの再クエリを省略する。
+ウォームなLambdaコンテナ内ではモジュールレベルのインスタンスが生き続けるため、
+コンテナをまたぐターン向けに共有バックエンド（DynamoDB TTLテーブル等）を差し込める。
+"""
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import boto3
+
+from authenticate_guest import authenticate_guest
+from voice_logger import get_logger
+from event_capture import event_capture
+
+DEFAULT_TTL_SECONDS = int(os.environ.get('GUEST_CACHE_TTL_SECONDS', '300'))
+DEFAULT_MAX_ENTRIES = int(os.environ.get('GUEST_CACHE_MAX_ENTRIES', '256'))
+GUEST_CACHE_TABLE_NAME = os.environ.get('GUEST_CACHE_TABLE_NAME')
+
+logger = get_logger('guest_session_cache')
+
+
+class SharedCacheBackend(ABC):
+    """
+    コンテナ間で共有するキャッシュバックエンドのインターフェース
+
+    get は未登録・期限切れの場合に None を返し、例外は呼び出し側で握りつぶす。
+    get / set のどちらかを実装していないバックエンドは生成時に TypeError になる。
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Dict]:
+        """キーの値（未登録・期限切れなら None）"""
+
+    @abstractmethod
+    def set(self, key: str, value: Dict, expires_at: float) -> None:
+        """値を expires_at（エポック秒）まで保存する"""
+
+
+class DynamoDBCacheBackend(SharedCacheBackend):
+    """DynamoDBのTTL属性付きテーブルを共有バックエンドとして使う実装"""
+
+    def __init__(self, table_name: str, dynamodb_resource=None):
+        resource = dynamodb_resource or boto3.resource('dynamodb')
+        self.table = resource.Table(table_name)
+
+    def get(self, key: str) -> Optional[Dict]:
+        item = self.table.get_item(Key={'cacheKey': key}).get('Item')
+        if not item or float(item.get('expiresAt', 0)) <= time.time():
+            return None
+        return json.loads(item['value'])
+
+    def set(self, key: str, value: Dict, expires_at: float) -> None:
+        self.table.put_item(Item={
+            'cacheKey': key,
+            'value': json.dumps(value, ensure_ascii=False),
+            'expiresAt': int(expires_at)
+        })
+
+
+class GuestSessionCache:
+    """TTLとLRU上限付きのプロセス内キャッシュ（共有バックエンドはオプション）"""
+
+    def __init__(self, ttl_seconds: int = DEFAULT_TTL_SECONDS, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 shared_backend: Optional[SharedCacheBackend] = None, clock=time.time):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.shared_backend = shared_backend
+        self._clock = clock
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _shared_key(key: Tuple[str, str]) -> str:
+        return f"guest#{key[0]}#{key[1]}"
+
+    def get(self, room_number: str, phone_last4: str) -> Optional[Dict]:
+        """キャッシュからゲスト情報を取得。ローカル→共有バックエンドの順に探す"""
+        key = (room_number, phone_last4)
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, guest_info = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return guest_info
+                del self._entries[key]
+
+        guest_info = self._get_shared(key)
+        if guest_info is not None:
+            self._put_local(key, guest_info, now + self.ttl_seconds)
+            with self._lock:
+                self.shared_hits += 1
+            return guest_info
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, room_number: str, phone_last4: str, guest_info: Dict) -> None:
+        """認証成功したゲスト情報を登録"""
+        key = (room_number, phone_last4)
+        expires_at = self._clock() + self.ttl_seconds
+        self._put_local(key, guest_info, expires_at)
+        if self.shared_backend:
+            try:
+                self.shared_backend.set(self._shared_key(key), guest_info, expires_at)
+            except Exception as e:
+                logger.warning("Failed to write guest cache to shared backend", error=e)
+
+    def _put_local(self, key: Tuple[str, str], guest_info: Dict, expires_at: float) -> None:
+        with self._lock:
+            self._entries[key] = (expires_at, guest_info)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _get_shared(self, key: Tuple[str, str]) -> Optional[Dict]:
+        if not self.shared_backend:
+            return None
+        try:
+            return self.shared_backend.get(self._shared_key(key))
+        except Exception as e:
+            logger.warning("Failed to read guest cache from shared backend", error=e)
+            return None
+
+    def stats(self) -> Dict:
+        """ヒット/ミスのカウンタを返す"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries)
+            }
+
+
+def _create_default_cache() -> GuestSessionCache:
+    """環境変数に応じて共有バックエンド付きのキャッシュを生成"""
+    backend = DynamoDBCacheBackend(GUEST_CACHE_TABLE_NAME) if GUEST_CACHE_TABLE_NAME else None
+    return GuestSessionCache(shared_backend=backend)
+
+
+# 記録・再生ハーネス用にヒット結果を記録する（再生時はキャッシュの中身を記録から再現する）
+guest_session_cache = event_capture.wrap('guest_cache', _create_default_cache(), ('get',))
+
+
+def authenticate_guest_cached(room_number: str, phone_last4: str) -> Dict:
+    """
+    キャッシュを優先してゲストを認証する（ミス時のみ authenticate_guest を呼ぶ）
+
+    Args:
+        room_number: 部屋番号
+        phone_last4: 電話番号下4桁
+
+    Returns:
+        authenticate_guest と同じ形式の結果辞書（失敗結果はキャッシュしない）
+    """
+    guest_info = guest_session_cache.get(room_number, phone_last4)
+    if guest_info is not None:
+        return {'success': True, 'guest_info': guest_info}
+
+    auth_result = authenticate_guest(room_number, phone_last4)
+    if auth_result['success']:
+        guest_session_cache.put(room_number, phone_last4, auth_result['guest_info'])
+    return auth_result
@@ -1,17 +1,28 @@
 import json
-import urllib.parse
 import base64
 import boto3
 from botocore.config import Config
 import os
-from twilio.twiml.voice_response import VoiceResponse, Gather
+import time
+import uuid
 from lingual_manager import LingualManager
-from authenticate_guest import authenticate_guest
-from ssml_helper import wrap_with_prosody
+from guest_session_cache import authenticate_guest_cached, guest_session_cache
+from twiml_renderer import TwimlRenderer, HANGUP_TAIL, dial, document, pause, redirect
+from session_token import session_codec, SessionTokenError
+from call_result_store import create_result_store
+from call_hold import HOLD_MAX_SECONDS, hold_tail
+from voice_logger import get_logger, set_context, update_context
+from event_capture import event_capture
+from call_tracing import tracer
+from twilio_webhook_form import CORE_FIELDS, TwilioWebhookForm, parse_webhook_form
 
 # Lambda関数2の名前を環境変数から取得
 AI_PROCESSING_LAMBDA_NAME = os.environ.get('AI_PROCESSING_LAMBDA_NAME', 'obw-ai-processing-function')
 OPERATOR_PHONE_NUMBER = os.environ.get('OPERATOR_PHONE_NUMBER', '+15005550006')  # デフォルトはTwilioのテスト番号
+# AI応答の受け渡し方式: "push"（AI Lambdaがcalls.updateで差し替え）/ "poll"（結果ストアをRedirectでポーリング）
+AI_RESPONSE_MODE = os.environ.get('AI_RESPONSE_MODE', 'push')
+POLL_INTERVAL_SECONDS = int(os.environ.get('POLL_INTERVAL_SECONDS', '2'))
+POLL_MAX_ATTEMPTS = int(os.environ.get('POLL_MAX_ATTEMPTS', '15'))  # 2秒 x 15回 = 従来の30秒待機と同等
 
 # boto3クライアントにタイムアウトを設定（SonarQube対応）
 boto3_config = Config(
@@ -19,8 +30,27 @@ boto3_config = Config(
     read_timeout=30,      # 読み取りタイムアウト: 30秒
     retries={'max_attempts': 3}  # リトライ回数
 )
-lambda_client = boto3.client('lambda', config=boto3_config)
+
+
+def capture_lambda_client(client):
+    """AI Processing Lambda の非同期呼び出しを記録・再生の対象にする"""
+    return event_capture.wrap(
+        'lambda', client, ('invoke',),
+        describe=lambda op, args, kwargs: {'payload': json.loads(kwargs.get('Payload') or '{}')},
+        serialize=lambda op, response: {'StatusCode': response.get('StatusCode')}
+    )
+
+
+def capture_result_store(store):
+    """結果ストアの読み出し（ポーリング）を記録・再生の対象にする"""
+    return event_capture.wrap('result_store', store, ('get',))
+
+
+lambda_client = capture_lambda_client(boto3.client('lambda', config=boto3_config))
 lingual_mgr = LingualManager() # LingualManagerのインスタンスを作成
+twiml_renderer = TwimlRenderer(lingual_mgr)  # 固定フラグメントをコールドスタート時にコンパイル
+result_store = capture_result_store(create_result_store())  # ポーリングモード用（テーブル未設定ならNone）
+logger = get_logger('immediate_response')
 
 
 # 許可される部屋番号リスト (2F〜8F 各フロア 01〜04号室)
@@ -54,7 +84,7 @@ def _validate_cloudfront_secret(event):
     if received_secret == expected_secret:
         return None
     
-    print('⚠️ CloudFront Secret検証失敗 - 不正なアクセス試行')
+    logger.warning('⚠️ CloudFront Secret検証失敗 - 不正なアクセス試行')
     return {
         'statusCode': 403,
         'headers': {'Content-Type': 'application/json'},
@@ -66,24 +96,23 @@ def _validate_cloudfront_secret(event):
 
 
 def _log_request_headers(event):
-    """リクエストヘッダーをログに出力"""
+    """リクエストヘッダーをログに出力（ヘッダー全体はDEBUGレベルのみ）"""
     if 'headers' not in event:
-        print("No headers found in event.")
+        logger.info("No headers found in event.")
         return
     
-    print(f"Request Headers: {json.dumps(event['headers'])}")
-    origin_header = event['headers'].get('origin') or event['headers'].get('Origin')
-    if origin_header:
-        print(f"Received Origin header: {origin_header}")
-    else:
-        print("Origin header not found in request.")
+    headers = event['headers']
+    logger.debug("Request headers", headers=lambda: headers)
+    origin_header = headers.get('origin') or headers.get('Origin')
+    if not origin_header:
+        logger.info("Origin header not found in request.")
 
 
 def _get_body_content(event):
     """リクエストボディを取得（Base64デコード対応）"""
     is_post = event.get('requestContext', {}).get('http', {}).get('method') == 'POST'
     if not is_post or 'body' not in event or not event['body']:
-        print("Not a POST request with body, or body is empty.")
+        logger.info("Not a POST request with body, or body is empty.")
         return ""
     
     raw_body = event['body']
@@ -93,228 +122,157 @@ def _get_body_content(event):
     try:
         return base64.b64decode(raw_body).decode('utf-8')
     except Exception as e:
-        print(f"Error decoding Base64 body: {e}. Will try to parse raw body.")
+        logger.warning("Error decoding Base64 body. Will try to parse raw body.", error=e)
         return raw_body
 
 
+# ルーティングに使うフィールド + 音声認識の信頼度（ログ用）
+WEBHOOK_FIELDS = CORE_FIELDS | {'Confidence'}
+
+
 def _parse_request_body(event):
-    """Twilioからのリクエストボディを解析"""
+    """Twilioからのリクエストボディを解析（必要なフィールドのみ取り出す）"""
     body_content = _get_body_content(event)
     if not body_content:
-        return None, None, None
+        return TwilioWebhookForm()
     
     try:
-        parsed_body = urllib.parse.parse_qs(body_content)
-        print(f"Parsed body dictionary: {json.dumps(parsed_body)}")
-        
-        speech_result = parsed_body.get('SpeechResult', [None])[0]
-        digits_result = parsed_body.get('Digits', [None])[0]
-        call_sid = parsed_body.get('CallSid', [None])[0]
-        
-        if speech_result:
-            print(f"Received SpeechResult: {speech_result}")
-        if digits_result:
-            print(f"Received Digits: {digits_result}")
-        if call_sid:
-            print(f"Received CallSid: {call_sid}")
-        
-        return speech_result, digits_result, call_sid
+        form = parse_webhook_form(body_content, WEBHOOK_FIELDS)
     except Exception as e:
-        print(f"Error parsing the body content: {e}")
-        return None, None, None
-
-
-def _add_timeout_and_hangup(twilio_response, language):
-    """タイムアウトメッセージとハングアップを追加"""
-    timeout_msg = lingual_mgr.get_message(language, "timeout_message")
-    voice = lingual_mgr.get_voice(language)
-    twilio_response.say(wrap_with_prosody(timeout_msg), language=language, voice=voice)
-    twilio_response.pause(length=3)
-    twilio_response.hangup()
-
-
-def _create_language_selection_gather():
-    """言語選択用のGatherを作成"""
-    gather_lang = Gather(input='dtmf', numDigits=1, method='POST', action='?action=language_selected')
-    gather_lang.say(wrap_with_prosody("For English, press 1."), language="en-US", voice=lingual_mgr.get_voice("en-US"))
-    gather_lang.say(wrap_with_prosody("日本語をご希望の場合は2を押してください。"), language="ja-JP", voice=lingual_mgr.get_voice("ja-JP"))
-    return gather_lang
-
-
-def _create_room_number_gather(language, attempt=1):
-    """部屋番号入力用のGatherを作成"""
-    room_prompt = lingual_mgr.get_message(language, "prompt_room_number")
-    voice = lingual_mgr.get_voice(language)
-    gather_room = Gather(
-        input='dtmf', numDigits=3, method='POST',
-        action=f'?language={language}&source=room_number_input&attempt={attempt}'
-    )
-    gather_room.say(wrap_with_prosody(room_prompt), language=language, voice=voice)
-    return gather_room
-
-
-def _create_phone_last4_gather(language, room_number, attempt=1):
-    """電話番号下4桁入力用のGatherを作成"""
-    phone_prompt = lingual_mgr.get_message(language, "prompt_phone_last4")
-    voice = lingual_mgr.get_voice(language)
-    gather_phone = Gather(
-        input='dtmf', numDigits=4, method='POST',
-        action=f'?language={language}&source=phone_last4_input&room_number={room_number}&attempt={attempt}'
-    )
-    gather_phone.say(wrap_with_prosody(phone_prompt), language=language, voice=voice)
-    return gather_phone
+        logger.error("Error parsing the body content", error=e)
+        return TwilioWebhookForm()
+    
+    update_context(call_sid=form.call_sid)
+    tracer.set_call(form.call_sid)
+    logger.info("Received Twilio webhook", has_speech=bool(form.speech_result), has_digits=bool(form.digits),
+                confidence=form.confidence)
+    return form
 
 
-def _handle_operator_choice_dtmf(twilio_response, digits_result, language, query_params, previous_openai_response_id_from_query, room_number):
+def _handle_operator_choice_dtmf(twiml, digits_result, language, query_params, previous_openai_response_id_from_query, room_number):
     """オペレーター選択プロンプト(DTMF)からの応答を処理"""
-    print("Handling response from 'operator_choice_dtmf' prompt.")
-    voice = lingual_mgr.get_voice(language)
+    logger.info("Handling response from 'operator_choice_dtmf' prompt.", digits=digits_result)
     
     if digits_result == '1':
-        print("User pressed 1 for operator. Transferring...")
-        transfer_message = lingual_mgr.get_message(language, "transferring_to_operator")
-        twilio_response.say(wrap_with_prosody(transfer_message), language=language, voice=voice)
-        twilio_response.dial(OPERATOR_PHONE_NUMBER)
+        logger.info("User pressed 1 for operator. Transferring...")
+        twiml.append(twiml_renderer.say_message(language, "transferring_to_operator"))
+        twiml.append(dial(OPERATOR_PHONE_NUMBER))
         return
     
     if digits_result == '2':
-        print("User pressed 2 for other inquiries. Re-prompting.")
-        follow_up_msg = lingual_mgr.get_message(language, "follow_up_question")
-        phone_last4 = query_params.get('phone_last4')
-        room_param = f"&room_number={room_number}" if room_number else ""
-        phone_param = f"&phone_last4={phone_last4}" if phone_last4 else ""
-        gather = Gather(
-            input='speech', method='POST', language=language,
-            speechTimeout='auto', timeout=7, speechModel='deepgram-nova-3',
-            action=f'?language={language}&previous_openai_response_id={previous_openai_response_id_from_query}{room_param}{phone_param}'
-        )
-        gather.say(wrap_with_prosody(follow_up_msg), language=language, voice=voice)
-        twilio_response.append(gather)
-        twilio_response.pause(length=3)
-        twilio_response.hangup()
+        logger.info("User pressed 2 for other inquiries. Re-prompting.")
+        session = query_params.get('session')
+        if session:
+            # セッショントークンに会話ポインタが含まれているのでそのまま引き継ぐ
+            action = f'?language={language}&session={session}'
+        else:
+            phone_last4 = query_params.get('phone_last4')
+            room_param = f"&room_number={room_number}" if room_number else ""
+            phone_param = f"&phone_last4={phone_last4}" if phone_last4 else ""
+            response_param = (f"&previous_openai_response_id={previous_openai_response_id_from_query}"
+                              if previous_openai_response_id_from_query else "")
+            action = f'?language={language}{response_param}{room_param}{phone_param}'
+        twiml.append(twiml_renderer.speech_gather(language, action, "follow_up_question"))
+        twiml.append(HANGUP_TAIL)
         return
     
     # タイムアウトまたは無効な入力
-    print("Timeout or invalid input after operator choice prompt.")
-    _add_timeout_and_hangup(twilio_response, language)
+    logger.info("Timeout or invalid input after operator choice prompt.")
+    twiml.append(twiml_renderer.timeout_tail(language))
 
 
-def _handle_valid_room_number(twilio_response, digits_result, language):
+def _handle_valid_room_number(twiml, digits_result, language):
     """有効な部屋番号の処理"""
-    print(f"Valid room number: {digits_result}")
-    gather_phone = _create_phone_last4_gather(language, digits_result, attempt=1)
-    twilio_response.append(gather_phone)
-    _add_timeout_and_hangup(twilio_response, language)
+    logger.info("Valid room number", room_number=digits_result)
+    twiml.append(twiml_renderer.phone_last4_gather(language, digits_result, attempt=1))
+    twiml.append(twiml_renderer.timeout_tail(language))
 
 
-def _handle_invalid_room_number(twilio_response, digits_result, language, attempt):
+def _handle_invalid_room_number(twiml, digits_result, language, attempt):
     """無効な部屋番号の処理"""
-    print(f"Invalid room number: {digits_result}. Attempt: {attempt}")
-    invalid_msg = lingual_mgr.get_message(language, "invalid_room_number")
-    voice = lingual_mgr.get_voice(language)
-    twilio_response.say(wrap_with_prosody(invalid_msg), language=language, voice=voice)
+    logger.info("Invalid room number", room_number=digits_result, attempt=attempt)
+    twiml.append(twiml_renderer.say_message(language, "invalid_room_number"))
     
     if attempt < 2:
-        gather_room_retry = _create_room_number_gather(language, attempt=2)
-        twilio_response.append(gather_room_retry)
+        twiml.append(twiml_renderer.room_number_gather(language, attempt=2))
     
-    _add_timeout_and_hangup(twilio_response, language)
+    twiml.append(twiml_renderer.timeout_tail(language))
 
 
-def _handle_room_number_input(twilio_response, digits_result, language, attempt):
+def _handle_room_number_input(twiml, digits_result, language, attempt):
     """部屋番号入力からの応答を処理"""
-    print(f"Handling room number input: {digits_result}")
-    
     if is_valid_room_number(digits_result):
-        _handle_valid_room_number(twilio_response, digits_result, language)
+        _handle_valid_room_number(twiml, digits_result, language)
     else:
-        _handle_invalid_room_number(twilio_response, digits_result, language, attempt)
+        _handle_invalid_room_number(twiml, digits_result, language, attempt)
 
 
-def _handle_auth_success(twilio_response, guest_info, language, room_number, digits_result):
+def _handle_auth_success(twiml, guest_info, language, room_number, digits_result):
     """認証成功時の処理"""
-    print(f"Authentication successful for guest: {guest_info.get('guestName')} in room {room_number}")
-    welcome_message = lingual_mgr.get_message(language, "welcome")
-    voice = lingual_mgr.get_voice(language)
-    gather_inquiry = Gather(
-        input='speech', method='POST', language=language,
-        speechTimeout='auto', timeout=7, speechModel='deepgram-nova-3',
-        action=f'?language={language}&room_number={room_number}&phone_last4={digits_result}&attempt=1'
-    )
-    gather_inquiry.say(wrap_with_prosody(welcome_message), language=language, voice=voice)
-    twilio_response.append(gather_inquiry)
-    _add_timeout_and_hangup(twilio_response, language)
+    logger.info("Authentication successful", room_number=room_number)
+    if session_codec.enabled:
+        session = session_codec.encode(language, room_number, guest_info)
+        action = f'?language={language}&session={session}&attempt=1'
+    else:
+        action = f'?language={language}&room_number={room_number}&phone_last4={digits_result}&attempt=1'
+    twiml.append(twiml_renderer.speech_gather(language, action, "welcome"))
+    twiml.append(twiml_renderer.timeout_tail(language))
 
 
-def _handle_auth_failure(twilio_response, auth_result, language, room_number, digits_result):
+def _handle_auth_failure(twiml, auth_result, language, room_number, digits_result):
     """認証失敗時の処理"""
     error_code = auth_result.get('error', 'UNKNOWN_ERROR')
-    print(f"Authentication failed: {error_code} for room {room_number}, phone_last4 {digits_result}")
-    voice = lingual_mgr.get_voice(language)
-    auth_failed_msg = lingual_mgr.get_message(language, "authentication_failed")
-    twilio_response.say(wrap_with_prosody(auth_failed_msg), language=language, voice=voice)
-    twilio_response.pause(length=3)
-    twilio_response.hangup()
+    logger.info("Authentication failed", error_code=error_code, room_number=room_number)
+    twiml.append(twiml_renderer.say_message(language, "authentication_failed"))
+    twiml.append(HANGUP_TAIL)
 
 
-def _handle_valid_phone_last4(twilio_response, digits_result, language, room_number):
+def _handle_valid_phone_last4(twiml, digits_result, language, room_number):
     """有効な電話番号下4桁の処理"""
-    print(f"Valid phone last 4 digits: {digits_result}")
-    print(f"Room number from query: {room_number}")
-    
-    auth_result = authenticate_guest(room_number, digits_result)
+    with tracer.span('guest_auth', source='lookup'):
+        auth_result = authenticate_guest_cached(room_number, digits_result)
     
     if auth_result['success']:
-        _handle_auth_success(twilio_response, auth_result['guest_info'], language, room_number, digits_result)
+        _handle_auth_success(twiml, auth_result['guest_info'], language, room_number, digits_result)
     else:
-        _handle_auth_failure(twilio_response, auth_result, language, room_number, digits_result)
+        _handle_auth_failure(twiml, auth_result, language, room_number, digits_result)
 
 
-def _handle_invalid_phone_last4(twilio_response, digits_result, language, room_number, attempt):
+def _handle_invalid_phone_last4(twiml, digits_result, language, room_number, attempt):
     """無効な電話番号下4桁の処理"""
-    print(f"Invalid phone last 4 digits: {digits_result}. Attempt: {attempt}")
-    invalid_msg = lingual_mgr.get_message(language, "invalid_phone_last4")
-    voice = lingual_mgr.get_voice(language)
-    twilio_response.say(wrap_with_prosody(invalid_msg), language=language, voice=voice)
+    logger.info("Invalid phone last 4 digits", phone_last4=digits_result, attempt=attempt)
+    twiml.append(twiml_renderer.say_message(language, "invalid_phone_last4"))
     
     if attempt < 2:
-        gather_phone_retry = _create_phone_last4_gather(language, room_number, attempt=2)
-        twilio_response.append(gather_phone_retry)
+        twiml.append(twiml_renderer.phone_last4_gather(language, room_number, attempt=2))
     
-    _add_timeout_and_hangup(twilio_response, language)
+    twiml.append(twiml_renderer.timeout_tail(language))
 
 
-def _handle_phone_last4_input(twilio_response, digits_result, language, room_number, attempt):
+def _handle_phone_last4_input(twiml, digits_result, language, room_number, attempt):
     """電話番号下4桁入力からの応答を処理"""
-    print(f"Handling phone last 4 digits input: {digits_result}")
-    
     is_valid = len(digits_result) == 4 and digits_result.isdigit()
     if is_valid:
-        _handle_valid_phone_last4(twilio_response, digits_result, language, room_number)
+        _handle_valid_phone_last4(twiml, digits_result, language, room_number)
     else:
-        _handle_invalid_phone_last4(twilio_response, digits_result, language, room_number, attempt)
+        _handle_invalid_phone_last4(twiml, digits_result, language, room_number, attempt)
 
 
-def _handle_language_selection(twilio_response, digits_result):
+def _handle_language_selection(twiml, digits_result):
     """言語選択の処理。選択された言語を返す（無効な場合はNone）"""
-    print("Handling language selection.")
-    
     language_map = {"1": "en-US", "2": "ja-JP"}
     language = language_map.get(digits_result)
     
     if language:
-        print(f"Language selected: {language}")
-        gather_room = _create_room_number_gather(language, attempt=1)
-        twilio_response.append(gather_room)
-        _add_timeout_and_hangup(twilio_response, language)
+        logger.info("Language selected", language=language)
+        twiml.append(twiml_renderer.room_number_gather(language, attempt=1))
+        twiml.append(twiml_renderer.timeout_tail(language))
         return language
     
     # 不正な入力の場合、再度言語選択を促す
-    print(f"Invalid digit input: {digits_result}. Re-prompting for language.")
-    gather_lang = _create_language_selection_gather()
-    twilio_response.append(gather_lang)
-    twilio_response.pause(length=3)
-    twilio_response.hangup()
+    logger.info("Invalid digit input. Re-prompting for language.", digits=digits_result)
+    twiml.append(twiml_renderer.language_menu_gather())
+    twiml.append(HANGUP_TAIL)
     return None
 
 
@@ -323,45 +281,137 @@ def _retrieve_guest_info(room_number, phone_last4):
     if not room_number or not phone_last4:
         return None
     
-    auth_result = authenticate_guest(room_number, phone_last4)
+    with tracer.span('guest_auth', source='lookup'):
+        auth_result = authenticate_guest_cached(room_number, phone_last4)
+    logger.debug("Guest cache stats", stats=guest_session_cache.stats)
     if auth_result['success']:
-        guest_info = auth_result['guest_info']
-        print(f"Guest info retrieved: {guest_info.get('guestName')} in room {room_number}")
-        return guest_info
+        logger.info("Guest info retrieved", room_number=room_number)
+        return auth_result['guest_info']
     
-    print(f"Warning: Guest re-authentication failed in speech handling: {auth_result.get('error')}")
+    logger.warning("Guest re-authentication failed in speech handling", error_code=auth_result.get('error'))
     return None
 
 
-def _invoke_ai_processing_lambda(payload, language, twilio_response):
+def _decode_session(session):
+    """セッショントークンを検証して通話状態を返す（無効な場合はNone）"""
+    try:
+        return session_codec.decode(session)
+    except SessionTokenError as e:
+        logger.warning("Invalid session token in speech handling", error=e)
+        return None
+
+
+def _is_poll_mode():
+    """ポーリングモードが有効か（結果ストアが設定されている場合のみ）"""
+    if AI_RESPONSE_MODE != 'poll':
+        return False
+    if result_store is None:
+        logger.warning("AI_RESPONSE_MODE=poll but CALL_RESULT_TABLE_NAME is not set. Falling back to push mode.")
+        return False
+    return True
+
+
+def _append_poll_redirect(twiml, language, turn_id, attempt):
+    """短いPauseの後にポーリングエンドポイントへRedirect"""
+    twiml.append(pause(POLL_INTERVAL_SECONDS))
+    twiml.append(redirect(f'?language={language}&source=poll_result&turn={turn_id}&attempt={attempt}'))
+
+
+def _handle_poll_result(twiml, call_sid, language, query_params, attempt):
+    """ポーリング: 結果があればそのTwiMLを返し、なければ待機を延長する"""
+    turn_id = query_params.get('turn')
+    tracer.set_turn(turn_id)
+    stored_twiml = None
+    try:
+        with tracer.span('result_store_get', attempt=attempt):
+            stored_twiml = result_store.get(call_sid, turn_id) if result_store and turn_id else None
+    except Exception as e:
+        logger.error("Error reading call result store", error=e)
+
+    if stored_twiml:
+        logger.info("Poll hit", turn_id=turn_id, attempt=attempt)
+        return _build_twiml_response(stored_twiml)
+
+    if turn_id and attempt < POLL_MAX_ATTEMPTS:
+        logger.debug("Poll miss", turn_id=turn_id, attempt=attempt, max_attempts=POLL_MAX_ATTEMPTS)
+        _append_poll_redirect(twiml, language, turn_id, attempt + 1)
+        return None
+
+    logger.warning("Poll gave up", turn_id=turn_id, attempt=attempt)
+    twiml.append(twiml_renderer.say_message(language, "processing_error"))
+    twiml.append(HANGUP_TAIL)
+    return None
+
+
+def _handle_hold(twiml, language, query_params):
+    """保留の延長: 上限までは短いPause+Redirectを返し、上限に達したらエラー案内で終了する"""
+    try:
+        held_since = int(query_params.get('held_since', '0'))
+    except ValueError:
+        held_since = 0
+    tracer.set_turn(held_since)
+    tail = hold_tail(language, held_since)
+    if tail:
+        logger.debug("Hold extended", held_since=held_since)
+        twiml.append(tail)
+        return None
+
+    # AI Processing Lambda からの TwiML が上限までに届かなかった
+    logger.warning("Hold expired without an AI response", held_since=held_since, hold_max_seconds=HOLD_MAX_SECONDS)
+    twiml.append(twiml_renderer.say_message(language, "processing_error"))
+    twiml.append(HANGUP_TAIL)
+    return None
+
+
+def _invoke_ai_processing_lambda(payload, language, twiml):
     """AI処理Lambdaを非同期で呼び出す。成功時はTrue、失敗時はFalse"""
     try:
-        lambda_client.invoke(
-            FunctionName=AI_PROCESSING_LAMBDA_NAME,
-            InvocationType='Event',
-            Payload=json.dumps(payload)
-        )
-        print(f"Successfully invoked {AI_PROCESSING_LAMBDA_NAME} asynchronously.")
+        with tracer.span('lambda_invoke'):
+            # CALL_TRACING_ENABLED=true ならトレースコンテキストを入れ、AI Processing Lambda のスパンの親にする
+            lambda_client.invoke(
+                FunctionName=AI_PROCESSING_LAMBDA_NAME,
+                InvocationType='Event',
+                Payload=json.dumps(tracer.inject(payload))
+            )
+        logger.info("Invoked AI processing Lambda asynchronously", function_name=AI_PROCESSING_LAMBDA_NAME)
         return True
     except Exception as e:
-        print(f"Error invoking {AI_PROCESSING_LAMBDA_NAME}: {e}")
-        error_message_text = lingual_mgr.get_message(language, "processing_error")
-        voice = lingual_mgr.get_voice(language)
-        twilio_response.say(wrap_with_prosody(error_message_text), language=language, voice=voice)
-        twilio_response.pause(length=3)
-        twilio_response.hangup()
+        logger.error("Error invoking AI processing Lambda", function_name=AI_PROCESSING_LAMBDA_NAME, error=e)
+        twiml.append(twiml_renderer.say_message(language, "processing_error"))
+        twiml.append(HANGUP_TAIL)
         return False
 
 
-def _handle_speech_result(twilio_response, speech_result, call_sid, event, previous_openai_response_id_from_query):
+def _handle_speech_result(twiml, speech_result, call_sid, event, previous_openai_response_id_from_query):
     """ユーザーの発話を受け取った場合の処理。エラー時は早期レスポンスを返す"""
     query_params = event.get('queryStringParameters', {})
     language = query_params.get('language', 'en-US')
-    room_number = query_params.get('room_number')
-    phone_last4 = query_params.get('phone_last4')
-    print(f"Speech result received: '{speech_result}'. Room: {room_number}, Phone: {phone_last4}. Invoking AI processing Lambda.")
+    session = query_params.get('session')
+
+    if session:
+        # 署名済みトークンからゲスト情報と会話ポインタを復元（DynamoDBアクセスなし）
+        with tracer.span('guest_auth', source='session'):
+            session_state = _decode_session(session) or {}
+        room_number = session_state.get('room_number')
+        phone_last4 = None
+        guest_info = session_state.get('guest_info')
+        previous_openai_response_id_from_query = session_state.get('previous_openai_response_id')
+        if not session_state:
+            session = None
+        logger.info("Speech result received", room_number=room_number, session_token=True,
+                    speech_result=speech_result)
+    else:
+        room_number = query_params.get('room_number')
+        phone_last4 = query_params.get('phone_last4')
+        logger.info("Speech result received", room_number=room_number, session_token=False,
+                    speech_result=speech_result)
+        guest_info = _retrieve_guest_info(room_number, phone_last4)
 
-    guest_info = _retrieve_guest_info(room_number, phone_last4)
+    # ポーリングモードではAI Lambdaが結果をストアに書き込むためのターンIDを発行
+    turn_id = uuid.uuid4().hex[:16] if _is_poll_mode() else None
+    received_at = time.time()  # AI Lambda が保留の残り時間を計算する基準
+    # トレースのターン（保留の held_since・ポーリングのターンIDと同じ値で、後続の呼び出しと結びつける）
+    tracer.set_turn(turn_id or int(received_at))
 
     payload = {
         'speech_result': speech_result,
@@ -369,53 +419,32 @@ def _handle_speech_result(twilio_response, speech_result, call_sid, event, previ
         'language': language,
         'room_number': room_number,
         'phone_last4': phone_last4,
+        'session': session,
         'guest_info': guest_info,
-        'previous_openai_response_id': previous_openai_response_id_from_query
+        'previous_openai_response_id': previous_openai_response_id_from_query,
+        'turn_id': turn_id,
+        'received_at': received_at
     }
 
-    success = _invoke_ai_processing_lambda(payload, language, twilio_response)
+    success = _invoke_ai_processing_lambda(payload, language, twiml)
     if not success:
         # エラー発生時は早期レスポンスを返す
-        twiml_body_error = str(twilio_response)
-        print(f"ImmediateResponse Lambda Returning TwiML (Error): {twiml_body_error}")
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/xml'},
-            'body': twiml_body_error
-        }
+        return _build_twiml_response(document(twiml))
 
     # Twilioに即時応答
-    analyzing_message_text = lingual_mgr.get_message(language, "received_and_analyzing")
-    voice = lingual_mgr.get_voice(language)
-    twilio_response.say(wrap_with_prosody(analyzing_message_text), language=language, voice=voice)
-    twilio_response.pause(length=30)  # AI処理完了まで30秒待機（Classification + Vector Search）
+    twiml.append(twiml_renderer.say_message(language, "received_and_analyzing"))
+    if turn_id:
+        # 結果ができ次第返せるよう短いPause+Redirectでポーリング
+        _append_poll_redirect(twiml, language, turn_id, 1)
+    else:
+        # AI処理の完了（calls.updateでの差し替え）まで短いPauseを延長しながら保留
+        twiml.append(hold_tail(language, int(received_at)))
     return None
 
 
-def _handle_initial_call(twilio_response):
-    """初回呼び出し (GETリクエスト、または入力なしのPOST)の処理"""
-    gather_lang = Gather(input='dtmf', numDigits=1, method='POST', action='?action=language_selected')
-    gather_lang.pause(length=1)
-    gather_lang.say(wrap_with_prosody("For English, press 1."), language="en-US", voice=lingual_mgr.get_voice("en-US"))
-    gather_lang.say(wrap_with_prosody("日本語をご希望の場合は2を押してください。"), language="ja-JP", voice=lingual_mgr.get_voice("ja-JP"))
-    twilio_response.append(gather_lang)
-
-    # Gatherがタイムアウトした場合のフォールバック - バイリンガルで案内
-    twilio_response.say(
-        wrap_with_prosody("We could not understand your input. Please try calling again."),
-        language="en-US", voice=lingual_mgr.get_voice("en-US")
-    )
-    twilio_response.say(
-        wrap_with_prosody("入力が確認できませんでした。もう一度おかけ直しください。"),
-        language="ja-JP", voice=lingual_mgr.get_voice("ja-JP")
-    )
-    twilio_response.pause(length=3)
-    twilio_response.hangup()
-
-
 def _build_twiml_response(twiml_body):
     """TwiMLレスポンスを構築"""
-    print(f"ImmediateResponse Lambda Returning TwiML: {twiml_body}")
+    logger.debug("ImmediateResponse Lambda Returning TwiML", twiml=twiml_body)
     return {
         'statusCode': 200,
         'headers': {'Content-Type': 'application/xml'},
@@ -428,7 +457,15 @@ def _build_twiml_response(twiml_body):
 # ============================================================
 
 def lambda_handler(event, context):
-    print(f"ImmediateResponse Lambda Event: {json.dumps(event)}")
+    # EVENT_CAPTURE_ENABLED=true ならイベント・I/O・応答を記録（記録・再生ハーネス用）
+    # CALL_TRACING_ENABLED=true ならステージごとの所要時間を EMF で出力
+    with event_capture.invocation('immediate_response', event), tracer.invocation('immediate_response'):
+        return event_capture.result(_handle_event(event, context))
+
+
+def _handle_event(event, context):
+    set_context(aws_request_id=getattr(context, 'aws_request_id', None))
+    logger.debug("ImmediateResponse Lambda Event", event=lambda: event)
 
     # CloudFront Secret検証（セキュリティ）
     forbidden_response = _validate_cloudfront_secret(event)
@@ -446,63 +483,69 @@ def lambda_handler(event, context):
     attempt = int(query_params.get('attempt', '1'))
     room_number = query_params.get('room_number')
     
-    print(f"  Query Param - language: {language}")
-    print(f"  Query Param - previous_openai_response_id: {previous_openai_response_id_from_query}")
-    print(f"  Query Param - source: {source}")
-    print(f"  Query Param - attempt: {attempt}")
-    print(f"  Query Param - room_number: {room_number}")
+    logger.info("Query params", language=language, source=source, attempt=attempt, room_number=room_number,
+                previous_openai_response_id=previous_openai_response_id_from_query)
 
     # Twilioからのリクエストボディを解析
-    speech_result, digits_result, call_sid = _parse_request_body(event)
+    with tracer.span('body_parse'):
+        form = _parse_request_body(event)
+    speech_result, digits_result, call_sid = form.speech_result, form.digits, form.call_sid
 
-    twilio_response = VoiceResponse()
+    twiml = []
 
     # ルーティング処理
     early_response = _route_request(
-        twilio_response, source, digits_result, speech_result, call_sid,
+        twiml, source, digits_result, speech_result, call_sid,
         language, query_params, previous_openai_response_id_from_query,
         room_number, attempt, event
     )
     if early_response:
         return early_response
 
-    return _build_twiml_response(str(twilio_response))
+    return _build_twiml_response(document(twiml))
 
 
-def _route_request(twilio_response, source, digits_result, speech_result, call_sid,
+def _route_request(twiml, source, digits_result, speech_result, call_sid,
                    language, query_params, previous_openai_response_id_from_query,
                    room_number, attempt, event):
     """リクエストを適切なハンドラーにルーティング"""
+    # ポーリングモード: AI応答の結果取得
+    if source == 'poll_result' and call_sid:
+        return _handle_poll_result(twiml, call_sid, language, query_params, attempt)
+
+    # AI応答待ちの保留の延長
+    if source == 'hold':
+        return _handle_hold(twiml, language, query_params)
+
     # A. オペレーター選択プロンプト(DTMF)からの応答
     if source == 'operator_choice_dtmf':
         _handle_operator_choice_dtmf(
-            twilio_response, digits_result, language, query_params,
+            twiml, digits_result, language, query_params,
             previous_openai_response_id_from_query, room_number
         )
         return None
 
     # B. 部屋番号入力からの応答
     if source == 'room_number_input' and digits_result:
-        _handle_room_number_input(twilio_response, digits_result, language, attempt)
+        _handle_room_number_input(twiml, digits_result, language, attempt)
         return None
 
     # C. 電話番号下4桁入力からの応答
     if source == 'phone_last4_input' and digits_result:
-        _handle_phone_last4_input(twilio_response, digits_result, language, room_number, attempt)
+        _handle_phone_last4_input(twiml, digits_result, language, room_number, attempt)
         return None
 
     # D. ユーザーが言語選択の番号を入力した場合
     if digits_result:
-        _handle_language_selection(twilio_response, digits_result)
+        _handle_language_selection(twiml, digits_result)
         return None
 
     # E. ユーザーの発話を受け取った場合
     if speech_result and call_sid:
         return _handle_speech_result(
-            twilio_response, speech_result, call_sid, event,
+            twiml, speech_result, call_sid, event,
             previous_openai_response_id_from_query
         )
 
-    # F. 初回呼び出し (GETリクエスト、または入力なしのPOST)
-    _handle_initial_call(twilio_response)
-    return None
+    # F. 初回呼び出し (GETリクエスト、または入力なしのPOST) - コンパイル済み文書をそのまま返す
+    return _build_twiml_response(twiml_renderer.initial_call())
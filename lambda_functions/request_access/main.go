@@ -12,6 +12,7 @@ import (
 	"net/smtp"
 	"os"
 	"strconv"
+	"strings"
 	"time"
 
 	"github.com/aws/aws-lambda-go/lambda"
@@ -248,23 +249,42 @@ func validateInput(input RequestAccessInput) *Response {
 	return nil
 }
 
+// roomPhoneLast4Key builds the "<roomNumber>#<last 4 phone digits>" key for RoomPhoneLast4Index
+// (Twilio phone authentication). Returns "" when the phone has fewer than 4 digits.
+func roomPhoneLast4Key(roomNumber, phone string) string {
+	digits := strings.Map(func(r rune) rune {
+		if r >= '0' && r <= '9' {
+			return r
+		}
+		return -1
+	}, phone)
+	if len(digits) < 4 {
+		return ""
+	}
+	return fmt.Sprintf("%s#%s", roomNumber, digits[len(digits)-4:])
+}
+
 // saveGuestToDynamoDB saves the guest record to DynamoDB
 func saveGuestToDynamoDB(ctx context.Context, input RequestAccessInput, guestID, tokenHash, bookingID string, pendingVerificationTTL int64) error {
+	item := map[string]types.AttributeValue{
+		"roomNumber":             &types.AttributeValueMemberS{Value: input.RoomNumber},
+		"guestId":                &types.AttributeValueMemberS{Value: guestID},
+		"guestName":              &types.AttributeValueMemberS{Value: input.GuestName},
+		"email":                  &types.AttributeValueMemberS{Value: input.Email},
+		"phone":                  &types.AttributeValueMemberS{Value: input.Phone},
+		"sessionTokenHash":       &types.AttributeValueMemberS{Value: tokenHash},
+		"approvalStatus":         &types.AttributeValueMemberS{Value: "pendingVerification"},
+		"pendingVerificationTtl": &types.AttributeValueMemberN{Value: strconv.FormatInt(pendingVerificationTTL, 10)},
+		"createdAt":              &types.AttributeValueMemberS{Value: nowISOmsZ()},
+		"contactChannel":         &types.AttributeValueMemberS{Value: input.ContactChannel},
+		"bookingId":              &types.AttributeValueMemberS{Value: bookingID},
+	}
+	if key := roomPhoneLast4Key(input.RoomNumber, input.Phone); key != "" {
+		item["roomPhoneLast4"] = &types.AttributeValueMemberS{Value: key}
+	}
 	_, err := dynamoClient.PutItem(ctx, &dynamodb.PutItemInput{
 		TableName: &tableName,
-		Item: map[string]types.AttributeValue{
-			"roomNumber":             &types.AttributeValueMemberS{Value: input.RoomNumber},
-			"guestId":                &types.AttributeValueMemberS{Value: guestID},
-			"guestName":              &types.AttributeValueMemberS{Value: input.GuestName},
-			"email":                  &types.AttributeValueMemberS{Value: input.Email},
-			"phone":                  &types.AttributeValueMemberS{Value: input.Phone},
-			"sessionTokenHash":       &types.AttributeValueMemberS{Value: tokenHash},
-			"approvalStatus":         &types.AttributeValueMemberS{Value: "pendingVerification"},
-			"pendingVerificationTtl": &types.AttributeValueMemberN{Value: strconv.FormatInt(pendingVerificationTTL, 10)},
-			"createdAt":              &types.AttributeValueMemberS{Value: nowISOmsZ()},
-			"contactChannel":         &types.AttributeValueMemberS{Value: input.ContactChannel},
-			"bookingId":              &types.AttributeValueMemberS{Value: bookingID},
-		},
+		Item:      item,
 	})
 	return err
 }
@@ -12,6 +12,7 @@ import (
 	"net"
 	"net/smtp"
 	"os"
+	"strings"
 	"time"
 
 	"github.com/aws/aws-lambda-go/lambda"
@@ -67,6 +68,7 @@ type GuestRecord struct {
 	CreatedAt             *string `dynamodbav:"createdAt,omitempty"`
 	UpdatedAt             *string `dynamodbav:"updatedAt,omitempty"`
 	CurrentLocation       *string `dynamodbav:"currentLocation,omitempty"`
+	RoomPhoneLast4        *string `dynamodbav:"roomPhoneLast4,omitempty"`
 }
 
 var (
@@ -281,6 +283,8 @@ func transferBatch(ctx context.Context, guests []GuestRecord, newRoomNumber stri
 		newGuest := guest
 		newGuest.RoomNumber = newRoomNumber
 		newGuest.UpdatedAt = &now
+		// Twilio電話認証用のルックアップキーも新しい部屋番号で作り直す
+		newGuest.RoomPhoneLast4 = roomPhoneLast4Key(newRoomNumber, guest.Phone)
 
 		// SessionTokenHash を持っている代表者のみ、新しいトークンを生成
 		if guest.SessionTokenHash != nil && *guest.SessionTokenHash != "" {
@@ -365,6 +369,24 @@ func hashToken(token string) string {
 	return hex.EncodeToString(hash[:])
 }
 
+// Twilio電話認証用のルックアップキー "<部屋番号>#<電話番号下4桁>" を生成（数字4桁未満はnil）
+func roomPhoneLast4Key(roomNumber string, phone *string) *string {
+	if phone == nil {
+		return nil
+	}
+	digits := strings.Map(func(r rune) rune {
+		if r >= '0' && r <= '9' {
+			return r
+		}
+		return -1
+	}, *phone)
+	if len(digits) < 4 {
+		return nil
+	}
+	key := fmt.Sprintf("%s#%s", roomNumber, digits[len(digits)-4:])
+	return &key
+}
+
 // Zoho SMTP経由でメール送信
 func sendEmail(_ context.Context, toEmail, guestName, roomNumber, guestID, token, nationality string) error {
 	if smtpUser == "" || smtpPassword == "" {
@@ -0,0 +1,43 @@
+"""
+Call Hold - AI応答を待つ間の保留（短い Pause + Redirect の繰り返し）
+
+責務: 発話の受信から AI 応答の TwiML が届くまで発信者をつなぎ止める TwiML を組み立てる。
+1つの長い Pause（従来は30秒）の代わりに HOLD_PAUSE_SECONDS の Pause と
+ImmediateResponse Lambda の保留エンドポイント（source=hold）への Redirect を返し、
+保留エンドポイントは受信時刻（held_since）からの経過が HOLD_MAX_SECONDS に達するまで同じ保留を延長する。
+AI Processing Lambda の calls.update は保留中のどの時点でも TwiML を差し替える。
+
+AI Processing Lambda 側の応答期限（hold_orchestrator）はこの保留の上限より前に設定し、
+期限を過ぎたら保留が切れる前に代わりの案内を送る。
+"""
+import os
+import time
+from typing import Optional
+
+from twiml_renderer import pause, redirect
+
+HOLD_PAUSE_SECONDS = int(os.environ.get('HOLD_PAUSE_SECONDS', '5'))
+HOLD_MAX_SECONDS = int(os.environ.get('HOLD_MAX_SECONDS', '30'))
+
+
+def hold_url(language: str, held_since: int, base_url: str = '') -> str:
+    """保留エンドポイントのURL（base_url を省略すると ImmediateResponse Lambda からの相対URL）"""
+    return f"{base_url}?language={language}&source=hold&held_since={held_since}"
+
+
+def hold_remaining_seconds(held_since: int, now: Optional[float] = None) -> float:
+    """発信者の保留の残り時間（秒）"""
+    return held_since + HOLD_MAX_SECONDS - (time.time() if now is None else now)
+
+
+def hold_tail(language: str, held_since: int, base_url: str = '', now: Optional[float] = None) -> Optional[str]:
+    """
+    短い Pause と保留エンドポイントへの Redirect
+
+    Returns:
+        保留を延長する TwiML フラグメント（保留の上限に達していればNone）
+    """
+    remaining = hold_remaining_seconds(held_since, now)
+    if remaining < 1:
+        return None
+    return pause(min(HOLD_PAUSE_SECONDS, int(remaining))) + redirect(hold_url(language, held_since, base_url))
@@ -0,0 +1,75 @@
+"""
+Call Result Store - AI応答TwiMLの受け渡しストア
+
+責務: ポーリングモードで AIProcessing Lambda が生成したTwiMLを
+CallSid + ターンIDをキーに保存し、ImmediateResponse Lambda のポーリング
+エンドポイントから取り出せるようにする。
+本番はDynamoDB（TTL付きテーブル）、ローカル検証用にインメモリ実装を持つ。
+"""
+import os
+import threading
+import time
+from typing import Optional
+
+import boto3
+
+CALL_RESULT_TABLE_NAME = os.environ.get('CALL_RESULT_TABLE_NAME')
+RESULT_TTL_SECONDS = int(os.environ.get('CALL_RESULT_TTL_SECONDS', '600'))
+
+
+def _result_key(call_sid: str, turn_id: str) -> str:
+    return f"{call_sid}#{turn_id}"
+
+
+class InMemoryResultStore:
+    """プロセス内の辞書で動くストア（ローカル検証・シミュレーション用）"""
+
+    def __init__(self, ttl_seconds: int = RESULT_TTL_SECONDS, clock=time.time):
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def put(self, call_sid: str, turn_id: str, twiml: str) -> None:
+        with self._lock:
+            self._results[_result_key(call_sid, turn_id)] = (self._clock() + self.ttl_seconds, twiml)
+
+    def get(self, call_sid: str, turn_id: str) -> Optional[str]:
+        with self._lock:
+            entry = self._results.get(_result_key(call_sid, turn_id))
+        if entry is None or entry[0] <= self._clock():
+            return None
+        return entry[1]
+
+
+class DynamoDBResultStore:
+    """DynamoDBのTTL属性付きテーブルを使うストア"""
+
+    def __init__(self, table_name: str, ttl_seconds: int = RESULT_TTL_SECONDS, dynamodb_resource=None):
+        resource = dynamodb_resource or boto3.resource('dynamodb')
+        self.table = resource.Table(table_name)
+        self.ttl_seconds = ttl_seconds
+
+    def put(self, call_sid: str, turn_id: str, twiml: str) -> None:
+        self.table.put_item(Item={
+            'resultKey': _result_key(call_sid, turn_id),
+            'twiml': twiml,
+            'expiresAt': int(time.time()) + self.ttl_seconds
+        })
+
+    def get(self, call_sid: str, turn_id: str) -> Optional[str]:
+        # 書き込み直後のポーリングで取りこぼさないよう強整合読み込み
+        item = self.table.get_item(
+            Key={'resultKey': _result_key(call_sid, turn_id)},
+            ConsistentRead=True
+        ).get('Item')
+        if not item or int(item.get('expiresAt', 0)) <= time.time():
+            return None
+        return item['twiml']
+
+
+def create_result_store():
+    """環境変数にテーブル名があればDynamoDBストアを生成（未設定ならNone）"""
+    if not CALL_RESULT_TABLE_NAME:
+        return None
+    return DynamoDBResultStore(CALL_RESULT_TABLE_NAME)
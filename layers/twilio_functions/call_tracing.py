@@ -0,0 +1,281 @@
+"""
+Call Tracing - 両Lambdaを通した通話のトレース（CloudWatch Embedded Metric Format）
+
+責務: 呼び出しの中のステージ（ボディの解析・ゲスト認証・Lambda の呼び出し・分類・ベクトル検索・
+calls.update など）をスパンとして計測し、呼び出しの終わりにスパンごとに1行の EMF を標準出力に書き出す。
+CloudWatch Logs が EMF の行から Handler × Stage ごとの Duration メトリクスを作るため、
+エージェントや PutMetricData なしでステージごとのレイテンシのダッシュボードが作れる。
+
+- トレースは CallSid とターンで識別する（trace_id = "CallSid/ターン"）。ターンはポーリングモードならターンID、
+  それ以外は発話の受信時刻（保留の held_since と同じエポック秒）で、保留・ポーリングの呼び出しも同じターンにつながる
+- ImmediateResponse Lambda は AI Processing Lambda の呼び出しペイロードにトレースコンテキスト（trace）を入れ、
+  AI Processing Lambda は呼び出し元のスパンを親にして、非同期呼び出しの待ち時間（async_queue）も記録する
+- 無効時（既定）は span が共有の何もしないコンテキストマネージャを返し、inject はペイロードをそのまま返す
+- invocation(collect=True) なら無効時も EMF を出さずにスパンだけ計測し、stage_durations() で
+  ステージごとの所要時間を読める（ターンの分析レコード用。call_analytics）
+- サンプリングは CallSid 単位（両Lambdaで同じ通話がそろって出力される）
+
+使い方:
+    with tracer.invocation('immediate_response'):
+        with tracer.span('body_parse'):
+            ...
+"""
+import contextvars
+import json
+import os
+import sys
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from voice_logger import get_logger
+
+CALL_TRACING_ENABLED = os.environ.get('CALL_TRACING_ENABLED', 'false').lower() == 'true'
+CALL_TRACING_SAMPLE_RATE = float(os.environ.get('CALL_TRACING_SAMPLE_RATE', '1.0'))
+CALL_TRACING_NAMESPACE = os.environ.get('CALL_TRACING_NAMESPACE', 'ObwVoice')
+
+TRACE_PAYLOAD_KEY = 'trace'
+ROOT_STAGE = 'invocation'
+METRIC_NAME = 'Duration'
+DIMENSIONS = [['Handler', 'Stage']]
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar('call_trace', default=None)
+_current_span: contextvars.ContextVar = contextvars.ContextVar('call_trace_span', default=None)
+
+logger = get_logger('call_tracing')
+
+
+def _new_span_id() -> str:
+    return os.urandom(8).hex()
+
+
+class _NoopSpan:
+    """トレースしないときのスパン（共有インスタンス）"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **fields) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    """1回の呼び出しのトレース（CallSid・ターンと、終わったスパンのバッファ）"""
+
+    def __init__(self, handler: str, call_sid: Optional[str] = None, turn: Optional[str] = None,
+                 parent_span_id: Optional[str] = None):
+        self.handler = handler
+        self.call_sid = call_sid
+        self.turn = turn
+        self.parent_span_id = parent_span_id
+        self.span_id = _new_span_id()
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+
+    @property
+    def trace_id(self) -> Optional[str]:
+        if not self.call_sid:
+            return None
+        return f"{self.call_sid}/{self.turn}" if self.turn else self.call_sid
+
+    def offset_ms(self) -> float:
+        return (time.perf_counter() - self._started) * 1000
+
+    def add(self, stage: str, span_id: str, parent_span_id: Optional[str], start_ms: float, duration_ms: float,
+            status: str, fields: Optional[Dict] = None) -> None:
+        self.spans.append({
+            'stage': stage, 'span_id': span_id, 'parent_span_id': parent_span_id,
+            'start_ms': round(start_ms, 2), 'duration_ms': round(duration_ms, 2), 'status': status,
+            'fields': fields,
+        })
+
+
+class Span:
+    """ステージ1つの計測（with で囲んだ区間。例外で抜けたら status=error）"""
+    __slots__ = ('_trace', 'stage', 'span_id', 'parent_span_id', 'fields', '_start_ms', '_token')
+
+    def __init__(self, trace: Trace, stage: str, fields: Dict):
+        self._trace = trace
+        self.stage = stage
+        self.span_id = _new_span_id()
+        self.parent_span_id = None
+        self.fields = fields or None
+        self._start_ms = 0.0
+        self._token = None
+
+    def __enter__(self):
+        self.parent_span_id = _current_span.get() or self._trace.span_id
+        self._token = _current_span.set(self.span_id)
+        self._start_ms = self._trace.offset_ms()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration_ms = self._trace.offset_ms() - self._start_ms
+        _current_span.reset(self._token)
+        self._trace.add(self.stage, self.span_id, self.parent_span_id, self._start_ms, duration_ms,
+                        'error' if exc_type else 'ok', self.fields)
+        return False
+
+    def set(self, **fields) -> None:
+        """スパンに属性を追加（EMF の行のプロパティとして出力）"""
+        self.fields = {**(self.fields or {}), **fields}
+
+
+class CallTracer:
+    """スパンの計測・トレースコンテキストの受け渡し・EMF の出力"""
+
+    def __init__(self, enabled: bool = CALL_TRACING_ENABLED, sample_rate: float = CALL_TRACING_SAMPLE_RATE,
+                 namespace: str = CALL_TRACING_NAMESPACE, stream=None):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.namespace = namespace
+        self._stream = stream
+        self.emitted_spans = 0
+        self.skipped_traces = 0
+
+    # ---- スパン ----
+
+    def span(self, stage: str, **fields):
+        """ステージを計測するコンテキストマネージャ（トレース中でなければ何もしない）"""
+        trace = _current_trace.get()
+        if trace is None:
+            return _NOOP_SPAN
+        return Span(trace, stage, fields)
+
+    def trace_coroutine(self, stage: str, coro):
+        """コルーチンの実行をスパンで囲む（トレース中でなければ coro をそのまま返す）"""
+        if _current_trace.get() is None:
+            return coro
+        return self._traced(stage, coro)
+
+    async def _traced(self, stage: str, coro):
+        with self.span(stage):
+            return await coro
+
+    def set_call(self, call_sid: Optional[str]) -> None:
+        trace = _current_trace.get()
+        if trace is not None and call_sid:
+            trace.call_sid = call_sid
+
+    def set_turn(self, turn) -> None:
+        trace = _current_trace.get()
+        if trace is not None and turn:
+            trace.turn = str(turn)
+
+    def stage_durations(self) -> Dict[str, float]:
+        """この呼び出しで終わったスパンのステージごとの合計時間（ms、トレース中でなければ空）"""
+        trace = _current_trace.get()
+        durations: Dict[str, float] = {}
+        for span in trace.spans if trace is not None else ():
+            durations[span['stage']] = round(durations.get(span['stage'], 0.0) + span['duration_ms'], 1)
+        return durations
+
+    # ---- 呼び出し ----
+
+    @contextmanager
+    def invocation(self, handler: str, call_sid: Optional[str] = None, parent: Optional[Dict] = None,
+                   collect: bool = False):
+        """
+        ハンドラの呼び出しをトレースする
+
+        Args:
+            handler: ハンドラ名（EMF の Handler ディメンション）
+            call_sid: CallSid（不明なら後から set_call で設定）
+            parent: 呼び出し元から受け取ったトレースコンテキスト（inject が入れた payload['trace']）
+            collect: 無効時もスパンを計測する（EMF は出さない）
+        """
+        if not (self.enabled or collect):
+            yield
+            return
+        parent = parent if isinstance(parent, dict) else {}
+        trace = Trace(handler, call_sid or parent.get('call_sid'), parent.get('turn'), parent.get('span_id'))
+        if isinstance(parent.get('sent_at'), (int, float)):
+            # 呼び出し元が invoke してからこの呼び出しが始まるまで（Lambda の非同期キュー・コールドスタート）
+            queue_ms = max(trace.started_at - parent['sent_at'], 0.0) * 1000
+            trace.add('async_queue', _new_span_id(), trace.parent_span_id, -queue_ms, queue_ms, 'ok')
+        trace_token = _current_trace.set(trace)
+        span_token = _current_span.set(trace.span_id)
+        status = 'ok'
+        try:
+            yield
+        except Exception:
+            status = 'error'
+            raise
+        finally:
+            _current_span.reset(span_token)
+            _current_trace.reset(trace_token)
+            if self.enabled:
+                trace.add(ROOT_STAGE, trace.span_id, trace.parent_span_id, 0.0, trace.offset_ms(), status)
+                self._emit(trace)
+
+    def inject(self, payload: Dict) -> Dict:
+        """呼び出し先の Lambda に渡すペイロードにトレースコンテキストを入れる（トレース中でなければそのまま返す）"""
+        trace = _current_trace.get() if self.enabled else None
+        if trace is None:
+            return payload  # collect のみの呼び出しは伝搬しない
+        return {**payload, TRACE_PAYLOAD_KEY: {
+            'call_sid': trace.call_sid,
+            'turn': trace.turn,
+            'span_id': _current_span.get() or trace.span_id,
+            'sent_at': time.time(),
+        }}
+
+    # ---- 出力 ----
+
+    def _sampled(self, call_sid: Optional[str]) -> bool:
+        if self.sample_rate >= 1.0:
+            return True
+        if not call_sid or self.sample_rate <= 0.0:
+            return False
+        return (zlib.crc32(call_sid.encode('utf-8')) % 10000) < self.sample_rate * 10000
+
+    def emf_record(self, trace: Trace, span: Dict) -> Dict:
+        """スパン1つの EMF ドキュメント（CallSid などはディメンションにせずプロパティとして出す）"""
+        return {
+            '_aws': {
+                'Timestamp': int((trace.started_at + span['start_ms'] / 1000) * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': self.namespace,
+                    'Dimensions': DIMENSIONS,
+                    'Metrics': [{'Name': METRIC_NAME, 'Unit': 'Milliseconds'}],
+                }],
+            },
+            'Handler': trace.handler,
+            'Stage': span['stage'],
+            METRIC_NAME: span['duration_ms'],
+            'trace_id': trace.trace_id,
+            'call_sid': trace.call_sid,
+            'turn': trace.turn,
+            'span_id': span['span_id'],
+            'parent_span_id': span['parent_span_id'],
+            'start_ms': span['start_ms'],
+            'status': span['status'],
+            **(span['fields'] or {}),
+        }
+
+    def _emit(self, trace: Trace) -> None:
+        if not self._sampled(trace.call_sid):
+            self.skipped_traces += 1
+            return
+        try:
+            lines = [json.dumps(self.emf_record(trace, span), ensure_ascii=False, separators=(',', ':'), default=str)
+                     for span in trace.spans]
+        except Exception as e:
+            logger.warning("Failed to build trace spans", error=e)
+            return
+        (self._stream or sys.stdout).write('\n'.join(lines) + '\n')
+        self.emitted_spans += len(lines)
+
+    def stats(self) -> Dict[str, int]:
+        return {'emitted_spans': self.emitted_spans, 'skipped_traces': self.skipped_traces}
+
+
+tracer = CallTracer()
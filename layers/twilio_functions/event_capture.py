@@ -0,0 +1,502 @@
+"""
+Event Capture - 本番の音声イベントの記録（記録・再生ハーネス用）
+
+責務: 両Lambdaの呼び出しごとに、受け取ったイベントと外部I/Oの結果（DynamoDB・キャッシュ・OpenAI）、
+出力（TwiML・calls.update・結果ストアへの保存・Lambda の非同期呼び出し）を1レコードにまとめ、
+1行のJSONとして標準出力（CloudWatch Logs）に書き出す。
+tools/export_voice_captures.py がログから取り出してキャプチャファイルにし、
+tools/replay_voice_events.py が現在のコードに対して再生して TwiML と処理時間を比較する。
+
+- 無効時（既定）は wrap がクライアントをそのまま返し、記録のコストはかからない
+- サンプリングは CallSid 単位（1通話の呼び出しがそろって記録される）
+- 個人情報は書き出す前に仮名化する（電話番号は下4桁だけを仮の4桁に置き換えて桁数を保つ、
+  ゲスト名は仮名、メールアドレスは伏せる）。同じレコード内では同じ値が同じ仮名になるため、
+  再生時も認証（電話番号下4桁の一致）が記録時と同じ結果になる。
+  仮名の鍵は EVENT_CAPTURE_REDACTION_KEY（未設定ならレコードごとの乱数で、レコード間の照合もできない）
+- セッショントークンは検証済みの通話状態（仮名化済み）に置き換える。再生時に再生用の鍵で署名し直す
+"""
+import base64
+import contextvars
+import hashlib
+import hmac
+import inspect
+import json
+import os
+import re
+import sys
+import time
+import zlib
+from contextlib import contextmanager
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from urllib.parse import parse_qsl, urlencode
+
+from session_token import SessionTokenError, session_codec
+from voice_logger import get_logger
+
+EVENT_CAPTURE_ENABLED = os.environ.get('EVENT_CAPTURE_ENABLED', 'false').lower() == 'true'
+EVENT_CAPTURE_SAMPLE_RATE = float(os.environ.get('EVENT_CAPTURE_SAMPLE_RATE', '1.0'))
+EVENT_CAPTURE_REDACTION_KEY = os.environ.get('EVENT_CAPTURE_REDACTION_KEY', '')
+MAX_RECORD_BYTES = int(os.environ.get('EVENT_CAPTURE_MAX_RECORD_BYTES', '200000'))  # CloudWatch の1イベント上限より小さく
+
+CAPTURE_MARKER = 'voice_event'
+FORMAT_VERSION = 1
+# 再生時に同じ設定を再現するため記録する環境変数（機能フラグ・モード）
+CONFIG_ENV_PATTERN = re.compile(r'^[A-Z0-9_]+_(ENABLED|MODE|FALLBACK)$')
+# Webhook のフォームのうち記録する項目（発信元・着信先などは記録しない）
+FORM_FIELDS = ('CallSid', 'Digits', 'SpeechResult', 'Confidence', 'CallStatus')
+# 出力（再生時に比較する）I/O
+OUTPUT_CALLS = frozenset({('lambda', 'invoke'), ('twilio', 'update'), ('result_store', 'put')})
+SESSION_PLACEHOLDER = '$session:'
+
+_PHONE_KEYS = frozenset({'phone', 'from', 'to', 'caller', 'called'})
+_LAST4_KEYS = frozenset({'phone_last4', 'phonelast4'})
+_NAME_KEYS = frozenset({'guestname', 'guest_name'})
+_EMAIL_KEYS = frozenset({'email'})
+_PHONE_PATTERN = re.compile(r"\+?\d[\d\- ]{5,}\d")
+_SESSION_PARAM = re.compile(r"(session=)[^&\"'<\s]+")
+_LAST4_PARAM = re.compile(r"(phone_last4=)(\d{4})")
+
+_current: contextvars.ContextVar = contextvars.ContextVar('event_capture_recording', default=None)
+logger = get_logger('event_capture')
+
+
+def mask_text(text: str) -> str:
+    """TwiML・発話テキストの共通マスク（セッショントークンと電話番号らしき数字列）"""
+    return _PHONE_PATTERN.sub('[PHONE]', _SESSION_PARAM.sub(r'\1[SESSION]', text))
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return str(value)
+
+
+class Redactor:
+    """1レコード分の仮名化（同じ値は同じ仮名になる）"""
+
+    def __init__(self, key: bytes):
+        self._key = key
+        self._replacements: Dict[str, str] = {}
+
+    def _digest(self, value: str) -> bytes:
+        return hmac.new(self._key, value.encode('utf-8'), hashlib.sha256).digest()
+
+    def last4(self, value: str) -> str:
+        digits = ''.join(c for c in str(value) if c.isdigit())
+        if not digits:
+            return value
+        pseudo = str(int.from_bytes(self._digest(digits)[:4], 'big') % 10 ** len(digits)).zfill(len(digits))
+        return pseudo
+
+    def phone(self, value: str) -> str:
+        """桁数と区切り文字を保ち、下4桁を仮の4桁、それ以外の数字を0にする"""
+        value = str(value)
+        digits = [c for c in value if c.isdigit()]
+        if len(digits) < 4:
+            return self.last4(value)
+        pseudo_digits = ['0'] * (len(digits) - 4) + list(self.last4(''.join(digits[-4:])))
+        pseudo = ''.join(pseudo_digits.pop(0) if c.isdigit() else c for c in value)
+        self._replacements[value] = pseudo
+        return pseudo
+
+    def name(self, value: str) -> str:
+        pseudo = f"Guest-{self._digest(str(value)).hex()[:6]}"
+        self._replacements[str(value)] = pseudo
+        return pseudo
+
+    def structure(self, value: Any, depth: int = 0) -> Any:
+        """キー名で個人情報を判定して仮名化（dict/list は再帰的に処理）"""
+        if depth > 8:
+            return value
+        if isinstance(value, dict):
+            return {key: self._field(str(key).lower(), item, depth) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self.structure(item, depth + 1) for item in value]
+        return value
+
+    def _field(self, key: str, value: Any, depth: int) -> Any:
+        if not value or not isinstance(value, str):
+            return self.structure(value, depth + 1)
+        if key in _PHONE_KEYS:
+            return self.phone(value)
+        if key in _LAST4_KEYS:
+            return self.last4(value)
+        if key == 'roomphonelast4':
+            room, _, last4 = value.partition('#')
+            return f"{room}#{self.last4(last4)}"
+        if key in _NAME_KEYS:
+            return self.name(value)
+        if key in _EMAIL_KEYS:
+            return '[REDACTED]'
+        return value
+
+    def text(self, value: Optional[str]) -> Optional[str]:
+        """自由文（発話・TwiML・モデル出力）: 仮名化済みの値を置き換え、残った電話番号らしき数字列を伏せる"""
+        if not value:
+            return value
+        for original, pseudo in self._replacements.items():
+            value = value.replace(original, pseudo)
+        value = _LAST4_PARAM.sub(lambda m: m.group(1) + self.last4(m.group(2)), value)
+        return mask_text(value)
+
+
+class Recording:
+    """1回の呼び出しの記録（書き出すまで生の値を保持する）"""
+
+    def __init__(self, handler: str, call_sid: Optional[str], event: Dict):
+        self.handler = handler
+        self.call_sid = call_sid
+        self.event = event
+        self.invoked_at = time.time()
+        self.calls: List[Dict] = []
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.timing: Dict[str, float] = {}
+        self._started = time.monotonic()
+        self._cpu_started = time.process_time()
+
+    def add(self, kind: str, op: str, request: Dict = None, response: Any = None, error: BaseException = None,
+            latency_ms: float = 0.0, **extra) -> None:
+        entry = {'kind': kind, 'op': op, 'latency_ms': round(latency_ms, 1)}
+        if request:
+            entry['request'] = request
+        if error is not None:
+            entry['error'] = _describe_error(error)
+        else:
+            entry['response'] = response
+        entry.update(extra)
+        self.calls.append(entry)
+
+    def finish(self) -> None:
+        """ハンドラの所要時間（CPU時間はプロセス全体。Lambda のコンテナは1呼び出しずつ処理する）"""
+        self.timing = {'wall_ms': round((time.monotonic() - self._started) * 1000, 1),
+                       'cpu_ms': round((time.process_time() - self._cpu_started) * 1000, 1)}
+
+
+def _describe_error(error: BaseException) -> Dict:
+    described = {'type': type(error).__name__, 'message': str(error)[:500]}
+    status = getattr(error, 'status_code', None) or getattr(error, 'status', None)
+    if isinstance(status, int):
+        described['status'] = status
+    return described
+
+
+def _message_text(response) -> Optional[str]:
+    for item in reversed(getattr(response, 'output', None) or []):
+        if getattr(item, 'type', None) == 'message' and getattr(item, 'content', None):
+            return getattr(item.content[0], 'text', None)
+    return None
+
+
+def serialize_openai_response(response) -> Dict:
+    """Responses API のレスポンスのうち、ハンドラが読む項目だけを記録する"""
+    usage = getattr(response, 'usage', None)
+    details = getattr(usage, 'input_tokens_details', None)
+    return {
+        'id': getattr(response, 'id', None),
+        'output_text': _message_text(response),
+        'metadata': getattr(response, 'metadata', None) or None,
+        'usage': {
+            'input_tokens': getattr(usage, 'input_tokens', None),
+            'output_tokens': getattr(usage, 'output_tokens', None),
+            'cached_tokens': getattr(details, 'cached_tokens', None),
+        } if usage is not None else None,
+    }
+
+
+class _CapturingProxy:
+    """指定メソッドの呼び出しを記録中のレコードに追加するプロキシ（その他の属性はそのまま委譲）"""
+
+    def __init__(self, kind: str, target, methods: Iterable[str], describe: Callable = None,
+                 serialize: Callable = None):
+        self._target = target
+        self._kind = kind
+        self._methods = frozenset(methods)
+        self._describe = describe or (lambda op, args, kwargs: None)
+        self._serialize = serialize or (lambda op, result: result)
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._target, name)
+        if name not in self._methods:
+            return attr
+        if inspect.iscoroutinefunction(attr):
+            return self._async_method(name, attr)
+        return self._sync_method(name, attr)
+
+    def _sync_method(self, name: str, method: Callable) -> Callable:
+        def call(*args, **kwargs):
+            recording = _current.get()
+            if recording is None:
+                return method(*args, **kwargs)
+            started = time.monotonic()
+            try:
+                result = method(*args, **kwargs)
+            except Exception as e:
+                recording.add(self._kind, name, self._describe(name, args, kwargs), error=e,
+                              latency_ms=(time.monotonic() - started) * 1000)
+                raise
+            recording.add(self._kind, name, self._describe(name, args, kwargs), self._serialize(name, result),
+                          latency_ms=(time.monotonic() - started) * 1000)
+            return result
+        return call
+
+    def _async_method(self, name: str, method: Callable) -> Callable:
+        async def call(*args, **kwargs):
+            recording = _current.get()
+            if recording is None:
+                return await method(*args, **kwargs)
+            started = time.monotonic()
+            try:
+                result = await method(*args, **kwargs)
+            except Exception as e:
+                recording.add(self._kind, name, self._describe(name, args, kwargs), error=e,
+                              latency_ms=(time.monotonic() - started) * 1000)
+                raise
+            if kwargs.get('stream'):
+                return self._recorded_stream(recording, name, self._describe(name, args, kwargs), result, started)
+            recording.add(self._kind, name, self._describe(name, args, kwargs), self._serialize(name, result),
+                          latency_ms=(time.monotonic() - started) * 1000)
+            return result
+        return call
+
+    async def _recorded_stream(self, recording: Recording, name: str, request, stream, started: float):
+        """ストリームのイベントをそのまま流し、完了時に最終レスポンスを記録する"""
+        first_delta_ms = None
+        final_response = None
+        async for event in stream:
+            event_type = getattr(event, 'type', None)
+            if event_type == 'response.output_text.delta' and first_delta_ms is None:
+                first_delta_ms = round((time.monotonic() - started) * 1000, 1)
+            elif event_type in ('response.completed', 'response.failed', 'response.incomplete'):
+                final_response = getattr(event, 'response', None)
+            yield event
+        recording.add(self._kind, name, request, self._serialize(name, final_response) if final_response else None,
+                      latency_ms=(time.monotonic() - started) * 1000, stream=True, first_delta_ms=first_delta_ms)
+
+
+class _CapturingOpenAI:
+    """AsyncOpenAI の responses / embeddings を記録するプロキシ"""
+
+    def __init__(self, client):
+        self._wrapped = client  # _client は AsyncOpenAI の httpx クライアント名なので使わない
+        self.responses = _CapturingProxy(
+            'openai.responses', client.responses, ('create', 'retrieve'),
+            describe=lambda op, args, kwargs: {
+                'model': kwargs.get('model'),
+                'format': (kwargs.get('text') or {}).get('format', {}).get('name'),
+            } if op == 'create' else None,
+            serialize=lambda op, response: serialize_openai_response(response))
+        self.embeddings = _CapturingProxy(
+            'openai.embeddings', client.embeddings, ('create',),
+            serialize=lambda op, response: {'embedding': [round(x, 6) for x in response.data[0].embedding]})
+
+    def __getattr__(self, name: str):
+        return getattr(self._wrapped, name)
+
+
+class EventCapture:
+    """呼び出しの記録の開始・I/Oのラップ・書き出し"""
+
+    def __init__(self, enabled: bool = EVENT_CAPTURE_ENABLED, sample_rate: float = EVENT_CAPTURE_SAMPLE_RATE,
+                 redaction_key: str = EVENT_CAPTURE_REDACTION_KEY, stream=None):
+        self.enabled = enabled
+        self.sample_rate = min(max(sample_rate, 0.0), 1.0)
+        self.redaction_key = redaction_key.encode('utf-8') if redaction_key else None
+        self._stream = stream
+        self.captured = 0
+        self.dropped = 0
+
+    # ---- I/Oのラップ（無効ならクライアントをそのまま返す） ----
+
+    def wrap(self, kind: str, target, methods: Iterable[str], describe: Callable = None, serialize: Callable = None):
+        if not self.enabled or target is None:
+            return target
+        return _CapturingProxy(kind, target, methods, describe, serialize)
+
+    def wrap_openai(self, client):
+        if not self.enabled or client is None:
+            return client
+        return _CapturingOpenAI(client)
+
+    @contextmanager
+    def io(self, kind: str, op: str, **request):
+        """ラップできないI/O（calls.update など）を記録する"""
+        recording = _current.get()
+        if recording is None:
+            yield
+            return
+        started = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            recording.add(kind, op, request, error=e, latency_ms=(time.monotonic() - started) * 1000)
+            raise
+        recording.add(kind, op, request, latency_ms=(time.monotonic() - started) * 1000)
+
+    # ---- 呼び出しの記録 ----
+
+    def _sampled(self, call_sid: Optional[str]) -> bool:
+        if self.sample_rate >= 1.0:
+            return True
+        if not call_sid or self.sample_rate <= 0.0:
+            return False
+        return (zlib.crc32(call_sid.encode('utf-8')) % 10000) < self.sample_rate * 10000
+
+    @contextmanager
+    def invocation(self, handler: str, event: Dict, call_sid: Optional[str] = None):
+        """ハンドラの呼び出しを記録する（サンプリング対象外なら何もしない）"""
+        if not self.enabled:
+            yield
+            return
+        call_sid = call_sid or _form_fields(event).get('CallSid')
+        if not self._sampled(call_sid):
+            yield
+            return
+        recording = Recording(handler, call_sid, event)
+        token = _current.set(recording)
+        try:
+            yield
+        except Exception as e:
+            recording.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            recording.finish()
+            _current.reset(token)
+            self._emit(recording)
+
+    def result(self, value):
+        """ハンドラの戻り値を記録して返す"""
+        recording = _current.get()
+        if recording is not None:
+            recording.result = value
+        return value
+
+    def _emit(self, recording: Recording) -> None:
+        try:
+            record = self.build_record(recording)
+            line = json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=_json_default)
+        except Exception as e:
+            logger.warning("Failed to build event capture", error=e)
+            self.dropped += 1
+            return
+        if len(line.encode('utf-8')) > MAX_RECORD_BYTES:
+            logger.warning("Event capture too large, dropped", bytes=len(line), handler=recording.handler)
+            self.dropped += 1
+            return
+        (self._stream or sys.stdout).write(line + '\n')
+        self.captured += 1
+
+    def build_record(self, recording: Recording) -> Dict:
+        """仮名化したレコード（構造化された値を先に処理し、自由文はその置換表で仮名化する）"""
+        redactor = Redactor(self.redaction_key or os.urandom(16))
+        sessions: List[Optional[Dict]] = []
+        if recording.handler == 'immediate_response':
+            event = _redact_immediate_event(recording.event, redactor, sessions)
+        else:
+            event = _redact_ai_event(recording.event, redactor, sessions)
+        calls = []
+        for entry in recording.calls:
+            entry = dict(entry)
+            if 'response' in entry:
+                entry['response'] = redactor.structure(entry['response'])
+            calls.append(entry)
+        for entry in calls:
+            _redact_call_text(entry, redactor)
+        return {
+            'capture': CAPTURE_MARKER,
+            'v': FORMAT_VERSION,
+            'handler': recording.handler,
+            'call_sid': recording.call_sid,
+            'invoked_at': round(recording.invoked_at, 3),
+            'config': {name: value for name, value in os.environ.items() if CONFIG_ENV_PATTERN.match(name)},
+            # 鍵は記録しない。再生時にセッショントークンを使うかどうか（Gather の URL の形）だけ残す
+            'session_tokens': session_codec.enabled,
+            'event': event,
+            'sessions': sessions,
+            'calls': calls,
+            'result': _redact_result(recording.result, redactor),
+            'error': recording.error,
+            **recording.timing,
+        }
+
+
+def _decode_body(event: Dict) -> str:
+    body = event.get('body') or ''
+    if event.get('isBase64Encoded'):
+        body = base64.b64decode(body).decode('utf-8')
+    return body
+
+
+def _form_fields(event: Dict) -> Dict[str, str]:
+    try:
+        return {key: value for key, value in parse_qsl(_decode_body(event)) if key in FORM_FIELDS}
+    except (ValueError, UnicodeDecodeError):
+        return {}
+
+
+def _session_placeholder(token: Optional[str], redactor: Redactor, sessions: List) -> Optional[str]:
+    """セッショントークンを仮名化した通話状態に置き換える（検証できないトークンは None の状態）"""
+    if not token:
+        return token
+    try:
+        state = session_codec.decode(token)
+    except SessionTokenError:
+        state = None
+    sessions.append(redactor.structure(state) if state else None)
+    return f"{SESSION_PLACEHOLDER}{len(sessions) - 1}"
+
+
+def _redact_immediate_event(event: Dict, redactor: Redactor, sessions: List) -> Dict:
+    query = dict(event.get('queryStringParameters') or {})
+    if 'session' in query:
+        query['session'] = _session_placeholder(query['session'], redactor, sessions)
+    query = redactor.structure(query)
+    form = _form_fields(event)
+    if form.get('Digits') and query.get('source') == 'phone_last4_input':
+        form['Digits'] = redactor.last4(form['Digits'])
+    if form.get('SpeechResult'):
+        form['SpeechResult'] = redactor.text(form['SpeechResult'])
+    method = ((event.get('requestContext') or {}).get('http') or {}).get('method', 'POST')
+    return {
+        'queryStringParameters': query or None,
+        'requestContext': {'http': {'method': method}},
+        'headers': {'content-type': 'application/x-www-form-urlencoded'},
+        'body': urlencode(form),
+        'isBase64Encoded': False,
+    }
+
+
+def _redact_ai_event(event: Dict, redactor: Redactor, sessions: List) -> Dict:
+    event = dict(event)
+    if event.get('session'):
+        event['session'] = _session_placeholder(event['session'], redactor, sessions)
+    event = redactor.structure(event)
+    event['speech_result'] = redactor.text(event.get('speech_result'))
+    return event
+
+
+def _redact_call_text(entry: Dict, redactor: Redactor) -> None:
+    request = entry.get('request')
+    if isinstance(request, dict):
+        if isinstance(request.get('twiml'), str):
+            request['twiml'] = redactor.text(request['twiml'])
+        if isinstance(request.get('payload'), dict):
+            # 出力の比較ではセッショントークンを使わない
+            payload = {key: value for key, value in request['payload'].items() if key != 'session'}
+            request['payload'] = _redact_ai_event(payload, redactor, [])
+    response = entry.get('response')
+    if isinstance(response, dict) and isinstance(response.get('output_text'), str):
+        response['output_text'] = redactor.text(response['output_text'])
+    elif entry['kind'] == 'result_store' and isinstance(response, str):
+        entry['response'] = redactor.text(response)
+
+
+def _redact_result(result: Any, redactor: Redactor) -> Any:
+    if isinstance(result, dict) and isinstance(result.get('body'), str):
+        return {**redactor.structure({k: v for k, v in result.items() if k != 'body'}),
+                'body': redactor.text(result['body'])}
+    return redactor.structure(result)
+
+
+event_capture = EventCapture()
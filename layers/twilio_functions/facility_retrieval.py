@@ -0,0 +1,291 @@
+"""
+Facility Retrieval - 施設資料のプロセス内検索エンジン
+
+責務: vector_db_files の施設ガイド・FAQ・アクセス情報をチャンクに分けた索引ファイルを
+メモリマップで開き、質問に近いチャンクを Lambda 内で検索する。
+OpenAI の file_search ツール（サーバー側の検索ホップと最大10チャンクの文脈）の代わりに、
+上位数チャンクだけをプロンプトに入れて応答を生成できるようにする。
+
+- 語彙: NFKC + casefold した英数字の単語と、日本語（かな・漢字）の文字バイグラム
+- スコア: BM25。索引に埋め込みベクトル（.npy）があり NumPy が使える場合は、
+  クエリベクトルとのコサイン類似度の順位と Reciprocal Rank Fusion で統合する
+- 英語の質問と日本語だけの資料のように語彙が重ならない場合は BM25 ではヒットしない
+  （ベクトルを使うか、呼び出し側で file_search に戻す）
+
+索引ファイル形式（リトルエンディアン）:
+    MAGIC(8) | ヘッダ長 uint32 | ヘッダ JSON | ポスティング (chunk_id uint32, tf uint16)* | チャンク本文 UTF-8
+索引は tools/build_facility_index.py で作成する。
+"""
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import unicodedata
+from typing import Dict, List, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from voice_logger import get_logger
+
+FACILITY_INDEX_PATH = os.environ.get(
+    'FACILITY_INDEX_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'facility_index.bin')
+)
+INDEX_MAGIC = b'OBWFIDX1'
+INDEX_FORMAT_VERSION = 1
+POSTING = struct.Struct('<IH')
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+FUSION_CANDIDATES = 50
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+|[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff]+')
+
+logger = get_logger('facility_retrieval')
+
+
+def tokenize(text: str) -> List[str]:
+    """英数字は単語、日本語は文字バイグラム（1文字だけの連なりはそのまま）に分割"""
+    tokens = []
+    for run in _TOKEN_RE.findall(unicodedata.normalize('NFKC', text or '').casefold()):
+        if run.isascii() or len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class RetrievedChunk:
+    """検索結果の1チャンク"""
+
+    def __init__(self, chunk_id: int, source: str, title: str, text: str, score: float):
+        self.chunk_id = chunk_id
+        self.source = source
+        self.title = title
+        self.text = text
+        self.score = score
+
+    def __repr__(self) -> str:
+        return f"RetrievedChunk({self.chunk_id}, {self.source!r}, score={self.score:.3f})"
+
+
+def format_context(chunks: Sequence[RetrievedChunk]) -> str:
+    """プロンプトに入れる参考資料テキスト"""
+    return "\n---\n".join(
+        f"[{chunk.source}{' / ' + chunk.title if chunk.title else ''}]\n{chunk.text}" for chunk in chunks
+    )
+
+
+def write_index(path: str, chunks: Sequence[Dict], content_version: str,
+                vectors=None, embedding_model: Optional[str] = None) -> Dict:
+    """
+    チャンク（source, title, text）から索引ファイルを書き出す
+
+    vectors を渡すと正規化して <path の拡張子を .npy にしたファイル> に保存する（NumPy が必要）。
+
+    Returns:
+        索引のヘッダ（統計表示用）
+    """
+    postings: Dict[str, List[tuple]] = {}
+    lengths = []
+    for chunk_id, chunk in enumerate(chunks):
+        counts: Dict[str, int] = {}
+        for token in tokenize(f"{chunk.get('title') or ''}\n{chunk['text']}"):
+            counts[token] = counts.get(token, 0) + 1
+        lengths.append(sum(counts.values()))
+        for token, tf in counts.items():
+            postings.setdefault(token, []).append((chunk_id, min(tf, 0xFFFF)))
+
+    postings_blob = bytearray()
+    terms = {}
+    for token in sorted(postings):
+        entries = postings[token]
+        terms[token] = [len(postings_blob) // POSTING.size, len(entries)]
+        for entry in entries:
+            postings_blob += POSTING.pack(*entry)
+
+    texts_blob = bytearray()
+    chunk_table = []
+    for chunk, length in zip(chunks, lengths):
+        encoded = chunk['text'].encode('utf-8')
+        chunk_table.append([chunk['source'], chunk.get('title') or '', len(texts_blob), len(encoded), length])
+        texts_blob += encoded
+
+    vector_file = None
+    if vectors is not None:
+        if np is None:
+            raise RuntimeError("NumPy is required to store embedding vectors")
+        matrix = np.asarray(vectors, dtype=np.float32)
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        vector_file = os.path.splitext(os.path.basename(path))[0] + '.npy'
+        np.save(os.path.join(os.path.dirname(path), vector_file), matrix)
+
+    header = {
+        'format': INDEX_FORMAT_VERSION,
+        'content_version': content_version,
+        'num_chunks': len(chunk_table),
+        'avg_length': sum(lengths) / len(lengths) if lengths else 0.0,
+        'postings_size': len(postings_blob),
+        'terms': terms,
+        'chunks': chunk_table,
+        'vector_file': vector_file,
+        'embedding_model': embedding_model if vector_file else None
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    with open(path, 'wb') as f:
+        f.write(INDEX_MAGIC)
+        f.write(struct.pack('<I', len(header_bytes)))
+        f.write(header_bytes)
+        f.write(postings_blob)
+        f.write(texts_blob)
+    return header
+
+
+class FacilityIndex:
+    """メモリマップした索引ファイルに対する BM25（+ ベクトル）検索"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            self.close()
+            raise ValueError(f"Not a facility index: {path}")
+        offset = len(INDEX_MAGIC)
+        (header_length,) = struct.unpack_from('<I', self._mmap, offset)
+        offset += 4
+        header = json.loads(self._mmap[offset:offset + header_length].decode('utf-8'))
+        if header.get('format') != INDEX_FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"Unsupported facility index format: {header.get('format')}")
+        self._postings_start = offset + header_length
+        self._texts_start = self._postings_start + header['postings_size']
+        self._terms = header['terms']
+        self._chunks = header['chunks']
+        self.content_version = header['content_version']
+        self.num_chunks = header['num_chunks']
+        self._avg_length = header['avg_length'] or 1.0
+        self.embedding_model = header.get('embedding_model')
+        self._vectors = None
+        if header.get('vector_file') and np is not None:
+            self._vectors = np.load(os.path.join(os.path.dirname(path), header['vector_file']), mmap_mode='r')
+        self._lock = threading.Lock()
+        self.searches = 0
+        self.empty_results = 0
+        self.search_ms = 0.0
+
+    @property
+    def has_vectors(self) -> bool:
+        return self._vectors is not None
+
+    def close(self) -> None:
+        self._mmap.close()
+        self._file.close()
+
+    def _idf(self, document_frequency: int) -> float:
+        return math.log(1 + (self.num_chunks - document_frequency + 0.5) / (document_frequency + 0.5))
+
+    def _bm25(self, query: str) -> Dict[int, float]:
+        scores: Dict[int, float] = {}
+        for token in set(tokenize(query)):
+            entry = self._terms.get(token)
+            if entry is None:
+                continue
+            start, count = entry
+            idf = self._idf(count)
+            begin = self._postings_start + start * POSTING.size
+            for chunk_id, tf in POSTING.iter_unpack(self._mmap[begin:begin + count * POSTING.size]):
+                length = self._chunks[chunk_id][4]
+                norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / self._avg_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+        return scores
+
+    def _vector_ranking(self, query_vector: Sequence[float]) -> List[tuple]:
+        query = np.asarray(query_vector, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        similarities = self._vectors @ query
+        top = np.argsort(-similarities)[:FUSION_CANDIDATES]
+        return [(int(chunk_id), float(similarities[chunk_id])) for chunk_id in top]
+
+    def _chunk(self, chunk_id: int, score: float) -> RetrievedChunk:
+        source, title, text_offset, text_length, _ = self._chunks[chunk_id]
+        begin = self._texts_start + text_offset
+        return RetrievedChunk(chunk_id, source, title, self._mmap[begin:begin + text_length].decode('utf-8'), score)
+
+    def search(self, query: str, top_k: int = 4, min_score: float = 0.0,
+               query_vector: Sequence[float] = None, min_similarity: float = 0.0) -> List[RetrievedChunk]:
+        """
+        質問に近いチャンクを最大 top_k 件返す
+
+        Args:
+            query: 質問文
+            top_k: 返すチャンク数
+            min_score: BM25 スコアの下限（下回るチャンクは返さない）
+            query_vector: クエリの埋め込み（索引にベクトルがある場合のみ使う）
+            min_similarity: ベクトル検索で採用するコサイン類似度の下限
+
+        Returns:
+            スコアの高い順の RetrievedChunk のリスト（該当なしなら空）
+        """
+        started = time.perf_counter()
+        bm25 = {chunk_id: score for chunk_id, score in self._bm25(query).items() if score >= min_score}
+        if query_vector is not None and self.has_vectors:
+            lexical = sorted(bm25, key=bm25.get, reverse=True)[:FUSION_CANDIDATES]
+            semantic = [chunk_id for chunk_id, similarity in self._vector_ranking(query_vector)
+                        if similarity >= min_similarity]
+            fused: Dict[int, float] = {}
+            for ranking in (lexical, semantic):
+                for rank, chunk_id in enumerate(ranking):
+                    fused[chunk_id] = fused.get(chunk_id, 0.0) + 1 / (RRF_K + rank + 1)
+            ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)
+        else:
+            ranked = sorted(bm25.items(), key=lambda item: item[1], reverse=True)
+        results = [self._chunk(chunk_id, score) for chunk_id, score in ranked[:top_k]]
+        with self._lock:
+            self.searches += 1
+            self.empty_results += not results
+            self.search_ms += (time.perf_counter() - started) * 1000
+        return results
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'chunks': self.num_chunks,
+                'terms': len(self._terms),
+                'vectors': self.has_vectors,
+                'searches': self.searches,
+                'empty_results': self.empty_results,
+                'avg_search_ms': round(self.search_ms / self.searches, 3) if self.searches else None
+            }
+
+
+_index: Optional[FacilityIndex] = None
+_index_error: Optional[str] = None
+_index_lock = threading.Lock()
+
+
+def get_facility_index(path: str = None) -> Optional[FacilityIndex]:
+    """
+    コンテナ内で共有する索引を返す（初回だけ開く）
+
+    索引ファイルが無い・壊れている場合はNoneを返し、エラーは最初の1回だけログに出す。
+    """
+    global _index, _index_error
+    if _index is not None or _index_error is not None:
+        return _index
+    with _index_lock:
+        if _index is None and _index_error is None:
+            try:
+                _index = FacilityIndex(path or FACILITY_INDEX_PATH)
+                logger.info("Facility index loaded", path=_index.path, chunks=_index.num_chunks,
+                            content_version=_index.content_version, vectors=_index.has_vectors)
+            except (OSError, ValueError) as e:
+                _index_error = str(e)
+                logger.error("Facility index unavailable", path=path or FACILITY_INDEX_PATH, error=e)
+    return _index
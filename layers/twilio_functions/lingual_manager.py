@@ -1,3 +1,8 @@
+from voice_logger import get_logger
+
+logger = get_logger('lingual_manager')
+
+
 class LingualManager:
     def __init__(self):
         self.messages = {
@@ -16,6 +21,8 @@ class LingualManager:
                 # 緊急度判定用メッセージを追加
                 "urgent_inquiry": "緊急のお問い合わせと判断しました。担当者にお繋ぎします。少々お待ちください。",
                 "general_inquiry": "回答を生成します。少々お待ちください。",
+                "answer_delayed": "申し訳ありません。回答の準備に時間がかかっています。",
+                "ai_unavailable": "申し訳ありません。ただいま自動応答でのご案内ができない状態です。",
                 "inquiry_not_understood": "お問い合わせ内容を解析できませんでした。可能な限りゆっくり話してください。",
                 "follow_up_question": "他にもご用件がある場合は続けてお話しください。",
                 "prompt_for_operator_dtmf": "オペレーターにお繋ぎする場合は「いち」を、他のご用件がございましたら「に」を押してください。",
@@ -39,6 +46,8 @@ class LingualManager:
                 # 英語版の緊急度判定用メッセージを追加
                 "urgent_inquiry": "I've identified this as an urgent inquiry. Connecting you to a representative. Please wait a moment.",
                 "general_inquiry": "I'm generating a response. Please wait a moment.",
+                "answer_delayed": "I'm sorry, preparing the answer is taking longer than expected.",
+                "ai_unavailable": "I'm sorry, our automated assistant is temporarily unable to answer.",
                 "inquiry_not_understood": "I was unable to analyze your inquiry. Please try speaking as slowly as possible.",
                 "follow_up_question": "If you have any other inquiries, please continue speaking.",
                 "prompt_for_operator_dtmf": "To speak with an operator, please press 1. For other inquiries, please press 2.",
@@ -62,12 +71,12 @@ class LingualManager:
         """
         lang_messages = self.messages.get(language_code)
         if not lang_messages:
-            print(f"Warning: Language code '{language_code}' not found in messages. Returning key '{key}'.")
+            logger.warning("Language code not found in messages. Returning key.", language=language_code, key=key)
             return key
         
         message = lang_messages.get(key)
         if not message:
-            print(f"Warning: Message key '{key}' not found for language '{language_code}'. Returning key itself.")
+            logger.warning("Message key not found for language. Returning key itself.", language=language_code, key=key)
             return key
             
         return message
@@ -0,0 +1,165 @@
+"""
+Session Token - 通話セッション状態の暗号化コンパクトトークン
+
+責務: Gatherのアクションに載せる通話状態（言語、部屋番号、認証済みゲスト情報、
+直前のOpenAIレスポンスID）をAES-256-GCMで暗号化したトークンにまとめる。
+両Lambdaは共有鍵だけでI/Oなしに検証・復号でき、ターンごとのDynamoDB再認証と
+URL・ログ（Twilio・CloudFront）へのゲスト名・電話番号の露出をなくす。
+
+トークン形式: v2.<鍵ID>.<base64url(nonce + 暗号文 + 認証タグ)>
+（"v2.<鍵ID>" を追加認証データにするので、鍵IDやバージョンを書き換えたトークンは復号できない）
+鍵は環境変数 CALL_SESSION_KEYS に "kid:secret,kid:secret" 形式で設定し、
+先頭の鍵で暗号化、全ての鍵で復号する（鍵ローテーション用）。AES鍵は secret から HMAC-SHA256 で導出する。
+デプロイ前に発行された v1（HMAC署名のみ・平文）トークンも有効期限までは受け付ける。
+"""
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+TOKEN_VERSION = "v2"
+LEGACY_TOKEN_VERSION = "v1"
+DEFAULT_TTL_SECONDS = int(os.environ.get('CALL_SESSION_TTL_SECONDS', '900'))
+SIGNATURE_BYTES = 16
+NONCE_BYTES = 12
+ENCRYPTION_KEY_CONTEXT = b"call-session-token/aes-256-gcm"
+
+# トークンに含めるゲスト情報（電話番号は含めない。暗号化するのでゲスト名は URL に平文で出ない）
+GUEST_SNAPSHOT_FIELDS = ('guestName', 'roomNumber', 'checkInDate', 'checkOutDate', 'approvalStatus')
+
+
+class SessionTokenError(Exception):
+    """トークンの形式不正・署名不一致・期限切れ"""
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _encryption_key(secret: bytes) -> AESGCM:
+    """署名鍵の secret から AES-256 の鍵を導出"""
+    return AESGCM(hmac.new(secret, ENCRYPTION_KEY_CONTEXT, hashlib.sha256).digest())
+
+
+def load_signing_keys(raw: str) -> List[Tuple[str, bytes]]:
+    """"kid:secret,kid:secret" 形式の文字列を (鍵ID, 鍵) のリストに変換"""
+    keys = []
+    for entry in (raw or "").split(","):
+        kid, sep, secret = entry.strip().partition(":")
+        if sep and kid and secret:
+            keys.append((kid, secret.encode("utf-8")))
+    return keys
+
+
+def guest_snapshot(guest_info: Optional[Dict]) -> Optional[Dict]:
+    """トークンに載せるゲスト情報を抽出"""
+    if not guest_info:
+        return None
+    return {field: guest_info.get(field) for field in GUEST_SNAPSHOT_FIELDS}
+
+
+class SessionTokenCodec:
+    """通話セッショントークンの暗号化と復号・検証"""
+
+    def __init__(self, keys: List[Tuple[str, bytes]], ttl_seconds: int = DEFAULT_TTL_SECONDS, clock=time.time):
+        self._signing_key = keys[0] if keys else None
+        self._verify_keys = dict(keys)
+        self._ciphers = {kid: _encryption_key(secret) for kid, secret in keys}
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+
+    @property
+    def enabled(self) -> bool:
+        """署名鍵が設定されているか"""
+        return self._signing_key is not None
+
+    @staticmethod
+    def _sign(key: bytes, signing_input: str) -> str:
+        digest = hmac.new(key, signing_input.encode("ascii"), hashlib.sha256).digest()
+        return _b64encode(digest[:SIGNATURE_BYTES])
+
+    def encode(self, language: str, room_number: str, guest_info: Optional[Dict],
+               previous_response_id: Optional[str] = None) -> str:
+        """通話状態をトークン化"""
+        if not self.enabled:
+            raise SessionTokenError("No signing key configured")
+        kid = self._signing_key[0]
+        claims = {
+            "l": language,
+            "r": room_number,
+            "g": guest_snapshot(guest_info),
+            "p": previous_response_id,
+            "e": int(self._clock()) + self.ttl_seconds
+        }
+        plaintext = json.dumps(claims, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        header = f"{TOKEN_VERSION}.{kid}"
+        nonce = os.urandom(NONCE_BYTES)
+        sealed = self._ciphers[kid].encrypt(nonce, plaintext, header.encode("ascii"))
+        return f"{header}.{_b64encode(nonce + sealed)}"
+
+    def decode(self, token: str) -> Dict:
+        """
+        トークンを検証して通話状態を返す
+
+        Returns:
+            {'language', 'room_number', 'guest_info', 'previous_openai_response_id'}
+
+        Raises:
+            SessionTokenError: 形式不正・未知の鍵ID・復号（署名）失敗・期限切れの場合
+        """
+        parts = (token or "").split(".")
+        if len(parts) == 3 and parts[0] == TOKEN_VERSION:
+            claims = self._open(*parts)
+        elif len(parts) == 4 and parts[0] == LEGACY_TOKEN_VERSION:
+            claims = self._verify_legacy(*parts)
+        else:
+            raise SessionTokenError("Malformed session token")
+        if int(claims.get("e", 0)) < self._clock():
+            raise SessionTokenError("Session token expired")
+        return {
+            'language': claims.get("l"),
+            'room_number': claims.get("r"),
+            'guest_info': claims.get("g"),
+            'previous_openai_response_id': claims.get("p")
+        }
+
+    def _open(self, version: str, kid: str, body: str) -> Dict:
+        """v2 トークンを復号（認証タグの検証を含む）"""
+        cipher = self._ciphers.get(kid)
+        if cipher is None:
+            raise SessionTokenError(f"Unknown session key id: {kid}")
+        try:
+            sealed = _b64decode(body)
+            plaintext = cipher.decrypt(sealed[:NONCE_BYTES], sealed[NONCE_BYTES:], f"{version}.{kid}".encode("ascii"))
+        except (InvalidTag, ValueError, binascii.Error):
+            raise SessionTokenError("Invalid session token")
+        try:
+            return json.loads(plaintext)
+        except (ValueError, UnicodeDecodeError) as e:
+            raise SessionTokenError(f"Undecodable session token: {e}")
+
+    def _verify_legacy(self, version: str, kid: str, body: str, signature: str) -> Dict:
+        """v1（HMAC署名のみ）トークンを検証"""
+        key = self._verify_keys.get(kid)
+        if key is None:
+            raise SessionTokenError(f"Unknown session key id: {kid}")
+        if not hmac.compare_digest(signature, self._sign(key, f"{version}.{kid}.{body}")):
+            raise SessionTokenError("Invalid session token signature")
+        try:
+            return json.loads(_b64decode(body))
+        except (ValueError, UnicodeDecodeError) as e:
+            raise SessionTokenError(f"Undecodable session token: {e}")
+
+
+session_codec = SessionTokenCodec(load_signing_keys(os.environ.get('CALL_SESSION_KEYS', '')))
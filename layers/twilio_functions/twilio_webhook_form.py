@@ -0,0 +1,101 @@
+"""
+Twilio Webhook Form Parser - Webhookフォームボディの軽量パーサ
+
+責務: Twilioが送ってくる application/x-www-form-urlencoded のボディ（約30フィールド）から、
+必要なフィールドだけを取り出す。
+urllib.parse.parse_qs のように全フィールドをリスト入りの辞書に展開せず、
+対象フィールドごとに "&<名前>=" を文字列検索して値だけを切り出す（対象外のフィールドはデコードもしない）。
+
+値の扱いは parse_qs(body)[name][0] と同じ（フィールド名はTwilioの仕様どおりエスケープされない前提で、
+"Speech%52esult" のようにエスケープされた名前は別名として扱う）:
+- 同名フィールドが複数ある場合は最初の空でない値
+- 空の値・"=" を含まない項目は無視
+- "+" は空白、%XX は UTF-8 としてデコード（不正なバイトは置換文字）
+"""
+from typing import Dict, FrozenSet, Optional
+from urllib.parse import unquote_plus
+
+# フォームのフィールド名 → レコードの属性名
+FIELD_SLOTS = {
+    'SpeechResult': 'speech_result',
+    'Digits': 'digits',
+    'CallSid': 'call_sid',
+    'Confidence': 'confidence',
+    'From': 'from_number',
+    'CallStatus': 'call_status',
+}
+
+# ルーティングに必要なフィールド（既定で取り出す）
+CORE_FIELDS: FrozenSet[str] = frozenset({'SpeechResult', 'Digits', 'CallSid'})
+# 必要な場合だけ取り出すフィールド
+OPTIONAL_FIELDS: FrozenSet[str] = frozenset({'Confidence', 'From', 'CallStatus'})
+ALL_FIELDS: FrozenSet[str] = CORE_FIELDS | OPTIONAL_FIELDS
+
+_SEARCH_KEYS = {name: f"&{name}=" for name in FIELD_SLOTS}
+
+
+class TwilioWebhookForm:
+    """Webhookから取り出したフィールド（未送信・対象外のフィールドはNone）"""
+
+    __slots__ = tuple(FIELD_SLOTS.values())
+
+    def __init__(self):
+        self.speech_result: Optional[str] = None
+        self.digits: Optional[str] = None
+        self.call_sid: Optional[str] = None
+        self.confidence: Optional[str] = None
+        self.from_number: Optional[str] = None
+        self.call_status: Optional[str] = None
+
+    def as_dict(self) -> Dict[str, Optional[str]]:
+        """ログ出力用に値のあるフィールドだけを辞書化"""
+        return {
+            name: getattr(self, slot)
+            for name, slot in FIELD_SLOTS.items()
+            if getattr(self, slot) is not None
+        }
+
+    def __repr__(self) -> str:
+        return f"TwilioWebhookForm({self.as_dict()!r})"
+
+
+def _decode(text: str) -> str:
+    # エスケープのない値（CallSid、Digits など）はそのまま返してコピーを避ける
+    if '%' in text or '+' in text:
+        return unquote_plus(text)
+    return text
+
+
+def _first_value(body: str, search_key: str) -> Optional[str]:
+    """"&" を先頭に付けたボディから最初の空でない値を探す"""
+    position = body.find(search_key)
+    while position >= 0:
+        value_start = position + len(search_key)
+        value_end = body.find('&', value_start)
+        if value_end < 0:
+            value_end = len(body)
+        if value_end > value_start:
+            return body[value_start:value_end]
+        position = body.find(search_key, value_end)
+    return None
+
+
+def parse_webhook_form(body: str, fields: FrozenSet[str] = CORE_FIELDS) -> TwilioWebhookForm:
+    """
+    フォームボディから指定フィールドを取り出す
+
+    Args:
+        body: URLエンコードされたフォームボディ（Base64デコード済み）
+        fields: 取り出すフィールド名（FIELD_SLOTS のキー）
+
+    Returns:
+        TwilioWebhookForm（指定外・未送信のフィールドはNone）
+    """
+    form = TwilioWebhookForm()
+    # 先頭の項目も "&<名前>=" で見つかるようにする
+    prefixed = '&' + body
+    for name in fields:
+        value = _first_value(prefixed, _SEARCH_KEYS[name])
+        if value is not None:
+            setattr(form, FIELD_SLOTS[name], _decode(value))
+    return form
@@ -0,0 +1,214 @@
+"""
+TwiML Renderer - 事前コンパイル済みフラグメントによるTwiML生成
+
+責務: TwiML文書の「組み立て」を担当
+twilioライブラリのVoiceResponse/Gather（ElementTree経由のシリアライズ）と
+同一のXMLを文字列連結だけで生成する。
+固定の案内文（言語メニュー、部屋番号・電話番号プロンプト、タイムアウト+切断、
+オペレーター選択プロンプト、エラー切断）はコールドスタート時に言語ごとに一度だけ
+コンパイルし、アクションURLやアシスタントの応答テキストなどの動的部分のみ
+XMLエスケープして差し込む。
+"""
+from lingual_manager import LingualManager
+from ssml_helper import wrap_with_prosody
+
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8"?>'
+
+# Gather共通設定
+SPEECH_MODEL = "deepgram-nova-3"
+GATHER_TIMEOUT_SECONDS = 7
+HANGUP_PAUSE_SECONDS = 3
+
+LANGUAGE_SELECTION_ACTION = "?action=language_selected"
+
+
+def escape_text(text: str) -> str:
+    """要素テキストのエスケープ（ElementTreeの_escape_cdataと同一）"""
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+    return text
+
+
+def escape_attr(text: str) -> str:
+    """属性値のエスケープ（ElementTreeの_escape_attribと同一）"""
+    text = escape_text(text)
+    if '"' in text:
+        text = text.replace('"', "&quot;")
+    if "\r" in text:
+        text = text.replace("\r", "&#13;")
+    if "\n" in text:
+        text = text.replace("\n", "&#10;")
+    if "\t" in text:
+        text = text.replace("\t", "&#09;")
+    return text
+
+
+def element(name: str, attrs: dict = None, body: str = "") -> str:
+    """
+    TwiML要素を文字列として生成する
+
+    twilioライブラリと同様に属性はキー名でソートし、bool値は小文字化する。
+    bodyはエスケープ済みのテキストまたは子要素の文字列であること。
+    """
+    attr_str = ""
+    if attrs:
+        for key in sorted(attrs):
+            value = attrs[key]
+            if value is None:
+                continue
+            value = str(value).lower() if isinstance(value, bool) else str(value)
+            attr_str += f' {key}="{escape_attr(value)}"'
+    if not body:
+        return f"<{name}{attr_str} />"
+    return f"<{name}{attr_str}>{body}</{name}>"
+
+
+def say(text: str, language: str, voice: str) -> str:
+    """prosodyでラップしたSay要素を生成"""
+    return element("Say", {"language": language, "voice": voice}, escape_text(wrap_with_prosody(text)))
+
+
+def pause(length: int) -> str:
+    """Pause要素を生成"""
+    return element("Pause", {"length": length})
+
+
+def dial(number: str) -> str:
+    """Dial要素を生成"""
+    return element("Dial", None, escape_text(number))
+
+
+def redirect(url: str) -> str:
+    """Redirect要素を生成（POST）"""
+    return element("Redirect", {"method": "POST"}, escape_text(url))
+
+
+HANGUP = element("Hangup")
+HANGUP_TAIL = pause(HANGUP_PAUSE_SECONDS) + HANGUP
+
+
+def document(fragments) -> str:
+    """フラグメントのリストをResponse文書にまとめる"""
+    return f"{XML_DECLARATION}{element('Response', None, ''.join(fragments))}"
+
+
+def dtmf_gather(action: str, num_digits: int, body: str, timeout: int = None) -> str:
+    """DTMF入力用のGather要素を生成"""
+    return element("Gather", {
+        "action": action, "input": "dtmf", "method": "POST",
+        "numDigits": num_digits, "timeout": timeout
+    }, body)
+
+
+def speech_gather(action: str, language: str, body: str) -> str:
+    """音声入力用のGather要素を生成"""
+    return element("Gather", {
+        "action": action, "input": "speech", "language": language, "method": "POST",
+        "speechModel": SPEECH_MODEL, "speechTimeout": "auto", "timeout": GATHER_TIMEOUT_SECONDS
+    }, body)
+
+
+class TwimlRenderer:
+    """言語ごとの固定フラグメントを保持し、TwiMLを組み立てるレンダラー"""
+
+    def __init__(self, lingual_mgr: LingualManager):
+        self.lingual_mgr = lingual_mgr
+        self._fragments = {
+            language: self._compile_language(language)
+            for language in lingual_mgr.messages
+        }
+        menu = (
+            say("For English, press 1.", "en-US", lingual_mgr.get_voice("en-US"))
+            + say("日本語をご希望の場合は2を押してください。", "ja-JP", lingual_mgr.get_voice("ja-JP"))
+        )
+        self._language_menu = dtmf_gather(LANGUAGE_SELECTION_ACTION, 1, menu)
+        self._initial_call = document([
+            dtmf_gather(LANGUAGE_SELECTION_ACTION, 1, pause(1) + menu),
+            say("We could not understand your input. Please try calling again.", "en-US", lingual_mgr.get_voice("en-US")),
+            say("入力が確認できませんでした。もう一度おかけ直しください。", "ja-JP", lingual_mgr.get_voice("ja-JP")),
+            HANGUP_TAIL
+        ])
+
+    def _compile_language(self, language: str) -> dict:
+        """1言語分の全メッセージのSay要素と定型テールをコンパイル"""
+        voice = self.lingual_mgr.get_voice(language)
+        says = {
+            key: say(message, language, voice)
+            for key, message in self.lingual_mgr.messages[language].items()
+        }
+        return {
+            "voice": voice,
+            "says": says,
+            "timeout_tail": says["timeout_message"] + HANGUP_TAIL
+        }
+
+    def _language_fragments(self, language: str) -> dict:
+        """言語のフラグメントを取得（未登録言語はキャッシュせずその場でコンパイル）"""
+        fragments = self._fragments.get(language)
+        if fragments is not None:
+            return fragments
+        voice = self.lingual_mgr.get_voice(language)
+        timeout_say = say(self.lingual_mgr.get_message(language, "timeout_message"), language, voice)
+        return {"voice": voice, "says": {}, "timeout_tail": timeout_say + HANGUP_TAIL}
+
+    # ------------------------------------------------------------
+    # Say要素
+    # ------------------------------------------------------------
+
+    def say_message(self, language: str, key: str) -> str:
+        """LingualManagerのメッセージキーに対応するSay要素（コンパイル済み）"""
+        fragments = self._language_fragments(language)
+        cached = fragments["says"].get(key)
+        if cached is not None:
+            return cached
+        return say(self.lingual_mgr.get_message(language, key), language, fragments["voice"])
+
+    def say_text(self, language: str, text: str) -> str:
+        """任意テキスト（アシスタントの応答など）のSay要素"""
+        return say(text, language, self._language_fragments(language)["voice"])
+
+    def timeout_tail(self, language: str) -> str:
+        """タイムアウトメッセージ + Pause + Hangup"""
+        return self._language_fragments(language)["timeout_tail"]
+
+    # ------------------------------------------------------------
+    # Gather要素
+    # ------------------------------------------------------------
+
+    def language_menu_gather(self) -> str:
+        """言語選択用のGather"""
+        return self._language_menu
+
+    def room_number_gather(self, language: str, attempt: int = 1) -> str:
+        """部屋番号入力用のGather"""
+        action = f"?language={language}&source=room_number_input&attempt={attempt}"
+        return dtmf_gather(action, 3, self.say_message(language, "prompt_room_number"))
+
+    def phone_last4_gather(self, language: str, room_number: str, attempt: int = 1) -> str:
+        """電話番号下4桁入力用のGather"""
+        action = f"?language={language}&source=phone_last4_input&room_number={room_number}&attempt={attempt}"
+        return dtmf_gather(action, 4, self.say_message(language, "prompt_phone_last4"))
+
+    def operator_choice_gather(self, language: str, action: str) -> str:
+        """オペレーター転送選択（DTMF）用のGather"""
+        return dtmf_gather(action, 1, self.say_message(language, "prompt_for_operator_dtmf"), GATHER_TIMEOUT_SECONDS)
+
+    def speech_gather(self, language: str, action: str, prompt_key: str) -> str:
+        """発話入力用のGather"""
+        return speech_gather(action, language, self.say_message(language, prompt_key))
+
+    # ------------------------------------------------------------
+    # 完成済み文書
+    # ------------------------------------------------------------
+
+    def initial_call(self) -> str:
+        """初回呼び出し時の言語選択メニュー文書"""
+        return self._initial_call
+
+    def error_hangup(self, language: str, message_key: str = "processing_error") -> str:
+        """エラーメッセージ + 切断の文書"""
+        return document([self.say_message(language, message_key), HANGUP_TAIL])
@@ -0,0 +1,164 @@
+"""
+Voice Logger - 音声通話パス用の構造化ログ
+
+責務: 両Lambdaの print によるJSONダンプを置き換え、1行1レコードのJSONで出力する。
+- レベル: DEBUG / INFO / WARNING / ERROR（環境変数 LOG_LEVEL、既定は INFO）
+- サンプリング: LOG_SAMPLE_RATES="DEBUG=0.1,INFO=0.5" 形式でレベルごとに間引く。
+  CallSid がコンテキストにあれば通話単位で判定し、1通話のログが歯抜けにならないようにする。
+- 遅延評価: フィールドに callable を渡すと、出力が確定した場合にだけ呼び出す。
+- PIIマスク: 電話番号・ゲスト名などのキーは値を伏せ、文字列中の電話番号らしき数字列も置換する。
+
+使い方:
+    logger = get_logger("immediate_response")
+    logger.info("Speech result received", room_number=room_number)
+    logger.debug("Parsed body", body=lambda: parsed_body)
+"""
+import contextvars
+import json
+import os
+import random
+import re
+import sys
+import zlib
+from typing import Any, Dict, Optional
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+_LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+_LEVEL_VALUES = {name: value for value, name in _LEVEL_NAMES.items()}
+
+# 値を伏せるキー（小文字で比較）
+REDACTED_KEYS = frozenset({
+    "phone", "phone_last4", "phonelast4", "roomphonelast4", "guestname", "guest_name",
+    "from", "to", "caller", "called", "email", "session", "x-cloudfront-secret",
+    "authorization", "x-twilio-signature"
+})
+REDACTED = "[REDACTED]"
+# 7桁以上の電話番号らしき数字列（区切り文字・先頭の+を含む）
+_PHONE_PATTERN = re.compile(r"\+?\d[\d\- ]{5,}\d")
+# rawQueryString やフォームボディに埋め込まれたPII（phone_last4=1234 など）
+_QUERY_PII_PATTERN = re.compile(r"(?i)\b(phone_last4|session|From|To|Caller|Called)=[^&\s\"]+")
+_MAX_DEPTH = 6
+
+_context: contextvars.ContextVar = contextvars.ContextVar("voice_log_context", default={})
+
+
+def _parse_level(name: Optional[str], default: int = INFO) -> int:
+    return _LEVEL_VALUES.get((name or "").strip().upper(), default)
+
+
+def _parse_sample_rates(raw: str) -> Dict[int, float]:
+    """"DEBUG=0.1,INFO=0.5" 形式をレベル→サンプリング率に変換（不正な項目は無視）"""
+    rates = {}
+    for entry in (raw or "").split(","):
+        name, sep, value = entry.partition("=")
+        level = _LEVEL_VALUES.get(name.strip().upper())
+        if not sep or level is None:
+            continue
+        try:
+            rates[level] = min(max(float(value), 0.0), 1.0)
+        except ValueError:
+            continue
+    return rates
+
+
+def redact(value: Any, depth: int = 0) -> Any:
+    """ログ出力前にPIIを伏せる（dict/list は再帰的に処理）"""
+    if depth > _MAX_DEPTH:
+        return "..."
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if str(key).lower() in REDACTED_KEYS and value[key] else redact(value[key], depth + 1)
+            for key in value
+        }
+    if isinstance(value, (list, tuple)):
+        return [redact(item, depth + 1) for item in value]
+    if isinstance(value, str):
+        return _PHONE_PATTERN.sub("[PHONE]", _QUERY_PII_PATTERN.sub(r"\1=" + REDACTED, value))
+    return value
+
+
+def set_context(**fields) -> None:
+    """呼び出し単位の共通フィールド（call_sid 等）を設定。既存のコンテキストは置き換える"""
+    _context.set({key: value for key, value in fields.items() if value is not None})
+
+
+def update_context(**fields) -> None:
+    """呼び出し単位の共通フィールドを追加"""
+    merged = dict(_context.get())
+    merged.update({key: value for key, value in fields.items() if value is not None})
+    _context.set(merged)
+
+
+class VoiceLogger:
+    """レベル・サンプリング・遅延評価・PIIマスク付きの構造化ロガー"""
+
+    def __init__(self, name: str, level: int = INFO, sample_rates: Optional[Dict[int, float]] = None,
+                 stream=None, rng=random.random):
+        self.name = name
+        self.level = level
+        self.sample_rates = dict(sample_rates or {})
+        self._stream = stream
+        self._rng = rng
+
+    def is_enabled_for(self, level: int) -> bool:
+        return level >= self.level
+
+    def _sampled(self, level: int) -> bool:
+        rate = self.sample_rates.get(level, 1.0)
+        if rate >= 1.0:
+            return True
+        if rate <= 0.0:
+            return False
+        call_sid = _context.get().get("call_sid")
+        if call_sid:
+            # 通話単位で決定的に判定
+            return (zlib.crc32(str(call_sid).encode("utf-8")) % 10000) < rate * 10000
+        return self._rng() < rate
+
+    def log(self, level: int, msg: str, **fields) -> None:
+        if level < self.level or not self._sampled(level):
+            return
+        record = {"level": _LEVEL_NAMES.get(level, str(level)), "logger": self.name, "msg": msg}
+        record.update(_context.get())
+        for key, value in fields.items():
+            record[key] = value() if callable(value) else value
+        line = json.dumps(redact(record), ensure_ascii=False, default=str)
+        stream = self._stream or sys.stdout
+        stream.write(line + "\n")
+
+    def debug(self, msg: str, **fields) -> None:
+        self.log(DEBUG, msg, **fields)
+
+    def info(self, msg: str, **fields) -> None:
+        self.log(INFO, msg, **fields)
+
+    def warning(self, msg: str, **fields) -> None:
+        self.log(WARNING, msg, **fields)
+
+    def error(self, msg: str, **fields) -> None:
+        self.log(ERROR, msg, **fields)
+
+
+_DEFAULT_LEVEL = _parse_level(os.environ.get("LOG_LEVEL"))
+_DEFAULT_SAMPLE_RATES = _parse_sample_rates(os.environ.get("LOG_SAMPLE_RATES", ""))
+_loggers: Dict[str, VoiceLogger] = {}
+
+
+def get_logger(name: str) -> VoiceLogger:
+    """名前ごとのロガーを取得（環境変数のレベル・サンプリング率で初期化）"""
+    logger = _loggers.get(name)
+    if logger is None:
+        logger = _loggers[name] = VoiceLogger(name, _DEFAULT_LEVEL, _DEFAULT_SAMPLE_RATES)
+    return logger
+
+
+def set_level(level) -> None:
+    """全ロガーのレベルを変更（"DEBUG" などの名前、または数値）"""
+    global _DEFAULT_LEVEL
+    _DEFAULT_LEVEL = _parse_level(level) if isinstance(level, str) else int(level)
+    for logger in _loggers.values():
+        logger.level = _DEFAULT_LEVEL
@@ -0,0 +1,139 @@
+"""
+ベクトル検索インストラクションのトークン数とプロンプトキャッシュ効率の分析
+
+言語 × ゲスト状態の各バリエーションについて、vector_search が送るプロンプト
+（file_search ツール定義 + 応答スキーマ + インストラクション + 質問）のトークン数と、
+同じ言語の全バリエーションで共通の先頭部分（キャッシュ可能なプレフィックス）のトークン数を出し、
+OpenAI のプロンプトキャッシュの規則（1024トークン以上、128トークン単位）で
+キャッシュが温まっている場合に期待できるヒット率を、旧レイアウト（ゲスト情報が先頭）と比較する。
+shared 列はプロンプト全体に占める共通プレフィックスの割合（レイアウトの良し悪しの指標）。
+
+トークン数は tiktoken（o200k_base）があれば使い、なければ文字種からの概算を使う。
+
+使い方:
+    python tools/analyze_instruction_cache.py
+    python tools/analyze_instruction_cache.py --query "チェックアウトは何時ですか"
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, os.path.join(ROOT, 'lambda_functions', 'ai_processing'))
+sys.path.insert(0, os.path.join(ROOT, 'layers', 'twilio_functions'))
+os.environ.setdefault('LOG_LEVEL', 'ERROR')
+
+from utils import system_instructions as si  # noqa: E402
+from utils.calculate_key_code import calculate_key_code  # noqa: E402
+from vector_search import _build_request_payload  # noqa: E402
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding('o200k_base')
+except ImportError:
+    _ENCODING = None
+
+CACHE_MIN_TOKENS = 1024
+CACHE_INCREMENT = 128
+LANGUAGES = ('ja-JP', 'en-US')
+
+# 変更前のインストラクション末尾にあった JSON 形式の説明（比較用）
+LEGACY_JSON_FORMAT_PROSE = """
+回答は以下のJSON形式で返してください：
+{{
+  "assistant_response_text": "ユーザーへの応答テキスト（{language}）",
+  "needs_operator": true または false,
+  "end_conversation": true または false
+}}
+"""
+
+
+def count_tokens(text: str) -> int:
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    # 概算: ASCII は約4文字で1トークン、それ以外（日本語など）は1文字あたり約0.8トークン
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return round(ascii_chars / 4 + (len(text) - ascii_chars) * 0.8)
+
+
+def _guests() -> dict:
+    today = datetime.now()
+    stay = {'checkInDate': (today - timedelta(days=1)).date().isoformat(),
+            'checkOutDate': (today + timedelta(days=1)).date().isoformat()}
+    return {
+        'no_guest_info': None,
+        'pending_guest': {'guestName': 'Taro Yamada', 'roomNumber': '201', 'approvalStatus': 'pending'},
+        'in_stay_guest_a': dict(stay, guestName='Taro Yamada', roomNumber='201', approvalStatus='approved'),
+        'in_stay_guest_b': dict(stay, guestName='Jane Smith', roomNumber='305', approvalStatus='approved'),
+    }
+
+
+def legacy_instructions(guest_info, language: str) -> str:
+    """変更前のレイアウト（ゲスト名・部屋番号・暗証番号が先頭、JSON形式の説明あり）"""
+    guest_name = guest_info.get('guestName') if guest_info else None
+    room_number = guest_info.get('roomNumber') if guest_info else None
+    head = f"{si.ASSISTANT_IDENTITY}\nあなたの担当は、{room_number}号室の{guest_name}様です。\n"
+    if si.get_guest_state(guest_info) == si.GUEST_STATE_IN_STAY:
+        head += (f"{room_number}号室のキーボックスの暗証番号のダイヤル4桁（**Key Box Code**）の番号は : "
+                 f"{calculate_key_code(room_number)}\n")
+    return (f"{head}\n{si.COMMON_RESPONSE_GUIDELINES.format(language=language)}\n{si.COMMON_SYSTEM_CAPABILITIES}\n"
+            f"{si.COMMON_NEEDS_OPERATOR_INSTRUCTIONS}{LEGACY_JSON_FORMAT_PROSE.format(language=language)}")
+
+
+def serialize_prompt(instructions: str, query: str) -> str:
+    """キャッシュ判定の順序（ツール定義・応答スキーマ → インストラクション → 入力）で連結したプロンプト"""
+    payload = _build_request_payload(instructions, query, 'vs_analysis')
+    header = json.dumps({'tools': payload['tools'], 'format': payload['text']['format']}, ensure_ascii=False)
+    return header + payload['instructions'] + json.dumps(payload['input'], ensure_ascii=False)
+
+
+def _common_prefix(texts) -> str:
+    return os.path.commonprefix(list(texts))
+
+
+def cached_tokens(prefix_tokens: int) -> int:
+    if prefix_tokens < CACHE_MIN_TOKENS:
+        return 0
+    return CACHE_MIN_TOKENS + (prefix_tokens - CACHE_MIN_TOKENS) // CACHE_INCREMENT * CACHE_INCREMENT
+
+
+def analyze(layout: str, query: str) -> list:
+    build = legacy_instructions if layout == 'legacy' else si.get_vector_search_instructions
+    rows = []
+    for language in LANGUAGES:
+        prompts = {name: serialize_prompt(build(guest, language), query) for name, guest in _guests().items()}
+        prefix_tokens = count_tokens(_common_prefix(prompts.values()))
+        for name, prompt in prompts.items():
+            total = count_tokens(prompt)
+            cached = cached_tokens(prefix_tokens)
+            rows.append({'layout': layout, 'language': language, 'variant': name, 'total': total,
+                         'shared_prefix': prefix_tokens, 'cached': cached, 'hit_ratio': cached / total})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Token counts and expected prompt-cache hit ratio per instruction variant')
+    parser.add_argument('--query', default='チェックアウトは何時ですか')
+    args = parser.parse_args()
+
+    # 共通部分がプロセス内で使い回されていること（同一オブジェクト）を確認
+    assert si.get_instruction_prefix('ja-JP') is si.get_instruction_prefix('ja-JP')
+
+    print(f"tokenizer: {'tiktoken o200k_base' if _ENCODING else 'estimate (install tiktoken for exact counts)'}")
+    print(f"{'layout':<9}{'language':<9}{'variant':<17}{'total':>7}{'prefix':>8}{'shared':>8}{'cached':>8}{'hit':>7}")
+    for layout in ('legacy', 'current'):
+        rows = analyze(layout, args.query)
+        for row in rows:
+            print(f"{row['layout']:<9}{row['language']:<9}{row['variant']:<17}{row['total']:>7}"
+                  f"{row['shared_prefix']:>8}{row['shared_prefix'] / row['total']:>8.0%}"
+                  f"{row['cached']:>8}{row['hit_ratio']:>7.0%}")
+        shortfall = CACHE_MIN_TOKENS - min(row['shared_prefix'] for row in rows)
+        if shortfall > 0:
+            print(f"  {layout}: shared prefix is {shortfall} tokens short of the {CACHE_MIN_TOKENS}-token "
+                  f"cache minimum on the first turn (later turns carry the conversation and grow past it)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+obw-guest テーブルの roomPhoneLast4 属性バックフィルツール
+
+RoomPhoneLast4Index 追加前に作成された既存レコードへ
+"<部屋番号>#<電話番号下4桁>" のルックアップキーを書き込む。
+キーが既に正しいレコードはスキップするため、何度実行しても安全。
+バックフィル完了後、template-twilio-functions.yaml の RoomPhoneIndexFallback（immediate-response Lambda の
+ROOM_PHONE_INDEX_FALLBACK）を "false" にすると部屋単位クエリへのフォールバックが無効になる。
+
+使い方:
+    python tools/backfill_room_phone_last4.py --table obw-guest --dry-run
+    python tools/backfill_room_phone_last4.py --table obw-guest
+    python tools/backfill_room_phone_last4.py --table obw-guest --endpoint-url http://localhost:8000
+"""
+import argparse
+import os
+import sys
+
+import boto3
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda_functions', 'immediate-response'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'layers', 'twilio_functions'))
+os.environ.setdefault('AWS_DEFAULT_REGION', 'ap-northeast-1')
+
+from authenticate_guest import ROOM_PHONE_ATTRIBUTE, build_room_phone_key  # noqa: E402
+
+
+def _scan_guests(table):
+    """テーブルを全件スキャン（必要な属性のみ取得）"""
+    kwargs = {
+        'ProjectionExpression': 'roomNumber, guestId, phone, #key',
+        'ExpressionAttributeNames': {'#key': ROOM_PHONE_ATTRIBUTE}
+    }
+    while True:
+        response = table.scan(**kwargs)
+        yield from response.get('Items', [])
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            return
+        kwargs['ExclusiveStartKey'] = last_key
+
+
+def backfill(table, dry_run: bool = False) -> dict:
+    """
+    ルックアップキーが未設定・不一致のレコードを更新
+
+    Returns:
+        {'scanned', 'updated', 'skipped', 'no_phone'} の件数
+    """
+    stats = {'scanned': 0, 'updated': 0, 'skipped': 0, 'no_phone': 0}
+    for guest in _scan_guests(table):
+        stats['scanned'] += 1
+        lookup_key = build_room_phone_key(guest.get('roomNumber'), guest.get('phone'))
+        if not lookup_key:
+            stats['no_phone'] += 1
+            continue
+        if guest.get(ROOM_PHONE_ATTRIBUTE) == lookup_key:
+            stats['skipped'] += 1
+            continue
+
+        stats['updated'] += 1
+        if dry_run:
+            continue
+        table.update_item(
+            Key={'roomNumber': guest['roomNumber'], 'guestId': guest['guestId']},
+            UpdateExpression='SET #key = :key',
+            # 削除済み・部屋移動済みのレコードを復活させない
+            ConditionExpression='attribute_exists(guestId)',
+            ExpressionAttributeNames={'#key': ROOM_PHONE_ATTRIBUTE},
+            ExpressionAttributeValues={':key': lookup_key}
+        )
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backfill roomPhoneLast4 on obw-guest records')
+    parser.add_argument('--table', default=os.environ.get('GUEST_TABLE_NAME', 'obw-guest'))
+    parser.add_argument('--endpoint-url', default=None, help='DynamoDB Local などのエンドポイント')
+    parser.add_argument('--dry-run', action='store_true', help='更新せずに件数だけ表示')
+    args = parser.parse_args()
+
+    dynamodb = boto3.resource('dynamodb', endpoint_url=args.endpoint_url)
+    stats = backfill(dynamodb.Table(args.table), dry_run=args.dry_run)
+    mode = "(dry run) " if args.dry_run else ""
+    print(f"{mode}scanned={stats['scanned']} updated={stats['updated']} "
+          f"already_set={stats['skipped']} no_phone={stats['no_phone']}")
+
+
+if __name__ == '__main__':
+    main()
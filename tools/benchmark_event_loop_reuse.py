@@ -0,0 +1,148 @@
+"""
+常駐イベントループによるウォーム呼び出しのレイテンシ比較
+
+ローカルの TLS サーバー（自己署名証明書、OpenAI Responses API の代わり）に対して、
+モジュールレベルの openai.AsyncOpenAI で1回ずつリクエストする「呼び出し」を繰り返し、
+- 呼び出しごとに asyncio.run（従来の lambda_handler）
+- event_loop_runtime.PersistentLoopRunner（常駐ループ）
+の2方式で、ウォーム呼び出し（2回目以降）のレイテンシとサーバー側で受け付けた TLS 接続数を比較する。
+ローカルホストの往復時間はほぼ0のため、実環境ではハンドシェイクの往復分（数十〜百ms）だけ差が広がる。
+asyncio.run 方式の errors は、閉じたループに紐づいたプール内の接続を使おうとして失敗した回数
+（本番では SDK の自動再試行に隠れて、再接続の分だけ遅くなる）。
+
+証明書の生成に openssl コマンドを使う。外部へはアクセスしない。
+
+使い方:
+    python tools/benchmark_event_loop_reuse.py
+    python tools/benchmark_event_loop_reuse.py --invocations 200
+"""
+import argparse
+import asyncio
+import os
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, os.path.join(ROOT, 'lambda_functions', 'ai_processing'))
+sys.path.insert(0, os.path.join(ROOT, 'layers', 'twilio_functions'))
+os.environ.setdefault('LOG_LEVEL', 'ERROR')
+
+import openai  # noqa: E402
+from aiohttp import web  # noqa: E402
+
+from event_loop_runtime import PersistentLoopRunner, httpx_pool_connections  # noqa: E402
+
+RESPONSE_BODY = {
+    'id': 'resp_benchmark', 'object': 'response', 'created_at': 0, 'status': 'completed', 'model': 'gpt-5-mini',
+    'output': [{'id': 'msg_1', 'type': 'message', 'role': 'assistant', 'status': 'completed',
+                'content': [{'type': 'output_text', 'text': '{}', 'annotations': []}]}],
+}
+
+
+def _make_certificate(directory: str):
+    cert, key = os.path.join(directory, 'cert.pem'), os.path.join(directory, 'key.pem')
+    subprocess.run([
+        'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1', '-subj', '/CN=127.0.0.1',
+        '-addext', 'subjectAltName=IP:127.0.0.1', '-keyout', key, '-out', cert
+    ], check=True, capture_output=True)
+    return cert, key
+
+
+class TlsStandIn:
+    """別スレッドのイベントループで動く TLS サーバー（受け付けた接続数を数える）"""
+
+    def __init__(self, cert: str, key: str):
+        self.ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        self.ssl_context.load_cert_chain(cert, key)
+        self.peers = set()
+        self.port = None
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        self.peers.add(request.transport.get_extra_info('peername'))
+        await request.read()
+        return web.json_response(RESPONSE_BODY)
+
+    def _serve(self):
+        asyncio.set_event_loop(self._loop)
+        app = web.Application()
+        app.router.add_post('/v1/responses', self._handle)
+        runner = web.AppRunner(app)
+        self._loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, '127.0.0.1', 0, ssl_context=self.ssl_context)
+        self._loop.run_until_complete(site.start())
+        self.port = site._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self._loop.run_forever()
+
+    def start(self):
+        self._thread.start()
+        self._ready.wait()
+
+    def connections(self) -> int:
+        return len(self.peers)
+
+
+def _client(port: int, cert: str) -> openai.AsyncOpenAI:
+    verify = ssl.create_default_context(cafile=cert)
+    return openai.AsyncOpenAI(
+        api_key='sk-benchmark', base_url=f"https://127.0.0.1:{port}/v1", max_retries=0,
+        http_client=openai.DefaultAsyncHttpxClient(verify=verify)
+    )
+
+
+async def _invocation(client: openai.AsyncOpenAI) -> None:
+    await client.responses.create(model='gpt-5-mini', input='ping')
+
+
+def run_mode(mode: str, server: TlsStandIn, cert: str, invocations: int) -> dict:
+    client = _client(server.port, cert)  # Lambda のモジュールレベルのクライアントに相当
+    runner = PersistentLoopRunner()
+    connections_before = server.connections()
+    latencies, errors = [], 0
+    for _ in range(invocations):
+        started = time.perf_counter()
+        try:
+            if mode == 'persistent':
+                runner.run(_invocation(client))
+            else:
+                asyncio.run(_invocation(client))
+        except Exception:
+            errors += 1
+        latencies.append((time.perf_counter() - started) * 1000)
+    warm = latencies[1:]
+    return {
+        'cold_ms': latencies[0],
+        'warm_p50_ms': statistics.median(warm),
+        'warm_p95_ms': statistics.quantiles(warm, n=20)[-1],
+        'tls_connections': server.connections() - connections_before,
+        'errors': errors,
+        'pool_connections': httpx_pool_connections(client),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare warm invocation latency: asyncio.run vs persistent loop')
+    parser.add_argument('--invocations', type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        cert, key = _make_certificate(directory)
+        server = TlsStandIn(cert, key)
+        server.start()
+        print(f"{'mode':<18}{'cold_ms':>9}{'warm_p50_ms':>13}{'warm_p95_ms':>13}{'tls_conns':>11}{'errors':>8}{'pooled':>8}")
+        for mode in ('asyncio.run', 'persistent'):
+            report = run_mode(mode, server, cert, args.invocations)
+            print(f"{mode:<18}{report['cold_ms']:>9.1f}{report['warm_p50_ms']:>13.2f}{report['warm_p95_ms']:>13.2f}"
+                  f"{report['tls_connections']:>11}{report['errors']:>8}{str(report['pool_connections']):>8}")
+
+
+if __name__ == '__main__':
+    main()
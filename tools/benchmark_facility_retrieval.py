@@ -0,0 +1,151 @@
+"""
+施設資料のプロセス内検索（local）と file_search の比較
+
+tools/fixtures/facility_questions.jsonl の質問について、
+- 検索のみ（既定、オフライン）: プロセス内索引の検索レイテンシ、上位 k 件に質問の話題語（keywords）を含む
+  チャンクがある割合（hit@k）、該当なしで file_search に戻る質問の数
+- --live: vector_search を file_search と local の両方で実行し、応答生成のレイテンシと、
+  回答の一致度（needs_operator / end_conversation の一致、回答テキストの文字バイグラム類似度）
+を表示する。--live は OpenAI API を呼ぶため OPENAI_API_KEY と OPENAI_VECTOR_STORE_ID_FACILITY が必要。
+
+索引は --index で既存のファイルを指定するか、--source の資料から一時ファイルに作る。
+
+使い方:
+    python tools/benchmark_facility_retrieval.py
+    python tools/benchmark_facility_retrieval.py --index layers/twilio_functions/facility_index.bin --top-k 3
+    python tools/benchmark_facility_retrieval.py --live
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, os.path.join(ROOT, 'lambda_functions', 'ai_processing'))
+sys.path.insert(0, os.path.join(ROOT, 'layers', 'twilio_functions'))
+sys.path.insert(0, os.path.dirname(__file__))
+os.environ.setdefault('ANSWER_CACHE_ENABLED', 'false')
+os.environ.setdefault('LOG_LEVEL', 'ERROR')
+
+import facility_retrieval  # noqa: E402
+from build_facility_index import DEFAULT_SOURCE, collect_chunks  # noqa: E402
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'facility_questions.jsonl')
+SEARCH_REPEAT = 20
+
+
+def load_questions(path: str) -> list:
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def _hit(chunks, keywords) -> bool:
+    texts = [f"{chunk.title}\n{chunk.text}".casefold() for chunk in chunks]
+    return any(keyword.casefold() in text for keyword in keywords for text in texts)
+
+
+def bigram_similarity(a: str, b: str) -> float:
+    """正規化した回答テキストの文字バイグラムの Dice 係数"""
+    from answer_cache import normalize_query
+    grams_a, grams_b = ({text[i:i + 2] for i in range(len(text) - 1)}
+                        for text in (normalize_query(a), normalize_query(b)))
+    if not grams_a or not grams_b:
+        return float(grams_a == grams_b)
+    return 2 * len(grams_a & grams_b) / (len(grams_a) + len(grams_b))
+
+
+def benchmark_search(index: facility_retrieval.FacilityIndex, questions: list, top_k: int, min_score: float,
+                     verbose: bool) -> None:
+    latencies_us, hits, empty = [], 0, 0
+    for question in questions:
+        for _ in range(SEARCH_REPEAT):
+            started = time.perf_counter()
+            chunks = index.search(question['text'], top_k, min_score)
+            latencies_us.append((time.perf_counter() - started) * 1_000_000)
+        hit = _hit(chunks, question['keywords'])
+        hits += hit
+        empty += not chunks
+        if verbose:
+            top = f"{chunks[0].source} ({chunks[0].score:.2f})" if chunks else '-'
+            print(f"  {'HIT ' if hit else 'MISS'} {question['language']} {question['text']} -> {top}")
+    print(f"search: questions={len(questions)} top_k={top_k} hit@k={hits / len(questions):.0%} "
+          f"no_match(falls back to file_search)={empty} "
+          f"p50={statistics.median(latencies_us):.0f}us p95={_percentile(latencies_us, 0.95):.0f}us")
+
+
+async def _answer(vector_search, client, question: dict, mode: str) -> tuple:
+    vector_search.FACILITY_RETRIEVAL_MODE = mode
+    started = time.monotonic()
+    result = await vector_search.openai_vector_search_with_file_search_tool(
+        client, question['text'], question['language'], os.environ.get('OPENAI_VECTOR_STORE_ID_FACILITY')
+    )
+    return json.loads(result), (time.monotonic() - started) * 1000
+
+
+async def benchmark_live(questions: list, top_k: int, min_score: float) -> None:
+    import openai
+    import vector_search
+    vector_search.FACILITY_RETRIEVAL_TOP_K = top_k
+    vector_search.FACILITY_RETRIEVAL_MIN_SCORE = min_score
+    client = openai.AsyncOpenAI()
+    latencies = {'file_search': [], 'local': []}
+    flags_agree, similarities = 0, []
+    print(f"{'language':<7}{'file_search_ms':>15}{'local_ms':>10}{'flags':>7}{'similarity':>12}  question")
+    for question in questions:
+        remote, remote_ms = await _answer(vector_search, client, question, 'file_search')
+        local, local_ms = await _answer(vector_search, client, question, 'local')
+        latencies['file_search'].append(remote_ms)
+        latencies['local'].append(local_ms)
+        agree = all(remote.get(flag) == local.get(flag) for flag in ('needs_operator', 'end_conversation'))
+        similarity = bigram_similarity(remote['assistant_response_text'], local['assistant_response_text'])
+        flags_agree += agree
+        similarities.append(similarity)
+        print(f"{question['language']:<7}{remote_ms:>15.0f}{local_ms:>10.0f}{'same' if agree else 'DIFF':>7}"
+              f"{similarity:>12.2f}  {question['text']}")
+    for mode, values in latencies.items():
+        print(f"{mode:<12} p50={statistics.median(values):.0f}ms p95={_percentile(values, 0.95):.0f}ms")
+    print(f"parity: flags_agree={flags_agree}/{len(questions)} mean_similarity={statistics.mean(similarities):.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark in-process facility retrieval against file_search')
+    parser.add_argument('--index', help='既存の索引ファイル（省略時は --source から一時ファイルに作成）')
+    parser.add_argument('--source', default=DEFAULT_SOURCE)
+    parser.add_argument('--questions', default=FIXTURE)
+    parser.add_argument('--top-k', type=int, default=int(os.environ.get('FACILITY_RETRIEVAL_TOP_K', '4')))
+    parser.add_argument('--min-score', type=float, default=float(os.environ.get('FACILITY_RETRIEVAL_MIN_SCORE', '2.0')))
+    parser.add_argument('--live', action='store_true', help='OpenAI API で file_search と local の回答を比較する')
+    parser.add_argument('--verbose', action='store_true', help='質問ごとの上位チャンクを表示')
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions)
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.index
+        if not path:
+            if not os.path.isdir(args.source):
+                print(f"source directory not found: {args.source} (use --index)", file=sys.stderr)
+                sys.exit(2)
+            chunks, content_version, _ = collect_chunks(args.source, 500)
+            path = os.path.join(directory, 'facility_index.bin')
+            facility_retrieval.write_index(path, chunks, content_version)
+        index = facility_retrieval.get_facility_index(path)
+        if index is None:
+            sys.exit(2)
+        print(f"index: {path} {index.stats()}")
+        benchmark_search(index, questions, args.top_k, args.min_score, args.verbose)
+        if args.live:
+            asyncio.run(benchmark_live(questions, args.top_k, args.min_score))
+        index.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,307 @@
+"""
+file_search の検索設定と推論量のベンチマーク
+
+tools/fixtures/retrieval_labels.jsonl のラベル付き質問を、max_num_results × score_threshold × reasoning effort
+の組み合わせごとに openai_vector_search_with_file_search_tool で実行し（同時実行数は --concurrency まで）、
+言語ごとに正答率・レイテンシのパーセンタイル・入出力トークン数を集計する。
+正答率を落とさない範囲（最高値 - --tolerance 以上）で p50 レイテンシが最小の設定を言語ごとに選び、
+FILE_SEARCH_SETTINGS_BY_LANGUAGE に指定できる JSON として表示する。
+
+正誤の判定（ラベルの expect）:
+- pattern: 回答テキストが正規表現に一致する（{key_code} はゲストの部屋のキーボックス暗証番号に置換）
+- absent: 回答テキストに含まれてはいけない文字列（未承認ゲストに暗証番号を案内しないこと）
+- needs_operator / end_conversation: フラグが一致する
+
+実行モード:
+- 既定: OpenAI API を呼ぶ（OPENAI_API_KEY と OPENAI_VECTOR_STORE_ID_FACILITY が必要）
+- --record PATH: API を呼び、リクエストごとの応答・トークン数・レイテンシを PATH に保存する
+- --replay PATH: 保存した応答を再生する（オフライン・決定的。レイテンシは記録時の値を使う）
+
+使い方:
+    python tools/benchmark_retrieval_settings.py --record /tmp/retrieval.json
+    python tools/benchmark_retrieval_settings.py --replay /tmp/retrieval.json --report /tmp/report.json
+    python tools/benchmark_retrieval_settings.py --max-results 3,5,10 --score-thresholds 0.2,0.5 --efforts minimal,low
+"""
+import argparse
+import asyncio
+import contextvars
+import hashlib
+import itertools
+import json
+import os
+import re
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, os.path.join(ROOT, 'lambda_functions', 'ai_processing'))
+sys.path.insert(0, os.path.join(ROOT, 'layers', 'twilio_functions'))
+for name, value in {
+    'ANSWER_CACHE_ENABLED': 'false',
+    'CONTEXT_COMPACTION_ENABLED': 'false',
+    'FACILITY_RETRIEVAL_MODE': 'file_search',
+    'LOG_LEVEL': 'ERROR',
+}.items():
+    os.environ.setdefault(name, value)
+
+import openai  # noqa: E402
+
+import vector_search  # noqa: E402
+from utils.calculate_key_code import calculate_key_code  # noqa: E402
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'retrieval_labels.jsonl')
+ROOM_NUMBER = '201'
+
+# 実行中のリクエストの記録先と繰り返し番号（タスクごと）
+_calls = contextvars.ContextVar('calls')
+_repeat = contextvars.ContextVar('repeat', default=0)
+
+
+def _guest(kind: str):
+    if not kind:
+        return None
+    today = datetime.now()
+    return {
+        'guestName': 'Taro Yamada', 'roomNumber': ROOM_NUMBER,
+        'approvalStatus': 'approved' if kind == 'in_stay' else 'pending',
+        'checkInDate': (today - timedelta(days=1)).date().isoformat(),
+        'checkOutDate': (today + timedelta(days=1)).date().isoformat(),
+    }
+
+
+def load_labels(path: str) -> list:
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def is_correct(result: dict, expect: dict) -> bool:
+    text = result.get('assistant_response_text') or ''
+    key_code = calculate_key_code(ROOM_NUMBER)
+    if 'pattern' in expect and not re.search(expect['pattern'].replace('{key_code}', key_code), text, re.IGNORECASE):
+        return False
+    if 'absent' in expect and expect['absent'].replace('{key_code}', key_code) in text:
+        return False
+    return all(result.get(flag) == expect[flag] for flag in ('needs_operator', 'end_conversation') if flag in expect)
+
+
+def request_key(payload: dict) -> str:
+    """リクエスト内容と繰り返し番号から決まる記録のキー"""
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return f"{hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:20]}#{_repeat.get()}"
+
+
+def _response_from(entry: dict):
+    """記録から vector_search が読む形のレスポンスを組み立てる"""
+    content = SimpleNamespace(type='output_text', text=entry['output_text'])
+    return SimpleNamespace(id=entry['response_id'], output=[SimpleNamespace(type='message', content=[content])])
+
+
+class Cassette:
+    """リクエストキーごとの応答の記録（JSONファイル）"""
+
+    def __init__(self, path: str, vector_store_id: str = None):
+        self.path = path
+        self.vector_store_id = vector_store_id
+        self.entries = {}
+
+    @classmethod
+    def load(cls, path: str) -> 'Cassette':
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        cassette = cls(path, data['vector_store_id'])
+        cassette.entries = data['entries']
+        return cassette
+
+    def save(self) -> None:
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'vector_store_id': self.vector_store_id, 'recorded_at': datetime.now().isoformat(),
+                       'entries': self.entries}, f, ensure_ascii=False, indent=1)
+
+
+class BenchmarkResponses:
+    """responses.create を中継してトークン数とレイテンシを記録する（replay なら記録を返す）"""
+
+    def __init__(self, live=None, cassette: Cassette = None, replay: bool = False):
+        self._live = live
+        self._cassette = cassette
+        self._replay = replay
+
+    async def create(self, **payload):
+        key = request_key(payload)
+        if self._replay:
+            entry = self._cassette.entries.get(key)
+            _calls.get().append(entry or {'missing': True})
+            if entry is None:
+                raise LookupError(f"no recorded response for {key}")
+            if entry.get('error'):
+                raise RuntimeError(entry['error'])
+            return _response_from(entry)
+
+        started = time.monotonic()
+        try:
+            response = await self._live.create(**payload)
+        except openai.APIError as e:
+            entry = {'error': f"{type(e).__name__}: {e}", 'latency_ms': (time.monotonic() - started) * 1000}
+            self._store(key, entry)
+            raise
+        usage = getattr(response, 'usage', None)
+        details = getattr(usage, 'input_tokens_details', None)
+        self._store(key, {
+            'response_id': response.id,
+            'output_text': getattr(response, 'output_text', ''),
+            'latency_ms': (time.monotonic() - started) * 1000,
+            'input_tokens': getattr(usage, 'input_tokens', None),
+            'cached_tokens': getattr(details, 'cached_tokens', None),
+            'output_tokens': getattr(usage, 'output_tokens', None),
+        })
+        return response
+
+    def _store(self, key: str, entry: dict) -> None:
+        _calls.get().append(entry)
+        if self._cassette is not None:
+            self._cassette.entries[key] = entry
+
+
+async def run_grid(client, vector_store_id: str, labels: list, grid: list, repeats: int, concurrency: int) -> list:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(settings: dict, label: dict, repeat: int) -> dict:
+        async with semaphore:
+            calls = []
+            _calls.set(calls)
+            _repeat.set(repeat)
+            raw = await vector_search.openai_vector_search_with_file_search_tool(
+                client, label['text'], label['language'], vector_store_id, None, _guest(label.get('guest')),
+                search_settings=settings
+            )
+        entry = calls[-1] if calls else {}
+        result = json.loads(raw)
+        return {
+            'settings': settings, 'language': label['language'], 'text': label['text'],
+            'correct': not entry.get('error') and not entry.get('missing') and is_correct(result, label['expect']),
+            'error': bool(entry.get('error')), 'missing': bool(entry.get('missing')),
+            'latency_ms': entry.get('latency_ms'), 'input_tokens': entry.get('input_tokens'),
+            'output_tokens': entry.get('output_tokens'),
+        }
+
+    return await asyncio.gather(*(
+        run_one(settings, label, repeat)
+        for settings in grid for label in labels for repeat in range(repeats)
+    ))
+
+
+def _percentile(values: list, fraction: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def _mean(values: list):
+    values = [value for value in values if value is not None]
+    return round(statistics.mean(values)) if values else None
+
+
+def summarize(results: list) -> list:
+    rows = []
+    groups = {}
+    for result in results:
+        key = (result['language'], json.dumps(result['settings'], sort_keys=True))
+        groups.setdefault(key, []).append(result)
+    for (language, settings), group in sorted(groups.items()):
+        latencies = [r['latency_ms'] for r in group if r['latency_ms'] is not None and not r['error']]
+        rows.append({
+            'language': language, 'settings': json.loads(settings), 'n': len(group),
+            'accuracy': sum(r['correct'] for r in group) / len(group),
+            'errors': sum(r['error'] for r in group), 'missing': sum(r['missing'] for r in group),
+            'p50_ms': _percentile(latencies, 0.5), 'p95_ms': _percentile(latencies, 0.95),
+            'mean_input_tokens': _mean([r['input_tokens'] for r in group]),
+            'mean_output_tokens': _mean([r['output_tokens'] for r in group]),
+        })
+    return rows
+
+
+def recommend(rows: list, tolerance: float) -> dict:
+    """言語ごとに、正答率が最高値 - tolerance 以上でエラーのない設定のうち p50 が最小のもの"""
+    picks = {}
+    for language in sorted({row['language'] for row in rows}):
+        candidates = [row for row in rows if row['language'] == language and not row['errors'] and not row['missing']
+                      and row['p50_ms'] is not None]
+        if not candidates:
+            continue
+        best_accuracy = max(row['accuracy'] for row in candidates)
+        eligible = [row for row in candidates if row['accuracy'] >= best_accuracy - tolerance]
+        pick = min(eligible, key=lambda row: (row['p50_ms'], row['mean_input_tokens'] or 0))
+        picks[language] = pick
+    return picks
+
+
+def _settings_label(settings: dict) -> str:
+    return f"k={settings['max_num_results']} th={settings['score_threshold']} effort={settings['reasoning_effort']}"
+
+
+def _split(text: str, cast) -> list:
+    return [cast(value) for value in text.split(',') if value]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark file_search retrieval settings and reasoning effort')
+    parser.add_argument('--labels', default=FIXTURE)
+    parser.add_argument('--max-results', default='3,5,10')
+    parser.add_argument('--score-thresholds', default='0.2,0.4')
+    parser.add_argument('--efforts', default='minimal,low')
+    parser.add_argument('--repeats', type=int, default=1)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--tolerance', type=float, default=0.05, help='推奨設定で許容する正答率の低下')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--record', metavar='PATH', help='API の応答を記録する')
+    mode.add_argument('--replay', metavar='PATH', help='記録した応答を再生する（オフライン）')
+    parser.add_argument('--report', metavar='PATH', help='集計結果を JSON で保存する')
+    args = parser.parse_args()
+
+    labels = load_labels(args.labels)
+    grid = [
+        {'max_num_results': k, 'score_threshold': threshold, 'reasoning_effort': effort}
+        for k, threshold, effort in itertools.product(
+            _split(args.max_results, int), _split(args.score_thresholds, float), _split(args.efforts, str))
+    ]
+    if args.replay:
+        cassette = Cassette.load(args.replay)
+        responses = BenchmarkResponses(cassette=cassette, replay=True)
+        vector_store_id = cassette.vector_store_id
+    else:
+        vector_store_id = os.environ.get('OPENAI_VECTOR_STORE_ID_FACILITY')
+        if not vector_store_id or not os.environ.get('OPENAI_API_KEY'):
+            print("OPENAI_API_KEY and OPENAI_VECTOR_STORE_ID_FACILITY are required (or use --replay)", file=sys.stderr)
+            sys.exit(2)
+        cassette = Cassette(args.record, vector_store_id) if args.record else None
+        responses = BenchmarkResponses(live=openai.AsyncOpenAI().responses, cassette=cassette)
+    client = SimpleNamespace(responses=responses)
+
+    results = asyncio.run(run_grid(client, vector_store_id, labels, grid, args.repeats, args.concurrency))
+    if args.record:
+        cassette.save()
+    rows = summarize(results)
+    picks = recommend(rows, args.tolerance)
+
+    print(f"{'language':<7}{'settings':<32}{'n':>4}{'acc':>6}{'err':>5}{'p50_ms':>8}{'p95_ms':>8}{'in_tok':>8}{'out_tok':>8}")
+    for row in rows:
+        marker = ' *' if picks.get(row['language']) is row else ''
+        print(f"{row['language']:<7}{_settings_label(row['settings']):<32}{row['n']:>4}{row['accuracy']:>6.0%}"
+              f"{row['errors'] + row['missing']:>5}{row['p50_ms'] or 0:>8.0f}{row['p95_ms'] or 0:>8.0f}"
+              f"{row['mean_input_tokens'] or 0:>8}{row['mean_output_tokens'] or 0:>8}{marker}")
+    missing = sum(row['missing'] for row in rows)
+    if missing:
+        print(f"{missing} requests were not in the recording (grid, labels or instructions differ); those rows are not recommended")
+    by_language = {language: row['settings'] for language, row in picks.items()}
+    print(f"FILE_SEARCH_SETTINGS_BY_LANGUAGE='{json.dumps(by_language, separators=(',', ':'))}'")
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({'rows': rows, 'recommended': by_language, 'results': results}, f, ensure_ascii=False, indent=1)
+
+
+if __name__ == '__main__':
+    main()
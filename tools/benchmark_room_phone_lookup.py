@@ -0,0 +1,258 @@
+"""
+ゲスト認証（authenticate_guest）の GSI 検索と部屋単位クエリの検証・レイテンシ比較
+
+数百行のゲストがいる部屋を用意し、次の3人が正しく認証されることを確認する。
+- roomPhoneLast4 がバックフィル済みのゲスト（RoomPhoneLast4Index の1回のクエリで認証）
+- 未バックフィルで部屋単位クエリの1ページ目にいるゲスト（フォールバック）
+- 未バックフィルで最後のページにいるゲスト（フォールバックでページネーションを辿る）
+バックフィル済みのゲストには同じ電話番号の過去の滞在の行もあり（GSI では先に返る）、
+チェックイン日の新しい行が選ばれることも確認する。
+あわせて、電話番号の不一致（PHONE_NOT_MATCH）・空の部屋（NO_GUESTS_IN_ROOM）も確認し、
+GSI と部屋単位クエリのそれぞれで認証1回あたりの所要時間とクエリ数を表示する。
+
+テーブル:
+- 既定はメモリ上の偽物（DynamoDB の Query と同じく Limit・1MB ごとにページを切る）。
+  所要時間は --request-ms（1リクエストの往復）と --per-kb-ms（応答1KBあたり）で模擬する
+- --endpoint-url を指定すると DynamoDB Local などのテーブル（--table）を使う。
+  テーブルがなければ obw-guest と同じキー・RoomPhoneLast4Index で作り、終了時に削除する
+
+使い方:
+    python tools/benchmark_room_phone_lookup.py
+    python tools/benchmark_room_phone_lookup.py --rows 800 --page-size 100
+    python tools/benchmark_room_phone_lookup.py --endpoint-url http://localhost:8000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+import boto3
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda_functions', 'immediate-response'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'layers', 'twilio_functions'))
+os.environ.setdefault('AWS_DEFAULT_REGION', 'ap-northeast-1')
+os.environ.setdefault('LOG_LEVEL', 'ERROR')
+
+import authenticate_guest as auth  # noqa: E402
+
+ROOM_NUMBER = '801'
+EMPTY_ROOM_NUMBER = '999'
+MAX_PAGE_BYTES = 1024 * 1024  # DynamoDB の Query は1回の応答が1MBまで
+
+# 認証されるべきゲスト (名前, 電話番号, バックフィル済みか, 部屋内の位置)
+TARGETS = {
+    'gsi': ('Index Guest', '+81 90-1111-2468', True, 'middle'),
+    'fallback_first_page': ('First Page Guest', '+81 80-2222-1357', False, 'first'),
+    'fallback_last_page': ('Last Page Guest', '+1 (415) 555-9753', False, 'last'),
+}
+
+
+def _item_size(item) -> int:
+    return len(json.dumps(item, ensure_ascii=False, default=str).encode('utf-8'))
+
+
+class InMemoryGuestTable:
+    """obw-guest の Query（基本テーブル・RoomPhoneLast4Index）の偽物"""
+
+    def __init__(self, request_ms: float, per_kb_ms: float):
+        self.request_ms = request_ms
+        self.per_kb_ms = per_kb_ms
+        self._items = []
+
+    def put(self, item) -> None:
+        self._items.append(item)
+
+    def query(self, **kwargs):
+        _, value = kwargs['KeyConditionExpression'].get_expression()['values']
+        if kwargs.get('IndexName') == auth.ROOM_PHONE_INDEX_NAME:
+            matches = [item for item in self._items if item.get(auth.ROOM_PHONE_ATTRIBUTE) == value]
+        else:
+            matches = sorted((item for item in self._items if item['roomNumber'] == value),
+                             key=lambda item: item['guestId'])
+        start = kwargs.get('ExclusiveStartKey')
+        if start:
+            matches = [item for item in matches if item['guestId'] > start['guestId']]
+        page, size = [], 0
+        for item in matches:
+            if len(page) >= kwargs.get('Limit', len(matches)) or size + _item_size(item) > MAX_PAGE_BYTES:
+                break
+            page.append(item)
+            size += _item_size(item)
+        time.sleep((self.request_ms + self.per_kb_ms * size / 1024) / 1000)
+        response = {'Items': page}
+        if len(page) < len(matches):
+            last = page[-1]
+            response['LastEvaluatedKey'] = {'roomNumber': last['roomNumber'], 'guestId': last['guestId']}
+        return response
+
+
+class CountingTable:
+    """クエリ・ページ数を数え、部屋単位クエリに Limit（ページの大きさ）を付けるラッパー"""
+
+    def __init__(self, table, page_size: int):
+        self._table = table
+        self.page_size = page_size
+        self.index_queries = 0
+        self.room_pages = 0
+
+    def reset(self) -> None:
+        self.index_queries = self.room_pages = 0
+
+    def query(self, **kwargs):
+        if kwargs.get('IndexName'):
+            self.index_queries += 1
+        else:
+            self.room_pages += 1
+            kwargs.setdefault('Limit', self.page_size)
+        return self._table.query(**kwargs)
+
+
+def _random_phone(rng: random.Random, taken: set) -> str:
+    while True:
+        phone = f"+81 90-{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}"
+        if phone[-4:] not in taken:
+            return phone
+
+
+def build_room(rows: int, seed: int = 0):
+    """部屋のゲスト（guestId 順に TARGETS の位置へ配置）"""
+    rng = random.Random(seed)
+    taken = {auth.phone_digits(phone)[-4:] for _, phone, _, _ in TARGETS.values()}
+    positions = {'first': 0, 'middle': rows // 2, 'last': rows - 1}
+    targets = {positions[position]: (name, phone, backfilled) for name, phone, backfilled, position in TARGETS.values()}
+    items = []
+    for i in range(rows):
+        name, phone, backfilled = targets.get(i, (f"Guest {i}", _random_phone(rng, taken), rng.random() < 0.5))
+        item = {
+            'roomNumber': ROOM_NUMBER,
+            'guestId': f"g{i:06d}",
+            'guestName': name,
+            'phone': phone,
+            'email': f"guest{i}@example.com",
+            'address': f"{rng.randint(1, 99)}-{rng.randint(1, 99)} Example-cho, Minato-ku, Tokyo",
+            'checkInDate': '2026-10-16',
+            'checkOutDate': '2026-10-19',
+            'approvalStatus': 'approved',
+            'bookingId': f"BK{rng.randint(10 ** 7, 10 ** 8 - 1)}",
+        }
+        if backfilled:
+            item[auth.ROOM_PHONE_ATTRIBUTE] = auth.build_room_phone_key(ROOM_NUMBER, phone)
+        items.append(item)
+    # 同じゲストの過去の滞在（先に登録されているため GSI では最初に返る）
+    name, phone, _, _ = TARGETS['gsi']
+    items.insert(0, {**items[positions['middle']], 'guestId': f"g{rows:06d}", 'guestName': f"{name} (2025 stay)",
+                     'checkInDate': '2025-04-01', 'checkOutDate': '2025-04-03'})
+    return items
+
+
+def _create_local_table(dynamodb, name: str):
+    """obw-guest と同じキー・RoomPhoneLast4Index のテーブルを作る"""
+    table = dynamodb.create_table(
+        TableName=name,
+        KeySchema=[{'AttributeName': 'roomNumber', 'KeyType': 'HASH'},
+                   {'AttributeName': 'guestId', 'KeyType': 'RANGE'}],
+        AttributeDefinitions=[{'AttributeName': attribute, 'AttributeType': 'S'}
+                              for attribute in ('roomNumber', 'guestId', auth.ROOM_PHONE_ATTRIBUTE)],
+        GlobalSecondaryIndexes=[{
+            'IndexName': auth.ROOM_PHONE_INDEX_NAME,
+            'KeySchema': [{'AttributeName': auth.ROOM_PHONE_ATTRIBUTE, 'KeyType': 'HASH'}],
+            'Projection': {'ProjectionType': 'ALL'},
+        }],
+        BillingMode='PAY_PER_REQUEST',
+    )
+    table.wait_until_exists()
+    return table
+
+
+def check(table: CountingTable, name: str, room_number: str, phone: str, expected_error: str = None,
+          expected_name: str = None) -> bool:
+    table.reset()
+    result = auth.authenticate_guest(room_number, auth.phone_digits(phone)[-4:])
+    if expected_error:
+        ok = not result['success'] and result.get('error') == expected_error
+    else:
+        ok = result['success'] and result['guest_info']['guestName'] == expected_name
+    detail = result.get('error') or result['guest_info']['guestName']
+    print(f"{'ok ' if ok else 'FAIL'} {name:<22} -> {detail:<18} index_queries={table.index_queries} "
+          f"room_pages={table.room_pages}")
+    return ok
+
+
+def run_checks(table: CountingTable, rows: int) -> int:
+    failures = 0
+    for key, (name, phone, backfilled, _) in TARGETS.items():
+        failures += not check(table, key, ROOM_NUMBER, phone, expected_name=name)
+        if backfilled and table.room_pages:
+            print(f"FAIL {key}: backfilled guest fell back to the room query")
+            failures += 1
+        if key == 'fallback_last_page' and table.room_pages < 2 and rows > table.page_size:
+            print(f"FAIL {key}: room query did not paginate ({table.room_pages} page)")
+            failures += 1
+    failures += not check(table, 'phone_not_match', ROOM_NUMBER, '+81 90-0000-0000', expected_error='PHONE_NOT_MATCH')
+    failures += not check(table, 'empty_room', EMPTY_ROOM_NUMBER, TARGETS['gsi'][1], expected_error='NO_GUESTS_IN_ROOM')
+    return failures
+
+
+def time_lookups(table: CountingTable, iterations: int) -> None:
+    print(f"\n{'path':<22}{'p50_ms':>9}{'p95_ms':>9}{'queries':>9}")
+    for key, (_, phone, _, _) in TARGETS.items():
+        durations = []
+        for _ in range(iterations):
+            table.reset()
+            started = time.perf_counter()
+            auth.authenticate_guest(ROOM_NUMBER, auth.phone_digits(phone)[-4:])
+            durations.append((time.perf_counter() - started) * 1000)
+        durations.sort()
+        p95 = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+        print(f"{key:<22}{statistics.median(durations):>9.2f}{p95:>9.2f}{table.index_queries + table.room_pages:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check and time guest authentication via RoomPhoneLast4Index vs room query')
+    parser.add_argument('--rows', type=int, default=400, help='部屋のゲストの行数')
+    parser.add_argument('--page-size', type=int, default=100, help='部屋単位クエリの1ページの行数（Limit）')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--request-ms', type=float, default=4.0, help='偽のテーブルの1リクエストの往復（ms）')
+    parser.add_argument('--per-kb-ms', type=float, default=0.05, help='偽のテーブルの応答1KBあたり（ms）')
+    parser.add_argument('--endpoint-url', default=None, help='DynamoDB Local などのエンドポイント')
+    parser.add_argument('--table', default='obw-guest-lookup-benchmark', help='--endpoint-url 時のテーブル名')
+    args = parser.parse_args()
+
+    items = build_room(args.rows, args.seed)
+    created = None
+    if args.endpoint_url:
+        dynamodb = boto3.resource('dynamodb', endpoint_url=args.endpoint_url)
+        existing = {table.name for table in dynamodb.tables.all()}
+        backend = dynamodb.Table(args.table) if args.table in existing else _create_local_table(dynamodb, args.table)
+        created = None if args.table in existing else backend
+        with backend.batch_writer() as batch:
+            for item in items:
+                batch.put_item(Item=item)
+        print(f"seeded {len(items)} rows in room {ROOM_NUMBER} of {args.table} at {args.endpoint_url}")
+    else:
+        backend = InMemoryGuestTable(args.request_ms, args.per_kb_ms)
+        for item in items:
+            backend.put(item)
+        print(f"seeded {len(items)} rows in room {ROOM_NUMBER} (in-memory table, "
+              f"{args.request_ms}ms/request + {args.per_kb_ms}ms/KB)")
+
+    table = CountingTable(backend, args.page_size)
+    auth.table = table
+    auth.ROOM_PHONE_INDEX_FALLBACK = True
+    try:
+        failures = run_checks(table, args.rows)
+        if failures:
+            print(f"{failures} checks failed")
+            sys.exit(1)
+        time_lookups(table, args.iterations)
+    finally:
+        if created is not None:
+            created.delete()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+"""
+TwiML レンダラーと twilio ライブラリ（VoiceResponse）の一致確認とマイクロベンチマーク
+
+1. 両 Lambda が返す TwiML の形（初回呼び出し・言語選択・DTMF の Gather・発話の Gather・転送・
+   保留のテール・ポーリングの Redirect・エラー切断）を、twiml_renderer と従来の VoiceResponse / Gather の
+   組み立ての両方で作り、str(VoiceResponse) とバイト単位で一致することを確認する。
+   アシスタントの応答・アクションURLには & < > " と改行を含む文字列も使う。
+2. 同じ形ごとに1件あたりの生成時間を比較する。
+
+使い方:
+    python tools/benchmark_twiml_renderer.py
+    python tools/benchmark_twiml_renderer.py --iterations 20000
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'layers', 'twilio_functions'))
+
+from twilio.twiml.voice_response import Gather, VoiceResponse  # noqa: E402
+
+from call_hold import hold_url  # noqa: E402
+from lingual_manager import LingualManager  # noqa: E402
+from ssml_helper import wrap_with_prosody  # noqa: E402
+from twiml_renderer import (  # noqa: E402
+    HANGUP_TAIL, TwimlRenderer, dial, document, pause, redirect
+)
+
+OPERATOR_PHONE_NUMBER = '+815012345678'
+LANGUAGES = ('en-US', 'ja-JP')
+# エスケープの確認用（要素テキストと属性値の両方に入れる）
+ANSWERS = [
+    'Checkout is at 11:00. Breakfast is served from 7:00 to 10:00.',
+    'Tom & Jerry\'s <special> "deal": 5 > 3 & 2 < 4\nsecond line',
+    'チェックアウトは11時です。朝食は「1階のレストラン」で7時から10時まで。',
+]
+RESPONSE_ID = 'resp_abc&def<1>"x"'
+
+lingual_mgr = LingualManager()
+renderer = TwimlRenderer(lingual_mgr)
+
+
+def _say(target, language: str, text: str) -> None:
+    target.say(wrap_with_prosody(text), language=language, voice=lingual_mgr.get_voice(language))
+
+
+def _message(target, language: str, key: str) -> None:
+    _say(target, language, lingual_mgr.get_message(language, key))
+
+
+def _timeout_tail(response: VoiceResponse, language: str) -> None:
+    _message(response, language, 'timeout_message')
+    response.pause(length=3)
+    response.hangup()
+
+
+def _speech_gather(action: str, language: str) -> Gather:
+    return Gather(input='speech', method='POST', language=language, speechTimeout='auto', timeout=7,
+                  speechModel='deepgram-nova-3', action=action)
+
+
+def _action(language: str, response_id: str = RESPONSE_ID) -> str:
+    return f'?language={language}&room_number=201&phone_last4=1234&previous_openai_response_id={response_id}'
+
+
+# ------------------------------------------------------------
+# 形ごとの (VoiceResponse での組み立て, レンダラーでの組み立て)
+# ------------------------------------------------------------
+
+def legacy_initial_call(language: str, text: str) -> str:
+    response = VoiceResponse()
+    gather = Gather(input='dtmf', numDigits=1, method='POST', action='?action=language_selected')
+    gather.pause(length=1)
+    _say(gather, 'en-US', 'For English, press 1.')
+    _say(gather, 'ja-JP', '日本語をご希望の場合は2を押してください。')
+    response.append(gather)
+    _say(response, 'en-US', 'We could not understand your input. Please try calling again.')
+    _say(response, 'ja-JP', '入力が確認できませんでした。もう一度おかけ直しください。')
+    response.pause(length=3)
+    response.hangup()
+    return str(response)
+
+
+def render_initial_call(language: str, text: str) -> str:
+    return renderer.initial_call()
+
+
+def legacy_language_gather(language: str, text: str) -> str:
+    response = VoiceResponse()
+    _message(response, language, 'invalid_room_number')
+    gather = Gather(input='dtmf', numDigits=1, method='POST', action='?action=language_selected')
+    _say(gather, 'en-US', 'For English, press 1.')
+    _say(gather, 'ja-JP', '日本語をご希望の場合は2を押してください。')
+    response.append(gather)
+    response.pause(length=3)
+    response.hangup()
+    return str(response)
+
+
+def render_language_gather(language: str, text: str) -> str:
+    return document([renderer.say_message(language, 'invalid_room_number'), renderer.language_menu_gather(),
+                     HANGUP_TAIL])
+
+
+def legacy_dtmf_gather(language: str, text: str) -> str:
+    response = VoiceResponse()
+    gather = Gather(input='dtmf', numDigits=4, method='POST',
+                    action=f'?language={language}&source=phone_last4_input&room_number=201&attempt=2')
+    _message(gather, language, 'prompt_phone_last4')
+    response.append(gather)
+    _timeout_tail(response, language)
+    return str(response)
+
+
+def render_dtmf_gather(language: str, text: str) -> str:
+    return document([renderer.phone_last4_gather(language, '201', attempt=2), renderer.timeout_tail(language)])
+
+
+def legacy_operator_choice(language: str, text: str) -> str:
+    response = VoiceResponse()
+    _say(response, language, text)
+    gather = Gather(input='dtmf', num_digits=1, method='POST', timeout=7,
+                    action=_action(language) + '&source=operator_choice_dtmf')
+    _message(gather, language, 'prompt_for_operator_dtmf')
+    response.append(gather)
+    _timeout_tail(response, language)
+    return str(response)
+
+
+def render_operator_choice(language: str, text: str) -> str:
+    return document([renderer.say_text(language, text),
+                     renderer.operator_choice_gather(language, _action(language) + '&source=operator_choice_dtmf'),
+                     renderer.timeout_tail(language)])
+
+
+def legacy_speech_gather(language: str, text: str) -> str:
+    response = VoiceResponse()
+    _say(response, language, text)
+    gather = _speech_gather(_action(language), language)
+    _message(gather, language, 'follow_up_question')
+    response.append(gather)
+    _timeout_tail(response, language)
+    return str(response)
+
+
+def render_speech_gather(language: str, text: str) -> str:
+    return document([renderer.say_text(language, text),
+                     renderer.speech_gather(language, _action(language), 'follow_up_question'),
+                     renderer.timeout_tail(language)])
+
+
+def legacy_dial(language: str, text: str) -> str:
+    response = VoiceResponse()
+    _message(response, language, 'urgent_inquiry')
+    response.dial(OPERATOR_PHONE_NUMBER)
+    return str(response)
+
+
+def render_dial(language: str, text: str) -> str:
+    return document([renderer.say_message(language, 'urgent_inquiry'), dial(OPERATOR_PHONE_NUMBER)])
+
+
+def legacy_hold_tail(language: str, text: str) -> str:
+    response = VoiceResponse()
+    _say(response, language, text)
+    response.pause(length=5)
+    response.redirect(hold_url(language, 1792206634, 'https://example.com/voice'), method='POST')
+    return str(response)
+
+
+def render_hold_tail(language: str, text: str) -> str:
+    return document([renderer.say_text(language, text), pause(5),
+                     redirect(hold_url(language, 1792206634, 'https://example.com/voice'))])
+
+
+def legacy_announce(language: str, text: str) -> str:
+    response = VoiceResponse()
+    _message(response, language, 'general_inquiry')
+    response.pause(length=25)
+    return str(response)
+
+
+def render_announce(language: str, text: str) -> str:
+    return document([renderer.say_message(language, 'general_inquiry'), pause(25)])
+
+
+def legacy_end_conversation(language: str, text: str) -> str:
+    response = VoiceResponse()
+    _say(response, language, text)
+    _message(response, language, 'ending_message')
+    response.pause(length=3)
+    response.hangup()
+    return str(response)
+
+
+def render_end_conversation(language: str, text: str) -> str:
+    return document([renderer.say_text(language, text), renderer.say_message(language, 'ending_message'),
+                     HANGUP_TAIL])
+
+
+def legacy_error_hangup(language: str, text: str) -> str:
+    response = VoiceResponse()
+    _message(response, language, 'processing_error')
+    response.pause(length=3)
+    response.hangup()
+    return str(response)
+
+
+def render_error_hangup(language: str, text: str) -> str:
+    return renderer.error_hangup(language)
+
+
+SHAPES = [
+    ('initial_call', legacy_initial_call, render_initial_call),
+    ('language_gather', legacy_language_gather, render_language_gather),
+    ('dtmf_gather', legacy_dtmf_gather, render_dtmf_gather),
+    ('operator_choice', legacy_operator_choice, render_operator_choice),
+    ('speech_gather', legacy_speech_gather, render_speech_gather),
+    ('dial', legacy_dial, render_dial),
+    ('hold_tail', legacy_hold_tail, render_hold_tail),
+    ('announce', legacy_announce, render_announce),
+    ('end_conversation', legacy_end_conversation, render_end_conversation),
+    ('error_hangup', legacy_error_hangup, render_error_hangup),
+]
+
+
+def check_parity() -> int:
+    """VoiceResponse と一致しない (形, 言語, 応答) の数を返す"""
+    mismatches = 0
+    for name, legacy, render in SHAPES:
+        for language in LANGUAGES:
+            for text in ANSWERS:
+                expected, actual = legacy(language, text), render(language, text)
+                if expected != actual:
+                    mismatches += 1
+                    print(f"MISMATCH {name} {language} {text[:20]!r}\n  expected={expected}\n  actual  ={actual}")
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description='TwiML renderer parity check against VoiceResponse and microbenchmark')
+    parser.add_argument('--iterations', type=int, default=5000)
+    args = parser.parse_args()
+
+    mismatches = check_parity()
+    print(f"parity: {len(SHAPES) * len(LANGUAGES) * len(ANSWERS)} documents, {mismatches} mismatches")
+    if mismatches:
+        sys.exit(1)
+
+    print(f"{'shape':<18}{'VoiceResponse':>15}{'renderer':>11}{'speedup':>9}")
+    for name, legacy, render in SHAPES:
+        timings = []
+        for func in (legacy, render):
+            seconds = min(timeit.repeat(lambda: func('ja-JP', ANSWERS[1]), number=args.iterations, repeat=5))
+            timings.append(seconds / args.iterations * 1e6)
+        print(f"{name:<18}{timings[0]:>13.2f}µs{timings[1]:>9.2f}µs{timings[0] / timings[1]:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+ImmediateResponse Lambda のログ有無によるハンドラ処理時間ベンチマーク
+
+AWS/Twilio へアクセスしない経路（初回呼び出し・言語選択・部屋番号入力）の
+Webhookイベントを lambda_handler に繰り返し渡し、ログレベルごとの1件あたりの
+処理時間を比較する。ログ出力先は /dev/null に差し替えるため、
+CloudWatch への取り込みコストは含まず、整形・シリアライズのCPUコストのみを測る。
+
+使い方:
+    python tools/benchmark_voice_logging.py
+    python tools/benchmark_voice_logging.py --iterations 20000
+"""
+import argparse
+import base64
+import contextlib
+import os
+import statistics
+import sys
+import time
+import urllib.parse
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, os.path.join(ROOT, 'lambda_functions', 'immediate-response'))
+sys.path.insert(0, os.path.join(ROOT, 'layers', 'twilio_functions'))
+os.environ.setdefault('AWS_DEFAULT_REGION', 'ap-northeast-1')
+
+import lambda_handler_immediate_response as handler  # noqa: E402
+import voice_logger  # noqa: E402
+
+# 比較するログ設定: (ラベル, LOG_LEVEL)
+LOG_SETTINGS = [('off (ERROR)', 'ERROR'), ('INFO', 'INFO'), ('DEBUG', 'DEBUG')]
+
+
+def _webhook_event(query: dict, form: dict) -> dict:
+    """Function URL 経由で届くTwilio Webhookと同じ形のイベント"""
+    return {
+        'headers': {
+            'content-type': 'application/x-www-form-urlencoded',
+            'user-agent': 'TwilioProxy/1.1',
+            'x-twilio-signature': 'benchmark-signature'
+        },
+        'queryStringParameters': query,
+        'requestContext': {'http': {'method': 'POST'}},
+        'isBase64Encoded': True,
+        'body': base64.b64encode(urllib.parse.urlencode(form).encode('utf-8')).decode('ascii')
+    }
+
+
+def _scenarios() -> dict:
+    base_form = {'CallSid': 'CA' + '0' * 32, 'From': '+819012345678', 'To': '+815012345678'}
+    return {
+        'initial_call': {'headers': {}, 'queryStringParameters': None,
+                         'requestContext': {'http': {'method': 'GET'}}},
+        'language_selection': _webhook_event({}, dict(base_form, Digits='2')),
+        'room_number_input': _webhook_event(
+            {'language': 'ja-JP', 'source': 'room_number_input', 'attempt': '1'},
+            dict(base_form, Digits='201')
+        ),
+    }
+
+
+def _measure(event: dict, iterations: int) -> float:
+    """1件あたりの処理時間（マイクロ秒）の中央値を返す（5回計測）"""
+    samples = []
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            handler.lambda_handler(event, None)
+        samples.append((time.perf_counter() - start) / iterations * 1e6)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ImmediateResponse handler time with logging on/off')
+    parser.add_argument('--iterations', type=int, default=5000)
+    args = parser.parse_args()
+
+    results = {}
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for label, level in LOG_SETTINGS:
+            voice_logger.set_level(level)
+            for name, event in _scenarios().items():
+                results[(name, label)] = _measure(event, args.iterations)
+
+    labels = [label for label, _ in LOG_SETTINGS]
+    print(f"{'scenario':<20}" + ''.join(f"{label:>14}" for label in labels))
+    for name in _scenarios():
+        print(f"{name:<20}" + ''.join(f"{results[(name, label)]:>12.1f}µs" for label in labels))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Twilio Webhookフォームパーサの parse_qs との一致確認とマイクロベンチマーク
+
+1. ランダム生成したフォームボディ（エスケープ・重複・空値・"=" なし項目・
+   不正な%エスケープ・マルチバイト文字・紛らわしいフィールド名を含む）で parse_webhook_form と
+   urllib.parse.parse_qs(body)[name][0] の結果が一致することを確認する。
+2. 実際のTwilio Gather Webhook（音声・DTMF）と同じ約30フィールドのボディで、
+   旧実装（parse_qs + 3フィールド取り出し）と新実装の1件あたりの処理時間を比較する。
+
+使い方:
+    python tools/benchmark_webhook_form.py
+    python tools/benchmark_webhook_form.py --fuzz-cases 100000 --iterations 200000
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+import urllib.parse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'layers', 'twilio_functions'))
+
+from twilio_webhook_form import ALL_FIELDS, CORE_FIELDS, FIELD_SLOTS, parse_webhook_form  # noqa: E402
+
+# 実際の speech Gather Webhook に近いボディ
+TWILIO_GATHER_FORM = {
+    'AccountSid': 'AC' + 'a' * 32, 'ApiVersion': '2010-04-01', 'CallSid': 'CA' + 'b' * 32,
+    'CallStatus': 'in-progress', 'Called': '+815012345678', 'CalledCity': '', 'CalledCountry': 'JP',
+    'CalledState': '', 'CalledZip': '', 'Caller': '+819012345678', 'CallerCity': '',
+    'CallerCountry': 'JP', 'CallerState': '', 'CallerZip': '', 'Confidence': '0.9123',
+    'Direction': 'inbound', 'From': '+819012345678', 'FromCity': '', 'FromCountry': 'JP',
+    'FromState': '', 'FromZip': '', 'Language': 'ja-JP',
+    'SpeechResult': 'チェックアウトは何時ですか？', 'To': '+815012345678', 'ToCity': '',
+    'ToCountry': 'JP', 'ToState': '', 'ToZip': '', 'msg': 'Gather End',
+}
+TWILIO_GATHER_BODY = urllib.parse.urlencode(TWILIO_GATHER_FORM)
+# DTMF Gather Webhook（SpeechResult/Confidence の代わりに Digits）
+TWILIO_DTMF_BODY = urllib.parse.urlencode(dict(
+    {k: v for k, v in TWILIO_GATHER_FORM.items() if k not in ('SpeechResult', 'Confidence')},
+    Digits='201', FinishedOnKey=''
+))
+
+# フィールド名は完全一致のみ（前後に文字が付いた名前・"+" を含む名前は別名）
+_FUZZ_NAMES = sorted(FIELD_SLOTS) + ['XDigits', 'DigitsX', 'Call+Sid', 'Other', '', 'Digits%']
+_FUZZ_VALUES = ['', '1', '201', '+81 90', 'a+b', '%E3%81%82', '%zz', '%E3%81', '=', 'x=y', 'チェック', '%2B819012']
+
+
+def _random_body(rng: random.Random) -> str:
+    items = []
+    for _ in range(rng.randint(0, 12)):
+        kind = rng.random()
+        if kind < 0.1:
+            items.append(rng.choice(_FUZZ_NAMES))  # "=" なし
+        elif kind < 0.2:
+            items.append('')  # 空項目（"&&"）
+        else:
+            items.append(f"{rng.choice(_FUZZ_NAMES)}={rng.choice(_FUZZ_VALUES)}")
+    return '&'.join(items)
+
+
+def check_parity(cases: int, seed: int = 0) -> int:
+    """parse_qs と結果が一致しないケース数を返す"""
+    rng = random.Random(seed)
+    bodies = [TWILIO_GATHER_BODY, TWILIO_DTMF_BODY] + [_random_body(rng) for _ in range(cases)]
+    mismatches = 0
+    for body in bodies:
+        expected = urllib.parse.parse_qs(body)
+        form = parse_webhook_form(body, ALL_FIELDS)
+        for name, slot in FIELD_SLOTS.items():
+            want = expected.get(name, [None])[0]
+            if getattr(form, slot) != want:
+                mismatches += 1
+                print(f"MISMATCH {name}: body={body!r} expected={want!r} got={getattr(form, slot)!r}")
+    return mismatches
+
+
+def _legacy_parse(body: str):
+    parsed_body = urllib.parse.parse_qs(body)
+    return (parsed_body.get('SpeechResult', [None])[0],
+            parsed_body.get('Digits', [None])[0],
+            parsed_body.get('CallSid', [None])[0])
+
+
+def _new_parse(body: str):
+    form = parse_webhook_form(body, CORE_FIELDS)
+    return form.speech_result, form.digits, form.call_sid
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Twilio webhook form parser parity check and microbenchmark')
+    parser.add_argument('--fuzz-cases', type=int, default=20000)
+    parser.add_argument('--iterations', type=int, default=50000)
+    args = parser.parse_args()
+
+    mismatches = check_parity(args.fuzz_cases)
+    print(f"parity: {args.fuzz_cases + 2} bodies, {mismatches} mismatches")
+    if mismatches:
+        sys.exit(1)
+
+    for body_label, body in [('speech', TWILIO_GATHER_BODY), ('dtmf', TWILIO_DTMF_BODY)]:
+        assert _legacy_parse(body) == _new_parse(body)
+        for label, func in [('parse_qs', _legacy_parse), ('parse_webhook_form', _new_parse)]:
+            seconds = min(timeit.repeat(lambda: func(body), number=args.iterations, repeat=5))
+            print(f"{body_label:<8}{label:<20}{seconds / args.iterations * 1e6:>8.2f}µs/call")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+施設資料のプロセス内検索用索引の作成
+
+vector_db_files のテキスト資料（.md / .txt / .csv / .json）を見出し・段落単位のチャンクに分け、
+layers/twilio_functions/facility_retrieval.py が読む索引ファイル（BM25 用の語彙とポスティング、
+チャンク本文）を書き出す。FACILITY ストアに入っていない AccessMap.md は既定で除く。--embed を付けると OpenAI の埋め込みベクトルも計算して .npy に保存する
+（NumPy と OPENAI_API_KEY が必要。AI Processing Lambda 側で FACILITY_RETRIEVAL_USE_VECTORS=true にしたときだけ使う）。
+
+PDF・画像などテキストとして読めない資料は索引に入らない（一覧を表示する）。
+それらの内容に関する質問は索引でヒットしないため、AI Processing Lambda は file_search に戻して回答する。
+
+使い方:
+    python tools/build_facility_index.py
+    python tools/build_facility_index.py vector_db_files --output /tmp/facility_index.bin --chunk-chars 400
+    python tools/build_facility_index.py --embed
+"""
+import argparse
+import hashlib
+import os
+import re
+import sys
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, os.path.join(ROOT, 'layers', 'twilio_functions'))
+os.environ.setdefault('LOG_LEVEL', 'ERROR')
+
+from facility_retrieval import write_index  # noqa: E402
+
+TEXT_EXTENSIONS = ('.md', '.txt', '.csv', '.json')
+DEFAULT_SOURCE = os.path.join(ROOT, 'vector_db_files')
+DEFAULT_OUTPUT = os.path.join(ROOT, 'layers', 'twilio_functions', 'facility_index.bin')
+DEFAULT_EMBEDDING_MODEL = 'text-embedding-3-small'
+# TRANSPORT ストアの資料（Web チャット用。電話の施設問い合わせの FACILITY ストアには入っていない）
+DEFAULT_EXCLUDE = ('AccessMap.md',)
+
+_HEADING_RE = re.compile(r'^(#{1,6})\s+(.*)$')
+_SENTENCE_END_RE = re.compile(r'(?<=[。！？!?])|(?<=\.)\s')
+
+
+def _split_long(paragraph: str, chunk_chars: int) -> list:
+    """1段落が長すぎる場合は文単位でまとめ直す（それでも長い文はそのまま切る）"""
+    pieces, current = [], ''
+    for sentence in filter(None, _SENTENCE_END_RE.split(paragraph)):
+        while len(sentence) > chunk_chars:
+            pieces.append(sentence[:chunk_chars])
+            sentence = sentence[chunk_chars:]
+        if current and len(current) + len(sentence) > chunk_chars:
+            pieces.append(current)
+            current = ''
+        current += sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def chunk_document(source: str, text: str, chunk_chars: int) -> list:
+    """見出しごとに段落を chunk_chars 以内にまとめたチャンク（title は直近の見出し）"""
+    chunks, title, buffer = [], '', []
+
+    def flush():
+        body = '\n\n'.join(buffer).strip()
+        if body:
+            chunks.append({'source': source, 'title': title, 'text': body})
+        buffer.clear()
+
+    for block in re.split(r'\n\s*\n', text):
+        block = block.strip()
+        if not block:
+            continue
+        lines = block.splitlines()
+        heading = _HEADING_RE.match(lines[0])
+        if heading:
+            flush()
+            title = heading.group(2).strip()
+            block = '\n'.join(lines[1:]).strip()
+            if not block:
+                continue
+        for piece in _split_long(block, chunk_chars) if len(block) > chunk_chars else [block]:
+            if buffer and sum(len(part) for part in buffer) + len(piece) > chunk_chars:
+                flush()
+            buffer.append(piece)
+    flush()
+    return chunks
+
+
+def collect_chunks(source_dir: str, chunk_chars: int, exclude=DEFAULT_EXCLUDE) -> tuple:
+    """(チャンクのリスト, 内容のハッシュ, 索引に入れなかったファイル)"""
+    chunks, skipped = [], []
+    digest = hashlib.sha256()
+    for directory, _, files in sorted(os.walk(source_dir)):
+        for name in sorted(files):
+            path = os.path.join(directory, name)
+            relative = os.path.relpath(path, source_dir)
+            if relative in exclude or not name.lower().endswith(TEXT_EXTENSIONS):
+                skipped.append(relative)
+                continue
+            with open(path, 'rb') as f:
+                raw = f.read()
+            digest.update(relative.encode('utf-8') + b'\0' + raw)
+            chunks.extend(chunk_document(relative, raw.decode('utf-8', errors='replace'), chunk_chars))
+    return chunks, digest.hexdigest()[:12], skipped
+
+
+def embed_chunks(chunks: list, model: str) -> list:
+    import openai
+    client = openai.OpenAI()
+    texts = [f"{chunk['title']}\n{chunk['text']}".strip() for chunk in chunks]
+    vectors = []
+    for start in range(0, len(texts), 100):
+        response = client.embeddings.create(model=model, input=texts[start:start + 100])
+        vectors.extend(item.embedding for item in response.data)
+    return vectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the in-process facility retrieval index')
+    parser.add_argument('source', nargs='?', default=DEFAULT_SOURCE, help='施設資料のディレクトリ')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    parser.add_argument('--chunk-chars', type=int, default=500)
+    parser.add_argument('--exclude', nargs='*', default=list(DEFAULT_EXCLUDE),
+                        help='索引に入れない資料（source からの相対パス）')
+    parser.add_argument('--embed', action='store_true', help='埋め込みベクトルも作成する（OpenAI API を呼ぶ）')
+    parser.add_argument('--embedding-model', default=DEFAULT_EMBEDDING_MODEL)
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.source):
+        print(f"source directory not found: {args.source}", file=sys.stderr)
+        sys.exit(2)
+    chunks, content_version, skipped = collect_chunks(args.source, args.chunk_chars, tuple(args.exclude))
+    if not chunks:
+        print(f"no text documents under {args.source}", file=sys.stderr)
+        sys.exit(2)
+    vectors = embed_chunks(chunks, args.embedding_model) if args.embed else None
+    header = write_index(args.output, chunks, content_version, vectors,
+                         args.embedding_model if args.embed else None)
+
+    print(f"index: {args.output} ({os.path.getsize(args.output)} bytes)")
+    print(f"content_version={content_version} chunks={header['num_chunks']} terms={len(header['terms'])} "
+          f"avg_tokens_per_chunk={header['avg_length']:.0f} vectors={header['vector_file'] or 'none'}")
+    if skipped:
+        print(f"not indexed (excluded or not text): {', '.join(skipped)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,14 @@
+"""
+通話フローのシミュレーター（tools/simulate_call_flow.py から使う）
+
+Twilio の通話・発信者・AWS（Lambda / DynamoDB）・OpenAI・Twilio REST を偽物にして、
+ImmediateResponse Lambda と AI Processing Lambda のハンドラを1プロセスで同時に何本も動かす。
+"""
+from .latency import LatencyModel
+from .report import StageRecorder, format_summary, percentile
+from .runtime import CallerScript, CallFlowSimulation, SimulationConfig, load_handlers
+
+__all__ = [
+    'CallFlowSimulation', 'CallerScript', 'LatencyModel', 'SimulationConfig', 'StageRecorder', 'format_summary',
+    'load_handlers', 'percentile',
+]
@@ -0,0 +1,227 @@
+"""
+boto3（Lambda / DynamoDB）・OpenAI 非同期クライアント・Twilio REST の偽物
+
+どれも LatencyModel で遅延と失敗を注入し、所要時間を StageRecorder に記録する。
+boto3 と Twilio の偽物は実物と同じく同期 API（ハンドラのスレッドから呼ばれる）で、
+結果をイベントループへ渡すときは call_soon_threadsafe を使う。
+"""
+import asyncio
+import json
+import random
+import threading
+import time
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional
+
+import openai
+from twilio.base.exceptions import TwilioRestException
+
+from .latency import LatencyModel
+from .report import StageRecorder
+
+ANSWER_MARKER = '[answer]'
+
+
+def _elapsed_ms(started: float) -> float:
+    return (time.monotonic() - started) * 1000
+
+
+class _Injector:
+    """遅延の待機と失敗の判定（乱数は偽物ごとに持つ）"""
+
+    def __init__(self, recorder: StageRecorder, seed: int):
+        self.recorder = recorder
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _draw(self, model: LatencyModel):
+        with self._lock:
+            return model.sample_ms(self._rng), model.fails(self._rng)
+
+    def block(self, stage: str, model: LatencyModel) -> bool:
+        """同期で待つ（失敗させる場合は True）"""
+        latency_ms, fails = self._draw(model)
+        time.sleep(latency_ms / 1000)
+        self.recorder.add(stage, latency_ms)
+        if fails:
+            self.recorder.error(stage)
+        return fails
+
+    async def wait(self, stage: str, model: LatencyModel) -> bool:
+        latency_ms, fails = self._draw(model)
+        await asyncio.sleep(latency_ms / 1000)
+        self.recorder.add(stage, latency_ms)
+        if fails:
+            self.recorder.error(stage)
+        return fails
+
+
+class FakeLambdaClient(_Injector):
+    """
+    lambda_client.invoke の偽物
+
+    InvocationType='Event' の呼び出しは、非同期呼び出しのキュー待ち（async_delay）の後に
+    イベントループ上で AI Processing Lambda のハンドラ（handler(event, context) のコルーチン）を実行する。
+    """
+
+    def __init__(self, recorder: StageRecorder, loop: asyncio.AbstractEventLoop, handler: Callable,
+                 invoke_latency: LatencyModel, async_delay: LatencyModel, seed: int = 0):
+        super().__init__(recorder, seed)
+        self._loop = loop
+        self._handler = handler
+        self.invoke_latency = invoke_latency
+        self.async_delay = async_delay
+        self.tasks = set()
+
+    def invoke(self, FunctionName: str, InvocationType: str = 'RequestResponse', Payload: str = '{}'):
+        if self.block('lambda.invoke', self.invoke_latency):
+            raise RuntimeError(f"simulated invoke failure for {FunctionName}")
+        self._loop.call_soon_threadsafe(self._start, json.loads(Payload))
+        return {'StatusCode': 202}
+
+    def _start(self, payload: Dict) -> None:
+        task = self._loop.create_task(self._run(payload))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _run(self, payload: Dict) -> None:
+        await self.wait('lambda.async_delay', self.async_delay)
+        started = time.monotonic()
+        try:
+            await self._handler(payload, None)
+        except Exception:
+            self.recorder.error('ai.invocation')
+        self.recorder.add('ai.invocation', _elapsed_ms(started))
+
+
+class FakeGuestTable(_Injector):
+    """obw-guest テーブル（table.query）の偽物: roomPhoneLast4 GSI と roomNumber のクエリに答える"""
+
+    def __init__(self, recorder: StageRecorder, guests: List[Dict], latency: LatencyModel, seed: int = 0):
+        super().__init__(recorder, seed)
+        self.latency = latency
+        self._by_lookup: Dict[str, List[Dict]] = {}
+        self._by_room: Dict[str, List[Dict]] = {}
+        for guest in guests:
+            self._by_lookup.setdefault(guest['roomPhoneLast4'], []).append(guest)
+            self._by_room.setdefault(guest['roomNumber'], []).append(guest)
+
+    def query(self, **kwargs):
+        if self.block('dynamodb.query', self.latency):
+            raise RuntimeError('simulated DynamoDB failure')
+        _, value = kwargs['KeyConditionExpression'].get_expression()['values']
+        items = self._by_lookup if kwargs.get('IndexName') else self._by_room
+        return {'Items': list(items.get(value, []))}
+
+
+class FakeResultStore(_Injector):
+    """ポーリングモードの結果ストア（DynamoDB）の偽物: 中身は InMemoryResultStore"""
+
+    def __init__(self, recorder: StageRecorder, store, latency: LatencyModel, seed: int = 0):
+        super().__init__(recorder, seed)
+        self._store = store
+        self.latency = latency
+
+    def put(self, call_sid: str, turn_id: str, twiml: str) -> None:
+        if self.block('dynamodb.result_put', self.latency):
+            raise RuntimeError('simulated DynamoDB failure')
+        self._store.put(call_sid, turn_id, twiml)
+
+    def get(self, call_sid: str, turn_id: str) -> Optional[str]:
+        if self.block('dynamodb.result_get', self.latency):
+            raise RuntimeError('simulated DynamoDB failure')
+        return self._store.get(call_sid, turn_id)
+
+
+def _estimated_tokens(text: str) -> int:
+    """トークン数の概算（4文字で1トークン。コスト集計の確認用）"""
+    return max(1, len(text) // 4)
+
+
+def _message_response(text: str, response_id: str, payload: Dict = None):
+    content = SimpleNamespace(type='output_text', text=text)
+    prompt = json.dumps([(payload or {}).get('instructions'), (payload or {}).get('input')], ensure_ascii=False)
+    usage = SimpleNamespace(input_tokens=_estimated_tokens(prompt), output_tokens=_estimated_tokens(text),
+                            input_tokens_details=SimpleNamespace(cached_tokens=0))
+    return SimpleNamespace(id=response_id, output=[SimpleNamespace(type='message', content=[content])],
+                           usage=usage)
+
+
+class FakeOpenAIResponses(_Injector):
+    """
+    openai_async_client.responses の偽物
+
+    分類は intents（発話 → 緊急度）、回答は flags（発話 → needs_operator / end_conversation）に従って返す。
+    回答テキストには ANSWER_MARKER を付ける（発信者側で回答の到着を判定するため）。
+    """
+
+    def __init__(self, recorder: StageRecorder, classify_latency: LatencyModel, answer_latency: LatencyModel,
+                 intents: Dict[str, str] = None, flags: Dict[str, Dict] = None, seed: int = 0):
+        super().__init__(recorder, seed)
+        self.classify_latency = classify_latency
+        self.answer_latency = answer_latency
+        self.intents = intents or {}
+        self.flags = flags or {}
+        self._sequence = 0
+
+    @staticmethod
+    def _user_text(payload: Dict) -> str:
+        messages = [item for item in payload.get('input', []) if isinstance(item, dict) and item.get('role') == 'user']
+        return messages[-1]['content'] if messages else ''
+
+    def _next_id(self, prefix: str) -> str:
+        with self._lock:
+            self._sequence += 1
+            return f"{prefix}_{self._sequence}"
+
+    async def create(self, stream: bool = False, **payload):
+        text = self._user_text(payload)
+        format_name = payload.get('text', {}).get('format', {}).get('name')
+        if format_name == 'urgency_classification':
+            if await self.wait('openai.classify', self.classify_latency):
+                raise openai.APIConnectionError(request=None)
+            urgency = self.intents.get(text, 'general')
+            return _message_response(json.dumps({'urgency': urgency, 'reasoning': 'simulation'}),
+                                     self._next_id('resp_classify'), payload)
+        if await self.wait('openai.answer', self.answer_latency):
+            raise openai.APIConnectionError(request=None)
+        answer = json.dumps({
+            'assistant_response_text': f"{ANSWER_MARKER} {text}",
+            'needs_operator': False,
+            'end_conversation': False,
+            **self.flags.get(text, {}),
+        }, ensure_ascii=False)
+        response = _message_response(answer, self._next_id('resp_answer'), payload)
+        if stream:
+            return self._events(answer, response)
+        return response
+
+    @staticmethod
+    async def _events(answer: str, response):
+        for start in range(0, len(answer), 16):
+            yield SimpleNamespace(type='response.output_text.delta', delta=answer[start:start + 16])
+        yield SimpleNamespace(type='response.completed', response=response)
+
+
+class FakeTwilioClient(_Injector):
+    """
+    Twilio REST（twilio_client.calls(sid).update(twiml=...)）の偽物
+
+    更新は deliver(call_sid, twiml) でイベントループ上の通話に渡す（実物と同じく再生中の TwiML を差し替える）。
+    """
+
+    def __init__(self, recorder: StageRecorder, loop: asyncio.AbstractEventLoop, deliver: Callable[[str, str], None],
+                 latency: LatencyModel, seed: int = 0):
+        super().__init__(recorder, seed)
+        self._loop = loop
+        self._deliver = deliver
+        self.latency = latency
+
+    def calls(self, call_sid: str):
+        return SimpleNamespace(update=lambda twiml: self._update(call_sid, twiml))
+
+    def _update(self, call_sid: str, twiml: str):
+        if self.block('twilio.update', self.latency):
+            raise TwilioRestException(500, f'/Calls/{call_sid}.json', 'simulated Twilio REST failure')
+        self._loop.call_soon_threadsafe(self._deliver, call_sid, twiml)
+        return SimpleNamespace(sid=call_sid)
@@ -0,0 +1,64 @@
+"""
+外部サービスの遅延・エラーの分布
+
+指定の書式（カンマ区切り）:
+    fixed:120                 常に120ms
+    uniform:80:200            80〜200msの一様分布
+    lognormal:900:0.4         中央値900ms、ばらつき0.4の対数正規分布
+    ...,tail=0.05:8000        確率0.05で約8000msの遅延を追加
+    ...,error=0.01            確率0.01で失敗させる
+"""
+import math
+import random
+from typing import Tuple
+
+
+class LatencyModel:
+    """1つの外部サービスの遅延（ms）と失敗の分布"""
+
+    def __init__(self, kind: str = 'fixed', params: Tuple[float, ...] = (0.0,), tail_prob: float = 0.0,
+                 tail_ms: float = 0.0, error_prob: float = 0.0):
+        self.kind = kind
+        self.params = params
+        self.tail_prob = tail_prob
+        self.tail_ms = tail_ms
+        self.error_prob = error_prob
+
+    @classmethod
+    def parse(cls, spec: str) -> 'LatencyModel':
+        """書式の文字列から作成（不正な書式は ValueError）"""
+        head, *options = [part.strip() for part in spec.split(',') if part.strip()]
+        kind, *values = head.split(':')
+        expected = {'fixed': 1, 'uniform': 2, 'lognormal': 2}
+        if kind not in expected or len(values) != expected[kind]:
+            raise ValueError(f"invalid latency spec: {spec!r}")
+        model = cls(kind, tuple(float(value) for value in values))
+        for option in options:
+            name, _, value = option.partition('=')
+            if name == 'error':
+                model.error_prob = float(value)
+            elif name == 'tail':
+                prob, _, tail_ms = value.partition(':')
+                model.tail_prob, model.tail_ms = float(prob), float(tail_ms)
+            else:
+                raise ValueError(f"invalid latency option: {option!r}")
+        return model
+
+    def sample_ms(self, rng: random.Random) -> float:
+        if self.kind == 'uniform':
+            latency = rng.uniform(*self.params)
+        elif self.kind == 'lognormal':
+            median, sigma = self.params
+            latency = median * math.exp(rng.gauss(0, sigma))
+        else:
+            latency = self.params[0]
+        if self.tail_prob and rng.random() < self.tail_prob:
+            latency += self.tail_ms * math.exp(rng.gauss(0, 0.3))
+        return latency
+
+    def fails(self, rng: random.Random) -> bool:
+        return bool(self.error_prob) and rng.random() < self.error_prob
+
+    def __repr__(self) -> str:
+        return (f"LatencyModel({self.kind}{self.params}, tail={self.tail_prob}:{self.tail_ms}, "
+                f"error={self.error_prob})")
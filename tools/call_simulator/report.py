@@ -0,0 +1,59 @@
+"""
+ステージごとの所要時間の集計と表示
+"""
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List
+
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+class StageRecorder:
+    """ステージ名ごとの所要時間（ms）と失敗数（偽クライアントはスレッドからも記録する）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.durations: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Counter = Counter()
+        self.outcomes: Counter = Counter()
+
+    def add(self, stage: str, duration_ms: float) -> None:
+        with self._lock:
+            self.durations[stage].append(duration_ms)
+
+    def error(self, stage: str) -> None:
+        with self._lock:
+            self.errors[stage] += 1
+
+    def outcome(self, name: str) -> None:
+        with self._lock:
+            self.outcomes[name] += 1
+
+    def summary(self) -> Dict[str, Dict]:
+        with self._lock:
+            stages = sorted(set(self.durations) | set(self.errors))
+            return {
+                stage: {
+                    'count': len(self.durations.get(stage, [])),
+                    'errors': self.errors.get(stage, 0),
+                    'p50': percentile(self.durations.get(stage, []), 0.5),
+                    'p95': percentile(self.durations.get(stage, []), 0.95),
+                    'p99': percentile(self.durations.get(stage, []), 0.99),
+                    'max': max(self.durations.get(stage, []), default=0.0),
+                }
+                for stage in stages
+            }
+
+
+def format_summary(summary: Dict[str, Dict], stages: Iterable[str] = None) -> str:
+    lines = [f"{'stage':<30}{'count':>7}{'errors':>7}{'p50_ms':>9}{'p95_ms':>9}{'p99_ms':>9}{'max_ms':>9}"]
+    for stage in stages or summary:
+        row = summary.get(stage)
+        if row is None:
+            continue
+        lines.append(f"{stage:<30}{row['count']:>7}{row['errors']:>7}{row['p50']:>9.0f}{row['p95']:>9.0f}"
+                     f"{row['p99']:>9.0f}{row['max']:>9.0f}")
+    return '\n'.join(lines)
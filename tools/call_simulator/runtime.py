@@ -0,0 +1,362 @@
+"""
+通話フローの実行: 偽の Twilio 通話（TwiML の実行）と台本どおりに話す発信者
+
+ImmediateResponse Lambda の lambda_handler をスレッドで、AI Processing Lambda の lambda_handler_async を
+イベントループ上でそのまま実行し、外部サービス（boto3・OpenAI・Twilio REST）だけを fakes の偽物に差し替える。
+偽物には本番のクライアントと同じラップ（トークン集計・EVENT_CAPTURE_ENABLED の記録）を掛けるため、
+シミュレーションの通話を記録して tools/replay_voice_events.py で再生できる。
+
+- SimulatedCall は Twilio の通話の代わりに TwiML を先頭から実行する（Say は読み上げ時間、Pause は秒数だけ待つ）。
+  Gather では発信者の台本から DTMF・発話を返し、アクションURLへの Webhook を ImmediateResponse Lambda に送る。
+  calls.update が届いたら実行中の TwiML を打ち切って新しい TwiML を実行する
+- 読み上げと発信者の考える時間は playback_scale で縮められる。Pause は縮めない
+  （ポーリングの回数上限や保留の期限が Pause の実時間を前提にしているため）
+- 発話の Webhook を送ってから回答（ANSWER_MARKER 付きの Say）を含む TwiML が届くまでを turn.time_to_answer、
+  緊急の発話からオペレーター転送（Dial）が届くまでを turn.time_to_operator として記録する
+"""
+import asyncio
+import os
+import re
+import sys
+import time
+import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from .fakes import (ANSWER_MARKER, FakeGuestTable, FakeLambdaClient, FakeOpenAIResponses, FakeResultStore,
+                    FakeTwilioClient, _Injector)
+from .latency import LatencyModel
+from .report import StageRecorder
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+SIMULATION_ENV = {
+    'AWS_DEFAULT_REGION': 'ap-northeast-1',
+    'TWILIO_ACCOUNT_SID': 'AC' + '0' * 32,
+    'TWILIO_AUTH_TOKEN': 'simulation',
+    'LAMBDA1_FUNCTION_URL': 'https://immediate-response.invalid/',
+    'OPENAI_API_KEY': 'sk-simulation',
+    'OPENAI_VECTOR_STORE_ID_FACILITY': 'vs_simulation',
+    'ANSWER_CACHE_ENABLED': 'false',    # 1プロセス＝1コンテナになるため、別の通話の回答がヒットしないようにする
+    'LOG_LEVEL': 'ERROR',
+    'LOG_SAMPLE_RATES': 'ERROR=0',      # 注入した障害のエラーログを出さない
+}
+_TAG = re.compile(r'<[^>]+>')
+
+
+def load_handlers(env: Dict[str, str] = None) -> SimpleNamespace:
+    """sys.path と環境変数を設定して両 Lambda のハンドラを読み込む（環境変数は未設定のものだけ設定する）"""
+    for path in ('layers/twilio_functions', 'lambda_functions/immediate-response', 'lambda_functions/ai_processing'):
+        full_path = os.path.join(ROOT, path)
+        if full_path not in sys.path:
+            sys.path.insert(0, full_path)
+    for name, value in {**SIMULATION_ENV, **(env or {})}.items():
+        os.environ.setdefault(name, value)
+
+    import answer_streaming
+    import authenticate_guest
+    import call_result_store
+    import lambda_handler_ai_processing
+    import lambda_handler_immediate_response
+    return SimpleNamespace(immediate=lambda_handler_immediate_response, ai=lambda_handler_ai_processing,
+                           authenticate_guest=authenticate_guest, call_result_store=call_result_store,
+                           answer_streaming=answer_streaming)
+
+
+class CallerScript:
+    """1人の発信者の台本（言語・部屋番号・電話番号下4桁・発話の列）"""
+
+    def __init__(self, language: str, room_number: str, phone_last4: str, utterances: List[Dict]):
+        self.language = language
+        self.room_number = room_number
+        self.phone_last4 = phone_last4
+        self.utterances = utterances  # {'text', 'urgency', 'needs_operator', 'end_conversation'}
+
+    @property
+    def language_digit(self) -> str:
+        return '2' if self.language == 'ja-JP' else '1'
+
+    def guest(self) -> Dict:
+        """obw-guest の項目（今日チェックイン・明日チェックアウトの承認済みゲスト）"""
+        today = time.strftime('%Y-%m-%d')
+        tomorrow = time.strftime('%Y-%m-%d', time.localtime(time.time() + 86400))
+        return {
+            'guestId': f"guest-{self.room_number}-{self.phone_last4}",
+            'guestName': 'Simulated Guest',
+            'roomNumber': self.room_number,
+            'phone': f"+81900000{self.phone_last4}",
+            'roomPhoneLast4': f"{self.room_number}#{self.phone_last4}",
+            'checkInDate': today,
+            'checkOutDate': tomorrow,
+            'approvalStatus': 'approved',
+        }
+
+
+class SimulationConfig:
+    """外部サービスの遅延分布と通話の実行設定"""
+
+    def __init__(self, latencies: Dict[str, LatencyModel], response_mode: str = 'push', streaming: bool = False,
+                 playback_scale: float = 1.0, max_call_seconds: float = 300.0, seed: int = 0):
+        self.latencies = latencies  # webhook / dynamodb / invoke / async_delay / classify / answer / twilio / think
+        self.response_mode = response_mode
+        self.streaming = streaming
+        self.playback_scale = playback_scale
+        self.max_call_seconds = max_call_seconds
+        self.seed = seed
+
+
+class _CallEnded(Exception):
+    pass
+
+
+class SimulatedCall:
+    """Twilio の通話1本（TwiML の実行と calls.update による差し替え）と、その発信者"""
+
+    def __init__(self, simulation: 'CallFlowSimulation', call_sid: str, script: CallerScript):
+        self.simulation = simulation
+        self.call_sid = call_sid
+        self.script = script
+        self.utterances = deque(script.utterances)
+        self.outcome: Optional[str] = None
+        self._pending_update: Optional[str] = None
+        self._update_event = asyncio.Event()
+        self._turn: Optional[Dict] = None
+        self.answered_turns = 0
+
+    # ---- Twilio 側 ----
+
+    def deliver(self, twiml: str) -> None:
+        """calls.update で届いた TwiML（実行中の TwiML を差し替える）"""
+        if self.outcome:
+            return
+        self._observe(twiml)
+        self._pending_update = twiml
+        self._update_event.set()
+
+    async def run(self) -> str:
+        started = time.monotonic()
+        recorder = self.simulation.recorder
+        try:
+            doc = await self.simulation.webhook(self, '', {})
+            await asyncio.wait_for(self._run_documents(doc), self.simulation.config.max_call_seconds)
+        except asyncio.TimeoutError:
+            self.outcome = 'stuck'
+        except _CallEnded:
+            pass
+        self.outcome = self.outcome or 'hangup'
+        if self._turn:
+            recorder.outcome('turn_unanswered')
+        recorder.outcome(self.outcome)
+        recorder.add('call.duration', (time.monotonic() - started) * 1000)
+        return self.outcome
+
+    async def _run_documents(self, doc: Optional[str]) -> None:
+        while doc is not None and not self.outcome:
+            self._update_event.clear()
+            execution = asyncio.ensure_future(self._execute(doc))
+            update = asyncio.ensure_future(self._update_event.wait())
+            await asyncio.wait({execution, update}, return_when=asyncio.FIRST_COMPLETED)
+            if update.done():
+                # calls.update は再生中の TwiML を打ち切る
+                execution.cancel()
+                await asyncio.gather(execution, return_exceptions=True)
+                doc = self._pending_update
+            else:
+                update.cancel()
+                doc = execution.result()
+
+    async def _say(self, verb: ET.Element) -> None:
+        text = _TAG.sub('', verb.text or '')
+        seconds = self.simulation.handlers.answer_streaming.estimate_speech_seconds(
+            text, verb.get('language', self.script.language))
+        await asyncio.sleep(seconds * self.simulation.config.playback_scale)
+
+    async def _execute(self, doc: str) -> Optional[str]:
+        """TwiML を先頭から実行し、次に実行する TwiML を返す（通話が終わればNone）"""
+        for verb in ET.fromstring(doc.encode('utf-8')):
+            if verb.tag == 'Say':
+                await self._say(verb)
+            elif verb.tag == 'Pause':
+                await asyncio.sleep(float(verb.get('length', '1')))
+            elif verb.tag == 'Gather':
+                next_doc = await self._gather(verb)
+                if next_doc is not None:
+                    return next_doc
+            elif verb.tag == 'Redirect':
+                return await self.simulation.webhook(self, verb.text or '', {})
+            elif verb.tag == 'Dial':
+                self._end('operator')
+            elif verb.tag == 'Hangup':
+                break
+        self._end('completed' if not self.utterances and self.answered_turns else 'system_hangup')
+
+    def _end(self, outcome: str) -> None:
+        self.outcome = self.outcome or outcome
+        raise _CallEnded()
+
+    # ---- 発信者側 ----
+
+    async def _gather(self, verb: ET.Element) -> Optional[str]:
+        for child in verb:
+            if child.tag == 'Say':
+                await self._say(child)
+            elif child.tag == 'Pause':
+                await asyncio.sleep(float(child.get('length', '1')))
+        action = verb.get('action', '')
+        if verb.get('input') == 'speech':
+            if not self.utterances:
+                self._end('completed')  # 台本の発話が終わったら発信者が切る
+            utterance = self.utterances.popleft()
+            params = {'SpeechResult': utterance['text'], 'Confidence': '0.92'}
+        else:
+            digits = self._digits_for(action)
+            if digits is None:
+                await asyncio.sleep(float(verb.get('timeout', '5')))
+                return None
+            params = {'Digits': digits}
+        await self.simulation.think()
+        if 'SpeechResult' in params:
+            self._turn = {'started': time.monotonic(), 'urgent': utterance.get('urgency') == 'urgent', 'acked': False}
+        return await self.simulation.webhook(self, action, params)
+
+    def _digits_for(self, action: str) -> Optional[str]:
+        query = dict(parse_qsl(urlsplit(action).query))
+        source = query.get('source')
+        if query.get('action') == 'language_selected':
+            return self.script.language_digit
+        if source == 'room_number_input':
+            return self.script.room_number
+        if source == 'phone_last4_input':
+            return self.script.phone_last4
+        if source == 'operator_choice_dtmf':
+            return '2' if self.utterances else '1'
+        return None
+
+    def _observe(self, twiml: str) -> None:
+        """届いた TwiML から発話ターンの応答時間を記録"""
+        turn = self._turn
+        if not turn:
+            return
+        elapsed_ms = (time.monotonic() - turn['started']) * 1000
+        recorder = self.simulation.recorder
+        if not turn['acked']:
+            turn['acked'] = True
+            recorder.add('turn.time_to_ack', elapsed_ms)
+        if ANSWER_MARKER in twiml:
+            recorder.add('turn.time_to_answer', elapsed_ms)
+            self.answered_turns += 1
+            self._turn = None
+        elif '<Dial' in twiml:
+            recorder.add('turn.time_to_operator', elapsed_ms)
+            self.answered_turns += 1
+            self._turn = None
+        elif 'source=operator_choice_dtmf' in twiml:
+            recorder.add('turn.time_to_fallback', elapsed_ms)
+            self._turn = None
+
+
+class CallFlowSimulation:
+    """偽の外部サービスを差し込んだ両ハンドラに、台本どおりの通話を同時に流す"""
+
+    def __init__(self, handlers: SimpleNamespace, config: SimulationConfig, recorder: StageRecorder = None):
+        self.handlers = handlers
+        self.config = config
+        self.recorder = recorder or StageRecorder()
+        self.calls: Dict[str, SimulatedCall] = {}
+        self._think = None
+        self._network = None
+
+    def _install_fakes(self, loop: asyncio.AbstractEventLoop, scripts: List[CallerScript]) -> FakeLambdaClient:
+        latencies, seed, recorder = self.config.latencies, self.config.seed, self.recorder
+        handlers = self.handlers
+        utterances = [utterance for script in scripts for utterance in script.utterances]
+        lambda_client = FakeLambdaClient(recorder, loop, handlers.ai.lambda_handler_async, latencies['invoke'],
+                                         latencies['async_delay'], seed + 1)
+        handlers.immediate.lambda_client = handlers.immediate.capture_lambda_client(lambda_client)
+        handlers.authenticate_guest.table = handlers.authenticate_guest.capture_table(FakeGuestTable(
+            recorder, [script.guest() for script in scripts], latencies['dynamodb'], seed + 2))
+        handlers.ai.twilio_client = FakeTwilioClient(recorder, loop, self._deliver, latencies['twilio'], seed + 3)
+        handlers.ai.call_dispatcher = None
+        # 本番と同じく call_analytics のトークン集計と event_capture の記録を通す（無効ならそのまま）
+        handlers.ai.openai_async_client = handlers.ai.instrument_openai(SimpleNamespace(
+            responses=FakeOpenAIResponses(
+                recorder, latencies['classify'], latencies['answer'],
+                intents={u['text']: u['urgency'] for u in utterances if u.get('urgency')},
+                flags={u['text']: {key: u[key] for key in ('needs_operator', 'end_conversation') if key in u}
+                       for u in utterances},
+                seed=seed + 4),
+            embeddings=None))
+        handlers.ai.ANSWER_STREAMING_ENABLED = self.config.streaming
+        handlers.immediate.AI_RESPONSE_MODE = self.config.response_mode
+        # キャプチャの config は環境変数から取るので、再生で同じモードになるよう環境変数にも反映する
+        os.environ['ANSWER_STREAMING_ENABLED'] = 'true' if self.config.streaming else 'false'
+        os.environ['AI_RESPONSE_MODE'] = self.config.response_mode
+        if self.config.response_mode == 'poll':
+            store = FakeResultStore(recorder, handlers.call_result_store.InMemoryResultStore(), latencies['dynamodb'],
+                                    seed + 5)
+            handlers.ai.result_store = store
+            handlers.immediate.result_store = handlers.immediate.capture_result_store(store)
+        self._think = _Injector(recorder, seed + 6)
+        self._network = _Injector(recorder, seed + 7)
+        return lambda_client
+
+    def _deliver(self, call_sid: str, twiml: str) -> None:
+        call = self.calls.get(call_sid)
+        if call:
+            call.deliver(twiml)
+
+    async def think(self) -> None:
+        """発信者が入力するまでの時間"""
+        latency_ms, _ = self._think._draw(self.config.latencies['think'])
+        await asyncio.sleep(latency_ms / 1000 * self.config.playback_scale)
+
+    async def webhook(self, call: SimulatedCall, url: str, params: Dict) -> Optional[str]:
+        """Twilio から ImmediateResponse Lambda（Function URL）への Webhook"""
+        query = dict(parse_qsl(urlsplit(url).query))
+        stage = 'webhook.' + (query.get('source') or ('language_selected' if query.get('action') else
+                                                       'speech' if 'SpeechResult' in params else 'initial'))
+        if await self._network.wait('twilio.webhook_network', self.config.latencies['webhook']):
+            call.outcome = call.outcome or 'webhook_error'
+            raise _CallEnded()
+        event = {
+            'queryStringParameters': query,
+            'requestContext': {'http': {'method': 'POST'}},
+            'headers': {'content-type': 'application/x-www-form-urlencoded'},
+            'body': urlencode({'CallSid': call.call_sid, **params}),
+            'isBase64Encoded': False,
+        }
+        started = time.monotonic()
+        response = await asyncio.to_thread(self.handlers.immediate.lambda_handler, event, None)
+        self.recorder.add(stage, (time.monotonic() - started) * 1000)
+        if response.get('statusCode') != 200:
+            self.recorder.error(stage)
+            call.outcome = call.outcome or 'webhook_error'
+            raise _CallEnded()
+        call._observe(response['body'])
+        return response['body']
+
+    async def run(self, scripts: List[CallerScript], concurrency: int, arrival_interval_ms: float = 0.0) -> StageRecorder:
+        loop = asyncio.get_running_loop()
+        # 同期のハンドラ・偽の boto3 / Twilio はスレッドで動くため、同時通話数に見合うスレッドを用意する
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=concurrency * 3 + 16))
+        lambda_client = self._install_fakes(loop, scripts)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def place_call(index: int, script: CallerScript):
+            async with semaphore:
+                call = SimulatedCall(self, f"CA{index:032x}", script)
+                self.calls[call.call_sid] = call
+                await call.run()
+
+        tasks = []
+        for index, script in enumerate(scripts):
+            tasks.append(asyncio.ensure_future(place_call(index, script)))
+            if arrival_interval_ms:
+                await asyncio.sleep(arrival_interval_ms / 1000)
+        await asyncio.gather(*tasks)
+        # 通話が終わった後に届く AI Processing Lambda の処理も待つ
+        while lambda_client.tasks:
+            await asyncio.gather(*list(lambda_client.tasks), return_exceptions=True)
+        return self.recorder
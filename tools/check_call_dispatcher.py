@@ -0,0 +1,247 @@
+"""
+calls.update ディスパッチャのローカル検証（偽の Twilio REST サーバー）
+
+aiohttp.web で Calls リソースを模したサーバーを 127.0.0.1 に立て、CallUpdateDispatcher の
+再試行（429 + Retry-After / 5xx / 接続エラー）、再試行対象外のエラー、同じ CallSid の更新の統合、
+同時実行数と秒間リクエスト数の上限、キープアライブ接続の再利用をシナリオごとに確認する。
+いずれかのシナリオが失敗すると終了コード1。
+
+使い方:
+    python tools/check_call_dispatcher.py
+    python tools/check_call_dispatcher.py --verbose
+"""
+import argparse
+import asyncio
+import base64
+import os
+import socket
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, os.path.join(ROOT, 'lambda_functions', 'ai_processing'))
+sys.path.insert(0, os.path.join(ROOT, 'layers', 'twilio_functions'))
+os.environ.setdefault('LOG_LEVEL', 'ERROR')
+
+from aiohttp import web  # noqa: E402
+
+from call_update_dispatcher import SENT, SUPERSEDED, CallUpdateDispatcher, TwilioCallUpdateError  # noqa: E402
+
+ACCOUNT_SID = 'AC' + '0' * 32
+AUTH_TOKEN = 'fake-token'
+CALL_PATH = '/2010-04-01/Accounts/{account}/Calls/{call_sid}.json'
+
+
+class FakeTwilioServer:
+    """scripted に積んだ (status, headers) を順に返し、なければ 200 を返す"""
+
+    def __init__(self):
+        self.requests = []
+        self.scripted = []
+        self.delay = 0.0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.peers = set()
+        self._runner = None
+        self.base_url = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            form = await request.post()
+            self.requests.append({
+                'call_sid': request.match_info['call_sid'],
+                'twiml': form.get('Twiml'),
+                'authorization': request.headers.get('Authorization'),
+                'at': time.monotonic()
+            })
+            self.peers.add(request.transport.get_extra_info('peername'))
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            if self.scripted:
+                status, headers = self.scripted.pop(0)
+                return web.json_response({'code': status, 'message': 'scripted'}, status=status, headers=headers)
+            return web.json_response({'sid': request.match_info['call_sid'], 'status': 'in-progress'})
+        finally:
+            self.in_flight -= 1
+
+    def reset(self):
+        self.requests, self.scripted, self.peers = [], [], set()
+        self.delay, self.max_in_flight = 0.0, 0
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post(CALL_PATH, self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+
+def _dispatcher(server: FakeTwilioServer, **overrides) -> CallUpdateDispatcher:
+    options = {'max_concurrency': 10, 'rate_per_second': 1000, 'max_attempts': 4, 'timeout_seconds': 2}
+    options.update(overrides)
+    return CallUpdateDispatcher(ACCOUNT_SID, AUTH_TOKEN, base_url=server.base_url, **options)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def scenario_basic(server):
+    dispatcher = _dispatcher(server)
+    results = [await dispatcher.update(f"CA{i:032d}", f"<Response><Say>{i}</Say></Response>") for i in range(3)]
+    await dispatcher.aclose()
+    expected_auth = 'Basic ' + base64.b64encode(f"{ACCOUNT_SID}:{AUTH_TOKEN}".encode()).decode()
+    assert results == [SENT] * 3, results
+    assert [r['twiml'] for r in server.requests] == [f"<Response><Say>{i}</Say></Response>" for i in range(3)]
+    assert all(r['authorization'] == expected_auth for r in server.requests)
+    assert len(server.peers) == 1, f"expected one keep-alive connection, got {len(server.peers)}"
+    return dispatcher.stats()
+
+
+async def scenario_retry_after_429(server):
+    server.scripted = [(429, {'Retry-After': '0.3'})]
+    dispatcher = _dispatcher(server)
+    started = time.monotonic()
+    result = await dispatcher.update('CA' + '1' * 32, '<Response/>')
+    elapsed = time.monotonic() - started
+    await dispatcher.aclose()
+    assert result == SENT and len(server.requests) == 2, (result, len(server.requests))
+    assert elapsed >= 0.3, f"Retry-After not honoured ({elapsed:.2f}s)"
+    assert dispatcher.stats()['rate_limited'] == 1
+    return dispatcher.stats()
+
+
+async def scenario_retry_5xx(server):
+    server.scripted = [(503, {}), (500, {})]
+    dispatcher = _dispatcher(server)
+    result = await dispatcher.update('CA' + '2' * 32, '<Response/>')
+    await dispatcher.aclose()
+    assert result == SENT and len(server.requests) == 3, (result, len(server.requests))
+    assert dispatcher.stats()['retried'] == 2
+    return dispatcher.stats()
+
+
+async def scenario_give_up_5xx(server):
+    server.scripted = [(502, {})] * 10
+    dispatcher = _dispatcher(server, max_attempts=3)
+    try:
+        await dispatcher.update('CA' + '3' * 32, '<Response/>')
+        raise AssertionError('expected TwilioCallUpdateError')
+    except TwilioCallUpdateError as e:
+        assert e.status == 502
+    await dispatcher.aclose()
+    assert len(server.requests) == 3, len(server.requests)
+    return dispatcher.stats()
+
+
+async def scenario_no_retry_4xx(server):
+    server.scripted = [(404, {})]
+    dispatcher = _dispatcher(server)
+    try:
+        await dispatcher.update('CA' + '4' * 32, '<Response/>')
+        raise AssertionError('expected TwilioCallUpdateError')
+    except TwilioCallUpdateError as e:
+        assert e.status == 404
+    await dispatcher.aclose()
+    assert len(server.requests) == 1, len(server.requests)
+    return dispatcher.stats()
+
+
+async def scenario_coalesce(server):
+    """送信中に同じ通話へ4件届いたら、送信されるのは最初と最後だけ"""
+    server.delay = 0.2
+    dispatcher = _dispatcher(server)
+    call_sid = 'CA' + '5' * 32
+    first = asyncio.ensure_future(dispatcher.update(call_sid, '<Response><Say>0</Say></Response>'))
+    await asyncio.sleep(0.05)
+    rest = [asyncio.ensure_future(dispatcher.update(call_sid, f"<Response><Say>{i}</Say></Response>"))
+            for i in range(1, 5)]
+    results = await asyncio.gather(first, *rest)
+    await dispatcher.aclose()
+    assert results == [SENT, SUPERSEDED, SUPERSEDED, SUPERSEDED, SENT], results
+    assert [r['twiml'] for r in server.requests] == ['<Response><Say>0</Say></Response>',
+                                                       '<Response><Say>4</Say></Response>']
+    return dispatcher.stats()
+
+
+async def scenario_concurrency_limit(server):
+    server.delay = 0.1
+    dispatcher = _dispatcher(server, max_concurrency=3)
+    results = await asyncio.gather(*(dispatcher.update(f"CA{i:032d}", '<Response/>') for i in range(10)))
+    await dispatcher.aclose()
+    assert results == [SENT] * 10
+    assert server.max_in_flight <= 3, f"max in flight {server.max_in_flight}"
+    return dict(dispatcher.stats(), max_in_flight=server.max_in_flight)
+
+
+async def scenario_rate_limit(server):
+    dispatcher = _dispatcher(server, rate_per_second=20)
+    started = time.monotonic()
+    await asyncio.gather(*(dispatcher.update(f"CA{i:032d}", '<Response/>') for i in range(30)))
+    elapsed = time.monotonic() - started
+    await dispatcher.aclose()
+    # バースト20件の後は秒間20件 → 残り10件に約0.5秒
+    assert elapsed >= 0.45, f"rate limit not applied ({elapsed:.2f}s)"
+    return dict(dispatcher.stats(), elapsed_s=round(elapsed, 2))
+
+
+async def scenario_connection_error(server):
+    dispatcher = CallUpdateDispatcher(ACCOUNT_SID, AUTH_TOKEN, base_url=f"http://127.0.0.1:{_free_port()}",
+                                      max_attempts=2, timeout_seconds=1)
+    try:
+        await dispatcher.update('CA' + '6' * 32, '<Response/>')
+        raise AssertionError('expected ConnectionError')
+    except ConnectionError:
+        pass
+    await dispatcher.aclose()
+    assert dispatcher.stats()['failed'] == 1
+    return dispatcher.stats()
+
+
+SCENARIOS = [
+    scenario_basic, scenario_retry_after_429, scenario_retry_5xx, scenario_give_up_5xx,
+    scenario_no_retry_4xx, scenario_coalesce, scenario_concurrency_limit, scenario_rate_limit,
+    scenario_connection_error,
+]
+
+
+async def run(verbose: bool) -> int:
+    server = FakeTwilioServer()
+    await server.start()
+    failures = 0
+    try:
+        for scenario in SCENARIOS:
+            server.reset()
+            name = scenario.__name__.removeprefix('scenario_')
+            try:
+                stats = await scenario(server)
+                print(f"PASS {name}" + (f" {stats}" if verbose else ''))
+            except AssertionError as e:
+                failures += 1
+                print(f"FAIL {name}: {e}")
+    finally:
+        await server.stop()
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check CallUpdateDispatcher against a local fake Twilio REST server')
+    parser.add_argument('--verbose', action='store_true', help='シナリオごとの統計を表示')
+    args = parser.parse_args()
+    failures = asyncio.run(run(args.verbose))
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+音声イベントのキャプチャ→再生の往復検証（シミュレーター）
+
+イベントキャプチャを有効にして simulate_call_flow.py で通話を流し、そのログを export_voice_captures.py で
+キャプチャファイルにして、replay_voice_events.py で遅延ゼロ・記録どおりの両方で再生する。
+シミュレーターの偽クライアントも本番と同じ記録用ラッパーを通すので、記録した出力と再生した出力は一致するはず。
+push・poll・回答ストリーミングの各モードで、いずれかの再生に差分・エラーがあると終了コード1。
+
+使い方:
+    python tools/check_voice_replay_roundtrip.py
+    python tools/check_voice_replay_roundtrip.py --calls 10 --mode poll
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+TOOLS = os.path.dirname(os.path.abspath(__file__))
+MODES = {
+    'push': [],
+    'poll': ['--mode', 'poll'],
+    'streaming': ['--streaming'],
+}
+LATENCIES = ('zero', 'recorded')
+
+
+def _run(args, env=None, stdout=None):
+    return subprocess.run([sys.executable, *args], env=env, stdout=stdout, stderr=subprocess.STDOUT, text=True,
+                          cwd=os.path.dirname(TOOLS))
+
+
+def check_mode(mode: str, calls: int, seed: int, workdir: str, verbose: bool) -> bool:
+    """1つのモードでキャプチャ→書き出し→再生（遅延ゼロ・記録どおり）を実行し、すべて一致すれば True"""
+    log_path = os.path.join(workdir, f'{mode}.log')
+    capture_path = os.path.join(workdir, f'{mode}.vcap.gz')
+    env = {**os.environ, 'EVENT_CAPTURE_ENABLED': 'true', 'EVENT_CAPTURE_REDACTION_KEY': 'roundtrip-check'}
+    with open(log_path, 'w', encoding='utf-8') as log:
+        simulated = _run([os.path.join(TOOLS, 'simulate_call_flow.py'), '--calls', str(calls), '--seed', str(seed),
+                          *MODES[mode]], env=env, stdout=log)
+    if simulated.returncode != 0:
+        print(f"{mode}: simulate_call_flow.py exited {simulated.returncode} (log: {log_path})")
+        return False
+    exported = _run([os.path.join(TOOLS, 'export_voice_captures.py'), log_path, '-o', capture_path],
+                    stdout=subprocess.PIPE)
+    if exported.returncode != 0:
+        print(f"{mode}: export_voice_captures.py exited {exported.returncode}\n{exported.stdout}")
+        return False
+
+    ok = True
+    for latency in LATENCIES:
+        replayed = _run([os.path.join(TOOLS, 'replay_voice_events.py'), capture_path, '--latency', latency],
+                        stdout=subprocess.PIPE)
+        passed = replayed.returncode == 0
+        ok = ok and passed
+        print(f"{mode:<10} latency={latency:<9} {'ok' if passed else 'FAILED'}")
+        if verbose or not passed:
+            print(replayed.stdout)
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that simulated voice captures replay without differences')
+    parser.add_argument('--calls', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--mode', choices=sorted(MODES), action='append', help='検証するモード（既定はすべて）')
+    parser.add_argument('--keep', action='store_true', help='ログとキャプチャファイルを残す')
+    parser.add_argument('--verbose', action='store_true', help='成功した再生の集計も表示')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='voice-roundtrip-')
+    failed = [mode for mode in (args.mode or list(MODES))
+              if not check_mode(mode, args.calls, args.seed, workdir, args.verbose)]
+    if args.keep or failed:
+        print(f"files: {workdir}")
+    else:
+        for name in os.listdir(workdir):
+            os.remove(os.path.join(workdir, name))
+        os.rmdir(workdir)
+    if failed:
+        print(f"round trip failed: {', '.join(failed)}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
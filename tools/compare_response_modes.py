@@ -0,0 +1,89 @@
+"""
+AI 応答の届け方（push: calls.update / poll: 結果ストア + Redirect）の発信者側レイテンシ比較
+
+tools/simulate_call_flow.py と同じシミュレーター・台本・遅延分布で、同じ発信者（同じ seed）を
+push モードと poll モード（--poll-intervals の間隔ごと）で通し、次を並べる。
+- turn.time_to_ack: 発話の Webhook を送ってから最初の案内が届くまで
+- turn.time_to_answer: 発話の Webhook を送ってから回答を含む TwiML が届くまで
+- turn.time_to_operator: 緊急の発話からオペレーター転送の TwiML が届くまで
+- calls.update（Twilio REST）とポーリングの Webhook・結果ストアの読み書きの回数
+
+poll モードの time_to_answer は回答の保存後、次のポーリング（最大 POLL_INTERVAL_SECONDS 後）で届く。
+ハンドラの読み込み・偽クライアント・遅延注入は tools/call_simulator を使う（単体では動かない。
+シミュレーターのない版では push / poll の比較はできない）。
+Pause はシミュレーションでも実時間で動くため、通話数を増やすと時間がかかる。
+
+使い方:
+    python tools/compare_response_modes.py
+    python tools/compare_response_modes.py --calls 100 --poll-intervals 1,2,3 --openai-answer "lognormal:4000:0.5"
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from call_simulator import CallFlowSimulation, LatencyModel, SimulationConfig, load_handlers  # noqa: E402
+from simulate_call_flow import DEFAULT_SCENARIOS, LATENCY_OPTIONS, build_scripts  # noqa: E402
+
+LATENCY_STAGES = ('turn.time_to_ack', 'turn.time_to_answer', 'turn.time_to_operator')
+COUNT_STAGES = ('twilio.update', 'webhook.poll_result', 'dynamodb.result_put', 'dynamodb.result_get')
+
+
+def run_mode(handlers, latencies, args, mode: str, poll_interval: int = None):
+    """1つのモードでシミュレーションを実行し、ステージの集計と結果を返す"""
+    if poll_interval is not None:
+        handlers.immediate.POLL_INTERVAL_SECONDS = poll_interval
+    config = SimulationConfig(latencies, response_mode=mode, streaming=args.streaming and mode == 'push',
+                              playback_scale=args.playback_scale, max_call_seconds=args.max_call_seconds,
+                              seed=args.seed)
+    scripts = build_scripts(DEFAULT_SCENARIOS, args.calls, args.seed)
+    arrival_interval_ms = 1000 / args.arrival_rate if args.arrival_rate > 0 else 0.0
+    recorder = asyncio.run(CallFlowSimulation(handlers, config).run(scripts, args.concurrency, arrival_interval_ms))
+    return recorder.summary(), recorder.outcomes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare caller-side latency of push (calls.update) and poll response modes')
+    parser.add_argument('--calls', type=int, default=40)
+    parser.add_argument('--concurrency', type=int, default=40, help='同時通話数の上限')
+    parser.add_argument('--arrival-rate', type=float, default=10.0, help='1秒あたりの着信数（0で一斉に着信）')
+    parser.add_argument('--poll-intervals', default='2', help='poll モードの POLL_INTERVAL_SECONDS（カンマ区切り）')
+    parser.add_argument('--streaming', action='store_true', help='push モードで ANSWER_STREAMING_ENABLED')
+    parser.add_argument('--playback-scale', type=float, default=0.1, help='Say の再生と考える時間の縮尺')
+    parser.add_argument('--max-call-seconds', type=float, default=300.0, help='これを超えた通話は stuck')
+    parser.add_argument('--seed', type=int, default=7)
+    for option, _, default, help_text in LATENCY_OPTIONS:
+        parser.add_argument(f'--{option}', default=default, help=help_text)
+    args = parser.parse_args()
+
+    try:
+        latencies = {key: LatencyModel.parse(getattr(args, option.replace('-', '_')))
+                     for option, key, _, _ in LATENCY_OPTIONS}
+        poll_intervals = [int(value) for value in args.poll_intervals.split(',') if value.strip()]
+    except ValueError as e:
+        parser.error(str(e))
+
+    handlers = load_handlers()
+    runs = [('push' + (' (streaming)' if args.streaming else ''), run_mode(handlers, latencies, args, 'push'))]
+    for interval in poll_intervals:
+        runs.append((f'poll {interval}s', run_mode(handlers, latencies, args, 'poll', interval)))
+
+    print(f"calls={args.calls} concurrency={args.concurrency} arrival_rate={args.arrival_rate} "
+          f"playback_scale={args.playback_scale}")
+    print(f"{'mode':<18}{'stage':<24}{'count':>7}{'p50_ms':>9}{'p95_ms':>9}{'p99_ms':>9}")
+    for label, (summary, _) in runs:
+        for stage in LATENCY_STAGES:
+            row = summary.get(stage)
+            if row and row['count']:
+                print(f"{label:<18}{stage:<24}{row['count']:>7}{row['p50']:>9.0f}{row['p95']:>9.0f}{row['p99']:>9.0f}")
+    print()
+    print(f"{'mode':<18}" + ''.join(f"{stage:>22}" for stage in COUNT_STAGES) + '  outcomes')
+    for label, (summary, outcomes) in runs:
+        counts = ''.join(f"{summary.get(stage, {}).get('count', 0):>22}" for stage in COUNT_STAGES)
+        print(f"{label:<18}{counts}  " + ', '.join(f'{name}={count}' for name, count in outcomes.most_common()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+"""
+モデル・推論量ルーティングの評価
+
+- 既定（オフライン）: ラベル付き質問に model_routing のルート選択を適用し、質問ごとのルートと
+  ルートの内訳を表示する（回答: retrieval_labels.jsonl と facility_questions.jsonl、
+  分類: urgency_labels.jsonl のうちルールで即判定されない発話）
+- --record PATH / --replay PATH: 固定の設定（ルーティング無効）とルーティング有効のそれぞれで
+  回答生成（retrieval_labels.jsonl の正誤ラベル）と緊急度分類（urgency_labels.jsonl のラベル）を実行し、
+  正答率・p50/p95 レイテンシ・トークン数を比較する。記録・再生は benchmark_retrieval_settings.py と同じ形式
+  （--record は OPENAI_API_KEY と OPENAI_VECTOR_STORE_ID_FACILITY が必要、--replay はオフラインで決定的）
+
+SLO による格下げはコンテナ内の直近のレイテンシで変わるため、正答率の評価では無効にしている。
+かわりに既定（オフライン）で、偽の時計と決まったレイテンシで格下げからの回復を確認する:
+standard ルートが --overload-seconds の間 SLO を超え、その後戻ったときに standard へ送られる割合の推移を、
+時間で捨てる窓 + probe（現在の設定）と、件数の窓だけ（probe なし）で比べる。
+
+使い方:
+    python tools/evaluate_model_routing.py
+    python tools/evaluate_model_routing.py --record /tmp/routing.json --repeats 3
+    python tools/evaluate_model_routing.py --replay /tmp/routing.json --report /tmp/routing_report.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from collections import Counter
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(__file__))
+os.environ.setdefault('MODEL_ROUTING_ENABLED', 'false')
+
+import openai  # noqa: E402
+
+import benchmark_retrieval_settings as bench  # noqa: E402  (sys.path と環境変数もここで設定される)
+import classification_service  # noqa: E402
+import model_routing  # noqa: E402
+import vector_search  # noqa: E402
+from urgency_rules import pre_classify  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+ANSWER_LABELS = os.path.join(FIXTURES, 'retrieval_labels.jsonl')
+FACILITY_QUESTIONS = os.path.join(FIXTURES, 'facility_questions.jsonl')
+URGENCY_LABELS = os.path.join(FIXTURES, 'urgency_labels.jsonl')
+ARMS = ('fixed', 'routed')
+# ルーティングで standard になる質問（SLO による格下げの確認用）
+STANDARD_QUESTION = ("I would like some extra towels please", 'en-US')
+
+
+def _router() -> model_routing.ModelRouter:
+    return model_routing.ModelRouter(answer_slo_ms=float('inf'), classify_slo_ms=float('inf'))
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def simulate_slo_recovery(args, window_seconds: float, probe_rate: float) -> list:
+    """1秒に1件の standard の質問を流し、区間ごとに standard へ送られた割合を返す"""
+    clock = FakeClock()
+    router = model_routing.ModelRouter(answer_slo_ms=model_routing.ANSWER_SLO_MS, window_seconds=window_seconds,
+                                       probe_rate=probe_rate, clock=clock)
+    text, language = STANDARD_QUESTION
+    buckets = []
+    for second in range(args.recovery_seconds):
+        clock.now = float(second)
+        decision = router.route_answer(text, language)
+        overloaded = second < args.overload_seconds
+        latency_ms = (args.overload_ms if overloaded else args.recovered_ms) if decision.route == 'standard' \
+            else args.fast_ms
+        router.record(decision, latency_ms)
+        if second % args.bucket_seconds == 0:
+            buckets.append(Counter())
+        buckets[-1][decision.route] += 1
+    return [bucket['standard'] / sum(bucket.values()) for bucket in buckets]
+
+
+def show_slo_recovery(args) -> None:
+    text, language = STANDARD_QUESTION
+    assert _router().route_answer(text, language).route == 'standard'
+    print(f"\nSLO recovery: standard p95 {args.overload_ms:.0f}ms for {args.overload_seconds}s, then "
+          f"{args.recovered_ms:.0f}ms (SLO {model_routing.ANSWER_SLO_MS:.0f}ms, 1 request/s); share routed to standard")
+    arms = (
+        (f"window {model_routing.LATENCY_WINDOW_SECONDS:.0f}s + probe {model_routing.PROBE_RATE:.0%}",
+         model_routing.LATENCY_WINDOW_SECONDS, model_routing.PROBE_RATE),
+        ('count window only', float('inf'), 0.0),
+    )
+    header = ''.join(f"{f'{i * args.bucket_seconds}s':>6}"
+                     for i in range(-(-args.recovery_seconds // args.bucket_seconds)))
+    print(f"{'':<26}{header}")
+    for label, window_seconds, probe_rate in arms:
+        shares = simulate_slo_recovery(args, window_seconds, probe_rate)
+        print(f"{label:<26}" + ''.join(f"{share:>6.0%}" for share in shares))
+
+
+def llm_classified(labels: list) -> list:
+    """ルールで即判定されずに分類モデルへ送られる発話"""
+    return [label for label in labels if pre_classify(label['text']) is None]
+
+
+def show_routes(answer_questions: list, classify_messages: list, verbose: bool) -> None:
+    router = _router()
+    for task, items, decide in (
+        ('answer', answer_questions, lambda item: router.route_answer(item['text'], item['language'])),
+        ('classify', classify_messages, lambda item: router.route_classification(item['text'], item['language'])),
+    ):
+        routes = Counter()
+        for item in items:
+            decision = decide(item)
+            routes[decision.route] += 1
+            if verbose:
+                print(f"  {task:<9}{decision.route:<9}{','.join(decision.reasons):<14}"
+                      f"len={decision.signals['length']:<4}{item['language']:<7}{item['text']}")
+        share = ' '.join(f"{route}={count}" for route, count in sorted(routes.items()))
+        print(f"{task}: {len(items)} questions -> {share}")
+
+
+def _set_routing(enabled: bool) -> None:
+    vector_search.MODEL_ROUTING_ENABLED = enabled
+    classification_service.MODEL_ROUTING_ENABLED = enabled
+    vector_search.model_router = classification_service.model_router = _router()
+
+
+async def run_classification(client, labels: list, repeats: int, concurrency: int) -> list:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(label: dict, repeat: int) -> dict:
+        async with semaphore:
+            calls = []
+            bench._calls.set(calls)
+            bench._repeat.set(repeat)
+            result = await classification_service.classify_message_urgency(client, label['text'], label['language'])
+        entry = calls[-1] if calls else {}
+        return {
+            'settings': None, 'language': label['language'], 'text': label['text'],
+            'correct': not entry.get('error') and not entry.get('missing') and result['urgency'] == label['label'],
+            'error': bool(entry.get('error')), 'missing': bool(entry.get('missing')),
+            'latency_ms': entry.get('latency_ms'), 'input_tokens': entry.get('input_tokens'),
+            'output_tokens': entry.get('output_tokens'),
+        }
+
+    return await asyncio.gather(*(run_one(label, repeat) for label in labels for repeat in range(repeats)))
+
+
+def compare(client, vector_store_id: str, answer_labels: list, urgency_labels: list,
+            repeats: int, concurrency: int) -> dict:
+    """固定設定とルーティング有効で実行し、タスク・アームごとの集計と結果を返す"""
+    report = {}
+    for arm in ARMS:
+        _set_routing(arm == 'routed')
+        answers = asyncio.run(bench.run_grid(client, vector_store_id, answer_labels, [None], repeats, concurrency))
+        classifications = asyncio.run(run_classification(client, urgency_labels, repeats, concurrency))
+        router = _router()
+        for result in answers:
+            result['route'] = router.route_answer(result['text'], result['language']).route if arm == 'routed' else '-'
+        for result in classifications:
+            result['route'] = (router.route_classification(result['text'], result['language']).route
+                               if arm == 'routed' else '-')
+        for task, results in (('answer', answers), ('classify', classifications)):
+            for result in results:
+                result['language'] = 'all'
+            report[(task, arm)] = {'summary': bench.summarize(results)[0], 'results': results}
+    return report
+
+
+def print_comparison(report: dict) -> None:
+    print(f"{'task':<10}{'arm':<8}{'n':>4}{'acc':>6}{'err':>5}{'p50_ms':>8}{'p95_ms':>8}{'in_tok':>8}{'out_tok':>8}"
+          "  routes")
+    for (task, arm), data in report.items():
+        row = data['summary']
+        routes = Counter(result['route'] for result in data['results'])
+        share = ' '.join(f"{route}={count}" for route, count in sorted(routes.items()) if route != '-')
+        print(f"{task:<10}{arm:<8}{row['n']:>4}{row['accuracy']:>6.0%}{row['errors'] + row['missing']:>5}"
+              f"{row['p50_ms'] or 0:>8.0f}{row['p95_ms'] or 0:>8.0f}{row['mean_input_tokens'] or 0:>8}"
+              f"{row['mean_output_tokens'] or 0:>8}  {share}")
+    for task in ('answer', 'classify'):
+        fixed, routed = report[(task, 'fixed')]['summary'], report[(task, 'routed')]['summary']
+        if fixed['p95_ms'] and routed['p95_ms']:
+            print(f"{task}: p95 {fixed['p95_ms']:.0f} -> {routed['p95_ms']:.0f}ms, "
+                  f"accuracy {fixed['accuracy']:.0%} -> {routed['accuracy']:.0%}")
+    missing = sum(data['summary']['missing'] for data in report.values())
+    if missing:
+        print(f"{missing} requests were not in the recording (labels, routes or instructions differ)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluate model / reasoning-effort routing')
+    parser.add_argument('--labels', default=ANSWER_LABELS)
+    parser.add_argument('--questions', default=FACILITY_QUESTIONS, help='ルートの内訳表示に加える質問')
+    parser.add_argument('--urgency-labels', default=URGENCY_LABELS)
+    parser.add_argument('--repeats', type=int, default=1)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--verbose', action='store_true', help='質問ごとのルートを表示')
+    parser.add_argument('--overload-seconds', type=int, default=120, help='standard ルートが SLO を超える時間')
+    parser.add_argument('--recovery-seconds', type=int, default=900, help='格下げからの回復を確認する時間')
+    parser.add_argument('--bucket-seconds', type=int, default=60)
+    parser.add_argument('--overload-ms', type=float, default=6000.0)
+    parser.add_argument('--recovered-ms', type=float, default=2500.0)
+    parser.add_argument('--fast-ms', type=float, default=1500.0)
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--record', metavar='PATH', help='API を呼んで応答を記録する')
+    mode.add_argument('--replay', metavar='PATH', help='記録した応答を再生する（オフライン）')
+    parser.add_argument('--report', metavar='PATH', help='比較結果を JSON で保存する')
+    args = parser.parse_args()
+
+    answer_labels = bench.load_labels(args.labels)
+    urgency_labels = llm_classified(bench.load_labels(args.urgency_labels))
+    show_routes(answer_labels + bench.load_labels(args.questions), urgency_labels, args.verbose)
+    if not (args.record or args.replay):
+        show_slo_recovery(args)
+        return
+
+    if args.replay:
+        cassette = bench.Cassette.load(args.replay)
+        responses = bench.BenchmarkResponses(cassette=cassette, replay=True)
+        vector_store_id = cassette.vector_store_id
+    else:
+        vector_store_id = os.environ.get('OPENAI_VECTOR_STORE_ID_FACILITY')
+        if not vector_store_id or not os.environ.get('OPENAI_API_KEY'):
+            print("OPENAI_API_KEY and OPENAI_VECTOR_STORE_ID_FACILITY are required (or use --replay)", file=sys.stderr)
+            sys.exit(2)
+        cassette = bench.Cassette(args.record, vector_store_id)
+        responses = bench.BenchmarkResponses(live=openai.AsyncOpenAI().responses, cassette=cassette)
+    client = SimpleNamespace(responses=responses)
+
+    report = compare(client, vector_store_id, answer_labels, urgency_labels, args.repeats, args.concurrency)
+    if args.record:
+        cassette.save()
+    print_comparison(report)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({f"{task}/{arm}": data for (task, arm), data in report.items()}, f, ensure_ascii=False, indent=1)
+
+
+if __name__ == '__main__':
+    main()
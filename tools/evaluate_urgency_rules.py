@@ -0,0 +1,103 @@
+"""
+緊急度プレ分類ルールの適合率・再現率レポート
+
+ラベル付きフィクスチャ（JSON Lines: {"text", "label", "language"[, "lookalike"]}）に
+urgency_rules.pre_classify を適用し、urgent / operator_request ごとに
+適合率（ルールが返した判定のうち正しい割合）と再現率（そのラベルのうちルールで即判定できた割合）を出す。
+"lookalike": true の行はルールの語を含む一般の質問（「fire show」「倒れたゴミ箱」「担当者の名前」など）で、
+これらの誤判定（fp）は別に集計する。
+ルールが判定しなかった発話はLLMにフォールバックするため、再現率の不足は遅延の問題、
+適合率の不足は誤転送の問題になる。語彙を調整するときは適合率を優先すること。
+
+使い方:
+    python tools/evaluate_urgency_rules.py
+    python tools/evaluate_urgency_rules.py --fixtures my_labels.jsonl --verbose
+    python tools/evaluate_urgency_rules.py --min-precision 1.0   # CI 用（下回ると終了コード1）
+"""
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, os.path.join(ROOT, 'lambda_functions', 'ai_processing'))
+
+from urgency_rules import pre_classify  # noqa: E402
+
+DEFAULT_FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'urgency_labels.jsonl')
+RULE_LABELS = ('urgent', 'operator_request')
+
+
+def _load_fixtures(path: str):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def evaluate(samples) -> dict:
+    """ラベルごとの tp/fp/fn と、誤判定・見逃しの一覧を返す"""
+    counts = {label: Counter() for label in RULE_LABELS}
+    lookalikes = Counter()
+    errors = []
+    for sample in samples:
+        result = pre_classify(sample['text'])
+        predicted = result['urgency'] if result else None
+        expected = sample['label']
+        if sample.get('lookalike'):
+            lookalikes['total'] += 1
+            lookalikes['fp'] += predicted is not None and predicted != expected
+        for label in RULE_LABELS:
+            if predicted == label and expected == label:
+                counts[label]['tp'] += 1
+            elif predicted == label:
+                counts[label]['fp'] += 1
+            elif expected == label:
+                counts[label]['fn'] += 1
+        if predicted is not None and predicted != expected:
+            errors.append(('FALSE_POSITIVE', sample, result))
+        elif predicted is None and expected in RULE_LABELS:
+            errors.append(('FALLBACK', sample, result))
+    return {'counts': counts, 'lookalikes': lookalikes, 'errors': errors, 'total': len(samples)}
+
+
+def _ratio(numerator: int, denominator: int) -> float:
+    return numerator / denominator if denominator else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precision/recall of the local urgency pre-classifier')
+    parser.add_argument('--fixtures', default=DEFAULT_FIXTURES)
+    parser.add_argument('--min-precision', type=float, default=None,
+                        help='いずれかのラベルの適合率がこれを下回ったら終了コード1')
+    parser.add_argument('--verbose', action='store_true', help='LLMにフォールバックした発話も表示')
+    args = parser.parse_args()
+
+    report = evaluate(_load_fixtures(args.fixtures))
+    decided = sum(c['tp'] + c['fp'] for c in report['counts'].values())
+    print(f"samples={report['total']} decided_by_rules={decided} "
+          f"({_ratio(decided, report['total']):.0%}, the rest falls back to the LLM)")
+    print(f"{'label':<18}{'precision':>10}{'recall':>10}{'tp':>5}{'fp':>5}{'fn':>5}")
+    failed = False
+    for label, c in report['counts'].items():
+        precision = _ratio(c['tp'], c['tp'] + c['fp'])
+        recall = _ratio(c['tp'], c['tp'] + c['fn'])
+        print(f"{label:<18}{precision:>10.2f}{recall:>10.2f}{c['tp']:>5}{c['fp']:>5}{c['fn']:>5}")
+        if args.min_precision is not None and precision < args.min_precision:
+            failed = True
+
+    lookalikes = report['lookalikes']
+    print(f"lookalike negatives: {lookalikes['total']} samples, fp={lookalikes['fp']}")
+
+    for kind, sample, result in report['errors']:
+        if kind == 'FALLBACK' and not args.verbose:
+            continue
+        matched = result['matched'] if result else []
+        marker = ' (lookalike)' if sample.get('lookalike') else ''
+        print(f"{kind:<15} [{sample['label']}]{marker} {sample['text']} {matched}")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
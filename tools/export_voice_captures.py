@@ -0,0 +1,100 @@
+"""
+音声イベントのキャプチャを CloudWatch Logs から取り出してキャプチャファイルにする
+
+両 Lambda に EVENT_CAPTURE_ENABLED=true（必要なら EVENT_CAPTURE_SAMPLE_RATE）を設定すると、
+呼び出しごとに仮名化済みのレコードが1行のJSONでログに出る（layers/twilio_functions/event_capture.py）。
+このツールはロググループから filter_log_events で、またはログのファイル（エクスポート・aws logs tail の出力）から
+レコードを集め、呼び出し時刻の順に gzip の JSON Lines（tools/voice_replay/capture_file.py）で保存する。
+
+使い方:
+    python tools/export_voice_captures.py --log-group /aws/lambda/obw-immediate-response-function \\
+        --log-group /aws/lambda/obw-ai-processing-function --since 6h -o captures.vcap.gz
+    python tools/export_voice_captures.py exported.log -o captures.vcap.gz --max-calls 50
+"""
+import argparse
+import os
+import sys
+import time
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from voice_replay.capture_file import CAPTURE_MARKER, extract_records, write_captures  # noqa: E402
+
+_UNITS = {'m': 60, 'h': 3600, 'd': 86400}
+
+
+def _parse_since(text: str) -> int:
+    """"6h" "30m" "2d" → 開始時刻（エポックミリ秒）"""
+    unit = text[-1]
+    if unit not in _UNITS:
+        raise ValueError(f"invalid --since: {text!r} (use e.g. 30m, 6h, 2d)")
+    return int((time.time() - float(text[:-1]) * _UNITS[unit]) * 1000)
+
+
+def _log_group_lines(log_groups, start_ms: int):
+    import boto3
+
+    logs = boto3.client('logs')
+    paginator = logs.get_paginator('filter_log_events')
+    for log_group in log_groups:
+        for page in paginator.paginate(logGroupName=log_group, startTime=start_ms,
+                                       filterPattern=f'{{ $.capture = "{CAPTURE_MARKER}" }}'):
+            for event in page.get('events', []):
+                yield event['message']
+
+
+def _file_lines(paths):
+    for path in paths:
+        with (sys.stdin if path == '-' else open(path, encoding='utf-8')) as f:
+            yield from f
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Collect voice event captures from CloudWatch Logs into a capture file')
+    parser.add_argument('inputs', nargs='*', help='ログのファイル（- で標準入力）')
+    parser.add_argument('--log-group', action='append', default=[], help='CloudWatch Logs のロググループ（複数可）')
+    parser.add_argument('--since', default='1h', help='ロググループから取り出す期間（30m / 6h / 2d）')
+    parser.add_argument('--call-sid', action='append', default=[], help='この通話のレコードだけ取り出す（複数可）')
+    parser.add_argument('--max-calls', type=int, default=0, help='取り出す通話数の上限（0で無制限、古い通話から）')
+    parser.add_argument('-o', '--output', required=True, help='キャプチャファイル（.vcap.gz）')
+    args = parser.parse_args()
+    if not args.inputs and not args.log_group:
+        parser.error('specify log files or --log-group')
+
+    lines = []
+    if args.log_group:
+        try:
+            lines.append(_log_group_lines(args.log_group, _parse_since(args.since)))
+        except ValueError as e:
+            parser.error(str(e))
+    if args.inputs:
+        lines.append(_file_lines(args.inputs))
+
+    calls = OrderedDict()
+    raw_bytes = 0
+    for source in lines:
+        for record in extract_records(source):
+            if args.call_sid and record.get('call_sid') not in args.call_sid:
+                continue
+            calls.setdefault(record.get('call_sid'), []).append(record)
+            raw_bytes += len(str(record))
+    groups = sorted(calls.values(), key=lambda group: min(record['invoked_at'] for record in group))
+    if args.max_calls:
+        groups = groups[:args.max_calls]
+    records = [record for group in groups for record in group]
+    if not records:
+        print('no captures found', file=sys.stderr)
+        sys.exit(1)
+
+    written = write_captures(args.output, records, source=', '.join(args.log_group + args.inputs))
+    by_handler = {}
+    for record in records:
+        by_handler[record['handler']] = by_handler.get(record['handler'], 0) + 1
+    print(f"{len(records)} records from {len(groups)} calls "
+          f"({', '.join(f'{name}={count}' for name, count in sorted(by_handler.items()))}) -> {args.output} "
+          f"({written / 1024:.1f} KiB, ~{raw_bytes / max(written, 1):.0f}x smaller than the log lines)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+記録した本番の音声イベントを現在のコードで再生し、TwiML と CPU 時間を記録と比較する
+
+tools/export_voice_captures.py で作ったキャプチャファイルのレコードを呼び出し時刻の順に、
+ImmediateResponse Lambda の lambda_handler と AI Processing Lambda の lambda_handler_async で実行する。
+外部I/O（DynamoDB・キャッシュ・OpenAI・Twilio・Lambda 呼び出し）は記録から返す（tools/voice_replay/replayer.py）。
+AWS・OpenAI・Twilio へはアクセスしない。
+
+- --latency recorded: 各I/Oを記録時の所要時間だけ待つ（既定。出力の列をすべて比較）
+- --latency zero: 待たない（時間に依存する保留中の calls.update は比較から外し、戻り値と最後の TwiML だけ比較）
+- 機能フラグ（*_ENABLED / *_MODE）は記録時の値を使う（実行環境で設定したものが優先）
+- --baseline に前回の --report を渡すと、ハンドラごとの CPU 時間の p95 の悪化を検出する
+
+出力の差分・再生エラー・CPU 時間の悪化があれば終了コード1（デプロイ前の確認用）。
+
+使い方:
+    python tools/replay_voice_events.py captures.vcap.gz
+    python tools/replay_voice_events.py captures.vcap.gz --latency zero --repeat 3 --report /tmp/replay.json
+    python tools/replay_voice_events.py captures.vcap.gz --latency zero --baseline /tmp/replay.json --max-cpu-regression 0.2
+"""
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from call_simulator import load_handlers  # noqa: E402
+from voice_replay.capture_file import read_captures  # noqa: E402
+from voice_replay.replayer import replay_environment  # noqa: E402
+
+
+def _configs_differ(records) -> bool:
+    configs = {json.dumps([record.get('config') or {}, record.get('session_tokens', True)], sort_keys=True)
+               for record in records}
+    return len(configs) > 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay captured voice events against the current handlers and diff the TwiML')
+    parser.add_argument('capture', help='キャプチャファイル（.vcap.gz）')
+    parser.add_argument('--latency', choices=('recorded', 'zero'), default='recorded')
+    parser.add_argument('--compare', choices=('all', 'final'), help='既定は recorded なら all、zero なら final')
+    parser.add_argument('--handler', choices=('immediate_response', 'ai_processing'), help='このハンドラのレコードだけ再生')
+    parser.add_argument('--call-sid', action='append', default=[], help='この通話のレコードだけ再生（複数可）')
+    parser.add_argument('--repeat', type=int, default=1, help='CPU 時間は N 回再生した最小値を使う')
+    parser.add_argument('--show-diffs', type=int, default=5, help='表示する差分の件数')
+    parser.add_argument('--report', help='結果（集計とレコードごとの差分）を JSON で保存')
+    parser.add_argument('--baseline', help='前回の --report（CPU 時間の比較用）')
+    parser.add_argument('--max-cpu-regression', type=float, default=0.25, help='CPU 時間の p95 の許容悪化率')
+    args = parser.parse_args()
+    compare = args.compare or ('all' if args.latency == 'recorded' else 'final')
+
+    header, records = read_captures(args.capture)
+    records = [record for record in records
+               if (not args.handler or record['handler'] == args.handler)
+               and (not args.call_sid or record.get('call_sid') in args.call_sid)]
+    if not records:
+        print('no records to replay', file=sys.stderr)
+        sys.exit(1)
+    if _configs_differ(records):
+        print('warning: records were captured with different feature flags; using the first record\'s', file=sys.stderr)
+
+    first = records[0]
+    handlers = load_handlers(replay_environment(first.get('config') or {}, first.get('session_tokens', True)))
+    from voice_replay.diff import compare_record, cpu_regressions, format_summary, summarize
+    from voice_replay.replayer import Replayer
+
+    replayer = Replayer(handlers, args.latency)
+    results = []
+    for record in records:
+        replayed = replayer.replay(record)
+        for _ in range(args.repeat - 1):
+            replayed['cpu_ms'] = min(replayed['cpu_ms'], replayer.replay(record)['cpu_ms'])
+        results.append(compare_record(record, replayed, compare))
+
+    summary = summarize(results)
+    print(f"{args.capture}: {len(records)} records (captured {header.get('created_at')}), "
+          f"latency={args.latency} compare={compare}")
+    print(format_summary(summary))
+    divergences = Counter(item for result in results for item in result['divergences'])
+    if divergences:
+        print('divergences from the recording: ' + ', '.join(f'{name}={count}' for name, count in divergences.most_common()))
+
+    shown = 0
+    for result in results:
+        if result['status'] == 'same' or shown >= args.show_diffs:
+            continue
+        shown += 1
+        print(f"\n--- {result['handler']} {result['call_sid']} @{result['invoked_at']} [{result['status']}]")
+        if result['error']:
+            print(result['error'])
+        print('\n'.join(result['diff']))
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = cpu_regressions(summary, json.load(f)['summary'], args.max_cpu_regression)
+        for regression in regressions:
+            print(f"CPU regression: {regression}")
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({'capture': args.capture, 'latency': args.latency, 'compare': compare, 'summary': summary,
+                       'results': results}, f, ensure_ascii=False, indent=1)
+
+    failed = any(row['changed'] or row['errors'] for row in summary.values()) or regressions
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+ターンの結果を SQLite に取り込み、無音時間・オペレーター転送までの時間・通話あたりのコストを集計する
+
+AI Processing Lambda に CALL_ANALYTICS_ENABLED=true を設定すると、ターンごとに1行のJSONがログに出る
+（lambda_functions/ai_processing/call_analytics.py）。
+
+- ingest: ロググループ（filter_log_events）またはログのファイルからレコードを取り出して SQLite に追記する
+  （取り込み済みのターンは飛ばすので、期間を重ねて何度実行してもよい）
+- report: 期間（--from / --to、または --last-weekend）のターンを集計する。時刻・時間帯は --utc-offset の時刻
+  （既定は日本時間）。コストは OpenAI のトークン数 × tools/fixtures/openai_prices.json の単価（--prices で上書き）
+
+使い方:
+    python tools/report_call_latency.py ingest --db voice_turns.sqlite \\
+        --log-group /aws/lambda/obw-ai-processing-function --since 2d
+    python tools/report_call_latency.py report --db voice_turns.sqlite --last-weekend
+    python tools/report_call_latency.py report --db voice_turns.sqlite --from 2026-10-01 --to 2026-10-08 --json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from turn_analytics.report import format_report, last_weekend, load_prices, report_data  # noqa: E402
+from turn_analytics.store import ANALYTICS_MARKER, connect, extract_turns, ingest, load_turns  # noqa: E402
+
+DEFAULT_PRICES = os.path.join(os.path.dirname(__file__), 'fixtures', 'openai_prices.json')
+_UNITS = {'m': 60, 'h': 3600, 'd': 86400}
+
+
+def _parse_since(text: str) -> int:
+    """"6h" "30m" "2d" → 開始時刻（エポックミリ秒）"""
+    unit = text[-1]
+    if unit not in _UNITS:
+        raise ValueError(f"invalid --since: {text!r} (use e.g. 30m, 6h, 2d)")
+    return int((time.time() - float(text[:-1]) * _UNITS[unit]) * 1000)
+
+
+def _log_group_lines(log_groups, start_ms: int):
+    import boto3
+
+    logs = boto3.client('logs')
+    paginator = logs.get_paginator('filter_log_events')
+    for log_group in log_groups:
+        for page in paginator.paginate(logGroupName=log_group, startTime=start_ms,
+                                       filterPattern=f'{{ $.analytics = "{ANALYTICS_MARKER}" }}'):
+            for event in page.get('events', []):
+                yield event['message']
+
+
+def _file_lines(paths):
+    for path in paths:
+        with (sys.stdin if path == '-' else open(path, encoding='utf-8')) as f:
+            yield from f
+
+
+def _parse_time(text: str, tz: timezone) -> datetime:
+    """"2026-10-10" または "2026-10-10T18:00"（--utc-offset の時刻）"""
+    value = datetime.fromisoformat(text)
+    return value if value.tzinfo else value.replace(tzinfo=tz)
+
+
+def run_ingest(args, parser) -> None:
+    if not args.inputs and not args.log_group:
+        parser.error('specify log files or --log-group')
+    sources = []
+    if args.log_group:
+        try:
+            sources.append(_log_group_lines(args.log_group, _parse_since(args.since)))
+        except ValueError as e:
+            parser.error(str(e))
+    if args.inputs:
+        sources.append(_file_lines(args.inputs))
+    conn = connect(args.db)
+    inserted = skipped = 0
+    for source in sources:
+        added, duplicates = ingest(conn, extract_turns(source))
+        inserted += added
+        skipped += duplicates
+    total = conn.execute("SELECT COUNT(*) FROM turns").fetchone()[0]
+    print(f"{inserted} turns added, {skipped} already stored -> {args.db} ({total} turns)")
+
+
+def run_report(args, parser) -> None:
+    tz = timezone(timedelta(hours=args.utc_offset))
+    start = end = None
+    if args.last_weekend:
+        start, end = last_weekend(datetime.now(tz))
+    else:
+        try:
+            start = _parse_time(args.start, tz) if args.start else None
+            end = _parse_time(args.end, tz) if args.end else None
+        except ValueError as e:
+            parser.error(str(e))
+    prices = load_prices(DEFAULT_PRICES)
+    if args.prices:
+        prices.update(load_prices(args.prices))
+
+    turns = load_turns(connect(args.db), start.timestamp() if start else None, end.timestamp() if end else None)
+    if not turns:
+        print('no turns in the period', file=sys.stderr)
+        sys.exit(1)
+    if args.json:
+        print(json.dumps({'from': start.isoformat() if start else None, 'to': end.isoformat() if end else None,
+                          **report_data(turns, prices, tz)}, ensure_ascii=False, indent=1))
+        return
+    period = f"{start.isoformat() if start else '-'} .. {end.isoformat() if end else '-'}"
+    print(f"period {period}")
+    print(format_report(turns, prices, tz))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Store per-turn call outcomes in SQLite and report latency and cost')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    ingest_parser = commands.add_parser('ingest', help='ログからターンの結果を取り込む')
+    ingest_parser.add_argument('inputs', nargs='*', help='ログのファイル（- で標準入力）')
+    ingest_parser.add_argument('--db', required=True, help='SQLite のファイル')
+    ingest_parser.add_argument('--log-group', action='append', default=[], help='CloudWatch Logs のロググループ（複数可）')
+    ingest_parser.add_argument('--since', default='1d', help='ロググループから取り出す期間（30m / 6h / 2d）')
+
+    report_parser = commands.add_parser('report', help='期間のターンを集計する')
+    report_parser.add_argument('--db', required=True, help='SQLite のファイル')
+    report_parser.add_argument('--from', dest='start', help='開始（2026-10-10 / 2026-10-10T18:00）')
+    report_parser.add_argument('--to', dest='end', help='終了（この時刻は含まない）')
+    report_parser.add_argument('--last-weekend', action='store_true', help='直近の終わった週末（土曜 0時〜月曜 0時）')
+    report_parser.add_argument('--utc-offset', type=float, default=9.0, help='期間・時間帯の時差（時間、既定は日本時間）')
+    report_parser.add_argument('--prices', help='単価の JSON（fixtures/openai_prices.json と同じ形式、モデルごとに上書き）')
+    report_parser.add_argument('--json', action='store_true', help='集計を JSON で出力')
+    args = parser.parse_args()
+
+    if args.command == 'ingest':
+        run_ingest(args, ingest_parser)
+    else:
+        run_report(args, report_parser)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""
+回答の文単位ストリーミングのシミュレーション
+
+AI Processing Lambda の lambda_handler_async を、偽の OpenAI クライアント（Responses API の
+ストリーミングイベントを一定間隔で返す）と偽の Twilio クライアント（calls.update を記録する）で実行し、
+従来の一括送信とストリーミング送信で「最初の回答音声までの時間」（time to first audio）を比較する。
+あわせて、部分JSONからの回答テキスト抽出がランダムな分割で json.loads と一致することを確認する。
+
+AWS・OpenAI・Twilio へはアクセスしない。
+
+使い方:
+    python tools/simulate_answer_streaming.py
+    python tools/simulate_answer_streaming.py --chunk-delay-ms 40 --twilio-latency-ms 300 --verbose
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, os.path.join(ROOT, 'lambda_functions', 'ai_processing'))
+sys.path.insert(0, os.path.join(ROOT, 'layers', 'twilio_functions'))
+for name, value in {
+    'AWS_DEFAULT_REGION': 'ap-northeast-1',
+    'TWILIO_ACCOUNT_SID': 'AC' + '0' * 32,
+    'TWILIO_AUTH_TOKEN': 'simulation',
+    'LAMBDA1_FUNCTION_URL': 'https://example.invalid/',
+    'OPENAI_API_KEY': 'sk-simulation',
+    'OPENAI_VECTOR_STORE_ID_FACILITY': 'vs_simulation',
+    'ANSWER_CACHE_ENABLED': 'false',
+    'LOG_LEVEL': 'ERROR',
+}.items():
+    os.environ.setdefault(name, value)
+
+import lambda_handler_ai_processing as handler  # noqa: E402
+from answer_streaming import PartialAnswerExtractor  # noqa: E402
+
+ANSWERS = {
+    'ja-JP': ("チェックアウトは午前10時までにお願いいたします。鍵はキーボックスに戻し、"
+              "ゴミは分別して玄関横のゴミ箱へ入れてください。延長をご希望の場合は前日までにご連絡ください。"),
+    'en-US': ("Check-out is by 10 a.m. on the day of departure. Please return the key to the key box "
+              "and leave the trash sorted by the entrance. If you need a late check-out, let us know a day ahead."),
+}
+QUERIES = {'ja-JP': 'チェックアウトは何時ですか', 'en-US': 'What time is check-out?'}
+
+
+def _message_response(text: str, response_id: str):
+    content = SimpleNamespace(type='output_text', text=text)
+    return SimpleNamespace(id=response_id, output=[SimpleNamespace(type='message', content=[content])])
+
+
+class FakeResponses:
+    """分類は一括、回答生成は stream=True ならイベント列、そうでなければ全文を返す"""
+
+    def __init__(self, answer: str, args):
+        self.answer_json = json.dumps(
+            {'assistant_response_text': answer, 'needs_operator': False, 'end_conversation': False},
+            ensure_ascii=False
+        )
+        self.args = args
+
+    def _chunks(self):
+        size = self.args.chunk_chars
+        return [self.answer_json[i:i + size] for i in range(0, len(self.answer_json), size)]
+
+    async def create(self, stream: bool = False, **payload):
+        if payload['text']['format']['name'] == 'urgency_classification':
+            await asyncio.sleep(self.args.classify_delay_ms / 1000)
+            return _message_response('{"urgency": "general", "reasoning": "simulation"}', 'resp_classify')
+        await asyncio.sleep(self.args.first_token_delay_ms / 1000)
+        if stream:
+            return self._events()
+        await asyncio.sleep(len(self._chunks()) * self.args.chunk_delay_ms / 1000)
+        return _message_response(self.answer_json, 'resp_answer')
+
+    async def _events(self):
+        for chunk in self._chunks():
+            await asyncio.sleep(self.args.chunk_delay_ms / 1000)
+            yield SimpleNamespace(type='response.output_text.delta', delta=chunk)
+        yield SimpleNamespace(type='response.completed', response=_message_response(self.answer_json, 'resp_answer'))
+
+
+class FakeTwilioClient:
+    """calls(sid).update(twiml=...) の呼び出し時刻と内容を記録"""
+
+    def __init__(self, latency_ms: float):
+        self.latency_ms = latency_ms
+        self.updates = []
+        self.started_at = time.monotonic()
+
+    def calls(self, _call_sid):
+        return SimpleNamespace(update=self._update)
+
+    def _update(self, twiml: str):
+        time.sleep(self.latency_ms / 1000)
+        self.updates.append((time.monotonic() - self.started_at, twiml))
+
+
+def _first_audio_seconds(updates, answer: str):
+    """回答の先頭部分を含む最初の更新の時刻"""
+    head = answer[:6]
+    return next((at for at, twiml in updates if head in twiml), None)
+
+
+def run_call(language: str, streaming: bool, args) -> dict:
+    answer = ANSWERS[language]
+    twilio = FakeTwilioClient(args.twilio_latency_ms)
+    handler.twilio_client = twilio
+    handler.call_dispatcher = None  # 偽クライアントの calls.update を使う
+    handler.openai_async_client = SimpleNamespace(responses=FakeResponses(answer, args))
+    handler.ANSWER_STREAMING_ENABLED = streaming
+    event = {'speech_result': QUERIES[language], 'call_sid': 'CA' + '1' * 32, 'language': language}
+    result = asyncio.run(handler.lambda_handler_async(event, None))
+    return {
+        'status': result.get('status'),
+        'first_audio_s': _first_audio_seconds(twilio.updates, answer),
+        'done_s': twilio.updates[-1][0] if twilio.updates else None,
+        'updates': twilio.updates,
+    }
+
+
+def check_extractor(samples: int, seed: int = 0) -> int:
+    """ランダムな分割・エスケープで最終的な抽出結果が json.loads と一致しない件数"""
+    rng = random.Random(seed)
+    texts = list(ANSWERS.values()) + ['引用符 "quoted" とバックスラッシュ \\ と改行\nと絵文字 🏨 を含む回答。']
+    mismatches = 0
+    for _ in range(samples):
+        text = rng.choice(texts)
+        raw = json.dumps({'assistant_response_text': text, 'needs_operator': False, 'end_conversation': False},
+                         ensure_ascii=rng.random() < 0.5)
+        extractor = PartialAnswerExtractor()
+        decoded, pos = '', 0
+        while pos < len(raw):
+            step = rng.randint(1, 12)
+            partial = extractor.feed(raw[pos:pos + step])
+            if not text.startswith(partial) or len(partial) < len(decoded):
+                mismatches += 1
+                break
+            decoded, pos = partial, pos + step
+        else:
+            mismatches += decoded != json.loads(raw)['assistant_response_text']
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare time to first audio with and without answer streaming')
+    parser.add_argument('--classify-delay-ms', type=float, default=600)
+    parser.add_argument('--first-token-delay-ms', type=float, default=1500, help='file_search と推論の待ち時間')
+    parser.add_argument('--chunk-delay-ms', type=float, default=30)
+    parser.add_argument('--chunk-chars', type=int, default=4)
+    parser.add_argument('--twilio-latency-ms', type=float, default=250)
+    parser.add_argument('--fuzz-samples', type=int, default=2000)
+    parser.add_argument('--verbose', action='store_true', help='送信したTwiMLを表示')
+    args = parser.parse_args()
+
+    print(f"extractor mismatches: {check_extractor(args.fuzz_samples)} / {args.fuzz_samples}")
+    print(f"{'language':<10}{'mode':<10}{'status':<11}{'first_audio_s':>14}{'done_s':>9}{'updates':>9}")
+    for language in ANSWERS:
+        for streaming in (False, True):
+            report = run_call(language, streaming, args)
+            mode = 'streamed' if streaming else 'buffered'
+            print(f"{language:<10}{mode:<10}{report['status']:<11}{report['first_audio_s']:>14.2f}"
+                  f"{report['done_s']:>9.2f}{len(report['updates']):>9}")
+            if args.verbose:
+                for at, twiml in report['updates']:
+                    print(f"    {at:6.2f}s {twiml}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+通話フロー全体のシミュレーション（同時通話・外部サービスの遅延注入）
+
+Twilio の通話と発信者を模擬し、ImmediateResponse Lambda と AI Processing Lambda のハンドラを
+1プロセスで実行する（言語選択 → 部屋番号 → 電話番号下4桁 → 質問と回答の繰り返し → 終話）。
+AWS（Lambda / DynamoDB）・OpenAI・Twilio REST は tools/call_simulator の偽物に差し替え、
+それぞれの遅延と失敗を分布で指定する（書式は tools/call_simulator/latency.py）。
+
+結果はステージごとの p50 / p95 / p99 と通話の結果（completed / operator / system_hangup / stuck など）。
+turn.time_to_answer は発話の Webhook を送ってから回答を含む TwiML が届くまでの時間。
+
+ハンドラ内の待ち時間（保留の期限など）と TwiML の Pause は実時間で動く。--playback-scale は Say の再生と
+発信者の考える時間だけを縮める（1.0 で実際の通話と同じ長さ）。AWS・OpenAI・Twilio へはアクセスしない。
+
+台本（--scenarios）は JSON の配列:
+    [{"language": "ja-JP", "weight": 3, "utterances": [
+        {"text": "チェックアウトは何時ですか"},
+        {"text": "部屋で水漏れしています", "urgency": "urgent"},
+        {"text": "以上です", "end_conversation": true}]}]
+
+使い方:
+    python tools/simulate_call_flow.py
+    python tools/simulate_call_flow.py --calls 200 --concurrency 200 --arrival-rate 20 --mode poll
+    python tools/simulate_call_flow.py --openai-answer "lognormal:3000:0.5,tail=0.05:15000" --twilio-update "fixed:300,error=0.02"
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from call_simulator import (CallerScript, CallFlowSimulation, LatencyModel, SimulationConfig,  # noqa: E402
+                            format_summary, load_handlers)
+
+DEFAULT_SCENARIOS = [
+    {'language': 'ja-JP', 'weight': 6, 'utterances': [
+        {'text': 'チェックアウトは何時ですか'},
+        {'text': '近くにコンビニはありますか'},
+        {'text': 'ありがとうございました、以上です', 'end_conversation': True},
+    ]},
+    {'language': 'en-US', 'weight': 3, 'utterances': [
+        {'text': 'What time is check-out?'},
+        {'text': 'Is there a coin laundry nearby?'},
+    ]},
+    {'language': 'ja-JP', 'weight': 1, 'utterances': [
+        {'text': '部屋で水漏れしています', 'urgency': 'urgent'},
+    ]},
+]
+LATENCY_OPTIONS = [
+    # (引数名, 設定のキー, 既定値, 説明)
+    ('twilio-webhook', 'webhook', 'lognormal:120:0.3', 'Twilio から Function URL への Webhook のネットワーク遅延'),
+    ('twilio-update', 'twilio', 'lognormal:250:0.3', 'Twilio REST（calls.update）'),
+    ('lambda-invoke', 'invoke', 'lognormal:40:0.3', 'lambda_client.invoke（Event）の応答'),
+    ('lambda-async-delay', 'async_delay', 'lognormal:150:0.5', '非同期呼び出しが AI Processing Lambda に届くまで'),
+    ('dynamodb', 'dynamodb', 'lognormal:15:0.4', 'DynamoDB（ゲスト認証・結果ストア）'),
+    ('openai-classify', 'classify', 'lognormal:700:0.4', 'OpenAI 緊急度分類'),
+    ('openai-answer', 'answer', 'lognormal:2500:0.4,tail=0.03:8000', 'OpenAI 回答生成'),
+    ('think', 'think', 'uniform:300:1500', '発信者が入力・発話するまでの時間（--playback-scale で縮める）'),
+]
+STAGES = [
+    'turn.time_to_ack', 'turn.time_to_answer', 'turn.time_to_operator', 'turn.time_to_fallback',
+    'webhook.initial', 'webhook.language_selected', 'webhook.room_number_input', 'webhook.phone_last4_input',
+    'webhook.speech', 'webhook.hold', 'webhook.poll_result', 'webhook.operator_choice_dtmf',
+    'lambda.invoke', 'lambda.async_delay', 'ai.invocation', 'dynamodb.query', 'dynamodb.result_put',
+    'dynamodb.result_get', 'openai.classify', 'openai.answer', 'twilio.update', 'twilio.webhook_network',
+    'call.duration',
+]
+
+
+def build_scripts(scenarios, count: int, seed: int):
+    """台本を重みに従って選び、発信者ごとに部屋番号と電話番号下4桁を割り当てる"""
+    from lambda_handler_immediate_response import ALLOWED_ROOMS
+
+    rng = random.Random(seed)
+    rooms = sorted(ALLOWED_ROOMS)
+    weights = [scenario.get('weight', 1) for scenario in scenarios]
+    scripts = []
+    for index in range(count):
+        scenario = rng.choices(scenarios, weights)[0]
+        scripts.append(CallerScript(scenario['language'], rooms[index % len(rooms)], f"{index % 10000:04d}",
+                                    [dict(utterance) for utterance in scenario['utterances']]))
+    return scripts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate concurrent calls through both Lambda handlers with injected latency')
+    parser.add_argument('--calls', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=50, help='同時通話数の上限')
+    parser.add_argument('--arrival-rate', type=float, default=10.0, help='1秒あたりの着信数（0で一斉に着信）')
+    parser.add_argument('--mode', choices=('push', 'poll'), default='push', help='AI_RESPONSE_MODE')
+    parser.add_argument('--streaming', action='store_true', help='ANSWER_STREAMING_ENABLED（push モードのみ）')
+    parser.add_argument('--playback-scale', type=float, default=0.1, help='Say の再生と考える時間の縮尺')
+    parser.add_argument('--max-call-seconds', type=float, default=300.0, help='これを超えた通話は stuck')
+    parser.add_argument('--scenarios', help='台本の JSON ファイル')
+    parser.add_argument('--seed', type=int, default=7)
+    for option, _, default, help_text in LATENCY_OPTIONS:
+        parser.add_argument(f'--{option}', default=default, help=help_text)
+    args = parser.parse_args()
+
+    try:
+        latencies = {key: LatencyModel.parse(getattr(args, option.replace('-', '_')))
+                     for option, key, _, _ in LATENCY_OPTIONS}
+    except ValueError as e:
+        parser.error(str(e))
+    scenarios = DEFAULT_SCENARIOS
+    if args.scenarios:
+        with open(args.scenarios, encoding='utf-8') as f:
+            scenarios = json.load(f)
+
+    handlers = load_handlers()
+    scripts = build_scripts(scenarios, args.calls, args.seed)
+    config = SimulationConfig(latencies, response_mode=args.mode, streaming=args.streaming,
+                              playback_scale=args.playback_scale, max_call_seconds=args.max_call_seconds,
+                              seed=args.seed)
+    simulation = CallFlowSimulation(handlers, config)
+    arrival_interval_ms = 1000 / args.arrival_rate if args.arrival_rate > 0 else 0.0
+    recorder = asyncio.run(simulation.run(scripts, args.concurrency, arrival_interval_ms))
+
+    summary = recorder.summary()
+    print(f"calls={args.calls} concurrency={args.concurrency} mode={args.mode} streaming={args.streaming} "
+          f"playback_scale={args.playback_scale}")
+    print(format_summary(summary, STAGES + sorted(set(summary) - set(STAGES))))
+    print('outcomes: ' + ', '.join(f'{name}={count}' for name, count in recorder.outcomes.most_common()))
+
+
+if __name__ == '__main__':
+    main()
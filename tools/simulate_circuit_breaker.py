@@ -0,0 +1,169 @@
+"""
+OpenAI 障害時のサーキットブレーカーと縮退応答のシミュレーション
+
+AI Processing Lambda の lambda_handler_async を simulate_answer_streaming.py の偽クライアントに
+障害を注入するラッパーをかぶせて連続で実行し、ブレーカーなし・ありで通話ごとの結果と
+最後の TwiML が届くまでの時間をフェーズ別に比較する。
+
+フェーズ（--phases、名前:通話数 のカンマ区切り）:
+    healthy  障害なし
+    outage   --error-after-ms 待ってから接続エラー（タイムアウトに近い障害）
+    slow     通常の応答に --slow-extra-ms の遅延を追加
+    flaky    確率 --flaky-error-prob で outage と同じ接続エラー
+
+質問は定型回答のある質問とない質問を交互に使う（ブレーカーが開いている間、前者は定型回答、後者はオペレーター案内になる）。
+待ち時間とブレーカーの時間窓は --time-scale で縮めて実行する（表示は縮尺前の秒）。AWS・OpenAI・Twilio へはアクセスしない。
+
+使い方:
+    python tools/simulate_circuit_breaker.py
+    python tools/simulate_circuit_breaker.py --phases healthy:10,flaky:40,healthy:20 --flaky-error-prob 0.6
+"""
+import argparse
+import asyncio
+import functools
+import os
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(__file__))
+os.environ.setdefault('LOG_SAMPLE_RATES', 'WARNING=0,ERROR=0')  # 注入した障害のエラーログを出さない
+
+import simulate_answer_streaming as sim  # noqa: E402  (sys.path と環境変数もここで設定される)
+import circuit_breaker  # noqa: E402
+import canned_answers  # noqa: E402
+import openai  # noqa: E402
+from hold_orchestrator import ANSWER_DEADLINE_MS, KEEPALIVE_AFTER_MS, HoldOrchestrator  # noqa: E402
+
+LANGUAGE = 'ja-JP'
+CANNED_QUERY = 'チェックアウトは何時ですか'
+OTHER_QUERY = '近くにおすすめのレストランはありますか'
+CANNED_TEXT = 'チェックアウトの時刻はご予約確認メールに記載しております。'
+UNAVAILABLE_TEXT = sim.handler.lingual_mgr.get_message(LANGUAGE, 'ai_unavailable')
+
+
+class FaultyResponses:
+    """偽の responses.create に障害（接続エラー・遅延）を注入する"""
+
+    def __init__(self, inner, args, rng: random.Random):
+        self.inner = inner
+        self.args = args
+        self.rng = rng
+        self.phase = 'healthy'
+        self.requests = 0
+
+    async def create(self, **payload):
+        self.requests += 1
+        scale = self.args.time_scale
+        fails = self.phase == 'outage' or (self.phase == 'flaky' and self.rng.random() < self.args.flaky_error_prob)
+        if fails:
+            await asyncio.sleep(self.args.error_after_ms / 1000 * scale)
+            raise openai.APIConnectionError(request=None)
+        if self.phase == 'slow':
+            await asyncio.sleep(self.args.slow_extra_ms / 1000 * scale)
+        return await self.inner.create(**payload)
+
+
+def _outcome(twiml: str, answer: str) -> str:
+    if CANNED_TEXT in twiml:
+        return 'canned'
+    if answer[:6] in twiml:
+        return 'answer'
+    if UNAVAILABLE_TEXT in twiml:
+        return 'operator_offer'
+    if 'source=operator_choice_dtmf' in twiml:
+        return 'deadline_fallback'
+    return 'error_hangup' if '<Hangup' in twiml else 'other'
+
+
+def _install_breakers(enabled: bool, args) -> None:
+    scale = args.time_scale
+    circuit_breaker.CIRCUIT_BREAKER_ENABLED = enabled
+    circuit_breaker.circuit_breakers.update({
+        name: circuit_breaker.CircuitBreaker(name, slow_call_ms * scale, window_seconds=args.window_seconds * scale,
+                                             open_seconds=args.open_seconds * scale)
+        for name, slow_call_ms in circuit_breaker.SLOW_CALL_MS.items()
+    })
+
+
+def run_arm(enabled: bool, phases, args) -> list:
+    scale = args.time_scale
+    answer = sim.ANSWERS[LANGUAGE]
+    fake_args = SimpleNamespace(classify_delay_ms=args.classify_ms * scale, first_token_delay_ms=args.answer_ms * scale,
+                                chunk_delay_ms=0, chunk_chars=4096)
+    responses = FaultyResponses(sim.FakeResponses(answer, fake_args), args, random.Random(args.seed))
+    _install_breakers(enabled, args)
+    canned_answers._canned = canned_answers.CannedAnswers({LANGUAGE: [{'questions': [CANNED_QUERY], 'answer': CANNED_TEXT}]})
+    handler = sim.handler
+    handler.call_dispatcher = None
+    handler.openai_async_client = SimpleNamespace(responses=responses)
+    handler.ANSWER_STREAMING_ENABLED = False
+    handler.HoldOrchestrator = functools.partial(HoldOrchestrator, keepalive_after_ms=KEEPALIVE_AFTER_MS * scale,
+                                                 deadline_ms=ANSWER_DEADLINE_MS * scale)
+    calls = []
+    for phase, count in phases:
+        responses.phase = phase
+        for index in range(count):
+            twilio = sim.FakeTwilioClient(args.twilio_latency_ms * scale)
+            handler.twilio_client = twilio
+            query = CANNED_QUERY if index % 2 == 0 else OTHER_QUERY
+            event = {'speech_result': query, 'call_sid': 'CA' + '1' * 32, 'language': LANGUAGE,
+                     'received_at': time.time()}
+            before = responses.requests
+            asyncio.run(handler.lambda_handler_async(event, None))
+            final_at, final_twiml = twilio.updates[-1] if twilio.updates else (None, '')
+            calls.append({'phase': phase, 'outcome': _outcome(final_twiml, answer),
+                          'final_s': final_at / scale if final_at is not None else None,
+                          'openai_requests': responses.requests - before})
+            time.sleep(args.call_interval_s * scale)
+    return calls
+
+
+def _parse_phases(text: str):
+    phases = []
+    for item in text.split(','):
+        name, _, count = item.partition(':')
+        phases.append((name.strip(), int(count or 10)))
+    return phases
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare call outcomes during an OpenAI outage with and without circuit breakers')
+    parser.add_argument('--phases', default='healthy:10,outage:20,slow:10,healthy:20')
+    parser.add_argument('--classify-ms', type=float, default=600)
+    parser.add_argument('--answer-ms', type=float, default=2500)
+    parser.add_argument('--error-after-ms', type=float, default=10000, help='障害時に接続エラーになるまでの時間')
+    parser.add_argument('--slow-extra-ms', type=float, default=16000, help='slow フェーズで追加する遅延')
+    parser.add_argument('--flaky-error-prob', type=float, default=0.5)
+    parser.add_argument('--twilio-latency-ms', type=float, default=250)
+    parser.add_argument('--call-interval-s', type=float, default=3.0, help='通話の間隔')
+    parser.add_argument('--window-seconds', type=float, default=circuit_breaker.WINDOW_SECONDS)
+    parser.add_argument('--open-seconds', type=float, default=circuit_breaker.OPEN_SECONDS)
+    parser.add_argument('--time-scale', type=float, default=0.01, help='待ち時間の縮尺（表示は縮尺前の秒）')
+    parser.add_argument('--seed', type=int, default=3)
+    args = parser.parse_args()
+    phases = _parse_phases(args.phases)
+
+    print(f"{'breaker':<8}{'phase':<9}{'calls':>6}{'mean_final_s':>13}{'max_final_s':>12}{'openai_req':>11}  outcomes")
+    for enabled in (False, True):
+        calls = run_arm(enabled, phases, args)
+        by_phase = defaultdict(list)
+        for call in calls:
+            by_phase[call['phase']].append(call)
+        for phase in dict.fromkeys(name for name, _ in phases):
+            group = by_phase[phase]
+            finals = [call['final_s'] for call in group if call['final_s'] is not None]
+            outcomes = Counter(call['outcome'] for call in group)
+            print(f"{'on' if enabled else 'off':<8}{phase:<9}{len(group):>6}"
+                  f"{(sum(finals) / len(finals) if finals else 0):>13.1f}{max(finals, default=0):>12.1f}"
+                  f"{sum(call['openai_requests'] for call in group):>11}  "
+                  f"{', '.join(f'{name}={count}' for name, count in outcomes.most_common())}")
+        if enabled:
+            for name, stats in circuit_breaker.circuit_stats().items():
+                print(f"  {name}: state={stats['state']} rejected={stats['rejected']} transitions={stats['transitions']}")
+
+
+if __name__ == '__main__':
+    main()
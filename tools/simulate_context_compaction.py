@@ -0,0 +1,181 @@
+"""
+長い通話での会話コンテキスト圧縮のシミュレーション
+
+vector_search.openai_vector_search_with_file_search_tool を、偽の OpenAI クライアントで
+1通話あたり複数ターン（previous_response_id でつなぐ継続質問）実行し、
+圧縮なし・圧縮ありのそれぞれについてターンごとの入力トークン数とレイテンシを表示する。
+要約は AiProcessing Lambda と同じく回答を返した後に drain() で生成を待つため、回答のレイテンシには入らず、
+summary_ms（回答後の要約の生成時間）として別に表示する。
+
+偽のクライアントは Responses API のチェーンを模して、previous_response_id の履歴（過去の質問・回答・
+file_search の検索結果）を毎ターンの入力トークンに積み上げ、入力トークン数に比例した時間だけ待つ。
+別コンテナでの復元（responses.retrieve / input_items.list）も --cold-container で確認できる。
+
+OpenAI へはアクセスしない。
+
+使い方:
+    python tools/simulate_context_compaction.py
+    python tools/simulate_context_compaction.py --turns 16 --max-turns 4 --cold-container
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, os.path.join(ROOT, 'lambda_functions', 'ai_processing'))
+sys.path.insert(0, os.path.join(ROOT, 'layers', 'twilio_functions'))
+os.environ.setdefault('ANSWER_CACHE_ENABLED', 'false')
+os.environ.setdefault('LOG_LEVEL', 'ERROR')
+
+import vector_search  # noqa: E402
+from context_compaction import ConversationCompactor  # noqa: E402
+
+QUESTIONS = [
+    "チェックアウトは何時ですか", "ゴミはどこに捨てればいいですか", "近くにコンビニはありますか",
+    "Wi-Fiのパスワードを教えてください", "エアコンのリモコンが見当たりません", "駐車場はありますか",
+    "タオルの追加はできますか", "大阪駅までの行き方を教えてください", "洗濯機は使えますか",
+    "チェックアウトを少し遅らせることはできますか", "鍵はどこに返せばいいですか", "近くのおすすめの食事処は",
+]
+ANSWER = "ご質問ありがとうございます。{question}についてご案内します。詳しくは玄関横の案内をご確認ください。"
+SUMMARY = "- ゲストはチェックアウト時刻、ゴミの捨て方、周辺施設について質問済み\n- 未解決の事項はなし"
+
+
+def count_tokens(text: str) -> int:
+    """文字種からの概算（ASCIIは約4文字で1トークン、それ以外は1文字あたり約0.8トークン）"""
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return round(ascii_chars / 4 + (len(text) - ascii_chars) * 0.8)
+
+
+def _item_tokens(items) -> int:
+    return sum(count_tokens(item['content']) for item in items)
+
+
+class FakeResponses:
+    """previous_response_id の履歴を積み上げて入力トークン数と待ち時間を決める Responses API"""
+
+    def __init__(self, args):
+        self.args = args
+        self._ids = itertools.count(1)
+        self.stored = {}
+        self.calls = []
+        self.input_items = SimpleNamespace(list=self._list_input_items)
+
+    async def _sleep_for(self, input_tokens: int, output_tokens: int) -> None:
+        simulated_ms = self.args.base_ms + input_tokens * self.args.ms_per_input_token + output_tokens * 8
+        await asyncio.sleep(simulated_ms / 1000 * self.args.time_scale)
+
+    async def create(self, **payload):
+        previous = self.stored.get(payload.get('previous_response_id'))
+        history_tokens = previous['history_tokens'] if previous else 0
+        is_answer = any(tool['type'] == 'file_search' for tool in payload.get('tools', []))
+        search_tokens = self.args.search_result_tokens if is_answer else 0
+        input_tokens = (count_tokens(payload['instructions']) + history_tokens
+                        + _item_tokens(payload['input']) + search_tokens)
+        question = payload['input'][-1]['content']
+        if is_answer:
+            text = json.dumps({'assistant_response_text': ANSWER.format(question=question),
+                               'needs_operator': False, 'end_conversation': False}, ensure_ascii=False)
+        else:
+            text = SUMMARY
+        output_tokens = count_tokens(text)
+        await self._sleep_for(input_tokens, output_tokens)
+
+        response_id = f"resp_{next(self._ids)}"
+        response = SimpleNamespace(
+            id=response_id, output_text=text, metadata=payload.get('metadata'),
+            usage=SimpleNamespace(input_tokens=input_tokens, input_tokens_details=SimpleNamespace(cached_tokens=0)),
+            output=[SimpleNamespace(type='message', content=[SimpleNamespace(type='output_text', text=text)])]
+        )
+        self.calls.append({'kind': 'answer' if is_answer else 'summary', 'input_tokens': input_tokens})
+        if payload.get('store', True):
+            self.stored[response_id] = {
+                'response': response, 'question': question,
+                # 指示文は引き継がれない。検索結果と入出力は次のターンの入力に残る
+                'history_tokens': history_tokens + _item_tokens(payload['input']) + search_tokens + output_tokens,
+            }
+        return response
+
+    async def retrieve(self, response_id: str):
+        await asyncio.sleep(self.args.base_ms / 10000 * self.args.time_scale)
+        return self.stored[response_id]['response']
+
+    async def _list_input_items(self, response_id: str, order: str = 'desc', limit: int = 20):
+        question = self.stored[response_id]['question']
+        return SimpleNamespace(data=[SimpleNamespace(type='message', role='user', content=question)])
+
+
+class FakeOpenAI:
+    def __init__(self, args):
+        self.responses = FakeResponses(args)
+
+
+async def run_call(args, compaction: bool) -> tuple:
+    """1通話分の継続質問を実行し、ターンごとの入力トークン数とレイテンシを返す"""
+    client = FakeOpenAI(args)
+    vector_search.CONTEXT_COMPACTION_ENABLED = compaction
+    vector_search.conversation_compactor = ConversationCompactor(args.max_turns, args.max_input_tokens)
+    rows, response_id = [], None
+    for turn in range(args.turns):
+        compactor = vector_search.conversation_compactor
+        if args.cold_container:
+            # 毎ターン別のコンテナに来た想定（チェーンの状態は保存済みレスポンスから復元）
+            compactor._chains.clear()
+        calls_before = len(client.responses.calls)
+        compactions_before = compactor.compactions
+        started = time.monotonic()
+        result = json.loads(await vector_search.openai_vector_search_with_file_search_tool(
+            client, QUESTIONS[turn % len(QUESTIONS)], 'ja-JP', 'vs_simulation', response_id, None
+        ))
+        elapsed_ms = (time.monotonic() - started) * 1000 / args.time_scale
+        answer_call = client.responses.calls[-1]
+        # 回答を届けた後（Lambda の呼び出しの終了前）に要約を待つ
+        drain_started = time.monotonic()
+        await compactor.drain()
+        summary_ms = (time.monotonic() - drain_started) * 1000 / args.time_scale
+        response_id = result['response_id']
+        rows.append({
+            'turn': turn + 1,
+            'input_tokens': answer_call['input_tokens'],
+            'compacted': compactor.compactions > compactions_before,
+            'summarized': any(call['kind'] == 'summary' for call in client.responses.calls[calls_before:]),
+            'latency_ms': elapsed_ms,
+            'summary_ms': summary_ms,
+        })
+    return rows, vector_search.conversation_compactor.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-turn input tokens and latency with and without context compaction')
+    parser.add_argument('--turns', type=int, default=12)
+    parser.add_argument('--max-turns', type=int, default=6)
+    parser.add_argument('--max-input-tokens', type=int, default=8000)
+    parser.add_argument('--search-result-tokens', type=int, default=1200, help='1ターンの file_search 結果のトークン数')
+    parser.add_argument('--base-ms', type=float, default=900)
+    parser.add_argument('--ms-per-input-token', type=float, default=0.08)
+    parser.add_argument('--time-scale', type=float, default=0.1, help='待ち時間の縮尺（表示は縮尺前のms）')
+    parser.add_argument('--cold-container', action='store_true', help='毎ターン別コンテナに来た想定で状態を復元する')
+    args = parser.parse_args()
+
+    baseline, _ = asyncio.run(run_call(args, compaction=False))
+    compacted, stats = asyncio.run(run_call(args, compaction=True))
+
+    print(f"{'turn':>4}  {'chain_in_tok':>12}{'chain_ms':>10}  {'compact_in_tok':>14}{'compact_ms':>12}"
+          f"{'summary_ms':>12}")
+    for before, after in zip(baseline, compacted):
+        marker = ' *compacted' if after['compacted'] else ''
+        summary = f"{after['summary_ms']:>12.0f}" if after['summarized'] else f"{'-':>12}"
+        print(f"{before['turn']:>4}  {before['input_tokens']:>12}{before['latency_ms']:>10.0f}  "
+              f"{after['input_tokens']:>14}{after['latency_ms']:>12.0f}{summary}{marker}")
+    for name, rows in (('chain', baseline), ('compact', compacted)):
+        print(f"{name:<8} total_input_tokens={sum(r['input_tokens'] for r in rows)} "
+              f"last_turn_ms={rows[-1]['latency_ms']:.0f} mean_ms={sum(r['latency_ms'] for r in rows) / len(rows):.0f}")
+    print(f"compactor stats (latency in scaled wall-clock ms): {stats}")
+
+
+if __name__ == '__main__':
+    main()
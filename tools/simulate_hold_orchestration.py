@@ -0,0 +1,117 @@
+"""
+応答期限つき保留のシミュレーション
+
+AI Processing Lambda の lambda_handler_async を simulate_answer_streaming.py と同じ偽の OpenAI / Twilio
+クライアントで実行し、回答の生成時間ごとに、従来（毎回アナウンス + Pause 25秒）と
+保留の制御あり（hold_orchestrator）の calls.update の回数・最初の音声・送った TwiML の種類を比較する。
+従来の方式で保留の上限（HOLD_MAX_SECONDS）を過ぎてから届いた TwiML には (after hold ended) を付ける
+（実際の通話ではその前に Pause が終わって切れている）。
+
+- 回答が KEEPALIVE_AFTER_MS より早ければアナウンスを送らない
+- 遅ければアナウンスの後ろに短い Pause + 保留エンドポイントへの Redirect を付ける
+- ANSWER_DEADLINE_MS を過ぎたら生成を打ち切り、お詫びとオペレーター選択を送る
+
+待ち時間は --time-scale で縮めて実行する（表示は縮尺前の秒）。AWS・OpenAI・Twilio へはアクセスしない。
+
+使い方:
+    python tools/simulate_hold_orchestration.py
+    python tools/simulate_hold_orchestration.py --answer-seconds 1.5,5,12,40 --streaming --verbose
+"""
+import argparse
+import asyncio
+import functools
+import os
+import re
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import simulate_answer_streaming as sim  # noqa: E402  (sys.path と環境変数もここで設定される)
+import answer_streaming  # noqa: E402
+from call_hold import HOLD_MAX_SECONDS  # noqa: E402
+from hold_orchestrator import ANSWER_DEADLINE_MS, KEEPALIVE_AFTER_MS, HoldOrchestrator, hold_stats  # noqa: E402
+
+LANGUAGE = 'ja-JP'
+CHUNK_CHARS = 4
+_estimate_speech_seconds = answer_streaming.estimate_speech_seconds
+
+
+def _kind(twiml: str, answer: str) -> str:
+    if answer[:6] in twiml:
+        return 'answer'
+    if 'source=operator_choice_dtmf' in twiml:
+        return 'deadline_fallback'
+    if 'source=hold' in twiml:
+        return 'keepalive+hold'
+    if re.search(r'<Pause length="25"', twiml):
+        return 'announce+pause'
+    return 'answer_rest' if '<Gather' in twiml else 'other'
+
+
+def _fake_args(answer: str, answer_seconds: float, args) -> SimpleNamespace:
+    """回答の最初の文字が first_sentence_seconds に届き、全文が answer_seconds にそろう偽の生成"""
+    scale = args.time_scale
+    first_ms = min(args.first_sentence_seconds, answer_seconds) * 1000
+    chunks = -(-len(sim.FakeResponses(answer, None).answer_json) // CHUNK_CHARS)
+    return SimpleNamespace(classify_delay_ms=args.classify_ms * scale, first_token_delay_ms=first_ms * scale,
+                           chunk_delay_ms=(answer_seconds * 1000 - first_ms) / chunks * scale, chunk_chars=CHUNK_CHARS)
+
+
+def run_call(answer_seconds: float, orchestrated: bool, args) -> dict:
+    scale = args.time_scale
+    answer = sim.ANSWERS[LANGUAGE]
+    fake_args = _fake_args(answer, answer_seconds, args)
+    # 先行再生の読み上げ時間の見積もりも同じ縮尺にする
+    answer_streaming.estimate_speech_seconds = lambda text, language: _estimate_speech_seconds(text, language) * scale
+    twilio = sim.FakeTwilioClient(args.twilio_latency_ms * scale)
+    handler = sim.handler
+    handler.twilio_client = twilio
+    handler.call_dispatcher = None
+    handler.openai_async_client = SimpleNamespace(responses=sim.FakeResponses(answer, fake_args))
+    handler.ANSWER_STREAMING_ENABLED = args.streaming
+    handler.HOLD_ORCHESTRATION_ENABLED = orchestrated
+    handler.HoldOrchestrator = functools.partial(HoldOrchestrator, keepalive_after_ms=args.keepalive_after_ms * scale,
+                                                 deadline_ms=args.deadline_ms * scale)
+    event = {'speech_result': sim.QUERIES[LANGUAGE], 'call_sid': 'CA' + '1' * 32, 'language': LANGUAGE}
+    result = asyncio.run(handler.lambda_handler_async(event, None))
+    updates = [(at / scale, twiml) for at, twiml in twilio.updates]
+    return {
+        'action': result.get('action') or result.get('message'),
+        'updates': updates,
+        'kinds': [_kind(twiml, answer) + (' (after hold ended)' if at > HOLD_MAX_SECONDS else '')
+                  for at, twiml in updates],
+        'first_audio_s': next((at for at, twiml in updates if answer[:6] in twiml), None),
+        'done_s': updates[-1][0] if updates else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare fixed announcements with deadline-aware hold orchestration')
+    parser.add_argument('--answer-seconds', default='1.5,3,6,12,40', help='回答の生成にかかる秒数（カンマ区切り）')
+    parser.add_argument('--classify-ms', type=float, default=600)
+    parser.add_argument('--twilio-latency-ms', type=float, default=250)
+    parser.add_argument('--keepalive-after-ms', type=float, default=KEEPALIVE_AFTER_MS)
+    parser.add_argument('--deadline-ms', type=float, default=ANSWER_DEADLINE_MS)
+    parser.add_argument('--streaming', action='store_true', help='回答の最初の1文を先行再生する')
+    parser.add_argument('--first-sentence-seconds', type=float, default=2.0,
+                        help='回答の生成開始から最初の1文がそろうまでの秒数（--streaming 用）')
+    parser.add_argument('--time-scale', type=float, default=0.1, help='待ち時間の縮尺（表示は縮尺前の秒）')
+    parser.add_argument('--verbose', action='store_true', help='送信したTwiMLを表示')
+    args = parser.parse_args()
+
+    print(f"{'answer_s':>8}  {'mode':<12}{'updates':>8}{'first_audio_s':>14}{'done_s':>8}  sequence")
+    for answer_seconds in (float(value) for value in args.answer_seconds.split(',') if value):
+        for orchestrated in (False, True):
+            report = run_call(answer_seconds, orchestrated, args)
+            first_audio = f"{report['first_audio_s']:.1f}" if report['first_audio_s'] is not None else '-'
+            print(f"{answer_seconds:>8.1f}  {'orchestrated' if orchestrated else 'fixed':<12}{len(report['updates']):>8}"
+                  f"{first_audio:>14}{report['done_s'] or 0:>8.1f}  {' > '.join(report['kinds'])}")
+            if args.verbose:
+                for at, twiml in report['updates']:
+                    print(f"    {at:6.2f}s {twiml}")
+    print(f"hold stats: {hold_stats.snapshot()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+OpenAI リクエストのヘッジのシミュレーション
+
+request_hedging.RequestHedger を、レイテンシの分布を指定できる偽の responses.create で実行し、
+ヘッジなし・ヘッジありの p50 / p95 / p99、ヘッジ率、追加で送ったリクエストの割合を比較する。
+レイテンシは対数正規分布（中央値 --median-ms、ばらつき --sigma）に、確率 --tail-prob で
+--tail-ms 前後の遅延（サーバー側の詰まり）を混ぜたもの。--error-prob で失敗も混ぜられる。
+
+待ち時間は --time-scale で縮めて実行する（表示は縮尺前のミリ秒）。OpenAI へはアクセスしない。
+
+使い方:
+    python tools/simulate_request_hedging.py
+    python tools/simulate_request_hedging.py --median-ms 900 --tail-prob 0.08 --tail-ms 9000 --max-rate 0.15
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, os.path.join(ROOT, 'lambda_functions', 'ai_processing'))
+sys.path.insert(0, os.path.join(ROOT, 'layers', 'twilio_functions'))
+os.environ.setdefault('LOG_LEVEL', 'ERROR')
+
+from request_hedging import HEDGE_MAX_RATE, HEDGE_QUANTILE, RequestHedger  # noqa: E402
+
+
+class LatencyDistribution:
+    """対数正規分布 + まれな遅延 + 失敗"""
+
+    def __init__(self, median_ms: float, sigma: float, tail_prob: float, tail_ms: float, error_prob: float,
+                 rng: random.Random):
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.tail_prob = tail_prob
+        self.tail_ms = tail_ms
+        self.error_prob = error_prob
+        self.rng = rng
+
+    def sample(self):
+        """(レイテンシ ms, 失敗するか)"""
+        latency = self.median_ms * math.exp(self.rng.gauss(0, self.sigma))
+        if self.rng.random() < self.tail_prob:
+            latency += self.tail_ms * math.exp(self.rng.gauss(0, 0.3))
+        return latency, self.rng.random() < self.error_prob
+
+
+class FakeResponses:
+    """responses.create の代わり: 分布からレイテンシを引いて待ち、応答を返す（キャンセルも数える）"""
+
+    def __init__(self, distribution: LatencyDistribution, time_scale: float):
+        self.distribution = distribution
+        self.time_scale = time_scale
+        self.sent = 0
+        self.cancelled = 0
+
+    async def create(self, **payload):
+        self.sent += 1
+        latency_ms, fails = self.distribution.sample()
+        try:
+            await asyncio.sleep(latency_ms / 1000 * self.time_scale)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if fails:
+            raise RuntimeError('simulated API error')
+        return SimpleNamespace(id=f"resp_{self.sent}", output=[])
+
+
+def _percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+async def run_arm(hedged: bool, args) -> dict:
+    rng = random.Random(args.seed)
+    distribution = LatencyDistribution(args.median_ms, args.sigma, args.tail_prob, args.tail_ms, args.error_prob, rng)
+    responses = FakeResponses(distribution, args.time_scale)
+    # 遅延とレイテンシは縮尺後の時計で測るため、表示の前に縮尺を戻す
+    hedger = RequestHedger(quantile=args.quantile, max_rate=args.max_rate,
+                           initial_delay_ms=args.initial_delay_ms * args.time_scale,
+                           min_delay_ms=args.min_delay_ms * args.time_scale)
+    latencies, errors = [], 0
+    for _ in range(args.requests):
+        started = time.monotonic()
+        try:
+            if hedged:
+                await hedger.call('answer', lambda: responses.create(model='simulation'))
+            else:
+                await responses.create(model='simulation')
+        except RuntimeError:
+            errors += 1
+        latencies.append((time.monotonic() - started) * 1000 / args.time_scale)
+    stats = hedger.stats().get('answer', {})
+    return {
+        'p50': _percentile(latencies, 0.5),
+        'p95': _percentile(latencies, 0.95),
+        'p99': _percentile(latencies, 0.99),
+        'max': max(latencies),
+        'errors': errors,
+        'extra_requests': responses.sent / args.requests - 1,
+        'cancelled': responses.cancelled,
+        'stats': stats,
+        'delay_ms': hedger.delay_ms('answer') / args.time_scale,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare plain and hedged OpenAI requests on a synthetic latency distribution')
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--median-ms', type=float, default=1500)
+    parser.add_argument('--sigma', type=float, default=0.35, help='対数正規分布のばらつき')
+    parser.add_argument('--tail-prob', type=float, default=0.05, help='まれな遅延が起きる確率')
+    parser.add_argument('--tail-ms', type=float, default=8000, help='まれな遅延の大きさ')
+    parser.add_argument('--error-prob', type=float, default=0.0)
+    parser.add_argument('--quantile', type=float, default=HEDGE_QUANTILE)
+    parser.add_argument('--max-rate', type=float, default=HEDGE_MAX_RATE)
+    parser.add_argument('--initial-delay-ms', type=float, default=3000)
+    parser.add_argument('--min-delay-ms', type=float, default=300)
+    parser.add_argument('--time-scale', type=float, default=0.002, help='待ち時間の縮尺（表示は縮尺前のミリ秒）')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    print(f"{'arm':<8}{'p50':>8}{'p95':>8}{'p99':>8}{'max':>8}{'errors':>8}{'extra_req':>10}")
+    reports = {}
+    for hedged in (False, True):
+        report = reports[hedged] = asyncio.run(run_arm(hedged, args))
+        print(f"{'hedged' if hedged else 'plain':<8}{report['p50']:>8.0f}{report['p95']:>8.0f}{report['p99']:>8.0f}"
+              f"{report['max']:>8.0f}{report['errors']:>8}{report['extra_requests']:>10.1%}")
+    stats = reports[True]['stats']
+    saved_ms = stats.get('estimated_saved_ms', 0) / args.time_scale
+    print(f"hedge delay now: {reports[True]['delay_ms']:.0f} ms, hedge rate: {stats.get('hedge_rate', 0):.1%}, "
+          f"hedge wins: {stats.get('hedge_wins', 0)}/{stats.get('hedged', 0)}, suppressed: {stats.get('suppressed', 0)}, "
+          f"cancelled losers: {reports[True]['cancelled']}, estimated saved: {saved_ms:.0f} ms total")
+
+
+if __name__ == '__main__':
+    main()
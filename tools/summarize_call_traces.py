@@ -0,0 +1,146 @@
+"""
+通話トレース（EMF の行）からステージごとのレイテンシを集計し、通話のタイムラインを表示する
+
+両 Lambda に CALL_TRACING_ENABLED=true を設定すると、呼び出しの中のステージがスパンごとに1行の
+CloudWatch Embedded Metric Format で出力される（layers/twilio_functions/call_tracing.py）。
+CloudWatch のメトリクス（Namespace ObwVoice、Handler × Stage の Duration）はダッシュボードでそのまま見られるが、
+このツールはログの行から Handler × Stage ごとの p50 / p95 / p99 と失敗数を集計し、
+--call-sid を指定するとその通話のスパンをターンごとに親子関係のタイムラインで表示する。
+
+使い方:
+    python tools/summarize_call_traces.py --log-group /aws/lambda/obw-immediate-response-function \\
+        --log-group /aws/lambda/obw-ai-processing-function --since 6h
+    python tools/summarize_call_traces.py exported.log --call-sid CAxxxxxxxx
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from call_simulator.report import percentile  # noqa: E402
+
+_UNITS = {'m': 60, 'h': 3600, 'd': 86400}
+_EMF_MARKER = '{"_aws"'
+_decoder = json.JSONDecoder()
+
+
+def _parse_since(text: str) -> int:
+    """"6h" "30m" "2d" → 開始時刻（エポックミリ秒）"""
+    unit = text[-1]
+    if unit not in _UNITS:
+        raise ValueError(f"invalid --since: {text!r} (use e.g. 30m, 6h, 2d)")
+    return int((time.time() - float(text[:-1]) * _UNITS[unit]) * 1000)
+
+
+def _log_group_lines(log_groups, start_ms: int, namespace: str):
+    import boto3
+
+    logs = boto3.client('logs')
+    paginator = logs.get_paginator('filter_log_events')
+    for log_group in log_groups:
+        for page in paginator.paginate(logGroupName=log_group, startTime=start_ms,
+                                       filterPattern=f'{{ $._aws.CloudWatchMetrics[0].Namespace = "{namespace}" }}'):
+            for event in page.get('events', []):
+                yield event['message']
+
+
+def _file_lines(paths):
+    for path in paths:
+        with (sys.stdin if path == '-' else open(path, encoding='utf-8')) as f:
+            yield from f
+
+
+def extract_spans(lines, namespace: str):
+    """ログの行から EMF のスパンを取り出す（行頭にタイムスタンプなどが付いていてもよい）"""
+    for line in lines:
+        start = line.find(_EMF_MARKER)
+        if start < 0:
+            continue
+        try:
+            record, _ = _decoder.raw_decode(line, start)
+        except ValueError:
+            continue
+        metrics = record['_aws'].get('CloudWatchMetrics') or [{}]
+        if metrics[0].get('Namespace') == namespace and 'span_id' in record:
+            yield record
+
+
+def stage_summary(spans):
+    """Handler × Stage ごとの件数・失敗数・Duration の分位点"""
+    durations = defaultdict(list)
+    errors = defaultdict(int)
+    for span in spans:
+        key = (span['Handler'], span['Stage'])
+        durations[key].append(span['Duration'])
+        errors[key] += span.get('status') == 'error'
+    lines = [f"{'handler':<20}{'stage':<18}{'count':>7}{'errors':>8}{'p50_ms':>10}{'p95_ms':>10}{'p99_ms':>10}"]
+    for (handler, stage), values in sorted(durations.items()):
+        lines.append(f"{handler:<20}{stage:<18}{len(values):>7}{errors[(handler, stage)]:>8}"
+                     f"{percentile(values, 0.5):>10.1f}{percentile(values, 0.95):>10.1f}{percentile(values, 0.99):>10.1f}")
+    return '\n'.join(lines)
+
+
+def timeline(spans):
+    """1通話のスパンをターンごとに、親子関係で字下げしたタイムライン（開始時刻はターンの最初のスパンから）"""
+    by_turn = defaultdict(list)
+    for span in spans:
+        by_turn[span.get('turn') or '-'].append(span)
+    lines = []
+    for turn, group in sorted(by_turn.items(), key=lambda item: min(span['_aws']['Timestamp'] for span in item[1])):
+        origin = min(span['_aws']['Timestamp'] for span in group)
+        children = defaultdict(list)
+        ids = {span['span_id'] for span in group}
+        for span in group:
+            children[span['parent_span_id'] if span['parent_span_id'] in ids else None].append(span)
+        lines.append(f"turn {turn}")
+
+        def walk(parent_id, depth):
+            for span in sorted(children[parent_id], key=lambda span: span['_aws']['Timestamp']):
+                marker = ' !' if span.get('status') == 'error' else ''
+                label = f"{'  ' * depth}{span['Handler']}.{span['Stage']}{marker}"
+                lines.append(f"  {label:<48}+{span['_aws']['Timestamp'] - origin:>7}ms {span['Duration']:>9.1f}ms")
+                walk(span['span_id'], depth + 1)
+
+        walk(None, 0)
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize call trace spans (EMF lines) by stage')
+    parser.add_argument('inputs', nargs='*', help='ログのファイル（- で標準入力）')
+    parser.add_argument('--log-group', action='append', default=[], help='CloudWatch Logs のロググループ（複数可）')
+    parser.add_argument('--since', default='1h', help='ロググループから取り出す期間（30m / 6h / 2d）')
+    parser.add_argument('--namespace', default='ObwVoice', help='CALL_TRACING_NAMESPACE')
+    parser.add_argument('--call-sid', action='append', default=[], help='この通話のタイムラインを表示（複数可）')
+    args = parser.parse_args()
+    if not args.inputs and not args.log_group:
+        parser.error('specify log files or --log-group')
+
+    sources = []
+    if args.log_group:
+        try:
+            sources.append(_log_group_lines(args.log_group, _parse_since(args.since), args.namespace))
+        except ValueError as e:
+            parser.error(str(e))
+    if args.inputs:
+        sources.append(_file_lines(args.inputs))
+    spans = [span for source in sources for span in extract_spans(source, args.namespace)]
+    if not spans:
+        print('no trace spans found', file=sys.stderr)
+        sys.exit(1)
+
+    calls = {span.get('call_sid') for span in spans}
+    turns = {span.get('trace_id') for span in spans if span.get('trace_id')}
+    print(f"{len(spans)} spans from {len(calls)} calls ({len(turns)} traces)")
+    print(stage_summary(spans))
+    for call_sid in args.call_sid:
+        print(f"\n--- {call_sid}")
+        print(timeline([span for span in spans if span.get('call_sid') == call_sid]) or '(no spans)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,7 @@
+"""
+ターンの結果の分析ストアと集計（tools/report_call_latency.py から使う）
+
+ターンの結果は lambda_functions/ai_processing/call_analytics.py（CALL_ANALYTICS_ENABLED=true）が CloudWatch Logs に書き出す。
+- store: ログから取り出したレコードを SQLite に追記する（同じターンのレコードは重複させない）
+- report: 無音時間・保留時間・オペレーター転送までの時間の分位点と、言語・時間帯ごとの通話あたりのコスト
+"""
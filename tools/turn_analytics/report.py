@@ -0,0 +1,177 @@
+"""
+ターンの結果の集計
+
+- 無音時間（first_audio_ms）・保留時間（answer_ms）の p50 / p95 / p99（言語ごと）
+- 緊急・オペレーター希望の経路で転送の TwiML を届けるまでの時間（operator_ms）
+- ステージごとの所要時間（stages）
+- 通話あたりの OpenAI のコスト（言語・通話開始の時間帯ごと。単価は fixtures/openai_prices.json）
+
+通話の言語と時間帯は通話の最初のターンで決める。
+"""
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from call_simulator.report import percentile
+
+OPERATOR_PATHS = ('urgent', 'operator_request')
+
+
+def load_prices(path: str) -> Dict[str, Dict[str, float]]:
+    with open(path, encoding='utf-8') as f:
+        return {model: price for model, price in json.load(f).items() if not model.startswith('_')}
+
+
+def _price_for(model: Optional[str], prices: Dict[str, Dict[str, float]]) -> Optional[Dict[str, float]]:
+    """最長一致の接頭辞で単価を探す（gpt-5-mini-2025-08-07 → gpt-5-mini。gpt-5.4-mini は gpt-5 に一致させない）"""
+    matches = [name for name in prices if model and (model == name or model.startswith(name + '-'))]
+    return prices[max(matches, key=len)] if matches else None
+
+
+def turn_cost(usage: Iterable[Dict], prices: Dict[str, Dict[str, float]]) -> Tuple[float, Dict[str, int]]:
+    """(USD, 単価のないモデル → トークン数)"""
+    cost = 0.0
+    unpriced: Dict[str, int] = {}
+    for entry in usage or ():
+        price = _price_for(entry.get('model'), prices)
+        tokens = entry.get('input_tokens', 0) + entry.get('output_tokens', 0)
+        if price is None:
+            unpriced[entry.get('model') or '?'] = unpriced.get(entry.get('model') or '?', 0) + tokens
+            continue
+        cached = min(entry.get('cached_tokens', 0), entry.get('input_tokens', 0))
+        cost += ((entry.get('input_tokens', 0) - cached) * price.get('input', 0.0)
+                 + cached * price.get('cached_input', price.get('input', 0.0))
+                 + entry.get('output_tokens', 0) * price.get('output', 0.0)) / 1_000_000
+    return cost, unpriced
+
+
+def _quantiles(values: List[float]) -> Dict[str, float]:
+    values = [value for value in values if value is not None]
+    return {'count': len(values), 'p50': percentile(values, 0.5), 'p95': percentile(values, 0.95),
+            'p99': percentile(values, 0.99)}
+
+
+def latency_by_language(turns: List[Dict], field: str) -> Dict[str, Dict[str, float]]:
+    """field（ms）の分位点を言語ごとと全体で"""
+    groups = defaultdict(list)
+    for turn in turns:
+        groups[turn['language'] or '?'].append(turn[field])
+        groups['all'].append(turn[field])
+    return {language: _quantiles(values) for language, values in sorted(groups.items())}
+
+
+def operator_latency(turns: List[Dict]) -> Dict[str, Dict[str, float]]:
+    """転送の経路ごとの operator_ms の分位点（転送の TwiML を届けられなかったターンは failed に数える）"""
+    result = {}
+    for path in OPERATOR_PATHS:
+        group = [turn for turn in turns if turn['path'] == path]
+        if group:
+            result[path] = {**_quantiles([turn['operator_ms'] for turn in group]),
+                            'failed': sum(1 for turn in group if turn['operator_ms'] is None)}
+    return result
+
+
+def stage_latency(turns: List[Dict]) -> Dict[str, Dict[str, float]]:
+    groups = defaultdict(list)
+    for turn in turns:
+        for stage, duration_ms in (turn['stages'] or {}).items():
+            groups[stage].append(duration_ms)
+    return {stage: _quantiles(values) for stage, values in sorted(groups.items())}
+
+
+def path_counts(turns: List[Dict]) -> Dict[str, int]:
+    counts = defaultdict(int)
+    for turn in turns:
+        counts[turn['path'] or '(none)'] += 1
+    return dict(sorted(counts.items(), key=lambda item: -item[1]))
+
+
+def cost_by_language_hour(turns: List[Dict], prices: Dict[str, Dict[str, float]],
+                          tz: timezone) -> Tuple[Dict[Tuple[str, int], Dict[str, float]], Dict[str, int]]:
+    """
+    (言語, 時) ごとの通話数・ターン数・通話あたりのコスト
+
+    Returns:
+        (集計, 単価のないモデル → トークン数)
+    """
+    calls: Dict[str, Dict] = {}
+    unpriced: Dict[str, int] = defaultdict(int)
+    for turn in turns:
+        cost, missing = turn_cost(turn['usage'], prices)
+        for model, tokens in missing.items():
+            unpriced[model] += tokens
+        call = calls.setdefault(turn['call_sid'], {'language': turn['language'] or '?',
+                                                   'first': turn['received_at'], 'turns': 0, 'cost': 0.0})
+        call['turns'] += 1
+        call['cost'] += cost
+    groups = defaultdict(list)
+    for call in calls.values():
+        hour = datetime.fromtimestamp(call['first'], tz).hour
+        groups[(call['language'], hour)].append(call)
+    table = {}
+    for key, group in sorted(groups.items()):
+        costs = [call['cost'] for call in group]
+        table[key] = {'calls': len(group), 'turns': sum(call['turns'] for call in group),
+                      'cost_per_call': sum(costs) / len(group), 'p95_cost': percentile(costs, 0.95),
+                      'total_cost': sum(costs)}
+    return table, dict(unpriced)
+
+
+def last_weekend(now: datetime) -> Tuple[datetime, datetime]:
+    """直近の終わった週末（土曜 0時〜月曜 0時。週末の最中なら前の週末）"""
+    monday = (now - timedelta(days=now.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+    return monday - timedelta(days=2), monday
+
+
+def _format_quantiles(title: str, rows: Dict[str, Dict[str, float]], extra: str = None) -> List[str]:
+    header = f"{'':<18}{'count':>7}{'p50_s':>9}{'p95_s':>9}{'p99_s':>9}" + (f"{extra:>8}" if extra else '')
+    lines = [title, header]
+    for name, row in rows.items():
+        line = (f"{name:<18}{row['count']:>7}{row['p50'] / 1000:>9.2f}{row['p95'] / 1000:>9.2f}"
+                f"{row['p99'] / 1000:>9.2f}")
+        lines.append(line + (f"{row[extra]:>8}" if extra else ''))
+    return lines
+
+
+def format_report(turns: List[Dict], prices: Dict[str, Dict[str, float]], tz: timezone) -> str:
+    calls = {turn['call_sid'] for turn in turns}
+    lines = [f"{len(turns)} turns from {len(calls)} calls",
+             'paths: ' + ', '.join(f"{path}={count}" for path, count in path_counts(turns).items()), '']
+    lines += _format_quantiles('Dead air: speech received -> first AI audio', latency_by_language(turns, 'first_audio_ms'))
+    lines += ['']
+    lines += _format_quantiles('Hold: speech received -> final TwiML', latency_by_language(turns, 'answer_ms'))
+    operator = operator_latency(turns)
+    if operator:
+        lines += ['']
+        lines += _format_quantiles('Time to operator: speech received -> transfer TwiML', operator, extra='failed')
+    stages = stage_latency(turns)
+    if stages:
+        lines += ['']
+        lines += _format_quantiles('AI Lambda stages (per turn total)', stages)
+
+    table, unpriced = cost_by_language_hour(turns, prices, tz)
+    lines += ['', 'OpenAI cost per call by language and hour (call start)',
+              f"{'language':<10}{'hour':>5}{'calls':>7}{'turns':>7}{'usd/call':>11}{'p95_usd':>11}{'total_usd':>11}"]
+    for (language, hour), row in table.items():
+        lines.append(f"{language:<10}{hour:>5}{row['calls']:>7}{row['turns']:>7}{row['cost_per_call']:>11.5f}"
+                     f"{row['p95_cost']:>11.5f}{row['total_cost']:>11.4f}")
+    for model, tokens in sorted(unpriced.items()):
+        lines.append(f"warning: no price for model {model} ({tokens} tokens not costed; add it with --prices)")
+    return '\n'.join(lines)
+
+
+def report_data(turns: List[Dict], prices: Dict[str, Dict[str, float]], tz: timezone) -> Dict:
+    """--json 用の集計"""
+    table, unpriced = cost_by_language_hour(turns, prices, tz)
+    return {
+        'turns': len(turns),
+        'calls': len({turn['call_sid'] for turn in turns}),
+        'paths': path_counts(turns),
+        'dead_air_ms': latency_by_language(turns, 'first_audio_ms'),
+        'hold_ms': latency_by_language(turns, 'answer_ms'),
+        'time_to_operator_ms': operator_latency(turns),
+        'stages_ms': stage_latency(turns),
+        'cost_by_language_hour': [{'language': language, 'hour': hour, **row} for (language, hour), row in table.items()],
+        'unpriced_tokens': unpriced,
+    }
@@ -0,0 +1,117 @@
+"""
+ターンの結果の SQLite ストア
+
+1ターン1行の turns テーブル。集計に使う値は型付きの列に、ステージごとの所要時間・モデルごとのトークン数は
+JSON の列に入れる（コストは集計時に単価表から計算するため、単価が変わっても取り込み直す必要はない）。
+主キーは (call_sid, turn, started_at) で、同じログを何度取り込んでも重複しない
+（Lambda の非同期呼び出しの再試行は started_at が違う別の行になる）。
+"""
+import json
+import sqlite3
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+ANALYTICS_MARKER = 'voice_turn'
+FORMAT_VERSION = 1
+_MARKER_PREFIX = '{"analytics":"voice_turn"'
+_decoder = json.JSONDecoder()
+
+# (列名, 型)。JSON の列はレコードの同名のキーを json.dumps して入れる
+COLUMNS: List[Tuple[str, str]] = [
+    ('call_sid', 'TEXT NOT NULL'),
+    ('turn', 'TEXT NOT NULL'),
+    ('started_at', 'REAL NOT NULL'),
+    ('received_at', 'REAL NOT NULL'),
+    ('language', 'TEXT'),
+    ('continuing', 'INTEGER'),
+    ('path', 'TEXT'),
+    ('action', 'TEXT'),
+    ('status', 'TEXT'),
+    ('end_conversation', 'INTEGER'),
+    ('needs_operator', 'INTEGER'),
+    ('degraded', 'INTEGER'),
+    ('queue_ms', 'REAL'),
+    ('first_audio_ms', 'REAL'),
+    ('answer_ms', 'REAL'),
+    ('operator_ms', 'REAL'),
+    ('duration_ms', 'REAL'),
+    ('input_tokens', 'INTEGER'),
+    ('cached_tokens', 'INTEGER'),
+    ('output_tokens', 'INTEGER'),
+    ('error', 'TEXT'),
+    ('stages', 'TEXT'),
+    ('usage', 'TEXT'),
+    ('counts', 'TEXT'),
+]
+JSON_COLUMNS = frozenset({'stages', 'usage', 'counts'})
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS turns (
+    {', '.join(f'{name} {kind}' for name, kind in COLUMNS)},
+    PRIMARY KEY (call_sid, turn, started_at)
+);
+CREATE INDEX IF NOT EXISTS turns_received_at ON turns (received_at);
+"""
+
+
+def extract_turns(lines: Iterable[str]) -> Iterator[Dict]:
+    """ログの行（前置きがあってもよい）からターンのレコードを取り出す"""
+    for line in lines:
+        start = line.find(_MARKER_PREFIX)
+        if start < 0:
+            continue
+        try:
+            record, _ = _decoder.raw_decode(line, start)
+        except json.JSONDecodeError:
+            continue
+        if record.get('v') == FORMAT_VERSION and record.get('call_sid'):
+            yield record
+
+
+def connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _row(record: Dict) -> List:
+    values = []
+    for name, _ in COLUMNS:
+        value = record.get(name)
+        if name in JSON_COLUMNS:
+            empty = [] if name == 'usage' else {}
+            value = json.dumps(value or empty, ensure_ascii=False, separators=(',', ':'))
+        elif isinstance(value, bool):
+            value = int(value)
+        values.append(value)
+    return values
+
+
+def ingest(conn: sqlite3.Connection, records: Iterable[Dict]) -> Tuple[int, int]:
+    """レコードを追記し、(追加した行数, 取り込み済みで飛ばした行数) を返す"""
+    placeholders = ', '.join('?' for _ in COLUMNS)
+    inserted = skipped = 0
+    with conn:
+        for record in records:
+            cursor = conn.execute(f"INSERT OR IGNORE INTO turns VALUES ({placeholders})", _row(record))
+            inserted += cursor.rowcount
+            skipped += 1 - cursor.rowcount
+    return inserted, skipped
+
+
+def load_turns(conn: sqlite3.Connection, start: Optional[float] = None, end: Optional[float] = None) -> List[Dict]:
+    """受信時刻（エポック秒）が [start, end) のターン（JSON の列は戻す）"""
+    query, params = "SELECT * FROM turns WHERE 1=1", []
+    if start is not None:
+        query += " AND received_at >= ?"
+        params.append(start)
+    if end is not None:
+        query += " AND received_at < ?"
+        params.append(end)
+    turns = []
+    for row in conn.execute(query + " ORDER BY received_at", params):
+        turn = dict(row)
+        for name in JSON_COLUMNS:
+            turn[name] = json.loads(turn[name]) if turn[name] else None
+        turns.append(turn)
+    return turns
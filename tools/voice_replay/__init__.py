@@ -0,0 +1,10 @@
+"""
+本番の音声イベントの記録・再生ハーネス（tools/export_voice_captures.py・tools/replay_voice_events.py から使う）
+
+記録は layers/twilio_functions/event_capture.py（EVENT_CAPTURE_ENABLED=true）が CloudWatch Logs に書き出す。
+- capture_file: キャプチャファイル（gzip の JSON Lines）の読み書き
+- replayer: 記録したI/Oを返す偽物を差し込んでハンドラを再生する
+- diff: 記録と再生の出力の比較・CPU 時間の集計
+
+replayer と diff はハンドラと共有レイヤーのモジュールを使うため、call_simulator.load_handlers の後に読み込む。
+"""
@@ -0,0 +1,55 @@
+"""
+キャプチャファイル（gzip 圧縮の JSON Lines）の読み書き
+
+1行目がヘッダー（{"format": "voice-capture", "version": 1, ...}）、2行目以降が
+layers/twilio_functions/event_capture.py が書き出したレコード（呼び出し時刻の順）。
+同じ TwiML・指示文の繰り返しが多いため gzip で 1/10 程度になる。
+"""
+import gzip
+import json
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+FORMAT_NAME = 'voice-capture'
+FORMAT_VERSION = 1
+CAPTURE_MARKER = 'voice_event'
+_MARKER_PREFIX = '{"capture":"voice_event"'
+_decoder = json.JSONDecoder()
+
+
+def extract_records(lines: Iterable[str]) -> Iterator[Dict]:
+    """ログの行（CloudWatch Logs のエクスポート・aws logs tail の出力など、前置きがあってもよい）からレコードを取り出す"""
+    for line in lines:
+        start = line.find(_MARKER_PREFIX)
+        if start < 0:
+            continue
+        try:
+            record, _ = _decoder.raw_decode(line, start)
+        except json.JSONDecodeError:
+            continue
+        if record.get('v') == FORMAT_VERSION:
+            yield record
+
+
+def write_captures(path: str, records: List[Dict], source: str = None) -> int:
+    """レコードを呼び出し時刻の順に書き出し、書き込んだバイト数を返す"""
+    records = sorted(records, key=lambda record: record.get('invoked_at', 0))
+    header = {'format': FORMAT_NAME, 'version': FORMAT_VERSION, 'created_at': datetime.now().isoformat(),
+              'source': source, 'records': len(records)}
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        for item in [header, *records]:
+            f.write(json.dumps(item, ensure_ascii=False, separators=(',', ':')) + '\n')
+    with open(path, 'rb') as f:
+        return len(f.read())
+
+
+def read_captures(path: str) -> Tuple[Dict, List[Dict]]:
+    """(ヘッダー, レコードのリスト) を返す（形式が違えば ValueError）"""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        lines = [line for line in f if line.strip()]
+    if not lines:
+        raise ValueError(f"empty capture file: {path}")
+    header = json.loads(lines[0])
+    if header.get('format') != FORMAT_NAME or header.get('version') != FORMAT_VERSION:
+        raise ValueError(f"not a {FORMAT_NAME} v{FORMAT_VERSION} file: {path}")
+    return header, [json.loads(line) for line in lines[1:]]
@@ -0,0 +1,140 @@
+"""
+記録と再生の出力の比較とレポート
+
+出力は1件ずつ比較用の文字列にする。TwiML はセッショントークン・電話番号らしき数字列
+（event_capture.mask_text と同じ規則）と、再生ごとに変わる値（ポーリングのターンID・保留の開始時刻）を伏せる。
+Lambda の非同期呼び出しのペイロードは同じ理由でターンID・受信時刻・セッション・トレースコンテキストを除く。
+
+compare='all' は出力の列をすべて、'final' は戻り値・Lambda の呼び出しと最後の TwiML だけを比較する
+（遅延なしの再生では保留中の calls.update の回数が記録と変わるため）。
+"""
+import difflib
+import json
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from event_capture import mask_text
+
+_VOLATILE = [
+    # 記録側は値の一部が mask_text で [PHONE] になっていることがあるため、次の区切りまでを伏せる
+    (re.compile(r'(turn=)[^&<"\s]+'), r'\1*'),
+    (re.compile(r'(held_since=)[^&<"\s]+'), r'\1*'),
+]
+_VOLATILE_PAYLOAD_KEYS = ('turn_id', 'received_at', 'session', 'trace')
+_TWIML_OUTPUTS = (('twilio', 'update'), ('result_store', 'put'))
+
+
+def normalize_twiml(twiml: Optional[str]) -> str:
+    text = twiml or ''
+    for pattern, replacement in _VOLATILE:
+        text = pattern.sub(replacement, text)
+    return mask_text(text).replace('><', '>\n<')  # 差分を要素ごとの行にする
+
+
+def _normalize_output(entry: Dict) -> str:
+    kind, op = entry['kind'], entry['op']
+    request = entry.get('request') or entry
+    if (kind, op) == ('lambda', 'invoke'):
+        payload = {key: value for key, value in (request.get('payload') or {}).items()
+                   if key not in _VOLATILE_PAYLOAD_KEYS}
+        payload['speech_result'] = mask_text(payload.get('speech_result') or '')
+        return f"lambda.invoke {json.dumps(payload, ensure_ascii=False, sort_keys=True)}"
+    body = normalize_twiml(request.get('twiml'))
+    error = f" error={entry['error']['type']}" if entry.get('error') else ''
+    return f"{kind}.{op}{error}\n{body}"
+
+
+def _normalize_result(result) -> str:
+    if isinstance(result, dict) and 'body' in result:
+        return f"statusCode={result.get('statusCode')}\n{normalize_twiml(result.get('body'))}"
+    return json.dumps(result, ensure_ascii=False, sort_keys=True, default=str)
+
+
+def _select(outputs: List[Dict], compare: str) -> List[Dict]:
+    if compare == 'all':
+        return outputs
+    twiml = [entry for entry in outputs if (entry['kind'], entry['op']) in _TWIML_OUTPUTS]
+    return [entry for entry in outputs if (entry['kind'], entry['op']) == ('lambda', 'invoke')] + twiml[-1:]
+
+
+def expected_outputs(record: Dict) -> List[Dict]:
+    from event_capture import OUTPUT_CALLS
+
+    return [entry for entry in record.get('calls', []) if (entry['kind'], entry['op']) in OUTPUT_CALLS]
+
+
+def render(outputs: List[Dict], result, compare: str) -> List[str]:
+    """比較用の行（戻り値と出力）"""
+    lines = ['# result', *_normalize_result(result).split('\n')]
+    for entry in _select(outputs, compare):
+        lines.extend(['# output', *_normalize_output(entry).split('\n')])
+    return lines
+
+
+def compare_record(record: Dict, replayed: Dict, compare: str) -> Dict:
+    """1レコードの比較結果（status: same / changed / error）"""
+    expected = render(expected_outputs(record), record.get('result'), compare)
+    actual = render(replayed['outputs'], replayed['result'], compare)
+    diff = list(difflib.unified_diff(expected, actual, 'recorded', 'replayed', lineterm='', n=2))
+    status = 'error' if replayed['error'] else ('changed' if diff else 'same')
+    return {
+        'call_sid': record.get('call_sid'),
+        'handler': record['handler'],
+        'invoked_at': record.get('invoked_at'),
+        'status': status,
+        'error': replayed['error'],
+        'divergences': replayed['divergences'],
+        'cpu_ms': round(replayed['cpu_ms'], 2),
+        'wall_ms': round(replayed['wall_ms'], 1),
+        'recorded_cpu_ms': record.get('cpu_ms'),
+        'recorded_wall_ms': record.get('wall_ms'),
+        'diff': diff,
+    }
+
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(value for value in values if value is not None)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+def summarize(results: List[Dict]) -> Dict[str, Dict]:
+    """ハンドラごとの件数と CPU 時間（再生・記録時）"""
+    by_handler = defaultdict(list)
+    for result in results:
+        by_handler[result['handler']].append(result)
+    summary = {}
+    for handler, group in sorted(by_handler.items()):
+        summary[handler] = {
+            'invocations': len(group),
+            'same': sum(1 for r in group if r['status'] == 'same'),
+            'changed': sum(1 for r in group if r['status'] == 'changed'),
+            'errors': sum(1 for r in group if r['status'] == 'error'),
+            'diverged': sum(1 for r in group if r['divergences']),
+            'cpu_p50_ms': percentile([r['cpu_ms'] for r in group], 0.5),
+            'cpu_p95_ms': percentile([r['cpu_ms'] for r in group], 0.95),
+            'recorded_cpu_p50_ms': percentile([r['recorded_cpu_ms'] for r in group], 0.5),
+            'recorded_cpu_p95_ms': percentile([r['recorded_cpu_ms'] for r in group], 0.95),
+            'wall_p95_ms': percentile([r['wall_ms'] for r in group], 0.95),
+        }
+    return summary
+
+
+def cpu_regressions(summary: Dict[str, Dict], baseline: Dict[str, Dict], max_regression: float) -> List[str]:
+    """前回の再生レポート（同じキャプチャ・同じマシン）と比べて CPU 時間の p95 が悪化したハンドラ"""
+    regressions = []
+    for handler, row in summary.items():
+        before = (baseline.get(handler) or {}).get('cpu_p95_ms')
+        if before and row['cpu_p95_ms'] > before * (1 + max_regression):
+            regressions.append(f"{handler}: cpu p95 {before:.2f}ms -> {row['cpu_p95_ms']:.2f}ms")
+    return regressions
+
+
+def format_summary(summary: Dict[str, Dict]) -> str:
+    lines = [f"{'handler':<20}{'calls':>7}{'same':>7}{'changed':>9}{'errors':>8}{'diverged':>10}"
+             f"{'cpu_p50':>9}{'cpu_p95':>9}{'rec_p50':>9}{'rec_p95':>9}"]
+    for handler, row in summary.items():
+        lines.append(f"{handler:<20}{row['invocations']:>7}{row['same']:>7}{row['changed']:>9}{row['errors']:>8}"
+                     f"{row['diverged']:>10}{row['cpu_p50_ms']:>9.2f}{row['cpu_p95_ms']:>9.2f}"
+                     f"{row['recorded_cpu_p50_ms']:>9.2f}{row['recorded_cpu_p95_ms']:>9.2f}")
+    return '\n'.join(lines)
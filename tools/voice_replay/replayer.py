@@ -0,0 +1,343 @@
+"""
+記録したレコードを現在のハンドラに対して再生する
+
+レコードごとに、記録された外部I/Oの結果（DynamoDB・ゲストキャッシュ・回答キャッシュ・結果ストア・OpenAI）を
+記録順に返す偽物を差し込み、ハンドラの出力（応答の TwiML・calls.update・結果ストアへの保存・
+Lambda の非同期呼び出し）と CPU 時間を集める。
+
+- latency='recorded' は各I/Oを記録時の所要時間だけ待つ（保留・応答期限の判定も記録時に近くなる）。
+  'zero' は待たない（CPU 時間の比較向け。保留中の calls.update など時間に依存する出力は変わる）
+- OpenAI の応答は (API, 出力形式名) ごとの記録順で返す（分類と回答の並行実行で順序が入れ替わっても対応がずれない）
+- 記録にない I/O は UnrecordedCall を投げ（キャッシュは未ヒット扱い）、レコードの divergences に残す
+- 受信時刻（received_at・held_since）は再生時刻にずらし、セッショントークンは再生用の鍵で署名し直す
+"""
+import asyncio
+import copy
+import json
+import os
+import time
+from collections import defaultdict, deque
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import openai
+from twilio.base.exceptions import TwilioRestException
+
+# 再生で必ず使う設定（記録の機能フラグや実行環境の値より優先する）
+REPLAY_ENV = {
+    'EVENT_CAPTURE_ENABLED': 'false',
+    'CALL_SESSION_KEYS': 'replay:voice-replay-signing-key',
+    'OPENAI_HEDGING_ENABLED': 'false',  # 複製リクエストは記録と対応づけられない
+    'PERSISTENT_EVENT_LOOP_ENABLED': 'false',
+    'CALL_TRACING_ENABLED': 'false',   # 再生の出力に EMF の行を混ぜない
+    'CALL_ANALYTICS_ENABLED': 'false',
+}
+SESSION_PLACEHOLDER = '$session:'
+INVALID_SESSION = 'v2.replay.invalid'
+
+
+class UnrecordedCall(Exception):
+    """再生中のコードが記録にないI/Oを呼んだ"""
+
+
+def _raise_recorded(kind: str, error: Dict):
+    """記録したエラーを同じ種類の例外として投げ直す（ハンドラの分岐を記録時と同じにする）"""
+    error_type, message = error.get('type', 'Error'), error.get('message', '')
+    if error_type == 'APITimeoutError':
+        raise openai.APITimeoutError(request=None)
+    if error_type == 'APIConnectionError':
+        raise openai.APIConnectionError(message=message or 'Connection error.', request=None)
+    if kind.startswith('openai') and error.get('status'):
+        try:
+            import httpx
+            response = httpx.Response(error['status'], request=httpx.Request('POST', 'https://api.openai.com/v1/responses'))
+            raise openai.APIStatusError(message, response=response, body=None)
+        except ImportError:
+            pass
+    if error_type == 'TwilioRestException':
+        raise TwilioRestException(error.get('status', 500), '', message)
+    raise RuntimeError(f"{error_type}: {message}")
+
+
+class RecordedIO:
+    """1レコード分の記録済みI/O（種類・操作ごとの記録順のキュー）と、再生で出た出力"""
+
+    def __init__(self, calls: List[Dict], zero_latency: bool):
+        self.zero_latency = zero_latency
+        self._queues = defaultdict(deque)
+        for entry in calls:
+            self._queues[self.queue_key(entry['kind'], entry['op'], entry.get('request'))].append(entry)
+        self.outputs: List[Dict] = []
+        self.divergences: List[str] = []
+
+    @staticmethod
+    def queue_key(kind: str, op: str, request: Optional[Dict] = None):
+        if kind == 'openai.responses' and op == 'create':
+            return kind, op, (request or {}).get('format')
+        return kind, op
+
+    def take(self, kind: str, op: str, request: Dict = None, required: bool = True) -> Optional[Dict]:
+        queue = self._queues.get(self.queue_key(kind, op, request))
+        if queue:
+            return queue.popleft()
+        label = f"{kind}.{op}" + (f"[{request['format']}]" if request and request.get('format') else '')
+        self.divergences.append(f"unrecorded {label}")
+        if required:
+            raise UnrecordedCall(label)
+        return None
+
+    def latency(self, entry: Optional[Dict], key: str = 'latency_ms') -> float:
+        if self.zero_latency or not entry:
+            return 0.0
+        return (entry.get(key) or 0.0) / 1000
+
+    def sync_call(self, kind: str, op: str, required: bool = True):
+        """同期I/O: 記録時間だけ待ち、記録のエラーを投げるか結果を返す"""
+        entry = self.take(kind, op, required=required)
+        time.sleep(self.latency(entry))
+        if entry and entry.get('error'):
+            _raise_recorded(kind, entry['error'])
+        return entry.get('response') if entry else None
+
+    def output(self, kind: str, op: str, **fields):
+        """出力I/O: 出力を集め、記録があればその所要時間とエラーを再現する（なければ成功扱い）"""
+        output = {'kind': kind, 'op': op, **fields}
+        self.outputs.append(output)
+        entry = self.take(kind, op, required=False)
+        time.sleep(self.latency(entry))
+        if entry and entry.get('error'):
+            output['error'] = entry['error']
+            _raise_recorded(kind, entry['error'])
+
+
+class ReplayProxy:
+    """指定メソッドを記録から返し、それ以外は実物（空のキャッシュなど）に委譲する"""
+
+    def __init__(self, kind: str, target, methods, io: RecordedIO, required: bool = False):
+        self._kind = kind
+        self._target = target
+        self._methods = frozenset(methods)
+        self._io = io
+        self._required = required
+
+    def __getattr__(self, name: str):
+        if name in self._methods:
+            return lambda *args, **kwargs: self._io.sync_call(self._kind, name, required=self._required)
+        return getattr(self._target, name)
+
+
+class ReplayTable:
+    def __init__(self, io: RecordedIO):
+        self._io = io
+
+    def query(self, **kwargs):
+        response = self._io.sync_call('dynamodb', 'query')
+        return {key: value for key, value in response.items() if value is not None}
+
+
+class ReplayResultStore:
+    def __init__(self, io: RecordedIO):
+        self._io = io
+
+    def get(self, call_sid: str, turn_id: str) -> Optional[str]:
+        return self._io.sync_call('result_store', 'get', required=False)
+
+    def put(self, call_sid: str, turn_id: str, twiml: str) -> None:
+        self._io.output('result_store', 'put', twiml=twiml)
+
+
+class ReplayLambdaClient:
+    def __init__(self, io: RecordedIO):
+        self._io = io
+
+    def invoke(self, FunctionName: str, InvocationType: str = 'RequestResponse', Payload: str = '{}'):
+        self._io.output('lambda', 'invoke', payload=json.loads(Payload))
+        return {'StatusCode': 202}
+
+
+class ReplayTwilioClient:
+    def __init__(self, io: RecordedIO):
+        self._io = io
+
+    def calls(self, call_sid: str):
+        def update(twiml: str):
+            self._io.output('twilio', 'update', twiml=twiml)
+            return SimpleNamespace(sid=call_sid)
+        return SimpleNamespace(update=update)
+
+
+def _response_object(recorded: Optional[Dict]):
+    recorded = recorded or {}
+    text = recorded.get('output_text')
+    output = [SimpleNamespace(type='message', content=[SimpleNamespace(type='output_text', text=text)])] if text else []
+    usage = recorded.get('usage')
+    return SimpleNamespace(
+        id=recorded.get('id'), output=output, output_text=text or '', metadata=recorded.get('metadata') or {},
+        usage=SimpleNamespace(input_tokens=usage.get('input_tokens'), output_tokens=usage.get('output_tokens'),
+                              input_tokens_details=SimpleNamespace(cached_tokens=usage.get('cached_tokens')))
+        if usage else None)
+
+
+class _ReplayResponses:
+    def __init__(self, io: RecordedIO):
+        self._io = io
+        self.input_items = SimpleNamespace(list=self._unrecorded('input_items.list'))
+
+    def _unrecorded(self, op: str):
+        async def call(*args, **kwargs):
+            self._io.divergences.append(f"unrecorded openai.responses.{op}")
+            raise UnrecordedCall(f"openai.responses.{op}")
+        return call
+
+    async def create(self, stream: bool = False, **payload):
+        request = {'format': (payload.get('text') or {}).get('format', {}).get('name')}
+        entry = self._io.take('openai.responses', 'create', request)
+        if stream:
+            return self._stream(entry)
+        await asyncio.sleep(self._io.latency(entry))
+        if entry.get('error'):
+            _raise_recorded('openai.responses', entry['error'])
+        return _response_object(entry.get('response'))
+
+    async def _stream(self, entry: Dict):
+        first_delay = self._io.latency(entry, 'first_delta_ms') if entry.get('first_delta_ms') else self._io.latency(entry)
+        await asyncio.sleep(first_delay)
+        if entry.get('error'):
+            _raise_recorded('openai.responses', entry['error'])
+        response = _response_object(entry.get('response'))
+        text = response.output_text
+        for start in range(0, len(text), 16):
+            yield SimpleNamespace(type='response.output_text.delta', delta=text[start:start + 16])
+        await asyncio.sleep(max(self._io.latency(entry) - first_delay, 0.0))
+        yield SimpleNamespace(type='response.completed', response=response)
+
+    async def retrieve(self, response_id: str, **kwargs):
+        entry = self._io.take('openai.responses', 'retrieve')
+        await asyncio.sleep(self._io.latency(entry))
+        if entry.get('error'):
+            _raise_recorded('openai.responses', entry['error'])
+        return _response_object(entry.get('response'))
+
+
+class _ReplayEmbeddings:
+    def __init__(self, io: RecordedIO):
+        self._io = io
+
+    async def create(self, **kwargs):
+        entry = self._io.take('openai.embeddings', 'create')
+        await asyncio.sleep(self._io.latency(entry))
+        if entry.get('error'):
+            _raise_recorded('openai.embeddings', entry['error'])
+        return SimpleNamespace(data=[SimpleNamespace(embedding=entry['response']['embedding'])])
+
+
+class ReplayOpenAI:
+    def __init__(self, io: RecordedIO):
+        self.responses = _ReplayResponses(io)
+        self.embeddings = _ReplayEmbeddings(io)
+
+
+class Replayer:
+    """読み込んだハンドラのモジュールに偽物を差し込み、レコードを1件ずつ再生する"""
+
+    def __init__(self, handlers: SimpleNamespace, latency: str = 'recorded'):
+        import answer_cache
+        import guest_session_cache
+        import session_token
+        import vector_search
+
+        self.handlers = handlers
+        self.zero_latency = latency == 'zero'
+        self._answer_cache = answer_cache
+        self._guest_session_cache = guest_session_cache
+        self._vector_search = vector_search
+        self._codec = session_token.session_codec
+
+    def _install(self, io: RecordedIO) -> None:
+        immediate, ai = self.handlers.immediate, self.handlers.ai
+        immediate.lambda_client = ReplayLambdaClient(io)
+        immediate.result_store = ReplayResultStore(io)
+        self.handlers.authenticate_guest.table = ReplayTable(io)
+        self._guest_session_cache.guest_session_cache = ReplayProxy(
+            'guest_cache', self._guest_session_cache.GuestSessionCache(), ('get',), io)
+        self._vector_search.answer_cache = ReplayProxy('answer_cache', self._answer_cache.AnswerCache(), ('get',), io)
+        ai.twilio_client = ReplayTwilioClient(io)
+        ai.call_dispatcher = None
+        ai.result_store = ReplayResultStore(io)
+        ai.openai_async_client = ReplayOpenAI(io)
+
+    def _session(self, value, sessions: List[Optional[Dict]]):
+        if not isinstance(value, str) or not value.startswith(SESSION_PLACEHOLDER):
+            return value
+        state = sessions[int(value[len(SESSION_PLACEHOLDER):])]
+        if not state:
+            return INVALID_SESSION
+        return self._codec.encode(state.get('language'), state.get('room_number'), state.get('guest_info'),
+                                  state.get('previous_openai_response_id'))
+
+    def prepare_event(self, record: Dict) -> Dict:
+        """受信時刻を再生時刻にずらし、セッショントークンを署名し直したイベント"""
+        event = copy.deepcopy(record['event'])
+        shift = time.time() - record['invoked_at']
+        sessions = record.get('sessions') or []
+        if record['handler'] == 'immediate_response':
+            query = event.get('queryStringParameters') or {}
+            if 'session' in query:
+                query['session'] = self._session(query['session'], sessions)
+            if query.get('held_since'):
+                query['held_since'] = str(int(int(query['held_since']) + shift))
+        else:
+            event['session'] = self._session(event.get('session'), sessions)
+            if event.get('received_at'):
+                event['received_at'] = event['received_at'] + shift
+        return event
+
+    def replay(self, record: Dict) -> Dict:
+        """1レコードを再生して、出力・戻り値・所要時間・記録とのずれを返す"""
+        io = RecordedIO(record.get('calls', []), self.zero_latency)
+        self._install(io)
+        event = self.prepare_event(record)
+        error = None
+        result = None
+        started = time.monotonic()
+        if record['handler'] == 'immediate_response':
+            cpu_started = time.process_time()
+            try:
+                result = self.handlers.immediate.lambda_handler(event, None)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            cpu_ms = (time.process_time() - cpu_started) * 1000
+        else:
+            result, cpu_ms, error = asyncio.run(self._run_async(event))
+        return {
+            'handler': record['handler'],
+            'call_sid': record.get('call_sid'),
+            'outputs': io.outputs,
+            'result': result,
+            'error': error,
+            'divergences': io.divergences,
+            'cpu_ms': cpu_ms,
+            'wall_ms': (time.monotonic() - started) * 1000,
+        }
+
+    async def _run_async(self, event: Dict):
+        cpu_started = time.process_time()
+        try:
+            result, error = await self.handlers.ai.lambda_handler_async(event, None), None
+        except Exception as e:
+            result, error = None, f"{type(e).__name__}: {e}"
+        return result, (time.process_time() - cpu_started) * 1000, error
+
+
+def replay_environment(config: Dict[str, str], session_tokens: bool = True) -> Dict[str, str]:
+    """
+    再生時の環境変数（REPLAY_ENV を強制し、記録時の機能フラグは実行環境に未設定のものだけ使う）
+
+    session_tokens が False の記録（CALL_SESSION_KEYS 未設定で通話状態を URL パラメータで運んだ記録）は
+    再生でもセッショントークンを使わない。
+    """
+    os.environ.update(REPLAY_ENV)
+    if not session_tokens:
+        os.environ['CALL_SESSION_KEYS'] = ''
+    # 回答キャッシュは記録から再現する。記録に設定がないのは既定が有効だった頃の記録なので有効にする
+    return {'ANSWER_CACHE_ENABLED': 'true', **config}